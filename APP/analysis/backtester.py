@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+"""
+Backtest các lệnh đã được đề xuất (proposed trades) trên dữ liệu nến M1 cục bộ.
+
+Mỗi đề xuất (entry, SL, TP1/TP2, hướng, thời điểm) được "đi nến" trên kho nến M1
+(`persistence.bar_archive`, các cột time/open/high/low/close) để xác định: lệnh có khớp không, chạm SL hay TP nào trước,
+R-multiple thực tế và MAE/MFE. Có hai mô hình khớp lệnh (`BacktestParams.entry_fill`): lệnh giới hạn chờ
+giá chạm entry, hoặc lệnh thị trường khớp ở giá open của nến kế tiếp như `TRADE_ACTION_DEAL` mà
+auto-trade thực sự gửi (`from_config` dùng mô hình này). Ngữ nghĩa chia TP giống `build_trade_requests`: khi bật
+`split_tp_enabled` và có đủ TP1/TP2, lệnh được tách thành hai phần theo `split_tp_ratio`
+(phần 1 chốt ở TP1, phần 2 ở TP2, chung SL); nếu bật `move_to_be_after_tp1` thì SL của
+phần 2 dời về entry sau khi TP1 khớp.
+
+Thay vì vòng lặp Python trên từng nến, mỗi lô đề xuất được ánh xạ thành một ma trận cửa
+sổ nến (đề xuất x horizon) và mọi lần chạm được tìm bằng `argmax` trên mặt nạ boolean.
+Giá được chuẩn hóa theo hướng lệnh (lệnh SELL dùng giá đảo dấu) để một bộ công thức dùng
+chung cho cả hai chiều. Khi SL và TP cùng nằm trong một nến, giả định bất lợi: SL trước.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Mapping, Optional, Sequence
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from APP.configs.app_config import RunConfig
+
+logger = logging.getLogger(__name__)
+
+# Trạng thái / kết quả của một đề xuất sau khi backtest.
+STATUS_FILLED = "filled"
+STATUS_NOT_FILLED = "not_filled"
+STATUS_INVALID = "invalid"
+STATUS_NO_DATA = "no_data"
+
+OUTCOME_SL = "sl"
+OUTCOME_TP1 = "tp1"
+OUTCOME_TP2 = "tp2"
+OUTCOME_BREAKEVEN = "be"
+OUTCOME_OPEN = "open"
+
+_BATCH = 64  # số đề xuất mỗi lô; bộ nhớ ~ _BATCH x (expiry + max_hold) x 8 byte mỗi ma trận
+_SIM_COLUMNS = ("time", "open", "high", "low", "close")  # các cột nến mà mô phỏng dùng
+
+# Mô hình khớp lệnh vào.
+ENTRY_FILL_LIMIT = "limit"  # chờ giá chạm entry trong `entry_expiry_bars` nến
+ENTRY_FILL_MARKET = "market"  # khớp ở giá open của nến đầu tiên từ thời điểm đề xuất
+
+
+@dataclass(frozen=True)
+class BacktestParams:
+    """Tham số mô phỏng (mặc định khớp với `AutoTradeConfig`)."""
+
+    split_tp_enabled: bool = True
+    split_tp_ratio: int = 50
+    move_to_be_after_tp1: bool = False
+    entry_expiry_bars: int = 240  # lệnh chờ hết hạn sau N nến M1 nếu chưa khớp
+    max_hold_bars: int = 1440 * 3  # lệnh còn mở sau N nến được đóng theo giá close
+    time_offset_sec: int = 0  # giờ broker - UTC, để đổi `timestamp_utc` sang trục thời gian của kho nến
+    broker_timezone: str = ""  # nếu có, độ lệch tính theo từng đề xuất (đúng cả khi đổi giờ DST)
+    entry_fill: str = ENTRY_FILL_LIMIT  # ENTRY_FILL_LIMIT hoặc ENTRY_FILL_MARKET
+
+    @classmethod
+    def from_config(cls, cfg: "RunConfig", **overrides: Any) -> "BacktestParams":
+        """
+        Tham số từ cấu hình. Độ lệch giờ broker lấy từ `mt5.broker_timezone`; nếu trống thì đo
+        từ tick MT5 hiện tại (`mt5_service.broker_utc_offset_sec`). Khớp lệnh theo mô hình thị trường
+        vì `build_trade_requests` gửi lệnh `TRADE_ACTION_DEAL`, không phải lệnh chờ.
+        """
+        at = cfg.auto_trade
+        values: dict[str, Any] = {
+            "split_tp_enabled": bool(at.split_tp_enabled),
+            "split_tp_ratio": int(at.split_tp_ratio),
+            "move_to_be_after_tp1": bool(at.move_to_be_after_tp1),
+            "entry_fill": ENTRY_FILL_MARKET,
+        }
+        if getattr(at, "pending_ttl_min", 0):
+            values["entry_expiry_bars"] = int(at.pending_ttl_min)
+        tz_name = getattr(cfg.mt5, "broker_timezone", "") or ""
+        if tz_name and _zone(tz_name) is not None:
+            values["broker_timezone"] = tz_name
+        elif "time_offset_sec" not in overrides:
+            from APP.services import mt5_service
+
+            measured = mt5_service.broker_utc_offset_sec(cfg.mt5.symbol)
+            if measured is None:
+                logger.warning(
+                    "Không xác định được giờ broker (đặt mt5.broker_timezone); backtest coi giờ nến là UTC."
+                )
+            else:
+                values["time_offset_sec"] = measured
+        values.update(overrides)
+        return cls(**values)
+
+    def bar_time(self, utc_epoch: int) -> int:
+        """Đổi epoch UTC của đề xuất sang trục thời gian (giờ broker) của kho nến."""
+        zone = _zone(self.broker_timezone) if self.broker_timezone else None
+        if zone is None:
+            return utc_epoch + self.time_offset_sec
+        offset = datetime.fromtimestamp(utc_epoch, tz=timezone.utc).astimezone(zone).utcoffset()
+        return utc_epoch + int(offset.total_seconds() if offset else 0)
+
+
+def _zone(name: str) -> Optional[ZoneInfo]:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Múi giờ broker không hợp lệ: '{name}'.")
+        return None
+
+
+@dataclass(frozen=True)
+class Proposal:
+    """Một đề xuất giao dịch đã chuẩn hóa."""
+
+    time: int  # epoch giây (UTC)
+    side: int  # +1 BUY, -1 SELL
+    entry: float
+    sl: float
+    tp1: Optional[float]
+    tp2: Optional[float]
+    grade: str = "other"
+    session: str = "unknown"
+    report_file: str = ""
+    symbol: str = ""  # rỗng với bản ghi cũ không lưu symbol
+
+
+@dataclass(frozen=True)
+class TradeOutcome:
+    """Kết quả backtest của một đề xuất."""
+
+    proposal: Proposal
+    status: str
+    outcome: Optional[str] = None
+    r_multiple: Optional[float] = None
+    mae_r: Optional[float] = None
+    mfe_r: Optional[float] = None
+    tp1_hit: bool = False
+    tp2_hit: bool = False
+    bars_to_fill: Optional[int] = None
+    bars_held: Optional[int] = None
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data["proposal"]["direction"] = "BUY" if self.proposal.side > 0 else "SELL"
+        return data
+
+
+# region Đọc và chuẩn hóa đề xuất
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        out = float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return None
+    return out if out > 0 else None
+
+
+def _as_side(value: Any) -> int:
+    text = str(value or "").strip().upper()
+    if text in ("BUY", "LONG", "BULLISH"):
+        return 1
+    if text in ("SELL", "SHORT", "BEARISH"):
+        return -1
+    return 0
+
+
+def _as_epoch(value: Any) -> Optional[int]:
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _grade(risk_multiplier: Any) -> str:
+    try:
+        rm = float(risk_multiplier)
+    except (TypeError, ValueError):
+        return "other"
+    if rm >= 1.0:
+        return "A+"
+    if rm >= 0.5:
+        return "B"
+    return "other"
+
+
+def normalize_proposal(record: Mapping[str, Any]) -> Optional[Proposal]:
+    """
+    Chuẩn hóa một bản ghi đề xuất. Hỗ trợ cả dạng phẳng (`proposed_trades.jsonl`) lẫn
+    bản ghi của `json_handler._log_proposed_trade` (`{"timestamp_utc", "setup", "context_snapshot"}`).
+    """
+    setup = record.get("setup") if isinstance(record.get("setup"), Mapping) else record
+    snapshot = record.get("context_snapshot") or {}
+    side = _as_side(setup.get("direction"))
+    entry = _as_float(setup.get("entry"))
+    sl = _as_float(setup.get("sl"))
+    t = _as_epoch(record.get("timestamp_utc") or record.get("time") or record.get("timestamp"))
+    if not side or entry is None or sl is None or t is None:
+        return None
+    return Proposal(
+        time=t,
+        side=side,
+        entry=entry,
+        sl=sl,
+        tp1=_as_float(setup.get("tp1")),
+        tp2=_as_float(setup.get("tp2")),
+        grade=_grade(setup.get("risk_multiplier")),
+        session=str(snapshot.get("session") or record.get("session") or "unknown"),
+        report_file=str(record.get("report_file") or ""),
+        symbol=str(record.get("symbol") or setup.get("symbol") or ""),
+    )
+
+
+def load_proposals(reports_dir: Path) -> list[Proposal]:
+    """
+    Đọc mọi đề xuất từ `proposed_trades.jsonl` và các file `trade_log_*.jsonl` (bản ghi
+    có khóa `setup`), loại trùng và sắp xếp theo thời gian.
+    """
+    from APP.analysis.context_builder import _parse_jsonl_file
+
+    reports_dir = Path(reports_dir)
+    records = list(_parse_jsonl_file(reports_dir / "proposed_trades.jsonl"))
+    for log_file in sorted(reports_dir.glob("trade_log_*.jsonl")):
+        records.extend(r for r in _parse_jsonl_file(log_file) if isinstance(r, dict) and "setup" in r)
+
+    seen: set[tuple] = set()
+    out: list[Proposal] = []
+    for rec in records:
+        p = normalize_proposal(rec) if isinstance(rec, Mapping) else None
+        if p is None:
+            continue
+        key = (p.symbol, p.time, p.side, p.entry, p.sl, p.tp1, p.tp2)
+        if key not in seen:
+            seen.add(key)
+            out.append(p)
+    out.sort(key=lambda p: p.time)
+    logger.debug(f"Đã nạp {len(out)} đề xuất giao dịch từ {reports_dir}.")
+    return out
+# endregion
+
+
+def load_bars(
+    symbol: str, start: Optional[int] = None, end: Optional[int] = None, root: Optional[Path] = None
+) -> Optional[np.ndarray]:
+    """
+    Đọc nến M1 của symbol trong khoảng `start <= time < end` (epoch giờ broker, None = không giới
+    hạn) từ kho dạng cột `persistence.bar_archive` (chỉ các cột mô phỏng cần); None nếu chưa có dữ liệu.
+    """
+    from APP.persistence import bar_archive
+
+    bars = bar_archive.BarArchive(symbol, "M1", root=root).read(start, end, columns=_SIM_COLUMNS)
+    if bars.size == 0:
+        logger.debug(f"Chưa có kho nến M1 cho {symbol} trong khoảng yêu cầu.")
+        return None
+    return bars
+
+
+def load_bars_for(
+    symbol: str, proposals: Sequence[Proposal], params: BacktestParams, root: Optional[Path] = None
+) -> Optional[np.ndarray]:
+    """Chỉ nạp đoạn nến M1 mà `simulate` cần cho các đề xuất (từ đề xuất sớm nhất tới hết hạn giữ lệnh)."""
+    if not proposals:
+        return None
+    starts = [params.bar_time(p.time) for p in proposals]
+    horizon = (max(1, int(params.entry_expiry_bars)) + max(1, int(params.max_hold_bars)) + 1) * 60
+    return load_bars(symbol, min(starts), max(starts) + horizon, root=root)
+
+
+# region Bộ máy đi nến dạng vector
+def _first(mask: np.ndarray, width: int) -> np.ndarray:
+    """Cột đầu tiên True trên mỗi hàng, hoặc `width` nếu không có."""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), width)
+
+
+def _window(values: np.ndarray, starts: np.ndarray, width: int, fill: float) -> np.ndarray:
+    padded = np.concatenate([values, np.full(width, fill)])
+    return np.lib.stride_tricks.sliding_window_view(padded, width)[starts]
+
+
+def _simulate_batch(
+    props: Sequence[Proposal], bars: np.ndarray, times: np.ndarray, params: BacktestParams
+) -> list[TradeOutcome]:
+    n_bars = len(times)
+    market = params.entry_fill == ENTRY_FILL_MARKET
+    # Lệnh thị trường chỉ có thể khớp ở nến đầu tiên (open luôn nằm trong [low, high] của nến đó).
+    expiry = 1 if market else max(1, int(params.entry_expiry_bars))
+    width = expiry + max(1, int(params.max_hold_bars))
+    k = len(props)
+
+    side = np.array([p.side for p in props], dtype=np.float64)[:, None]
+    sl = np.array([p.sl for p in props])[:, None] * side
+    tp1_raw = np.array([p.tp1 or np.nan for p in props])
+    tp2_raw = np.array([p.tp2 or np.nan for p in props])
+    split = params.split_tp_enabled & ~np.isnan(tp1_raw) & ~np.isnan(tp2_raw)
+    # Không chia TP: một lệnh duy nhất với TP1 (hoặc TP2 nếu thiếu TP1), như `build_trade_requests`.
+    tp_single = np.where(np.isnan(tp1_raw), tp2_raw, tp1_raw)
+    tp1 = (np.where(split, tp1_raw, tp_single) * side[:, 0])[:, None]
+    tp2 = (np.where(split, tp2_raw, np.nan) * side[:, 0])[:, None]
+    w1 = np.where(split, params.split_tp_ratio / 100.0, 1.0)
+
+    starts = np.searchsorted(times, np.array([params.bar_time(p.time) for p in props]), side="left")
+    starts = np.minimum(starts, n_bars)
+    if market:
+        # Giá khớp là open của nến kế tiếp; R, SL dời về hòa vốn và MAE/MFE đều tính theo giá này.
+        opens = np.append(np.asarray(bars["open"], dtype=np.float64), np.nan)
+        entry = opens[starts][:, None] * side
+    else:
+        entry = np.array([p.entry for p in props])[:, None] * side
+    high = np.asarray(bars["high"], dtype=np.float64)
+    low = np.asarray(bars["low"], dtype=np.float64)
+    close = np.asarray(bars["close"], dtype=np.float64)
+
+    # Chuẩn hóa theo hướng: với SELL, "lên" là -low và "xuống" là -high.
+    h = _window(high, starts, width, np.nan)
+    l = _window(low, starts, width, np.nan)
+    c = _window(close, starts, width, np.nan)
+    is_long = side > 0
+    up = np.where(is_long, h, -l)
+    dn = np.where(is_long, l, -h)
+    cl = c * side
+    valid_bar = ~np.isnan(up)
+    col = np.arange(width)[None, :]
+
+    with np.errstate(invalid="ignore"):
+        touch = (dn <= entry) & (up >= entry) & (col < expiry)
+        fill = _first(touch, width)[:, None]
+        live = (col >= fill) & valid_bar
+        sl_j = _first(live & (dn <= sl), width)
+        tp1_j = _first(live & (up >= tp1), width)
+        tp2_j = _first(live & (up >= tp2), width)
+        last_j = np.minimum(fill[:, 0] + int(params.max_hold_bars), valid_bar.sum(axis=1)) - 1
+
+        # Phần 1: SL hoặc TP1, cùng nến thì tính SL.
+        tp1_first = tp1_j < sl_j
+        exit1 = np.where(tp1_first, tp1_j, sl_j)
+        # Phần 2: SL gốc, hoặc SL dời về entry sau khi TP1 khớp.
+        if params.move_to_be_after_tp1:
+            be_j = _first(live & (col > tp1_j[:, None]) & (dn <= entry), width)
+            stop2 = np.where(tp1_first, be_j, sl_j)
+        else:
+            stop2 = sl_j
+        tp2_first = tp2_j < stop2
+        exit2 = np.where(tp2_first, tp2_j, stop2)
+
+    out: list[TradeOutcome] = []
+    for i, p in enumerate(props):
+        if starts[i] >= n_bars:
+            out.append(TradeOutcome(proposal=p, status=STATUS_NO_DATA))
+            continue
+        e, s = entry[i, 0], sl[i, 0]
+        risk = e - s
+        t1 = tp1[i, 0]
+        if risk <= 0 or np.isnan(t1) or t1 <= e:
+            out.append(TradeOutcome(proposal=p, status=STATUS_INVALID))
+            continue
+        f = int(fill[i, 0])
+        if f >= width or f > last_j[i]:
+            out.append(TradeOutcome(proposal=p, status=STATUS_NOT_FILLED))
+            continue
+        horizon = int(last_j[i])
+
+        def _leg(exit_j: int, target: float, stop: float, hit_target: bool) -> tuple[float, int, str]:
+            if exit_j > horizon:
+                return (cl[i, horizon] - e) / risk, horizon, OUTCOME_OPEN
+            if hit_target:
+                return (target - e) / risk, exit_j, "target"
+            return (stop - e) / risk, exit_j, "stop"
+
+        r1, end1, kind1 = _leg(int(exit1[i]), t1, s, bool(tp1_first[i]))
+        hit1 = kind1 == "target"
+        if split[i]:
+            stop_price = e if (params.move_to_be_after_tp1 and hit1) else s
+            r2, end2, kind2 = _leg(int(exit2[i]), tp2[i, 0], stop_price, bool(tp2_first[i]))
+            r = w1[i] * r1 + (1.0 - w1[i]) * r2
+            end = max(end1, end2)
+            hit2 = kind2 == "target"
+            if hit2:
+                outcome = OUTCOME_TP2
+            elif OUTCOME_OPEN in (kind1, kind2):
+                outcome = OUTCOME_OPEN
+            elif hit1:
+                outcome = OUTCOME_BREAKEVEN if stop_price == e else OUTCOME_TP1
+            else:
+                outcome = OUTCOME_SL
+        else:
+            r, end, hit2 = r1, end1, False
+            outcome = OUTCOME_TP1 if hit1 else (OUTCOME_OPEN if kind1 == OUTCOME_OPEN else OUTCOME_SL)
+
+        span_up = up[i, f : end + 1]
+        span_dn = dn[i, f : end + 1]
+        out.append(
+            TradeOutcome(
+                proposal=p,
+                status=STATUS_FILLED,
+                outcome=outcome,
+                r_multiple=round(float(r), 4),
+                mae_r=round(float(max(0.0, e - np.nanmin(span_dn)) / risk), 4),
+                mfe_r=round(float(max(0.0, np.nanmax(span_up) - e) / risk), 4),
+                tp1_hit=hit1,
+                tp2_hit=hit2,
+                bars_to_fill=f,
+                bars_held=end - f,
+            )
+        )
+    return out
+
+
+def simulate(proposals: Sequence[Proposal], bars: np.ndarray, params: BacktestParams = BacktestParams()) -> list[TradeOutcome]:
+    """
+    Backtest danh sách đề xuất trên mảng nến M1 (dtype có các trường time/high/low/close, thêm
+    `open` với `ENTRY_FILL_MARKET`; `time` tăng dần). Kết quả giữ nguyên thứ tự đầu vào.
+    """
+    if len(bars) == 0:
+        return [TradeOutcome(proposal=p, status=STATUS_NO_DATA) for p in proposals]
+    times = np.asarray(bars["time"], dtype=np.int64)
+    out: list[TradeOutcome] = []
+    for i in range(0, len(proposals), _BATCH):
+        out.extend(_simulate_batch(proposals[i : i + _BATCH], bars, times, params))
+    return out
+# endregion
+
+
+# region Thống kê
+def _group_stats(items: Sequence[TradeOutcome]) -> dict[str, Any]:
+    filled = [o for o in items if o.status == STATUS_FILLED]
+    closed = [o for o in filled if o.outcome != OUTCOME_OPEN]
+    r = np.array([o.r_multiple for o in filled], dtype=np.float64)
+    stats: dict[str, Any] = {
+        "proposals": len(items),
+        "filled": len(filled),
+        "fill_rate": round(len(filled) / len(items), 3) if items else None,
+    }
+    if not filled:
+        return stats
+    wins = sum(1 for o in closed if (o.r_multiple or 0.0) > 0)
+    stats.update(
+        {
+            "win_rate": round(wins / len(closed), 3) if closed else None,
+            "tp1_hit_rate": round(sum(o.tp1_hit for o in filled) / len(filled), 3),
+            "tp2_hit_rate": round(sum(o.tp2_hit for o in filled) / len(filled), 3),
+            "sl_rate": round(sum(o.outcome == OUTCOME_SL for o in filled) / len(filled), 3),
+            "avg_r": round(float(r.mean()), 3),
+            "total_r": round(float(r.sum()), 3),
+            "avg_mae_r": round(float(np.mean([o.mae_r for o in filled])), 3),
+            "avg_mfe_r": round(float(np.mean([o.mfe_r for o in filled])), 3),
+        }
+    )
+    return stats
+
+
+def summarize(outcomes: Sequence[TradeOutcome]) -> dict[str, Any]:
+    """Tổng hợp R-multiple, tỷ lệ chạm TP/SL và MAE/MFE theo hạng setup, phiên và hướng."""
+    groups: dict[str, dict[str, list[TradeOutcome]]] = {
+        "by_grade": defaultdict(list),
+        "by_session": defaultdict(list),
+        "by_direction": defaultdict(list),
+    }
+    for o in outcomes:
+        groups["by_grade"][o.proposal.grade].append(o)
+        groups["by_session"][o.proposal.session].append(o)
+        groups["by_direction"]["BUY" if o.proposal.side > 0 else "SELL"].append(o)
+    summary: dict[str, Any] = {"overall": _group_stats(outcomes)}
+    for name, buckets in groups.items():
+        summary[name] = {key: _group_stats(items) for key, items in sorted(buckets.items())}
+    return summary
+
+
+def evaluate_trade_outcomes(
+    proposals: Iterable[Mapping[str, Any] | Proposal],
+    bars: Optional[np.ndarray],
+    params: BacktestParams = BacktestParams(),
+) -> dict[str, Any]:
+    """
+    Điểm vào cho `context_builder`: backtest các đề xuất và trả về thống kê gọn để đưa
+    vào `running_stats` của ngữ cảnh lịch sử.
+    """
+    props = [p if isinstance(p, Proposal) else normalize_proposal(p) for p in proposals]
+    props = [p for p in props if p is not None]
+    if not props:
+        return {"status": "no_proposals"}
+    if bars is None or len(bars) == 0:
+        return {"status": "no_bar_data", "proposals": len(props)}
+    outcomes = simulate(props, bars, params)
+    result = {"status": "ok", **summarize(outcomes)}
+    logger.debug(f"Backtest {len(props)} đề xuất: {result['overall']}")
+    return result
+# endregion
@@ -8,6 +8,7 @@ toàn cảnh cho việc ra quyết định.
 
 from __future__ import annotations
 
+import bisect
 import hashlib
 import json
 import logging
@@ -16,10 +17,7 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, cast
 
-# TODO: Tích hợp backtester và vectorizer vào cấu trúc APP
-# from . import backtester
-# from . import vectorizer
-from APP.analysis import report_parser
+from APP.analysis import backtester, report_parser, similarity_index, vectorizer
 from APP.services import mt5_service, news_service
 from APP.ui.utils.timeframe_detector import TimeframeDetector
 from APP.utils.safe_data import SafeData
@@ -78,6 +76,92 @@ def parse_vector_database_file(reports_dir: Path) -> List[Dict]:
     return _parse_jsonl_file(reports_dir / "vector_database.jsonl")
 
 
+SIMILAR_EXCLUDE_RECENT_SEC = 24 * 3600  # snapshot cùng symbol mới hơn mức này bị loại khỏi kết quả
+SIMILAR_PROPOSAL_JOIN_SEC = 30 * 60  # đề xuất trong khoảng này sau snapshot được coi là của lần chạy đó
+
+
+def find_similar_setups(
+    reports_dir: Path,
+    mt5_data: Dict[str, Any],
+    k: int = 10,
+    record: bool = True,
+    cfg: Optional["RunConfig"] = None,
+    exclude_recent_sec: float = SIMILAR_EXCLUDE_RECENT_SEC,
+) -> List[Dict]:
+    """
+    Tìm k tình huống quá khứ giống snapshot hiện tại nhất trong `vector_database.jsonl`
+    và (tùy chọn) ghi snapshot hiện tại vào kho vector cho các lần sau.
+
+    Các snapshot của cùng symbol trong `exclude_recent_sec` gần nhất bị loại (chúng gần như
+    trùng snapshot hiện tại và chưa có kết quả). Mỗi kết quả được nối với đề xuất giao dịch
+    của lần chạy đó và kết quả backtest của đề xuất (trường `outcome`, None nếu không có).
+
+    Args:
+        reports_dir: Thư mục Reports chứa kho vector và các đề xuất.
+        mt5_data: Payload `MT5_DATA` của lần chạy hiện tại.
+        k: Số kết quả tối đa.
+        record: Có ghi snapshot hiện tại vào kho hay không.
+        cfg: Cấu hình chạy, dùng cho tham số backtest (giờ broker, hạn chờ khớp...).
+        exclude_recent_sec: Độ dài cửa sổ loại trừ tính bằng giây.
+
+    Returns:
+        Danh sách bản ghi (không kèm vector) có thêm trường `distance` và `outcome`.
+    """
+    vector = vectorizer.vectorize_snapshot(mt5_data)
+    if vector is None:
+        return []
+    store = similarity_index.get_store(reports_dir, vectorizer.FEATURE_NAMES)
+    similar = store.most_similar(
+        vector, k=k, symbol=mt5_data.get("symbol"), exclude_recent_sec=exclude_recent_sec
+    )
+    if record:
+        store.append(vector, vectorizer.snapshot_meta(mt5_data))
+    if similar:
+        try:
+            _attach_setup_outcomes(reports_dir, similar, cfg)
+        except Exception as e:
+            logger.warning(f"Lỗi khi nối kết quả backtest cho các tình huống tương tự: {e}")
+    logger.debug(f"Tìm thấy {len(similar)} tình huống tương tự trong {len(store)} snapshot.")
+    return similar
+
+
+def _attach_setup_outcomes(reports_dir: Path, similar: List[Dict], cfg: Optional["RunConfig"]) -> None:
+    """
+    Gắn `outcome` (hướng, trạng thái, R) của đề xuất đi kèm mỗi snapshot tương tự.
+    Đề xuất chỉ được ghép với snapshot cùng symbol; đề xuất không ghi symbol bị bỏ qua.
+    """
+    by_symbol: Dict[str, List[backtester.Proposal]] = {}
+    for p in backtester.load_proposals(reports_dir):
+        if p.symbol:
+            by_symbol.setdefault(p.symbol, []).append(p)
+    times = {sym: [p.time for p in items] for sym, items in by_symbol.items()}
+    matched: Dict[str, List[Tuple[Dict, backtester.Proposal]]] = {}
+    for item in similar:
+        item["outcome"] = None
+        t = backtester._as_epoch(item.get("timestamp_utc"))
+        if t is None:
+            continue
+        symbol = str(item.get("symbol") or (cfg.mt5.symbol if cfg else ""))
+        proposals = by_symbol.get(symbol, [])
+        i = bisect.bisect_left(times.get(symbol, []), t)
+        if i < len(proposals) and proposals[i].time - t <= SIMILAR_PROPOSAL_JOIN_SEC:
+            matched.setdefault(symbol, []).append((item, proposals[i]))
+    if not matched:
+        return
+    params = backtester.BacktestParams.from_config(cfg) if cfg else backtester.BacktestParams()
+    for symbol, pairs in matched.items():
+        props = [p for _, p in pairs]
+        bars = backtester.load_bars_for(symbol, props, params)
+        results = backtester.simulate(props, bars if bars is not None else [], params)
+        for (item, p), res in zip(pairs, results):
+            item["outcome"] = {
+                "direction": "BUY" if p.side > 0 else "SELL",
+                "status": res.status,
+                "result": res.outcome,
+                "r_multiple": res.r_multiple,
+            }
+
+
 def parse_ctx_json_files(reports_dir: Path, max_n: int = 5) -> List[Dict]:
     """
     Phân tích các file ngữ cảnh JSON (ctx_*.json) từ một thư mục.
@@ -241,11 +325,18 @@ def build_historical_context_async(
     }
 
     # 3. Thống kê và quy tắc
-    # TODO: Tích hợp lại logic backtester khi có sẵn
-    # proposed_trades = parse_proposed_trades_file(reports_dir)
-    # backtest_results = backtester.evaluate_trade_outcomes(proposed_trades[-50:], cfg.mt5.symbol)
-    backtest_results = {"status": "not_implemented"}
-    
+    try:
+        proposed_trades = backtester.load_proposals(reports_dir)[-50:]
+        backtest_params = backtester.BacktestParams.from_config(cfg)
+        backtest_results = backtester.evaluate_trade_outcomes(
+            proposed_trades,
+            backtester.load_bars_for(cfg.mt5.symbol, proposed_trades, backtest_params),
+            backtest_params,
+        )
+    except Exception as e:
+        logger.warning(f"Lỗi khi backtest các đề xuất giao dịch: {e}")
+        backtest_results = {"status": "error"}
+
     running_stats = {"backtest_results": backtest_results}
     risk_rules = {
         "max_risk_per_trade_pct": cfg.auto_trade.risk_per_trade,
@@ -323,6 +414,20 @@ def create_concept_value_table(data: SafeData) -> str:
     m15_structure = mss_m15.get('type', "Không rõ") if isinstance(mss_m15, dict) else "Không rõ"
     add_row("M15 Structure", m15_structure)
 
+    alignment = data.get('structure_alignment') or {}
+    if alignment.get('score') is not None:
+        biases = ", ".join(
+            f"{tf}={tf_data.get('bias'):+.2f}"
+            for tf, tf_data in (alignment.get('timeframes') or {}).items()
+            if tf_data.get('bias') is not None
+        )
+        agreement = alignment.get('agreement') or 0.0
+        add_row(
+            "Đồng thuận Cấu trúc",
+            f"{alignment.get('direction')} (score {alignment['score']:+.2f}, "
+            f"cùng hướng {agreement:.0%}; {biases})",
+        )
+
     add_row("Trong Cửa sổ Tin tức", data.get('news_analysis', {}).get('is_in_news_window'))
     
     upcoming = data.get('news_analysis', {}).get('upcoming_events', [])
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Tương quan liên symbol và sức mạnh tiền tệ cho watchlist.
+
+`RollingReturns` giữ ma trận log-return của các symbol trên một lưới thời gian chung trong bộ
+đệm vòng `window` nến, cùng các tổng chạy (tổng return và ma trận tích chéo `RᵀR`). Mỗi nến mới
+chỉ cộng/trừ một hàng nên cập nhật tốn O(k²) với k symbol, không tính lại toàn bộ; sau mỗi
+`window` lần đẩy, các tổng được tính lại chính xác từ bộ đệm để chặn sai số trôi dấu phẩy động.
+
+Từ các tổng chạy:
+- Ma trận tương quan Pearson của return trong cửa sổ.
+- Chỉ số sức mạnh từng đồng tiền: trung bình return tích lũy của các cặp có đồng tiền đó làm
+  base (+) hoặc quote (-), tính bằng một phép nhân ma trận incidence.
+- Độ phơi nhiễm tương quan (lot tương đương) của một lệnh dự kiến so với các vị thế đang mở,
+  dùng cho kiểm tra rủi ro trước khi vào lệnh.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+from functools import reduce
+from typing import TYPE_CHECKING, Any, Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+
+from APP.analysis import watchlist_scanner
+
+if TYPE_CHECKING:
+    from APP.configs.app_config import RunConfig
+
+logger = logging.getLogger(__name__)
+
+CURRENCIES = frozenset(
+    {"USD", "EUR", "GBP", "JPY", "AUD", "NZD", "CAD", "CHF", "XAU", "XAG", "CNH", "SGD", "HKD", "NOK", "SEK", "MXN", "ZAR"}
+)
+# Chỉ số đồng tiền được coi như vị thế mua đồng tiền đó so với rổ.
+INDEX_CURRENCIES = {"DXY": "USD", "USDX": "USD"}
+
+
+def split_currencies(symbol: str) -> tuple[Optional[str], Optional[str]]:
+    """(base, quote) của một symbol FX/kim loại, bỏ hậu tố broker (`EURUSDm`, `XAUUSD.r`)."""
+    letters = re.sub(r"[^A-Za-z]", "", symbol).upper()
+    for index, currency in INDEX_CURRENCIES.items():
+        if letters.startswith(index):
+            return currency, None
+    base, quote = letters[:3], letters[3:6]
+    if base in CURRENCIES and quote in CURRENCIES:
+        return base, quote
+    return None, None
+
+
+class RollingReturns:
+    """Cửa sổ trượt log-return đã căn thời gian của nhiều symbol, cập nhật tăng dần."""
+
+    def __init__(self, symbols: Sequence[str], window: int = 120) -> None:
+        self.symbols = list(symbols)
+        self.window = max(2, int(window))
+        k = len(self.symbols)
+        self._buf = np.zeros((self.window, k))
+        self._sum = np.zeros(k)
+        self._cross = np.zeros((k, k))
+        self._count = 0
+        self._pos = 0
+        self._pushes = 0
+        self._last_close = np.full(k, np.nan)
+        self.last_time: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def push(self, t: int, closes: np.ndarray) -> bool:
+        """Thêm giá đóng cửa của mọi symbol tại thời điểm `t`; bỏ qua nếu không mới hơn."""
+        if self.last_time is not None and t <= self.last_time:
+            return False
+        closes = np.asarray(closes, dtype=np.float64)
+        prev, self._last_close, self.last_time = self._last_close, closes, int(t)
+        if np.isnan(prev).any():
+            return False
+        r = np.log(closes / prev)
+        if self._count == self.window:
+            old = self._buf[self._pos]
+            self._sum -= old
+            self._cross -= np.outer(old, old)
+        else:
+            self._count += 1
+        self._buf[self._pos] = r
+        self._sum += r
+        self._cross += np.outer(r, r)
+        self._pos = (self._pos + 1) % self.window
+        self._pushes += 1
+        if self._pushes % self.window == 0:
+            rows = self._buf[: self._count]
+            self._sum = rows.sum(axis=0)
+            self._cross = rows.T @ rows
+        return True
+
+    def cumulative(self) -> np.ndarray:
+        """Log-return tích lũy của từng symbol trong cửa sổ."""
+        return self._sum.copy()
+
+    def correlation(self) -> np.ndarray:
+        """Ma trận tương quan Pearson (NaN khi một symbol không biến động)."""
+        n = self._count
+        k = len(self.symbols)
+        if n < 3:
+            return np.full((k, k), np.nan)
+        mean = self._sum / n
+        cov = self._cross / n - np.outer(mean, mean)
+        std = np.sqrt(np.clip(np.diag(cov), 0.0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = cov / np.outer(std, std)
+        np.fill_diagonal(corr, 1.0)
+        return np.clip(corr, -1.0, 1.0)
+
+
+class CorrelationEngine:
+    """Duy trì `RollingReturns` cho một watchlist từ nến MT5/kho nến và tóm tắt cho prompt."""
+
+    def __init__(self, symbols: Sequence[str], timeframe: str = "H1", window: int = 120) -> None:
+        self.timeframe = timeframe
+        self.returns = RollingReturns(list(dict.fromkeys(symbols)), window)
+        self._lock = threading.Lock()
+        pairs = [split_currencies(s) for s in self.symbols]
+        self.currencies = sorted({c for pair in pairs for c in pair if c})
+        self._incidence = np.zeros((len(self.currencies), len(self.symbols)))
+        for j, (base, quote) in enumerate(pairs):
+            if base:
+                self._incidence[self.currencies.index(base), j] = 1.0
+            if quote:
+                self._incidence[self.currencies.index(quote), j] = -1.0
+
+    @property
+    def symbols(self) -> list[str]:
+        return self.returns.symbols
+
+    def update(self, load_bars: watchlist_scanner.BarLoader = watchlist_scanner.load_recent_bars) -> int:
+        """Nạp nến mới của mọi symbol, căn theo thời gian chung và đẩy vào cửa sổ."""
+        with self._lock:
+            series = []
+            for symbol in self.symbols:
+                bars = load_bars(symbol, self.timeframe, self.returns.window + 2)
+                if bars is None or len(bars) < 2:
+                    logger.debug(f"Không có nến {symbol} {self.timeframe} cho tương quan.")
+                    return 0
+                # Bỏ nến cuối: có thể là nến đang hình thành.
+                series.append(bars[:-1])
+            times = reduce(np.intersect1d, (s["time"] for s in series))
+            if self.returns.last_time is not None:
+                times = times[times > self.returns.last_time]
+            if times.size == 0:
+                return 0
+            closes = np.column_stack(
+                [s["close"][np.searchsorted(s["time"], times)] for s in series]
+            )
+            return sum(self.returns.push(int(t), row) for t, row in zip(times.tolist(), closes))
+
+    def correlation(self) -> np.ndarray:
+        return self.returns.correlation()
+
+    def currency_strength(self) -> dict[str, float]:
+        """Sức mạnh từng đồng tiền (% return tích lũy trung bình trong cửa sổ)."""
+        if not self.currencies or len(self.returns) == 0:
+            return {}
+        counts = np.abs(self._incidence).sum(axis=1)
+        strength = self._incidence @ self.returns.cumulative() / np.maximum(counts, 1) * 100.0
+        return {c: float(v) for c, v in zip(self.currencies, strength)}
+
+    def correlated_exposure(
+        self, symbol: str, direction: int, positions: Iterable[Mapping[str, Any]]
+    ) -> float:
+        """
+        Lot tương đương mà các vị thế đang mở đã "đặt cùng chiều" với một lệnh `direction`
+        (+1 mua, -1 bán) trên `symbol`: Σ corr(symbol, p) · direction · hướng(p) · volume(p).
+        Symbol ngoài watchlist chỉ được tính khi trùng `symbol`.
+        """
+        corr = self.correlation()
+        index = {s: i for i, s in enumerate(self.symbols)}
+        total = 0.0
+        for pos in positions:
+            other = str(pos.get("symbol") or "")
+            side = 1 if str(pos.get("type", "")).upper() == "BUY" else -1
+            if other == symbol:
+                rho = 1.0
+            elif symbol in index and other in index:
+                rho = float(corr[index[symbol], index[other]])
+                if not np.isfinite(rho):
+                    continue
+            else:
+                continue
+            total += rho * direction * side * float(pos.get("volume") or 0.0)
+        return total
+
+    def summary(
+        self,
+        symbol: str,
+        positions: Iterable[Mapping[str, Any]] = (),
+        *,
+        min_abs_corr: float = 0.5,
+        top: int = 5,
+    ) -> dict[str, Any]:
+        """Khối `correlation` gọn cho payload MT5_DATA."""
+        corr = self.correlation()
+        positions = list(positions)
+        out: dict[str, Any] = {"timeframe": self.timeframe, "window": len(self.returns)}
+        if symbol in self.symbols:
+            i = self.symbols.index(symbol)
+            peers = [
+                {"symbol": other, "corr": round(float(corr[i, j]), 2)}
+                for j, other in enumerate(self.symbols)
+                if j != i and np.isfinite(corr[i, j]) and abs(corr[i, j]) >= min_abs_corr
+            ]
+            out["correlated_with"] = sorted(peers, key=lambda p: -abs(p["corr"]))[:top]
+        strength = self.currency_strength()
+        if strength:
+            ranked = sorted(strength, key=strength.get, reverse=True)
+            out["currency_strength"] = {c: round(strength[c], 3) for c in ranked}
+            out["strongest"], out["weakest"] = ranked[0], ranked[-1]
+        out["exposure"] = {
+            "long": round(self.correlated_exposure(symbol, 1, positions), 3),
+            "short": round(self.correlated_exposure(symbol, -1, positions), 3),
+        }
+        return out
+
+
+_engines: dict[tuple[tuple[str, ...], str, int], CorrelationEngine] = {}
+_engines_guard = threading.Lock()
+
+
+def get_engine(symbols: Sequence[str], timeframe: str = "H1", window: int = 120) -> CorrelationEngine:
+    """Engine dùng chung cho mỗi (watchlist, timeframe, window) trong tiến trình."""
+    key = (tuple(dict.fromkeys(symbols)), timeframe, int(window))
+    with _engines_guard:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = CorrelationEngine(key[0], timeframe, window)
+        return engine
+
+
+def snapshot_summary(
+    cfg: "RunConfig",
+    positions: Iterable[Mapping[str, Any]],
+    *,
+    load_bars: watchlist_scanner.BarLoader = watchlist_scanner.load_recent_bars,
+) -> dict[str, Any]:
+    """Cập nhật engine của watchlist hiện tại và trả về khối tóm tắt cho snapshot."""
+    cc = cfg.correlation
+    symbols = list(dict.fromkeys([*watchlist_scanner.watchlist_symbols(cfg), *cc.symbols]))
+    if len(symbols) < 2:
+        return {}
+    engine = get_engine(symbols, cc.timeframe, cc.window)
+    engine.update(load_bars)
+    return engine.summary(cfg.mt5.symbol, positions, min_abs_corr=cc.min_abs_corr)
@@ -23,9 +23,11 @@ Cung cấp các hàm để xác định các cấu trúc thị trường quan tr
 from __future__ import annotations
 
 import logging
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from datetime import datetime
-from typing import Literal, Sequence
+from typing import Any, Literal, Sequence
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -79,13 +81,35 @@ class LiquidityVoid(ICTObject):
     top: float
     bottom: float
     bar_index: int
+
+@dataclass(frozen=True)
+class TimeframeStructure(ICTObject):
+    """
+    Tập hợp các kết quả ICT không phụ thuộc giá hiện tại của một khung thời gian.
+    Chỉ thay đổi khi có nến mới đóng, nên có thể được cache lại giữa các snapshot.
+    """
+    swing_highs: tuple[LiquidityLevel, ...]
+    swing_lows: tuple[LiquidityLevel, ...]
+    unfilled_fvgs: tuple[FVG, ...]
+    order_blocks: tuple[OrderBlock, ...]
+    liquidity_voids: tuple[LiquidityVoid, ...]
+    mss: MarketStructureShift | None
 # endregion
 
-def find_fvgs(rates: Sequence[dict], current_price: float, fill_check_limit: int = 10) -> list[FVG]:
+def _ohlc_arrays(rates: Sequence[dict]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Chuyển danh sách nến dạng dict thành 4 mảng cột open/high/low/close."""
+    n = len(rates)
+    o, h, l, c = (
+        np.fromiter((r[key] for r in rates), dtype=np.float64, count=n)
+        for key in ("open", "high", "low", "close")
+    )
+    return o, h, l, c
+
+def find_unfilled_fvgs(rates: Sequence[dict], fill_check_limit: int = 10) -> list[FVG]:
     """
-    Quét các thanh giá để tìm các FVG chưa được lấp đầy gần nhất.
+    Quét các thanh giá để tìm tất cả các FVG chưa được lấp đầy (không phụ thuộc giá hiện tại).
+    Thứ tự trả về giữ nguyên thứ tự xuất hiện trên chuỗi nến.
     """
-    logger.debug(f"Bắt đầu find_fvgs với {len(rates)} rates, current_price: {current_price}")
     if not rates or len(rates) < 3:
         return []
 
@@ -108,28 +132,39 @@ def find_fvgs(rates: Sequence[dict], current_price: float, fill_check_limit: int
                 is_filled = True
                 break
         if not is_filled:
-            unfilled_fvgs.append(fvg)
+            unfilled_fvgs.append(FVG(type=fvg["type"], top=fvg["top"], bottom=fvg["bottom"]))
+    return unfilled_fvgs
 
-    # Tìm FVG gần nhất với giá hiện tại
+def select_nearest_fvgs(fvgs: Sequence[FVG], current_price: float) -> list[FVG]:
+    """
+    Chọn FVG Bullish (bên dưới giá) và Bearish (bên trên giá) gần giá hiện tại nhất.
+    """
     nearest_bullish, nearest_bearish = None, None
     min_dist_bullish, min_dist_bearish = float('inf'), float('inf')
 
-    for fvg in unfilled_fvgs:
-        if fvg["type"] == "Bullish" and current_price > fvg["top"]:
-            dist = current_price - fvg["top"]
+    for fvg in fvgs:
+        if fvg.type == "Bullish" and current_price > fvg.top:
+            dist = current_price - fvg.top
             if dist < min_dist_bullish:
                 min_dist_bullish, nearest_bullish = dist, fvg
-        elif fvg["type"] == "Bearish" and current_price < fvg["bottom"]:
-            dist = fvg["bottom"] - current_price
+        elif fvg.type == "Bearish" and current_price < fvg.bottom:
+            dist = fvg.bottom - current_price
             if dist < min_dist_bearish:
                 min_dist_bearish, nearest_bearish = dist, fvg
 
     results = []
     if nearest_bullish:
-        results.append(FVG(type="Bullish", top=nearest_bullish["top"], bottom=nearest_bullish["bottom"]))
+        results.append(nearest_bullish)
     if nearest_bearish:
-        results.append(FVG(type="Bearish", top=nearest_bearish["top"], bottom=nearest_bearish["bottom"]))
-    
+        results.append(nearest_bearish)
+    return results
+
+def find_fvgs(rates: Sequence[dict], current_price: float, fill_check_limit: int = 10) -> list[FVG]:
+    """
+    Quét các thanh giá để tìm các FVG chưa được lấp đầy gần nhất.
+    """
+    logger.debug(f"Bắt đầu find_fvgs với {len(rates)} rates, current_price: {current_price}")
+    results = select_nearest_fvgs(find_unfilled_fvgs(rates, fill_check_limit), current_price)
     logger.debug(f"Kết thúc find_fvgs. Tìm thấy {len(results)} FVG.")
     return results
 
@@ -155,7 +190,7 @@ def find_liquidity_levels(rates: Sequence[dict], lookback: int = 200) -> dict[st
                        limited_rates[i]["low"] < limited_rates[i+1]["low"] and \
                        limited_rates[i]["low"] < limited_rates[i+2]["low"]
 
-        bar_index = len(rates) - lookback + i
+        bar_index = len(rates) - len(limited_rates) + i
         if is_swing_high:
             swing_highs.append(LiquidityLevel(price=limited_rates[i]["high"], bar_index=bar_index))
         if is_swing_low:
@@ -197,7 +232,7 @@ def find_order_blocks(rates: Sequence[dict], lookback: int = 100, mitigation_thr
                     break
             
             if not is_mitigated:
-                bar_index = len(rates) - lookback + i
+                bar_index = len(rates) - len(limited_rates) + i
                 unmitigated_obs.append(OrderBlock(
                     type=ob_type, top=ob_candle["high"], bottom=ob_candle["low"], bar_index=bar_index
                 ))
@@ -277,62 +312,163 @@ def find_market_structure_shift(rates: Sequence[dict], swing_highs: list[Liquidi
                 return MarketStructureShift("Bullish", "CHoCH", recent_high.price, i)
     return None
 
+SESSION_NAMES = ("asia", "london", "newyork_am", "newyork_pm")
+
+
+def _hhmm_to_minutes(value: str) -> int:
+    return int(value[:2]) * 60 + int(value[3:5])
+
+
+def session_liquidity_by_day(rates: Sequence[dict], sessions: dict) -> dict[str, dict[str, dict[str, float]]]:
+    """
+    Tính high/low của mọi phiên (Asia, London, NY AM/PM) cho từng ngày trong một lượt.
+
+    Mỗi nến được gán một session-id theo giờ trong `time`; các nến liên tiếp có cùng
+    (ngày, phiên) được gộp bằng `np.maximum.reduceat`/`np.minimum.reduceat`.
+    Phiên qua đêm (start > end) được tính cho ngày bắt đầu phiên.
+
+    Returns:
+        {"YYYY-MM-DD": {"asia": {"high": ..., "low": ...}, ...}, ...}
+    """
+    if not rates:
+        return {}
+
+    times = np.array([r["time"] for r in rates], dtype="datetime64[m]")
+    days = times.astype("datetime64[D]")
+    minutes = (times - days).astype(np.int64)
+    highs = np.fromiter((r["high"] for r in rates), dtype=np.float64, count=len(rates))
+    lows = np.fromiter((r["low"] for r in rates), dtype=np.float64, count=len(rates))
+
+    session_ids = np.full(len(rates), -1, dtype=np.int64)
+    session_days = days.copy()
+    for sid, name in enumerate(SESSION_NAMES):
+        rng = sessions.get(name)
+        if not rng or not rng.get("start") or not rng.get("end"):
+            continue
+        st, ed = _hhmm_to_minutes(rng["start"]), _hhmm_to_minutes(rng["end"])
+        if st <= ed:
+            mask = (minutes >= st) & (minutes < ed)
+        else:
+            late, early = minutes >= st, minutes < ed
+            mask = late | early
+            session_days[early & (session_ids == -1)] -= np.timedelta64(1, "D")
+        session_ids[mask & (session_ids == -1)] = sid
+
+    selected = np.nonzero(session_ids >= 0)[0]
+    if selected.size == 0:
+        return {}
+    group_key = session_days[selected].astype(np.int64) * len(SESSION_NAMES) + session_ids[selected]
+    starts = np.concatenate(([0], np.nonzero(np.diff(group_key))[0] + 1))
+    group_high = np.maximum.reduceat(highs[selected], starts)
+    group_low = np.minimum.reduceat(lows[selected], starts)
+
+    result: dict[str, dict[str, dict[str, float]]] = {}
+    for pos, hi, lo in zip(starts.tolist(), group_high.tolist(), group_low.tolist()):
+        idx = selected[pos]
+        day = str(session_days[idx])
+        name = SESSION_NAMES[session_ids[idx]]
+        entry = result.setdefault(day, {}).get(name)
+        if entry:
+            entry["high"], entry["low"] = max(entry["high"], hi), min(entry["low"], lo)
+        else:
+            result[day][name] = {"high": hi, "low": lo}
+    return result
+
+
 def get_session_liquidity(rates: Sequence[dict], sessions: dict, broker_time: datetime) -> dict:
     """
     Tìm mức cao/thấp của phiên trước đó dựa trên thời gian của broker.
     """
     session_liquidity = {}
-    today_str = broker_time.strftime("%Y-%m-%d")
     now_hhmm = broker_time.strftime("%H:%M")
-
     london_start = sessions.get("london", {}).get("start", "23:59")
-    if london_start <= now_hhmm:
-        asia_range = sessions.get("asia", {})
-        if asia_range:
-            asia_candles = [r for r in rates if r["time"].startswith(today_str) and asia_range["start"] <= r["time"][11:16] < asia_range["end"]]
-            if asia_candles:
-                session_liquidity["asia_high"] = max(r["high"] for r in asia_candles)
-                session_liquidity["asia_low"] = min(r["low"] for r in asia_candles)
-
     ny_start = sessions.get("newyork_am", {}).get("start", "23:59")
-    if ny_start <= now_hhmm:
-        london_range = sessions.get("london", {})
-        if london_range:
-            london_candles = [r for r in rates if r["time"].startswith(today_str) and london_range["start"] <= r["time"][11:16] < london_range["end"]]
-            if london_candles:
-                session_liquidity["london_high"] = max(r["high"] for r in london_candles)
-                session_liquidity["london_low"] = min(r["low"] for r in london_candles)
-                
+    if london_start > now_hhmm and ny_start > now_hhmm:
+        return session_liquidity
+
+    today = session_liquidity_by_day(rates, sessions).get(broker_time.strftime("%Y-%m-%d"), {})
+    if london_start <= now_hhmm and "asia" in today:
+        session_liquidity["asia_high"] = today["asia"]["high"]
+        session_liquidity["asia_low"] = today["asia"]["low"]
+    if ny_start <= now_hhmm and "london" in today:
+        session_liquidity["london_high"] = today["london"]["high"]
+        session_liquidity["london_low"] = today["london"]["low"]
     return session_liquidity
 
 def find_liquidity_voids(rates: Sequence[dict], lookback: int = 150) -> list[LiquidityVoid]:
     """
     Xác định các Liquidity Voids gần đây.
+
+    Nến có thân/biên độ > 0.7 là ứng viên; ứng viên bị loại nếu một trong 3 nến kế tiếp
+    quay lại giá mở cửa (kiểm tra bằng các mảng dịch chuyển thay vì vòng lặp lồng nhau).
     """
     if not rates or len(rates) < 3:
         return []
 
-    voids = []
     limited_rates = rates[-lookback:]
-    for i in range(1, len(limited_rates)):
-        candle = limited_rates[i]
-        body_size = abs(candle["close"] - candle["open"])
-        total_range = candle["high"] - candle["low"]
-
-        if total_range > 0 and (body_size / total_range) > 0.7:
-            is_unfilled = True
-            for j in range(i + 1, min(i + 4, len(limited_rates))):
-                if (candle["close"] > candle["open"] and limited_rates[j]["low"] < candle["open"]) or \
-                   (candle["close"] < candle["open"] and limited_rates[j]["high"] > candle["open"]):
-                    is_unfilled = False
-                    break
-            if is_unfilled:
-                bar_index = len(rates) - lookback + i
-                voids.append(LiquidityVoid(
-                    type="Bullish" if candle["close"] > candle["open"] else "Bearish",
-                    top=candle["high"], bottom=candle["low"], bar_index=bar_index
-                ))
-    return sorted(voids, key=lambda x: x.bar_index, reverse=True)[:3]
+    m = len(limited_rates)
+    o, h, l, c = _ohlc_arrays(limited_rates)
+    total_range = h - l
+    body_size = np.abs(c - o)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        strong = (total_range > 0) & (body_size / np.where(total_range > 0, total_range, 1.0) > 0.7)
+    strong[0] = False
+    bullish = c > o
+    bearish = c < o
+
+    filled = np.zeros(m, dtype=bool)
+    for k in range(1, 4):
+        if k >= m:
+            break
+        # So nến i với nến i+k; các vị trí vượt cuối cửa sổ không bị coi là đã lấp.
+        filled[:-k] |= (bullish[:-k] & (l[k:] < o[:-k])) | (bearish[:-k] & (h[k:] > o[:-k]))
+
+    offset = len(rates) - m
+    voids = [
+        LiquidityVoid(
+            type="Bullish" if bullish[i] else "Bearish",
+            top=limited_rates[i]["high"], bottom=limited_rates[i]["low"], bar_index=offset + int(i)
+        )
+        for i in np.nonzero(strong & ~filled)[0][::-1][:3]
+    ]
+    return voids
+
+def analyze_timeframe_structure(rates: Sequence[dict]) -> TimeframeStructure:
+    """
+    Chạy toàn bộ các bộ phát hiện ICT không phụ thuộc giá trên một chuỗi nến.
+    """
+    liquidity_data = find_liquidity_levels(rates)
+    swing_highs = liquidity_data.get("swing_highs_BSL", [])
+    swing_lows = liquidity_data.get("swing_lows_SSL", [])
+    return TimeframeStructure(
+        swing_highs=tuple(swing_highs),
+        swing_lows=tuple(swing_lows),
+        unfilled_fvgs=tuple(find_unfilled_fvgs(rates)),
+        order_blocks=tuple(find_order_blocks(rates)),
+        liquidity_voids=tuple(find_liquidity_voids(rates)),
+        mss=find_market_structure_shift(rates, swing_highs, swing_lows),
+    )
+
+def build_timeframe_patterns(structure: TimeframeStructure, current_price: float, tf_key: str) -> dict[str, Any]:
+    """
+    Ghép kết quả cấu trúc đã tính với giá hiện tại để tạo các khóa `ict_patterns`
+    (FVG gần nhất và trạng thái Premium/Discount được đánh giá lại mỗi lần gọi).
+    """
+    swing_highs = list(structure.swing_highs)
+    swing_lows = list(structure.swing_lows)
+    fvgs = select_nearest_fvgs(structure.unfilled_fvgs, current_price)
+    pd_range = analyze_premium_discount(current_price, swing_highs, swing_lows)
+    return {
+        f"liquidity_{tf_key}": {
+            "swing_highs_BSL": [asdict(h) for h in swing_highs],
+            "swing_lows_SSL": [asdict(low) for low in swing_lows],
+        },
+        f"fvgs_{tf_key}": [asdict(fvg) for fvg in fvgs],
+        f"order_blocks_{tf_key}": [asdict(ob) for ob in structure.order_blocks],
+        f"liquidity_voids_{tf_key}": [asdict(v) for v in structure.liquidity_voids],
+        f"premium_discount_{tf_key}": asdict(pd_range) if pd_range else None,
+        f"mss_{tf_key}": asdict(structure.mss) if structure.mss else None,
+    }
 
 def is_silver_bullet_window(broker_time: datetime, kills: dict) -> bool:
     """
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Cache kết quả phân tích ICT theo (symbol, timeframe, thời gian nến đóng gần nhất).
+
+Các cấu trúc ICT của H1/M15 chỉ thay đổi khi một nến mới đóng, trong khi tab biểu đồ
+yêu cầu snapshot liên tục. Module này lưu `TimeframeStructure` (phần không phụ thuộc
+giá hiện tại) trong một LRU nhỏ, đồng thời ghi tràn ra đĩa để lần khởi động sau
+có sẵn cache "ấm".
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+
+from APP.analysis.ict_analyzer import (
+    FVG,
+    LiquidityLevel,
+    LiquidityVoid,
+    MarketStructureShift,
+    OrderBlock,
+    TimeframeStructure,
+)
+from APP.configs.constants import PATHS
+
+logger = logging.getLogger(__name__)
+
+CacheKey = tuple[str, str, str, int]
+
+DEFAULT_CAPACITY = 64
+ICT_CACHE_JSON: Path = PATHS.APP_DIR / "ict_cache.json"
+
+
+def make_cache_key(symbol: str, timeframe: str, closed_rates: Sequence[dict]) -> CacheKey | None:
+    """
+    Tạo khóa cache từ chuỗi nến đã đóng.
+
+    Số lượng nến được đưa vào khóa vì `bar_index` của các đối tượng ICT được tính
+    tương đối với độ dài chuỗi.
+    """
+    if not closed_rates:
+        return None
+    last_time = str(closed_rates[-1].get("time", ""))
+    if not last_time:
+        return None
+    return (symbol, timeframe, last_time, len(closed_rates))
+
+
+def structure_to_dict(structure: TimeframeStructure) -> dict[str, Any]:
+    """Chuyển TimeframeStructure thành dict có thể ghi JSON."""
+    return {
+        "swing_highs": [[lv.price, lv.bar_index] for lv in structure.swing_highs],
+        "swing_lows": [[lv.price, lv.bar_index] for lv in structure.swing_lows],
+        "unfilled_fvgs": [[f.type, f.top, f.bottom] for f in structure.unfilled_fvgs],
+        "order_blocks": [[ob.type, ob.top, ob.bottom, ob.bar_index] for ob in structure.order_blocks],
+        "liquidity_voids": [[v.type, v.top, v.bottom, v.bar_index] for v in structure.liquidity_voids],
+        "mss": (
+            [structure.mss.type, structure.mss.event, structure.mss.price_level, structure.mss.break_bar_index]
+            if structure.mss
+            else None
+        ),
+    }
+
+
+def structure_from_dict(data: dict[str, Any]) -> TimeframeStructure:
+    """Dựng lại TimeframeStructure từ dict đã lưu trên đĩa."""
+    mss_raw = data.get("mss")
+    return TimeframeStructure(
+        swing_highs=tuple(LiquidityLevel(price=float(p), bar_index=int(i)) for p, i in data.get("swing_highs", [])),
+        swing_lows=tuple(LiquidityLevel(price=float(p), bar_index=int(i)) for p, i in data.get("swing_lows", [])),
+        unfilled_fvgs=tuple(FVG(type=t, top=float(top), bottom=float(bot)) for t, top, bot in data.get("unfilled_fvgs", [])),
+        order_blocks=tuple(
+            OrderBlock(type=t, top=float(top), bottom=float(bot), bar_index=int(i))
+            for t, top, bot, i in data.get("order_blocks", [])
+        ),
+        liquidity_voids=tuple(
+            LiquidityVoid(type=t, top=float(top), bottom=float(bot), bar_index=int(i))
+            for t, top, bot, i in data.get("liquidity_voids", [])
+        ),
+        mss=(
+            MarketStructureShift(mss_raw[0], mss_raw[1], float(mss_raw[2]), int(mss_raw[3]))
+            if mss_raw
+            else None
+        ),
+    )
+
+
+class IctResultCache:
+    """
+    LRU cache an toàn đa luồng cho các `TimeframeStructure`, có ghi tràn ra file JSON.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, spill_path: Optional[Path] = None) -> None:
+        self._capacity = max(1, int(capacity))
+        self._spill_path = spill_path
+        self._entries: "OrderedDict[CacheKey, TimeframeStructure]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = spill_path is None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def set_capacity(self, capacity: int) -> None:
+        """Thay đổi dung lượng LRU, loại bỏ các mục cũ nhất nếu cần."""
+        with self._lock:
+            self._capacity = max(1, int(capacity))
+            self._evict_locked()
+
+    def get(self, key: CacheKey) -> TimeframeStructure | None:
+        with self._lock:
+            self._ensure_loaded_locked()
+            structure = self._entries.get(key)
+            if structure is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return structure
+
+    def put(self, key: CacheKey, structure: TimeframeStructure) -> None:
+        with self._lock:
+            self._ensure_loaded_locked()
+            self._entries[key] = structure
+            self._entries.move_to_end(key)
+            self._evict_locked()
+            self._spill_locked()
+
+    def get_or_compute(
+        self, key: CacheKey | None, compute: Callable[[], TimeframeStructure]
+    ) -> TimeframeStructure:
+        """Trả về kết quả trong cache hoặc tính mới và lưu lại."""
+        if key is None:
+            return compute()
+        cached = self.get(key)
+        if cached is not None:
+            logger.debug(f"ICT cache hit cho {key[:3]}.")
+            return cached
+        structure = compute()
+        self.put(key, structure)
+        return structure
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._spill_locked()
+
+    def _evict_locked(self) -> None:
+        while len(self._entries) > self._capacity:
+            evicted, _ = self._entries.popitem(last=False)
+            logger.debug(f"ICT cache loại bỏ mục cũ nhất: {evicted[:3]}")
+
+    def _ensure_loaded_locked(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self._spill_path or not self._spill_path.exists():
+            return
+        try:
+            payload = json.loads(self._spill_path.read_text(encoding="utf-8"))
+            for item in payload.get("entries", []):
+                key = tuple(item["key"])
+                self._entries[(str(key[0]), str(key[1]), str(key[2]), int(key[3]))] = structure_from_dict(
+                    item["structure"]
+                )
+            self._evict_locked()
+            logger.debug(f"Đã nạp {len(self._entries)} mục ICT cache từ {self._spill_path.name}.")
+        except Exception as e:
+            logger.warning(f"Không thể nạp ICT cache từ đĩa, bỏ qua: {e}")
+            self._entries.clear()
+
+    def _spill_locked(self) -> None:
+        if not self._spill_path:
+            return
+        payload = {
+            "entries": [
+                {"key": list(key), "structure": structure_to_dict(structure)}
+                for key, structure in self._entries.items()
+            ]
+        }
+        try:
+            self._spill_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._spill_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(self._spill_path)
+        except OSError as e:
+            logger.warning(f"Không thể ghi ICT cache xuống đĩa: {e}")
+
+
+_default_cache: IctResultCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache(capacity: int = DEFAULT_CAPACITY) -> IctResultCache:
+    """Trả về instance cache dùng chung của tiến trình (khởi tạo lười)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = IctResultCache(capacity=capacity, spill_path=ICT_CACHE_JSON)
+        elif _default_cache.capacity != capacity:
+            _default_cache.set_capacity(capacity)
+        return _default_cache
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Chạy phân tích cấu trúc ICT của nhiều timeframe song song trên một process pool.
+
+Các bộ phát hiện trong `ict_analyzer` là Python thuần nên giữ GIL; khi chạy tuần tự
+trên luồng gọi, chúng làm đứng event loop của UI mỗi lần tạo snapshot. Module này
+đưa mảng OHLC của từng timeframe vào `multiprocessing.shared_memory`, gửi tên block
+sang một `ProcessPoolExecutor` tồn tại suốt vòng đời ứng dụng, rồi thu về các
+`TimeframeStructure`. Mọi lỗi (thiếu numpy, pool hỏng, timeout) đều quay về chạy
+trực tiếp trên luồng hiện tại.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Optional, Sequence
+
+from APP.analysis.ict_analyzer import TimeframeStructure, analyze_timeframe_structure
+
+try:
+    from multiprocessing import shared_memory
+
+    import numpy as np
+
+    PARALLEL_AVAILABLE = True
+except ImportError:  # pragma: no cover - numpy là phụ thuộc lõi nhưng vẫn phòng hờ
+    np = None  # type: ignore[assignment]
+    shared_memory = None  # type: ignore[assignment]
+    PARALLEL_AVAILABLE = False
+
+if TYPE_CHECKING:
+    from APP.configs.app_config import IctConfig
+
+logger = logging.getLogger(__name__)
+
+# Thứ tự cột trong block shared memory.
+OHLC_FIELDS = ("open", "high", "low", "close")
+RESULT_TIMEOUT_SEC = 30.0
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _rates_to_array(rates: Sequence[dict]) -> "np.ndarray":
+    return np.array(
+        [(r["open"], r["high"], r["low"], r["close"]) for r in rates], dtype=np.float64
+    ).reshape(len(rates), len(OHLC_FIELDS))
+
+
+def _analyze_shared_block(shm_name: str, n_bars: int) -> TimeframeStructure:
+    """
+    Hàm chạy trong process con: đọc mảng OHLC từ shared memory và phân tích.
+
+    Các bộ phát hiện chỉ dùng open/high/low/close nên không cần truyền cột thời gian.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = np.ndarray((n_bars, len(OHLC_FIELDS)), dtype=np.float64, buffer=shm.buf)
+        rates = [dict(zip(OHLC_FIELDS, row)) for row in view.tolist()]
+        del view
+    finally:
+        shm.close()
+    return analyze_timeframe_structure(rates)
+
+
+def get_executor(workers: int) -> ProcessPoolExecutor:
+    """Trả về process pool dùng chung, tạo lại nếu số worker thay đổi."""
+    global _executor, _executor_workers
+    workers = max(1, int(workers))
+    with _executor_lock:
+        if _executor is not None and _executor_workers != workers:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _executor is None:
+            logger.debug(f"Khởi tạo ProcessPoolExecutor cho ICT với {workers} worker.")
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        return _executor
+
+
+def shutdown_executor() -> None:
+    """Đóng process pool (gọi khi thoát ứng dụng hoặc khi pool bị hỏng)."""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+            _executor_workers = 0
+
+
+atexit.register(shutdown_executor)
+
+
+def analyze_structures_in_process_pool(
+    jobs: dict[str, Sequence[dict]], workers: int
+) -> dict[str, TimeframeStructure]:
+    """
+    Phân tích nhiều chuỗi nến song song. Ném lỗi nếu pool không dùng được,
+    để hàm gọi quyết định quay về chạy tuần tự.
+    """
+    if not PARALLEL_AVAILABLE:
+        raise RuntimeError("numpy/shared_memory không khả dụng.")
+
+    executor = get_executor(workers)
+    blocks: list["shared_memory.SharedMemory"] = []
+    futures: dict[str, Future] = {}
+    try:
+        for name, rates in jobs.items():
+            arr = _rates_to_array(rates)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+            blocks.append(shm)
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+            futures[name] = executor.submit(_analyze_shared_block, shm.name, len(rates))
+        return {name: fut.result(timeout=RESULT_TIMEOUT_SEC) for name, fut in futures.items()}
+    finally:
+        for fut in futures.values():
+            fut.cancel()
+        for shm in blocks:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def analyze_structures(
+    jobs: dict[str, Sequence[dict]], ict_config: "IctConfig | None" = None
+) -> dict[str, TimeframeStructure]:
+    """
+    Phân tích các chuỗi nến theo cấu hình: dùng process pool khi được bật và tổng số
+    nến đủ lớn để bù chi phí IPC, ngược lại chạy trực tiếp trên luồng hiện tại.
+    """
+    if not jobs:
+        return {}
+
+    use_pool = (
+        ict_config is not None
+        and ict_config.parallel_enabled
+        and PARALLEL_AVAILABLE
+        and len(jobs) > 1
+        and sum(len(r) for r in jobs.values()) >= ict_config.parallel_min_bars
+    )
+    if use_pool:
+        try:
+            return analyze_structures_in_process_pool(jobs, ict_config.parallel_workers or len(jobs))
+        except Exception as e:
+            logger.warning(f"Phân tích ICT song song thất bại, chuyển sang chạy tuần tự: {e}")
+            shutdown_executor()
+
+    return {name: analyze_timeframe_structure(rates) for name, rates in jobs.items()}
@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+"""
+Quét toàn bộ lịch sử nến để thống kê các sự kiện ICT (swing, FVG, OB, void, MSS).
+
+`ict_analyzer` chỉ làm việc trên danh sách dict nhỏ với lookback cố định 100–200 nến.
+Module này đọc kho nến dạng cột `persistence.bar_archive.BarArchive` theo vị trí nến,
+chia thành các chunk chồng lấn, chạy các bộ phát hiện dạng vector trên từng chunk
+và ghi *mọi* đối tượng phát hiện được ra một thư mục kết quả dạng cột
+(mỗi cột là một file nhị phân thô + `meta.json`).
+
+- Bộ nhớ bị chặn theo kích thước chunk, không phụ thuộc độ dài lịch sử.
+- Mỗi chunk chỉ "sở hữu" các sự kiện có `bar_index` trong [start, end); phần chồng lấn
+  phía trước cung cấp ngữ cảnh (swing, trạng thái MSS), phần phía sau đủ dài để xác
+  định swing và kiểm tra lấp/giảm thiểu.
+- Các chunk có thể chạy song song trên process pool; kết quả được ghi theo thứ tự chunk.
+
+Khác với `ict_analyzer`, mọi ứng viên đều được ghi lại kèm `ref_bar` là nến đã lấp
+FVG/void hoặc giảm thiểu OB trong phạm vi kiểm tra (-1 nếu chưa) — lọc `ref_bar == -1`
+sẽ cho đúng định nghĩa "chưa lấp" của `ict_analyzer`. Swing chỉ được coi là xác nhận
+sau 2 nến bên phải, nên MSS được phát hiện không nhìn trước tương lai.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Optional
+
+import numpy as np
+
+from APP.persistence.bar_archive import BarArchive
+
+if TYPE_CHECKING:
+    from APP.utils.threading_utils import CancelToken
+
+logger = logging.getLogger(__name__)
+
+# Định dạng nến trong RAM mà các bộ phát hiện nhận: mảng có cấu trúc, `time` là epoch giây
+# (giờ broker). `BarArchive.read` trả về các cột này (cùng tên) cộng thêm `spread`.
+BAR_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<i8"),
+    ]
+)
+
+# Mã loại sự kiện trong cột `kind`.
+KIND_SWING_HIGH = 1
+KIND_SWING_LOW = 2
+KIND_FVG = 3
+KIND_ORDER_BLOCK = 4
+KIND_LIQUIDITY_VOID = 5
+KIND_MSS = 6
+KIND_NAMES = {
+    KIND_SWING_HIGH: "swing_high",
+    KIND_SWING_LOW: "swing_low",
+    KIND_FVG: "fvg",
+    KIND_ORDER_BLOCK: "order_block",
+    KIND_LIQUIDITY_VOID: "liquidity_void",
+    KIND_MSS: "mss",
+}
+
+# Cột `flag` của MSS.
+MSS_BOS = 0
+MSS_CHOCH = 1
+
+# Các cột của file kết quả (tên -> dtype), ghi nối tiếp theo từng chunk.
+RESULT_COLUMNS: dict[str, str] = {
+    "kind": "u1",  # KIND_*
+    "direction": "i1",  # +1 Bullish / swing high, -1 Bearish / swing low
+    "flag": "u1",  # MSS: MSS_BOS / MSS_CHOCH
+    "bar_index": "<i8",  # chỉ số nến trong kho
+    "time": "<i8",  # epoch giây của nến tại bar_index
+    "top": "<f8",
+    "bottom": "<f8",
+    "ref_bar": "<i8",  # FVG/void: nến lấp; OB: nến giảm thiểu; MSS: swing bị phá; -1 nếu không có
+}
+META_FILE = "meta.json"
+
+
+@dataclass(frozen=True)
+class ScanParams:
+    """Tham số của bộ quét (giá trị mặc định bám theo `ict_analyzer`)."""
+
+    chunk_bars: int = 200_000
+    context_bars: int = 500
+    fvg_fill_horizon: int = 10
+    ob_mitigation_horizon: int = 100
+    ob_mitigation_threshold: float = 0.5
+    void_body_ratio: float = 0.7
+    void_fill_horizon: int = 3
+
+    @property
+    def lookahead_bars(self) -> int:
+        # +2 để xác nhận swing fractal ở cuối chunk.
+        return max(self.fvg_fill_horizon, self.ob_mitigation_horizon, self.void_fill_horizon) + 2
+
+
+# Các cột kho nến mà bộ quét cần đọc.
+_SCAN_COLUMNS = ("time", "open", "high", "low", "close")
+
+
+# region Bộ phát hiện dạng vector
+def _first_hit(
+    series: np.ndarray, idx: np.ndarray, thresh: np.ndarray, start: int, horizon: int, op: str
+) -> np.ndarray:
+    """
+    Với mỗi vị trí `idx[k]`, trả về chỉ số j đầu tiên trong [idx+start, idx+start+horizon)
+    thỏa `series[j] <op> thresh[k]`, hoặc -1 nếu không có.
+    """
+    if idx.size == 0 or horizon <= 0:
+        return np.full(idx.size, -1, dtype=np.int64)
+    padded = np.concatenate([series[start:], np.full(horizon, np.nan)])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, horizon)[idx]
+    t = thresh[:, None]
+    with np.errstate(invalid="ignore"):
+        if op == "le":
+            hit = windows <= t
+        elif op == "ge":
+            hit = windows >= t
+        elif op == "lt":
+            hit = windows < t
+        else:
+            hit = windows > t
+    first = hit.argmax(axis=1)
+    return np.where(hit.any(axis=1), idx + start + first, -1).astype(np.int64)
+
+
+def _swings(h: np.ndarray, l: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Swing high/low theo fractal 5 nến (giống `find_liquidity_levels`)."""
+    if h.size < 5:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    mh, ml = h[2:-2], l[2:-2]
+    is_high = (mh > h[1:-3]) & (mh > h[:-4]) & (mh > h[3:-1]) & (mh > h[4:])
+    is_low = (ml < l[1:-3]) & (ml < l[:-4]) & (ml < l[3:-1]) & (ml < l[4:])
+    return np.nonzero(is_high)[0] + 2, np.nonzero(is_low)[0] + 2
+
+
+def _mss_events(
+    c: np.ndarray, h: np.ndarray, l: np.ndarray, high_idx: np.ndarray, low_idx: np.ndarray
+) -> list[tuple[int, int, int, float, int]]:
+    """
+    Phát hiện BOS/CHoCH theo logic của `find_market_structure_shift`, nhưng cho mọi
+    thời điểm: trạng thái swing được cập nhật khi swing được xác nhận (2 nến sau đỉnh/đáy).
+
+    Trả về danh sách (break_bar, direction, flag, level, swing_bar).
+    """
+    confirmations = sorted(
+        [(int(i) + 2, 1, int(i)) for i in high_idx] + [(int(i) + 2, -1, int(i)) for i in low_idx]
+    )
+    events: list[tuple[int, int, int, float, int]] = []
+    rh = ph = rl = pl = None
+    rh_bar = rl_bar = -1
+    high_used = low_used = True
+    n = c.size
+    for k, (conf, side, bar) in enumerate(confirmations):
+        if side == 1:
+            ph, rh, rh_bar, high_used = rh, float(h[bar]), bar, False
+        else:
+            pl, rl, rl_bar, low_used = rl, float(l[bar]), bar, False
+        if None in (rh, ph, rl, pl):
+            continue
+
+        if rh > ph and rl > pl:
+            trend = 1
+        elif rh < ph and rl < pl:
+            trend = -1
+        else:
+            continue
+
+        scan_from = conf + 1
+        scan_to = min(n, confirmations[k + 1][0] + 1) if k + 1 < len(confirmations) else n
+        while scan_from < scan_to and not (high_used and low_used):
+            window = c[scan_from:scan_to]
+            up = np.argmax(window > rh) if not high_used else -1
+            up = up if up >= 0 and window[up] > rh else -1
+            down = np.argmax(window < rl) if not low_used else -1
+            down = down if down >= 0 and window[down] < rl else -1
+            if up < 0 and down < 0:
+                break
+            if down < 0 or (0 <= up < down):
+                flag = MSS_BOS if trend == 1 else MSS_CHOCH
+                events.append((scan_from + up, 1, flag, rh, rh_bar))
+                high_used, scan_from = True, scan_from + up + 1
+            else:
+                flag = MSS_BOS if trend == -1 else MSS_CHOCH
+                events.append((scan_from + down, -1, flag, rl, rl_bar))
+                low_used, scan_from = True, scan_from + down + 1
+    return events
+
+
+def detect_events(bars: np.ndarray, params: ScanParams = ScanParams()) -> dict[str, np.ndarray]:
+    """
+    Chạy tất cả bộ phát hiện trên một mảng nến (chỉ số cục bộ) và trả về các cột kết quả.
+    """
+    o = np.asarray(bars["open"], dtype=np.float64)
+    h = np.asarray(bars["high"], dtype=np.float64)
+    l = np.asarray(bars["low"], dtype=np.float64)
+    c = np.asarray(bars["close"], dtype=np.float64)
+    m = c.size
+    parts: list[tuple[int, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+
+    def _add(kind, bar, direction, flag, top, bottom, ref):
+        parts.append((kind, bar, direction, flag, top, bottom, ref))
+
+    # Swing high/low.
+    high_idx, low_idx = _swings(h, l)
+    for kind, idx, prices, direction in (
+        (KIND_SWING_HIGH, high_idx, h, 1),
+        (KIND_SWING_LOW, low_idx, l, -1),
+    ):
+        _add(kind, idx, np.full(idx.size, direction), np.zeros(idx.size), prices[idx], prices[idx], np.full(idx.size, -1))
+
+    if m >= 3:
+        # FVG: khoảng trống giữa nến i-2 và nến i.
+        bull = l[2:] > h[:-2]
+        bear = ~bull & (h[2:] < l[:-2])
+        for mask, direction in ((bull, 1), (bear, -1)):
+            idx = np.nonzero(mask)[0] + 2
+            if direction == 1:
+                top, bottom = l[idx], h[idx - 2]
+                ref = _first_hit(l, idx, bottom, 1, params.fvg_fill_horizon, "le")
+            else:
+                top, bottom = l[idx - 2], h[idx]
+                ref = _first_hit(h, idx, top, 1, params.fvg_fill_horizon, "ge")
+            _add(KIND_FVG, idx, np.full(idx.size, direction), np.zeros(idx.size), top, bottom, ref)
+
+    if m >= 2:
+        # Order block: nến ngược màu ngay trước nến phá vỡ thân/biên của nó.
+        up_candle = c[:-1] > o[:-1]
+        down_candle = c[:-1] < o[:-1]
+        bear_ob = up_candle & (c[1:] < l[:-1])
+        bull_ob = down_candle & (c[1:] > h[:-1])
+        mitigation = l + (h - l) * params.ob_mitigation_threshold
+        for mask, direction in ((bull_ob, 1), (bear_ob, -1)):
+            idx = np.nonzero(mask)[0]
+            if direction == 1:
+                ref = _first_hit(l, idx, mitigation[idx], 2, params.ob_mitigation_horizon, "lt")
+            else:
+                ref = _first_hit(h, idx, mitigation[idx], 2, params.ob_mitigation_horizon, "gt")
+            _add(KIND_ORDER_BLOCK, idx, np.full(idx.size, direction), np.zeros(idx.size), h[idx], l[idx], ref)
+
+    # Liquidity void: nến thân lớn (thân/biên độ > ngưỡng).
+    rng = h - l
+    body = np.abs(c - o)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        strong = (rng > 0) & (body / np.where(rng > 0, rng, 1.0) > params.void_body_ratio)
+    strong[:1] = False
+    for mask, direction in ((strong & (c > o), 1), (strong & (c < o), -1)):
+        idx = np.nonzero(mask)[0]
+        if direction == 1:
+            ref = _first_hit(l, idx, o[idx], 1, params.void_fill_horizon, "lt")
+        else:
+            ref = _first_hit(h, idx, o[idx], 1, params.void_fill_horizon, "gt")
+        _add(KIND_LIQUIDITY_VOID, idx, np.full(idx.size, direction), np.zeros(idx.size), h[idx], l[idx], ref)
+
+    # MSS (BOS/CHoCH).
+    mss = _mss_events(c, h, l, high_idx, low_idx)
+    if mss:
+        arr = np.array(mss, dtype=np.float64)
+        _add(
+            KIND_MSS,
+            arr[:, 0].astype(np.int64),
+            arr[:, 1],
+            arr[:, 2],
+            arr[:, 3],
+            arr[:, 3],
+            arr[:, 4].astype(np.int64),
+        )
+
+    columns = {name: [] for name in RESULT_COLUMNS if name != "time"}
+    for kind, bar, direction, flag, top, bottom, ref in parts:
+        columns["kind"].append(np.full(len(bar), kind))
+        columns["bar_index"].append(bar)
+        columns["direction"].append(direction)
+        columns["flag"].append(flag)
+        columns["top"].append(top)
+        columns["bottom"].append(bottom)
+        columns["ref_bar"].append(ref)
+
+    out = {
+        name: (np.concatenate(chunks) if chunks else np.empty(0)).astype(RESULT_COLUMNS[name])
+        for name, chunks in columns.items()
+    }
+    # Sắp xếp theo (bar_index, kind) để kết quả ổn định bất kể cách chia chunk.
+    order = np.lexsort((out["kind"], out["bar_index"]))
+    out = {name: col[order] for name, col in out.items()}
+    out["time"] = np.asarray(bars["time"], dtype=np.int64)[out["bar_index"]] if m else np.empty(0, "<i8")
+    return out
+# endregion
+
+
+def _scan_chunk(
+    root: str, symbol: str, timeframe: str, start: int, end: int, params: ScanParams
+) -> dict[str, np.ndarray]:
+    """Quét một chunk [start, end) kèm phần ngữ cảnh, trả về sự kiện thuộc chunk (chỉ số toàn cục)."""
+    archive = BarArchive(symbol, timeframe, root=Path(root))
+    lo = max(0, start - params.context_bars)
+    window = archive.read_rows(lo, end + params.lookahead_bars, _SCAN_COLUMNS)  # chỉ phần chunk vào RAM
+    events = detect_events(window, params)
+
+    keep = (events["bar_index"] >= start - lo) & (events["bar_index"] < end - lo)
+    out = {name: col[keep] for name, col in events.items()}
+    out["bar_index"] = out["bar_index"] + lo
+    out["ref_bar"] = np.where(out["ref_bar"] >= 0, out["ref_bar"] + lo, -1)
+    return out
+
+
+def scan_archive(
+    archive: BarArchive,
+    out_dir: Path,
+    *,
+    params: ScanParams = ScanParams(),
+    workers: int = 1,
+    cancel_token: Optional["CancelToken"] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> dict:
+    """
+    Quét toàn bộ kho nến và ghi các sự kiện ICT vào `out_dir` dạng cột.
+
+    Args:
+        archive: Kho nến (symbol, timeframe) cần quét.
+        out_dir: Thư mục kết quả (ghi đè nếu đã tồn tại).
+        workers: Số process song song; <= 1 thì quét tuần tự trên luồng hiện tại.
+        progress: Callback (số chunk đã xong, tổng số chunk).
+
+    Returns:
+        Nội dung `meta.json` đã ghi.
+    """
+    out_dir = Path(out_dir)
+    n_bars = len(archive)
+    source = (str(archive.root), archive.symbol, archive.timeframe)
+    chunk = max(1, int(params.chunk_bars))
+    ranges = [(s, min(n_bars, s + chunk)) for s in range(0, n_bars, chunk)]
+    logger.info(f"Bắt đầu quét ICT {archive.symbol} {archive.timeframe}: {n_bars} nến, {len(ranges)} chunk, {workers} worker.")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    files = {name: open(out_dir / f"{name}.bin", "wb") for name in RESULT_COLUMNS}
+    counts = {name: 0 for name in KIND_NAMES.values()}
+    total = 0
+
+    def _write(events: dict[str, np.ndarray]) -> None:
+        nonlocal total
+        for name, fh in files.items():
+            events[name].astype(RESULT_COLUMNS[name]).tofile(fh)
+        total += int(events["kind"].size)
+        for code, name in KIND_NAMES.items():
+            counts[name] += int(np.count_nonzero(events["kind"] == code))
+
+    try:
+        if workers <= 1 or len(ranges) <= 1:
+            for done, (start, end) in enumerate(ranges, 1):
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
+                _write(_scan_chunk(*source, start, end, params))
+                if progress:
+                    progress(done, len(ranges))
+        else:
+            # Giới hạn số chunk đang chạy để bộ nhớ không tăng theo độ dài lịch sử.
+            max_in_flight = workers * 2
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending: list[Future] = []
+                next_range = 0
+                done = 0
+                while done < len(ranges):
+                    while next_range < len(ranges) and len(pending) < max_in_flight:
+                        start, end = ranges[next_range]
+                        pending.append(executor.submit(_scan_chunk, *source, start, end, params))
+                        next_range += 1
+                    if cancel_token and cancel_token.is_cancelled():
+                        for fut in pending:
+                            fut.cancel()
+                        cancel_token.raise_if_cancelled()
+                    _write(pending.pop(0).result())
+                    done += 1
+                    if progress:
+                        progress(done, len(ranges))
+    finally:
+        for fh in files.values():
+            fh.close()
+
+    meta = {
+        "symbol": archive.symbol,
+        "timeframe": archive.timeframe,
+        "archive": str(archive.path),
+        "n_bars": n_bars,
+        "n_events": total,
+        "columns": RESULT_COLUMNS,
+        "kinds": {str(code): name for code, name in KIND_NAMES.items()},
+        "counts": counts,
+        "params": asdict(params),
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    (out_dir / META_FILE).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    logger.info(f"Hoàn tất quét ICT: {total} sự kiện -> {out_dir}")
+    return meta
+
+
+def load_scan_result(out_dir: Path) -> tuple[dict, dict[str, np.ndarray]]:
+    """Đọc `meta.json` và mở các cột kết quả dạng memmap chỉ đọc."""
+    out_dir = Path(out_dir)
+    meta = json.loads((out_dir / META_FILE).read_text(encoding="utf-8"))
+    columns: dict[str, np.ndarray] = {}
+    for name, dtype in meta["columns"].items():
+        path = out_dir / f"{name}.bin"
+        if meta["n_events"] == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(path, dtype=dtype, mode="r", shape=(meta["n_events"],))
+    return meta, columns
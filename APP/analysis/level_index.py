@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Chỉ mục mức giá đã sắp xếp cho các truy vấn "mức gần nhất" và "trong vòng N pips".
+
+Các mức (PDH/PDL, tuần, số tròn, phiên, cạnh FVG/OB, thanh khoản swing) được gắn nhãn
+nguồn và lưu trong một mảng giá đã sắp xếp; mọi truy vấn dùng `bisect` nên có độ phức
+tạp O(log n). `LevelIndexCache` giữ một chỉ mục cho mỗi khóa (symbol, phạm vi) và chỉ dựng
+lại khi chữ ký của khóa đó thay đổi; chữ ký do người gọi đưa vào (vd. bucket số tròn, đối tượng
+cấu trúc ICT đã cache) nên lần trúng cache không phải gom lại các mức. Khoảng cách luôn tính
+bằng pip (`distance_pips`), giống `key_levels_nearby`.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Iterable, Mapping, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+# Nhãn nguồn của mức giá.
+SOURCE_DAILY = "daily"
+SOURCE_WEEKLY = "weekly"
+SOURCE_ROUND = "round"
+SOURCE_SESSION = "session"
+SOURCE_FVG = "fvg"
+SOURCE_ORDER_BLOCK = "order_block"
+SOURCE_LIQUIDITY = "liquidity"
+
+
+@dataclass(frozen=True, order=True)
+class PriceLevel:
+    """Một mức giá được gắn nhãn nguồn."""
+
+    price: float
+    name: str
+    source: str
+
+    def to_dict(self, cp: float | None = None, pip: float | None = None) -> dict[str, Any]:
+        data: dict[str, Any] = {"name": self.name, "source": self.source, "price": self.price}
+        if cp:
+            data["relation"] = "ABOVE" if self.price > cp else ("BELOW" if self.price < cp else "INSIDE")
+            data["distance_pips"] = abs(self.price - cp) / pip if pip else None
+        return data
+
+
+class PriceLevelIndex:
+    """Mảng mức giá bất biến, sắp xếp theo giá, truy vấn bằng bisect."""
+
+    def __init__(self, levels: Iterable[PriceLevel]) -> None:
+        self._levels: tuple[PriceLevel, ...] = tuple(sorted(levels))
+        self._prices: list[float] = [lv.price for lv in self._levels]
+
+    def __len__(self) -> int:
+        return len(self._levels)
+
+    @property
+    def levels(self) -> tuple[PriceLevel, ...]:
+        return self._levels
+
+    def nearest(self, price: float) -> Optional[PriceLevel]:
+        """Mức gần `price` nhất (khi cách đều, ưu tiên mức bên dưới)."""
+        if not self._levels:
+            return None
+        i = bisect_left(self._prices, price)
+        if i == 0:
+            return self._levels[0]
+        if i == len(self._prices):
+            return self._levels[-1]
+        below, above = self._levels[i - 1], self._levels[i]
+        return below if price - below.price <= above.price - price else above
+
+    def above(self, price: float, k: int = 1) -> list[PriceLevel]:
+        """k mức gần nhất có giá > `price`, theo thứ tự tăng dần khoảng cách."""
+        i = bisect_right(self._prices, price)
+        return list(self._levels[i : i + max(0, k)])
+
+    def below(self, price: float, k: int = 1) -> list[PriceLevel]:
+        """k mức gần nhất có giá < `price`, theo thứ tự tăng dần khoảng cách."""
+        i = bisect_left(self._prices, price)
+        return list(reversed(self._levels[max(0, i - max(0, k)) : i]))
+
+    def within(self, price: float, distance: float) -> list[PriceLevel]:
+        """Tất cả các mức trong khoảng [price - distance, price + distance]."""
+        lo = bisect_left(self._prices, price - distance)
+        hi = bisect_right(self._prices, price + distance)
+        return list(self._levels[lo:hi])
+
+
+LevelSource = Union[Iterable[PriceLevel], Callable[[], Iterable[PriceLevel]]]
+
+
+class LevelIndexCache:
+    """Chỉ mục theo khóa (thường là `(symbol, phạm vi)`), giữ tối đa `max_keys` khóa gần nhất."""
+
+    def __init__(self, max_keys: int = 128) -> None:
+        self.max_keys = max(1, int(max_keys))
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple[Any, PriceLevelIndex]]" = OrderedDict()
+        self.builds = 0
+
+    def get(self, key: Hashable, levels: LevelSource, signature: Any = None) -> PriceLevelIndex:
+        """
+        Chỉ mục của `key`, dựng lại khi `signature` khác lần trước. `levels` có thể là hàm để chỉ
+        gom các mức khi phải dựng lại; không có `signature` thì chữ ký là chính tập mức.
+        """
+        if signature is None:
+            levels = tuple(levels() if callable(levels) else levels)
+            signature = levels
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is signature or entry[0] == signature):
+                self._entries.move_to_end(key)
+                return entry[1]
+        index = PriceLevelIndex(levels() if callable(levels) else levels)
+        with self._lock:
+            self._entries[key] = (signature, index)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+            self.builds += 1
+        return index
+
+    def merged(self, key: Hashable, parts: Sequence[PriceLevelIndex]) -> PriceLevelIndex:
+        """Chỉ mục gộp từ các chỉ mục con đã cache; chỉ dựng lại khi một phần thay đổi."""
+        return self.get(key, lambda: [lv for part in parts for lv in part.levels], signature=tuple(parts))
+
+
+_cache: Optional[LevelIndexCache] = None
+_cache_guard = threading.Lock()
+
+
+def get_level_index_cache() -> LevelIndexCache:
+    """Cache chỉ mục dùng chung cho mọi symbol trong tiến trình."""
+    global _cache
+    with _cache_guard:
+        if _cache is None:
+            _cache = LevelIndexCache()
+        return _cache
+
+
+def key_level_index(symbol: str, levels: Iterable[PriceLevel]) -> PriceLevelIndex:
+    """Chỉ mục các mức ngày của `symbol`; dùng chung giữa `mt5_service` và điều kiện key level."""
+    # Sắp trước để chữ ký không phụ thuộc thứ tự (payload `key_levels_nearby` đã sắp theo giá).
+    return get_level_index_cache().get((symbol, "key"), sorted(levels))
+
+
+def round_level_index(symbol: str, cp: float, pip: float, digits: int = 5) -> PriceLevelIndex:
+    """Các mức số tròn quanh `cp` (bậc 0/25/50/75); chỉ dựng lại khi giá sang bậc pip khác."""
+    bucket = int(math.floor(cp / pip))
+
+    def build() -> list[PriceLevel]:
+        out: list[PriceLevel] = []
+        for step in (0, 25, 50, 75):
+            raw = bucket * pip + step * pip / 100.0
+            level = f"{int(round((raw % 1) / pip * 100)):02d}"
+            out.append(PriceLevel(price=round(raw, digits), name=f"ROUND_{level}", source=SOURCE_ROUND))
+        return out
+
+    return get_level_index_cache().get((symbol, "round"), build, signature=(bucket, pip, digits))
+
+
+def _as_price(value: Any) -> Optional[float]:
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return None
+    return price if price > 0 else None
+
+
+def _add(out: list[PriceLevel], value: Any, name: str, source: str) -> None:
+    price = _as_price(value)
+    if price is not None:
+        out.append(PriceLevel(price=price, name=name, source=source))
+
+
+def collect_key_levels(daily: Mapping | None, prev_day: Mapping | None) -> list[PriceLevel]:
+    """Các mức ngày dùng cho `key_levels_nearby`: PDH, PDL, EQ50_D, DO."""
+    out: list[PriceLevel] = []
+    if prev_day:
+        _add(out, prev_day.get("high"), "PDH", SOURCE_DAILY)
+        _add(out, prev_day.get("low"), "PDL", SOURCE_DAILY)
+    if daily:
+        _add(out, daily.get("eq50"), "EQ50_D", SOURCE_DAILY)
+        _add(out, daily.get("open"), "DO", SOURCE_DAILY)
+    return out
+
+
+def collect_levels_from_mt5_data(mt5_data: Mapping[str, Any]) -> list[PriceLevel]:
+    """Gom mọi mức giá từ payload `MT5_DATA` (ngày, tuần, số tròn, phiên, ICT) theo thứ tự ổn định."""
+    levels_block = mt5_data.get("levels") or {}
+    out = collect_key_levels(levels_block.get("daily"), levels_block.get("prev_day"))
+    for rl in mt5_data.get("round_levels") or []:
+        _add(out, rl.get("price"), f"ROUND_{rl.get('level', '')}", SOURCE_ROUND)
+    return out + collect_context_levels(mt5_data)
+
+
+def collect_context_levels(mt5_data: Mapping[str, Any]) -> list[PriceLevel]:
+    """Các mức tuần, phiên và ICT của payload (không gồm mức ngày và số tròn)."""
+    levels_block = mt5_data.get("levels") or {}
+    out: list[PriceLevel] = []
+    weekly = levels_block.get("weekly") or {}
+    prev_week = levels_block.get("prev_week") or {}
+    _add(out, weekly.get("high"), "WH", SOURCE_WEEKLY)
+    _add(out, weekly.get("low"), "WL", SOURCE_WEEKLY)
+    _add(out, prev_week.get("high"), "PWH", SOURCE_WEEKLY)
+    _add(out, prev_week.get("low"), "PWL", SOURCE_WEEKLY)
+
+    for key, value in (mt5_data.get("session_liquidity") or {}).items():
+        _add(out, value, key.upper(), SOURCE_SESSION)
+
+    patterns = mt5_data.get("ict_patterns") or {}
+    for tf in ("h1", "m15", "m5", "m1"):
+        tf_up = tf.upper()
+        for fvg in patterns.get(f"fvgs_{tf}") or []:
+            _add(out, fvg.get("top"), f"FVG_{fvg.get('type', '')}_{tf_up}_TOP", SOURCE_FVG)
+            _add(out, fvg.get("bottom"), f"FVG_{fvg.get('type', '')}_{tf_up}_BOTTOM", SOURCE_FVG)
+        for ob in patterns.get(f"order_blocks_{tf}") or []:
+            _add(out, ob.get("top"), f"OB_{ob.get('type', '')}_{tf_up}_TOP", SOURCE_ORDER_BLOCK)
+            _add(out, ob.get("bottom"), f"OB_{ob.get('type', '')}_{tf_up}_BOTTOM", SOURCE_ORDER_BLOCK)
+        liquidity = patterns.get(f"liquidity_{tf}") or {}
+        for lv in liquidity.get("swing_highs_BSL") or []:
+            _add(out, lv.get("price"), f"BSL_{tf_up}", SOURCE_LIQUIDITY)
+        for lv in liquidity.get("swing_lows_SSL") or []:
+            _add(out, lv.get("price"), f"SSL_{tf_up}", SOURCE_LIQUIDITY)
+    return out
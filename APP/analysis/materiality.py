@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Đánh giá mức độ thay đổi "đáng kể" của thị trường giữa snapshot hiện tại và snapshot đã dùng
+cho báo cáo hoàn chỉnh gần nhất, để autorun bỏ qua hoặc hạ cấp model khi không có gì mới.
+
+Mỗi snapshot `MT5_DATA` được rút gọn thành một `Fingerprint` nhỏ (giá, ATR M5, killzone, chế độ
+spread, tập khóa các đối tượng ICT, vị thế đang mở). Điểm thay đổi là tổng:
+- Giá di chuyển theo đơn vị ATR M5 (chặn ở `PRICE_CAP_ATR`).
+- Đối tượng ICT mới (FVG, OB, void, MSS) có trọng số theo timeframe, chặn ở `ICT_CAP`.
+- Chuyển killzone, đổi chế độ spread, thay đổi vị thế.
+Fingerprint được lưu cạnh báo cáo (`Reports/materiality_state.json`) nên so sánh chỉ là vài
+phép toán trên tập nhỏ — dưới 1 ms.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Mapping, Optional
+
+if TYPE_CHECKING:
+    from APP.configs.app_config import MaterialityConfig
+
+logger = logging.getLogger(__name__)
+
+STATE_FILENAME = "materiality_state.json"
+
+PRICE_CAP_ATR = 3.0
+ICT_CAP = 3.0
+ICT_TIMEFRAME_WEIGHTS: dict[str, float] = {"h1": 1.0, "m15": 0.75, "m5": 0.5, "m1": 0.25}
+ICT_KINDS = ("fvgs", "order_blocks", "liquidity_voids")
+KILLZONE_WEIGHT = 1.5
+SPREAD_REGIME_WEIGHT = 1.0
+POSITIONS_WEIGHT = 3.0
+
+DECISION_FULL = "full"
+DECISION_LIGHT = "light"
+DECISION_SKIP = "skip"
+
+
+def _num(value: Any) -> Optional[float]:
+    try:
+        out = float(value)
+    except (TypeError, ValueError):
+        return None
+    return out if math.isfinite(out) else None
+
+
+def _spread_regime(mt5_data: Mapping[str, Any]) -> Optional[str]:
+    """Phân loại spread theo % ATR M5: tight (<10%), normal (<25%), wide."""
+    pct = _num((mt5_data.get("atr_norm") or {}).get("spread_as_pct_of_atr_m5"))
+    if pct is None:
+        return None
+    if pct < 10:
+        return "tight"
+    return "normal" if pct < 25 else "wide"
+
+
+def _ict_keys(patterns: Mapping[str, Any], digits: int) -> frozenset[str]:
+    """Khóa định danh của các đối tượng ICT theo giá (không theo `bar_index` vốn trôi theo nến mới)."""
+    keys: set[str] = set()
+    for tf in ICT_TIMEFRAME_WEIGHTS:
+        for kind in ICT_KINDS:
+            for obj in patterns.get(f"{kind}_{tf}") or []:
+                if not isinstance(obj, Mapping):
+                    continue
+                top, bottom = _num(obj.get("top")), _num(obj.get("bottom"))
+                if top is None or bottom is None:
+                    continue
+                keys.add(f"{tf}:{kind}:{obj.get('type')}:{top:.{digits}f}:{bottom:.{digits}f}")
+        mss = patterns.get(f"mss_{tf}")
+        if isinstance(mss, Mapping) and mss.get("type"):
+            level = _num(mss.get("price_level"))
+            level_txt = f"{level:.{digits}f}" if level is not None else "?"
+            keys.add(f"{tf}:mss:{mss.get('type')}:{mss.get('event') or ''}:{level_txt}")
+    return frozenset(keys)
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """Bản rút gọn của một snapshot, đủ để chấm điểm thay đổi."""
+
+    symbol: str
+    price: Optional[float]
+    atr: Optional[float]
+    killzone: Optional[str]
+    spread_regime: Optional[str]
+    ict: frozenset[str] = frozenset()
+    positions: tuple[tuple[Any, ...], ...] = ()
+
+    @classmethod
+    def from_snapshot(cls, mt5_data: Mapping[str, Any]) -> "Fingerprint":
+        tick = mt5_data.get("tick") or {}
+        info = mt5_data.get("info") or {}
+        digits = int(_num(info.get("digits")) or 5)
+        positions = tuple(
+            sorted(
+                (
+                    int(p.get("ticket") or 0),
+                    _num(p.get("volume")),
+                    _num(p.get("sl")),
+                    _num(p.get("tp")),
+                )
+                for p in mt5_data.get("positions") or []
+                if isinstance(p, Mapping)
+            )
+        )
+        return cls(
+            symbol=str(mt5_data.get("symbol") or ""),
+            price=_num(tick.get("bid")) or _num(tick.get("last")),
+            atr=_num(((mt5_data.get("volatility") or {}).get("ATR") or {}).get("M5")),
+            killzone=mt5_data.get("killzone_active"),
+            spread_regime=_spread_regime(mt5_data),
+            ict=_ict_keys(mt5_data.get("ict_patterns") or {}, digits),
+            positions=positions,
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "symbol": self.symbol,
+            "price": self.price,
+            "atr": self.atr,
+            "killzone": self.killzone,
+            "spread_regime": self.spread_regime,
+            "ict": sorted(self.ict),
+            "positions": [list(p) for p in self.positions],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "Fingerprint":
+        return cls(
+            symbol=str(data.get("symbol") or ""),
+            price=_num(data.get("price")),
+            atr=_num(data.get("atr")),
+            killzone=data.get("killzone"),
+            spread_regime=data.get("spread_regime"),
+            ict=frozenset(data.get("ict") or ()),
+            positions=tuple(tuple(p) for p in data.get("positions") or ()),
+        )
+
+
+@dataclass(frozen=True)
+class MaterialityResult:
+    """Điểm thay đổi và quyết định cho phiên hiện tại."""
+
+    score: float
+    decision: str
+    components: dict[str, float] = field(default_factory=dict)
+    reasons: tuple[str, ...] = ()
+    previous_age_min: Optional[float] = None
+
+    def summary(self) -> str:
+        detail = "; ".join(self.reasons) if self.reasons else "không có thay đổi đáng kể"
+        return f"điểm thay đổi {self.score:.2f} ({detail})"
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "score": round(self.score, 3) if math.isfinite(self.score) else None,
+            "decision": self.decision,
+            "components": {k: round(v, 3) for k, v in self.components.items()},
+            "reasons": list(self.reasons),
+            "previous_age_min": None if self.previous_age_min is None else round(self.previous_age_min, 1),
+        }
+
+
+def score_change(previous: Fingerprint, current: Fingerprint) -> tuple[float, dict[str, float], list[str]]:
+    """Chấm điểm thay đổi giữa hai fingerprint; trả về (điểm, thành phần, lý do)."""
+    components: dict[str, float] = {}
+    reasons: list[str] = []
+
+    atr = current.atr or previous.atr
+    if current.price is not None and previous.price is not None and atr:
+        moved = abs(current.price - previous.price) / atr
+        components["price"] = min(moved, PRICE_CAP_ATR)
+        if moved >= 0.25:
+            reasons.append(f"giá đi {moved:.2f} ATR")
+
+    new_objects = current.ict - previous.ict
+    if new_objects:
+        weight = sum(ICT_TIMEFRAME_WEIGHTS.get(key.split(":", 1)[0], 0.25) for key in new_objects)
+        components["ict"] = min(weight, ICT_CAP)
+        reasons.append(f"{len(new_objects)} đối tượng ICT mới")
+
+    if current.killzone != previous.killzone:
+        components["killzone"] = KILLZONE_WEIGHT
+        reasons.append(f"killzone {previous.killzone or '-'} -> {current.killzone or '-'}")
+
+    if current.spread_regime != previous.spread_regime and None not in (current.spread_regime, previous.spread_regime):
+        components["spread"] = SPREAD_REGIME_WEIGHT
+        reasons.append(f"spread {previous.spread_regime} -> {current.spread_regime}")
+
+    if current.positions != previous.positions:
+        components["positions"] = POSITIONS_WEIGHT
+        reasons.append("vị thế thay đổi")
+
+    return sum(components.values()), components, reasons
+
+
+def evaluate(
+    cfg: "MaterialityConfig",
+    current: Fingerprint,
+    previous: Optional[Fingerprint],
+    previous_at: Optional[float] = None,
+    now: Optional[float] = None,
+) -> MaterialityResult:
+    """Quyết định chạy đầy đủ / hạ cấp model / bỏ qua cho snapshot hiện tại."""
+    now = time.time() if now is None else now
+    age_min = (now - previous_at) / 60.0 if previous_at is not None else None
+    if previous is None or previous.symbol != current.symbol:
+        return MaterialityResult(math.inf, DECISION_FULL, reasons=("chưa có báo cáo trước để so sánh",))
+
+    score, components, reasons = score_change(previous, current)
+    if age_min is not None and cfg.max_skip_min > 0 and age_min >= cfg.max_skip_min:
+        decision = DECISION_FULL
+        reasons.append(f"báo cáo trước đã {age_min:.0f} phút")
+    elif score >= cfg.full_above:
+        decision = DECISION_FULL
+    elif score >= cfg.skip_below and cfg.light_model:
+        decision = DECISION_LIGHT
+    elif score >= cfg.skip_below:
+        decision = DECISION_FULL
+    else:
+        decision = DECISION_SKIP
+    return MaterialityResult(score, decision, components, tuple(reasons), age_min)
+
+
+def load_state(reports_dir: Path) -> tuple[Optional[Fingerprint], Optional[float]]:
+    """Fingerprint và thời điểm (epoch) của báo cáo hoàn chỉnh gần nhất trong `reports_dir`."""
+    path = Path(reports_dir) / STATE_FILENAME
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None, None
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Không đọc được {path}: {e}")
+        return None, None
+    return Fingerprint.from_dict(data.get("fingerprint") or {}), _num(data.get("saved_at"))
+
+
+def save_state(reports_dir: Path, fingerprint: Fingerprint, now: Optional[float] = None) -> None:
+    """Lưu fingerprint của snapshot vừa dùng cho một báo cáo hoàn chỉnh."""
+    path = Path(reports_dir) / STATE_FILENAME
+    payload = {"saved_at": time.time() if now is None else now, "fingerprint": fingerprint.to_dict()}
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+    except OSError as e:
+        logger.warning(f"Không thể lưu trạng thái materiality vào {path}: {e}")
@@ -40,24 +40,20 @@ def select_prompt(
     # `prompt_entry_run` có thể sẽ bị loại bỏ trong tương lai.
     return prompt_no_entry
 
-def construct_prompt(
+def construct_prompt_parts(
     app: "AnalysisUi",
     prompt: str,
     mt5_dict: Dict[str, Any],
     context_block: str,
     paths: List[str],
-) -> str:
+) -> tuple[str, str]:
     """
-    Xây dựng prompt cuối cùng bằng cách kết hợp các thành phần.
-    """
-    logger.debug("Bắt đầu xây dựng prompt cuối cùng.")
-    
-    # Thêm thông tin context và MT5 vào prompt
-    # (Đây là một cấu trúc ví dụ, có thể cần điều chỉnh)
-    final_prompt = f"""
-{prompt}
+    Tách prompt thành (phần tĩnh, phần động).
 
----
+    Phần tĩnh là nội dung file prompt (hướng dẫn, quy tắc) — ổn định giữa các lần chạy nên có
+    thể đưa vào context cache; phần động gồm dữ liệu MT5 và bối cảnh của phiên hiện tại.
+    """
+    dynamic_part = f"""---
 **Dữ liệu thị trường và tài khoản (MT5):**
 ```json
 {mt5_dict}
@@ -70,5 +66,21 @@ def construct_prompt(
 ---
 **Phân tích các hình ảnh được cung cấp.**
 """
+    return prompt, dynamic_part
+
+
+def construct_prompt(
+    app: "AnalysisUi",
+    prompt: str,
+    mt5_dict: Dict[str, Any],
+    context_block: str,
+    paths: List[str],
+) -> str:
+    """
+    Xây dựng prompt cuối cùng bằng cách kết hợp các thành phần.
+    """
+    logger.debug("Bắt đầu xây dựng prompt cuối cùng.")
+    static_part, dynamic_part = construct_prompt_parts(app, prompt, mt5_dict, context_block, paths)
+    final_prompt = f"{static_part}\n\n{dynamic_part}"
     logger.debug("Đã xây dựng xong prompt cuối cùng.")
     return final_prompt.strip()
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Khối thống kê phiên (session statistics cube) dựng từ kho nến cục bộ.
+
+Mỗi ngày đã đóng trong kho được rút gọn thành một bản ghi cố định (`DAY_RECORD_DTYPE`):
+high/low ngày, giờ tạo high/low, high/low của từng phiên (Asia, London, NY AM/PM) và việc phiên
+đó có quét high/low của phiên liền trước hay không. Bản ghi được lưu cạnh kho nến
+(`<root>/<symbol>/session_stats_<TF>.npz`) và chỉ được bổ sung khi có ngày mới đóng.
+
+Từ các bản ghi, khối thống kê được tính sẵn cho mọi khóa (thứ, phiên, tháng), kể cả khóa gộp
+(`ALL_WEEKDAYS`, `ALL_MONTHS`): phân vị biên độ, xác suất quét high/low phiên trước và phân bố
+giờ tạo high/low của ngày. Truy vấn khi dựng context chỉ là tra dict — O(1).
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Mapping, Optional
+
+import numpy as np
+
+from APP.analysis.ict_analyzer import SESSION_NAMES
+from APP.persistence import bar_archive
+
+logger = logging.getLogger(__name__)
+
+Schedule = Callable[[datetime], Mapping[str, Mapping[str, str]]]
+
+DAY = "day"
+ALL_WEEKDAYS = -1
+ALL_MONTHS = 0
+PERCENTILES = (25, 50, 75, 90)
+MIN_SAMPLES = 8
+WEEKDAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+DAY_RECORD_DTYPE = np.dtype(
+    [
+        ("day", "<i8"),
+        ("weekday", "i1"),
+        ("month", "i1"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("high_hour", "i1"),
+        ("low_hour", "i1"),
+        *[(f"{s}_{col}", "<f8") for s in SESSION_NAMES for col in ("high", "low")],
+        *[(f"{s}_start", "<i8") for s in SESSION_NAMES],
+        # -1: không xác định (không có phiên trước), 0/1: không quét / có quét.
+        *[(f"{s}_took_{col}", "i1") for s in SESSION_NAMES for col in ("high", "low")],
+    ]
+)
+
+
+def _hhmm_to_minutes(value: str) -> int:
+    return int(value[:2]) * 60 + int(value[3:5])
+
+
+def _default_schedule(d: datetime) -> Mapping[str, Mapping[str, str]]:
+    from APP.services import mt5_service
+
+    return mt5_service.session_ranges_today(None, reference_time=d)
+
+
+def build_day_records(
+    bars: np.ndarray,
+    schedule: Schedule,
+    *,
+    until_day: Optional[int] = None,
+    previous: Optional[tuple[float, float]] = None,
+) -> np.ndarray:
+    """
+    Rút gọn nến (cột time/high/low, epoch giây giờ broker) thành bản ghi theo ngày.
+
+    Chỉ các ngày `< until_day` (số ngày kể từ epoch) được dựng. `previous` là (high, low) của
+    phiên cuối cùng trước dữ liệu này, để nối tiếp việc đánh dấu quét phiên trước.
+    """
+    if len(bars) == 0:
+        return np.empty(0, dtype=DAY_RECORD_DTYPE)
+    times = bars["time"].astype(np.int64)
+    highs = bars["high"].astype(np.float64)
+    lows = bars["low"].astype(np.float64)
+    days = times // 86400
+    unique_days, starts = np.unique(days, return_index=True)
+    if until_day is not None:
+        keep = unique_days < until_day
+        unique_days, starts = unique_days[keep], starts[keep]
+    if unique_days.size == 0:
+        return np.empty(0, dtype=DAY_RECORD_DTYPE)
+    ends = np.append(starts[1:], np.searchsorted(days, unique_days[-1], "right"))
+
+    out = np.zeros(unique_days.size, dtype=DAY_RECORD_DTYPE)
+    occurrences: list[tuple[int, int, str]] = []
+    for i, (day, lo, hi) in enumerate(zip(unique_days.tolist(), starts.tolist(), ends.tolist())):
+        date = datetime.fromtimestamp(day * 86400, timezone.utc)
+        rec = out[i]
+        rec["day"], rec["weekday"], rec["month"] = day, date.weekday(), date.month
+        i_hi = lo + int(np.argmax(highs[lo:hi]))
+        i_lo = lo + int(np.argmin(lows[lo:hi]))
+        rec["high"], rec["low"] = highs[i_hi], lows[i_lo]
+        rec["high_hour"] = (times[i_hi] % 86400) // 3600
+        rec["low_hour"] = (times[i_lo] % 86400) // 3600
+
+        sessions = schedule(date.replace(hour=12)) or {}
+        for name in SESSION_NAMES:
+            rec[f"{name}_high"] = rec[f"{name}_low"] = np.nan
+            rec[f"{name}_took_high"] = rec[f"{name}_took_low"] = -1
+            rng = sessions.get(name) or {}
+            if not rng.get("start") or not rng.get("end"):
+                continue
+            st, ed = _hhmm_to_minutes(rng["start"]), _hhmm_to_minutes(rng["end"])
+            t0 = day * 86400 + st * 60
+            t1 = day * 86400 + ed * 60 + (86400 if st > ed else 0)
+            a, b = np.searchsorted(times, [t0, t1], "left")
+            if b > a:
+                rec[f"{name}_high"] = highs[a:b].max()
+                rec[f"{name}_low"] = lows[a:b].min()
+                rec[f"{name}_start"] = t0
+                occurrences.append((t0, i, name))
+
+    occurrences.sort()
+    prev = previous
+    for _, i, name in occurrences:
+        rec = out[i]
+        cur = (float(rec[f"{name}_high"]), float(rec[f"{name}_low"]))
+        if prev is not None:
+            rec[f"{name}_took_high"] = int(cur[0] > prev[0])
+            rec[f"{name}_took_low"] = int(cur[1] < prev[1])
+        prev = cur
+    return out
+
+
+def _last_session(record: np.void) -> Optional[tuple[float, float]]:
+    """(high, low) của phiên diễn ra muộn nhất trong một bản ghi ngày."""
+    best: Optional[tuple[int, str]] = None
+    for name in SESSION_NAMES:
+        start = int(record[f"{name}_start"])
+        if start and (best is None or start > best[0]):
+            best = (start, name)
+    if best is None:
+        return None
+    return float(record[f"{best[1]}_high"]), float(record[f"{best[1]}_low"])
+
+
+@dataclass(frozen=True)
+class CellStats:
+    """Thống kê của một ô (thứ, phiên, tháng)."""
+
+    n: int
+    range_pct: dict[int, float] = field(default_factory=dict)
+    p_take_prev_high: Optional[float] = None
+    p_take_prev_low: Optional[float] = None
+    high_hour_probs: tuple[float, ...] = ()
+    low_hour_probs: tuple[float, ...] = ()
+    sorted_ranges: np.ndarray = field(default_factory=lambda: np.empty(0), repr=False, compare=False)
+
+    def percentile_of(self, value: float) -> Optional[float]:
+        """Phân vị (0-100) của `value` trong phân bố biên độ của ô."""
+        if not self.n:
+            return None
+        return float(np.searchsorted(self.sorted_ranges, value, "right")) / self.n * 100.0
+
+    def to_dict(self) -> dict[str, Any]:
+        out: dict[str, Any] = {"n": self.n, **{f"range_p{p}": v for p, v in self.range_pct.items()}}
+        if self.p_take_prev_high is not None:
+            out["p_take_prev_high"] = round(self.p_take_prev_high, 3)
+            out["p_take_prev_low"] = round(self.p_take_prev_low or 0.0, 3)
+        for key, probs in (("high_hour_top", self.high_hour_probs), ("low_hour_top", self.low_hour_probs)):
+            if probs:
+                order = np.argsort(probs)[::-1][:3]
+                out[key] = [{"hour": int(h), "p": round(probs[h], 3)} for h in order if probs[h] > 0]
+        return out
+
+
+def _cell(records: np.ndarray, session: str) -> CellStats:
+    if session == DAY:
+        highs, lows = records["high"], records["low"]
+    else:
+        highs, lows = records[f"{session}_high"], records[f"{session}_low"]
+    ranges = highs - lows
+    ranges = np.sort(ranges[np.isfinite(ranges)])
+    if ranges.size == 0:
+        return CellStats(0)
+    pct = {p: float(v) for p, v in zip(PERCENTILES, np.percentile(ranges, PERCENTILES))}
+    if session == DAY:
+        high_hours = np.bincount(records["high_hour"].astype(np.int64), minlength=24)[:24] / len(records)
+        low_hours = np.bincount(records["low_hour"].astype(np.int64), minlength=24)[:24] / len(records)
+        return CellStats(
+            int(ranges.size), pct, None, None, tuple(high_hours.tolist()), tuple(low_hours.tolist()), ranges
+        )
+    took_high, took_low = records[f"{session}_took_high"], records[f"{session}_took_low"]
+    known = took_high >= 0
+    p_high = float(took_high[known].mean()) if known.any() else None
+    p_low = float(took_low[known].mean()) if known.any() else None
+    return CellStats(int(ranges.size), pct, p_high, p_low, sorted_ranges=ranges)
+
+
+def build_cube(records: np.ndarray) -> dict[tuple[int, str, int], CellStats]:
+    """Tính sẵn thống kê cho mọi khóa (thứ | ALL, phiên | DAY, tháng | ALL)."""
+    cube: dict[tuple[int, str, int], CellStats] = {}
+    if len(records) == 0:
+        return cube
+    weekdays = records["weekday"]
+    months = records["month"]
+    for wd in (ALL_WEEKDAYS, *np.unique(weekdays).tolist()):
+        wd_mask = np.ones(len(records), bool) if wd == ALL_WEEKDAYS else weekdays == wd
+        for month in (ALL_MONTHS, *np.unique(months[wd_mask]).tolist()):
+            mask = wd_mask if month == ALL_MONTHS else wd_mask & (months == month)
+            subset = records[mask]
+            for session in (DAY, *SESSION_NAMES):
+                cube[(int(wd), session, int(month))] = _cell(subset, session)
+    return cube
+
+
+class SessionStatsCube:
+    """Khối thống kê phiên cho một symbol, bổ sung tăng dần từ `bar_archive.BarArchive`."""
+
+    def __init__(
+        self,
+        symbol: str,
+        timeframe: str = "M15",
+        *,
+        schedule: Optional[Schedule] = None,
+        signature: str = "",
+        root: Optional[Path] = None,
+    ) -> None:
+        self.archive = bar_archive.BarArchive(symbol, timeframe, root=root)
+        self.path = self.archive.path.parent / f"session_stats_{timeframe}.npz"
+        self.schedule = schedule or _default_schedule
+        self.signature = signature
+        self._lock = threading.Lock()
+        self.records = self._load()
+        self._cube = build_cube(self.records)
+
+    # region Lưu trữ
+    def _load(self) -> np.ndarray:
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                records = data["records"]
+        except FileNotFoundError:
+            return np.empty(0, dtype=DAY_RECORD_DTYPE)
+        except Exception as e:
+            logger.warning(f"Không đọc được thống kê phiên {self.path}: {e}")
+            return np.empty(0, dtype=DAY_RECORD_DTYPE)
+        if records.dtype != DAY_RECORD_DTYPE or meta.get("signature") != self.signature:
+            logger.info(f"Lịch phiên hoặc định dạng đã đổi, dựng lại thống kê phiên {self.archive.symbol}.")
+            return np.empty(0, dtype=DAY_RECORD_DTYPE)
+        return records
+
+    def _save(self) -> None:
+        buf = io.BytesIO()
+        np.savez(buf, records=self.records, meta=np.array(json.dumps({"signature": self.signature})))
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_bytes(buf.getvalue())
+            tmp.replace(self.path)
+        except OSError as e:
+            logger.warning(f"Không thể lưu thống kê phiên {self.path}: {e}")
+
+    # endregion
+
+    # region Cập nhật
+    def update(self) -> int:
+        """Bổ sung các ngày đã đóng chưa có bản ghi; trả về số ngày mới."""
+        with self._lock:
+            last_time = self.archive.last_time()
+            if last_time is None:
+                return 0
+            until_day = last_time // 86400
+            start_day = int(self.records["day"][-1]) + 1 if len(self.records) else None
+            if start_day is not None and start_day >= until_day:
+                return 0
+            bars = self.archive.read(
+                start=start_day * 86400 if start_day is not None else None, columns=("time", "high", "low")
+            )
+            previous = _last_session(self.records[-1]) if len(self.records) else None
+            new = build_day_records(bars, self.schedule, until_day=until_day, previous=previous)
+            if not len(new):
+                return 0
+            self.records = np.concatenate([self.records, new])
+            self._cube = build_cube(self.records)
+            self._save()
+            logger.debug(f"Đã thêm {len(new)} ngày vào thống kê phiên {self.archive.symbol}.")
+            return len(new)
+
+    # endregion
+
+    # region Truy vấn
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def lookup(self, weekday: int, session: str, month: int, min_samples: int = MIN_SAMPLES) -> Optional[CellStats]:
+        """Ô (thứ, phiên, tháng); lùi dần về khóa gộp khi ô quá ít mẫu."""
+        for key in ((weekday, session, month), (weekday, session, ALL_MONTHS), (ALL_WEEKDAYS, session, month)):
+            cell = self._cube.get(key)
+            if cell is not None and cell.n >= min_samples:
+                return cell
+        cell = self._cube.get((ALL_WEEKDAYS, session, ALL_MONTHS))
+        return cell if cell is not None and cell.n else None
+
+    def adr(self) -> Optional[dict[str, Optional[float]]]:
+        """ADR 5/10/20 ngày đã đóng, cùng định dạng `mt5_service.adr_stats`."""
+        if len(self.records) < 5:
+            return None
+        ranges = self.records["high"] - self.records["low"]
+
+        def _avg(m: int) -> Optional[float]:
+            return float(ranges[-m:].mean()) if len(ranges) >= m else None
+
+        return {"d5": _avg(5), "d10": _avg(10), "d20": _avg(20)}
+
+    def context(self, now: datetime, day_range: Optional[float] = None) -> dict[str, Any]:
+        """Khối `session_stats` cho payload MT5_DATA tại thời điểm `now` (giờ broker)."""
+        if not len(self.records):
+            return {}
+        weekday, month = now.weekday(), now.month
+        out: dict[str, Any] = {"days": len(self.records), "weekday": WEEKDAY_NAMES[weekday], "month": month}
+        daily = self.lookup(weekday, DAY, month)
+        if daily is not None:
+            out["daily"] = daily.to_dict()
+            if day_range is not None:
+                out["day_range_percentile"] = daily.percentile_of(day_range)
+        out["sessions"] = {
+            name: cell.to_dict() for name in SESSION_NAMES if (cell := self.lookup(weekday, name, month)) is not None
+        }
+        return out
+
+    # endregion
+
+
+_cubes: dict[tuple[str, str, str], SessionStatsCube] = {}
+_cubes_guard = threading.Lock()
+
+
+def get_cube(
+    symbol: str,
+    timeframe: str = "M15",
+    *,
+    schedule: Optional[Schedule] = None,
+    signature: str = "",
+) -> SessionStatsCube:
+    """Instance dùng chung cho mỗi (symbol, timeframe, lịch phiên) trong tiến trình."""
+    key = (symbol, timeframe, signature)
+    with _cubes_guard:
+        cube = _cubes.get(key)
+        if cube is None:
+            cube = _cubes[key] = SessionStatsCube(symbol, timeframe, schedule=schedule, signature=signature)
+        return cube
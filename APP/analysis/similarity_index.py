@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+"""
+Chỉ mục tương đồng cho các vector trạng thái thị trường (`vector_database.jsonl`).
+
+- `SimilarityIndex`: ma trận float32 phẳng trong RAM, truy vấn top-k theo lô bằng một
+  phép nhân ma trận + `argpartition` (cosine hoặc L2). Có thể bật phân vùng thô IVF
+  (k-means) để chỉ quét `n_probe` cụm gần nhất khi số lượng vector rất lớn.
+- `VectorStore`: gắn chỉ mục với file `vector_database.jsonl` trong thư mục Reports.
+  File JSONL là nhật ký chỉ-ghi-thêm (nguồn dữ liệu gốc); thư mục `vector_index/` chứa
+  snapshot `.npy` của ma trận và vị trí byte của từng dòng. Khi mở, snapshot được nạp
+  trực tiếp và chỉ phần nhật ký ghi sau snapshot mới phải parse lại. Khi số vector vượt
+  `IVF_MIN_ROWS`, IVF được dựng lúc ghi snapshot (và dựng lại mỗi khi số hàng gấp đôi).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Mapping, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METRIC_COSINE = "cosine"
+METRIC_L2 = "l2"
+
+LOG_FILENAME = "vector_database.jsonl"
+INDEX_DIRNAME = "vector_index"
+IVF_MIN_ROWS = 50_000  # dưới ngưỡng này quét phẳng đủ nhanh, không cần IVF
+
+
+class SimilarityIndex:
+    """Ma trận vector phẳng với truy vấn top-k theo lô và IVF tùy chọn."""
+
+    def __init__(self, dim: int, metric: str = METRIC_COSINE) -> None:
+        if metric not in (METRIC_COSINE, METRIC_L2):
+            raise ValueError(f"Metric không hỗ trợ: {metric}")
+        self.dim = int(dim)
+        self.metric = metric
+        self._data = np.empty((0, self.dim), dtype=np.float32)
+        self._sq = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.empty(0, dtype=np.int32)
+        self._lists: Optional[tuple[np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._data[: self._size]
+
+    @property
+    def has_ivf(self) -> bool:
+        return self._centroids is not None
+
+    def _prepare(self, vectors: Any) -> np.ndarray:
+        v = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if v.shape[1] != self.dim:
+            raise ValueError(f"Vector có {v.shape[1]} chiều, chỉ mục yêu cầu {self.dim}.")
+        if self.metric == METRIC_COSINE:
+            norms = np.linalg.norm(v, axis=1, keepdims=True)
+            v = np.divide(v, norms, out=np.zeros_like(v), where=norms > 0)
+        return v
+
+    def add(self, vectors: Any) -> np.ndarray:
+        """Thêm một hoặc nhiều vector, trả về chỉ số hàng được cấp."""
+        v = self._prepare(vectors)
+        n = v.shape[0]
+        needed = self._size + n
+        if needed > self._data.shape[0]:
+            capacity = max(needed, 2 * self._data.shape[0], 1024)
+            data = np.empty((capacity, self.dim), dtype=np.float32)
+            data[: self._size] = self._data[: self._size]
+            sq = np.empty(capacity, dtype=np.float32)
+            sq[: self._size] = self._sq[: self._size]
+            self._data, self._sq = data, sq
+        self._data[self._size : needed] = v
+        self._sq[self._size : needed] = np.einsum("ij,ij->i", v, v)
+        rows = np.arange(self._size, needed)
+        self._size = needed
+        if self._centroids is not None:
+            self._assign = np.concatenate([self._assign, self._nearest_centroids(v, 1)[:, 0]])
+            self._lists = None
+        return rows
+
+    # region Khoảng cách
+    def _distances(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        data = self.vectors if rows is None else self._data[rows]
+        if self.metric == METRIC_COSINE:
+            return 1.0 - q @ data.T
+        sq = self._sq[: self._size] if rows is None else self._sq[rows]
+        d = sq[None, :] - 2.0 * (q @ data.T) + np.einsum("ij,ij->i", q, q)[:, None]
+        return np.maximum(d, 0.0)
+
+    @staticmethod
+    def _top_k(dist: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        k = min(k, dist.shape[1])
+        if k <= 0:
+            empty = np.empty((dist.shape[0], 0))
+            return empty.astype(np.int64), empty
+        if k < dist.shape[1]:
+            part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(dist.shape[1]), (dist.shape[0], 1))
+        part_d = np.take_along_axis(dist, part, axis=1)
+        order = np.argsort(part_d, axis=1, kind="stable")
+        return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_d, order, axis=1)
+    # endregion
+
+    def search(
+        self, queries: Any, k: int = 10, n_probe: int = 4, allowed: Optional[np.ndarray] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k cho một lô truy vấn. Trả về (rows, distances) kích thước (m, k), sắp xếp tăng
+        dần theo khoảng cách (cosine: 1 - cos; L2: bình phương khoảng cách). Hàng thiếu
+        (ít hơn k ứng viên) được điền -1 / inf. `allowed` (mảng bool theo hàng) loại các
+        hàng không được phép trả về.
+        """
+        q = self._prepare(queries)
+        m = q.shape[0]
+        rows_out = np.full((m, k), -1, dtype=np.int64)
+        dist_out = np.full((m, k), np.inf, dtype=np.float64)
+        if self._size == 0 or k <= 0:
+            return rows_out, dist_out
+
+        if self._centroids is None:
+            dist_all = self._distances(q)
+            if allowed is not None:
+                dist_all = np.where(allowed[: self._size][None, :], dist_all, np.inf)
+            rows, dist = self._top_k(dist_all, k)
+            rows = np.where(np.isinf(dist), -1, rows)
+            rows_out[:, : rows.shape[1]] = rows
+            dist_out[:, : dist.shape[1]] = dist
+            return rows_out, dist_out
+
+        order, bounds = self._list_rows()
+        probes = self._nearest_centroids(q, n_probe)
+        for i in range(m):
+            cand = np.concatenate([order[bounds[c] : bounds[c + 1]] for c in probes[i]])
+            if allowed is not None:
+                cand = cand[allowed[cand]]
+            if cand.size == 0:
+                continue
+            local, dist = self._top_k(self._distances(q[i : i + 1], cand), k)
+            rows_out[i, : local.shape[1]] = cand[local[0]]
+            dist_out[i, : dist.shape[1]] = dist[0]
+        return rows_out, dist_out
+
+    # region IVF
+    def _nearest_centroids(self, v: np.ndarray, n: int) -> np.ndarray:
+        c = self._centroids
+        d = np.einsum("ij,ij->i", c, c)[None, :] - 2.0 * (v @ c.T)
+        n = min(n, c.shape[0])
+        return np.argsort(d, axis=1)[:, :n]
+
+    def _list_rows(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self._assign, kind="stable")
+            bounds = np.searchsorted(self._assign[order], np.arange(self._centroids.shape[0] + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def build_ivf(self, n_lists: Optional[int] = None, n_iter: int = 10, sample: int = 20_000, seed: int = 0) -> None:
+        """Phân cụm k-means (Lloyd) trên một mẫu vector rồi gán mọi hàng vào cụm gần nhất."""
+        if self._size == 0:
+            return
+        n_lists = int(n_lists or max(1, int(np.sqrt(self._size))))
+        rng = np.random.default_rng(seed)
+        data = self.vectors
+        pick = rng.choice(self._size, size=min(sample, self._size), replace=False)
+        x = data[pick]
+        centroids = x[rng.choice(x.shape[0], size=min(n_lists, x.shape[0]), replace=False)].copy()
+        x_sq = np.einsum("ij,ij->i", x, x)
+        for _ in range(max(1, n_iter)):
+            d = x_sq[:, None] - 2.0 * (x @ centroids.T) + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+            labels = d.argmin(axis=1)
+            counts = np.bincount(labels, minlength=centroids.shape[0])
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, x)
+            empty = counts == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.maximum(counts, 1)[:, None]).astype(np.float32)
+            if empty.any():
+                centroids[empty] = x[rng.choice(x.shape[0], size=int(empty.sum()))]
+        self._centroids = centroids
+        self._assign = self._nearest_centroids(data, 1)[:, 0].astype(np.int32)
+        self._lists = None
+        logger.debug(f"Đã dựng IVF với {centroids.shape[0]} cụm cho {self._size} vector.")
+    # endregion
+
+    # region Lưu / nạp
+    def save(self, directory: Path) -> None:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        _save_npy(directory / "vectors.npy", self.vectors)
+        if self._centroids is not None:
+            _save_npy(directory / "centroids.npy", self._centroids)
+            _save_npy(directory / "assign.npy", self._assign)
+        else:
+            for name in ("centroids.npy", "assign.npy"):
+                (directory / name).unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, directory: Path, metric: str = METRIC_COSINE) -> "SimilarityIndex":
+        directory = Path(directory)
+        vectors = np.load(directory / "vectors.npy")
+        index = cls(vectors.shape[1], metric)
+        # Vector đã được chuẩn hóa khi lưu; nạp thẳng để tránh chuẩn hóa lại.
+        index._data = np.ascontiguousarray(vectors, dtype=np.float32)
+        index._sq = np.einsum("ij,ij->i", index._data, index._data)
+        index._size = vectors.shape[0]
+        if (directory / "centroids.npy").exists() and (directory / "assign.npy").exists():
+            assign = np.load(directory / "assign.npy")
+            if assign.shape[0] == index._size:
+                index._centroids = np.load(directory / "centroids.npy")
+                index._assign = assign
+        return index
+    # endregion
+
+
+def _save_npy(path: Path, arr: np.ndarray) -> None:
+    tmp = path.with_suffix(".tmp.npy")
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+class VectorStore:
+    """Chỉ mục tương đồng gắn với nhật ký `vector_database.jsonl` của một thư mục Reports."""
+
+    def __init__(
+        self,
+        reports_dir: Path,
+        feature_names: Sequence[str],
+        metric: str = METRIC_COSINE,
+        compact_every: int = 500,
+        ivf_min_rows: int = IVF_MIN_ROWS,
+    ) -> None:
+        self.reports_dir = Path(reports_dir)
+        self.log_path = self.reports_dir / LOG_FILENAME
+        self.index_dir = self.reports_dir / INDEX_DIRNAME
+        self.feature_names = tuple(feature_names)
+        self.metric = metric
+        self.compact_every = max(1, int(compact_every))
+        self.ivf_min_rows = max(1, int(ivf_min_rows))
+        self.index = SimilarityIndex(len(self.feature_names), metric)
+        self._offsets: list[int] = []
+        # Thời điểm (epoch UTC) và mã symbol của từng hàng, dùng để lọc khi truy vấn.
+        self._times = np.empty(0, dtype=np.int64)
+        self._symbol_ids = np.empty(0, dtype=np.int32)
+        self._symbols: list[str] = []
+        self._log_bytes = 0
+        self._snapshot_rows = 0
+        self._ivf_rows = 0
+        self._lock = threading.RLock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _state(self) -> dict[str, Any]:
+        return {
+            "rows": len(self.index),
+            "log_bytes": self._log_bytes,
+            "metric": self.metric,
+            "features": list(self.feature_names),
+            "symbols": self._symbols,
+            "ivf_rows": self._ivf_rows if self.index.has_ivf else 0,
+        }
+
+    def _reset(self) -> None:
+        self.index = SimilarityIndex(len(self.feature_names), self.metric)
+        self._offsets, self._log_bytes, self._snapshot_rows, self._ivf_rows = [], 0, 0, 0
+        self._times = np.empty(0, dtype=np.int64)
+        self._symbol_ids = np.empty(0, dtype=np.int32)
+        self._symbols = []
+
+    def _load(self) -> None:
+        state_path = self.index_dir / "state.json"
+        log_size = self.log_path.stat().st_size if self.log_path.exists() else 0
+        try:
+            if state_path.exists():
+                state = json.loads(state_path.read_text(encoding="utf-8"))
+                compatible = (
+                    state.get("features") == list(self.feature_names)
+                    and state.get("metric") == self.metric
+                    and isinstance(state.get("symbols"), list)
+                    and int(state.get("log_bytes", 0)) <= log_size
+                )
+                if compatible:
+                    index = SimilarityIndex.load(self.index_dir, self.metric)
+                    offsets = np.load(self.index_dir / "offsets.npy")
+                    times = np.load(self.index_dir / "times.npy")
+                    symbol_ids = np.load(self.index_dir / "symbols.npy")
+                    rows = int(state.get("rows", -1))
+                    if len(index) == rows == offsets.shape[0] == times.shape[0] == symbol_ids.shape[0]:
+                        self.index = index
+                        self._offsets = offsets.tolist()
+                        self._times = times.astype(np.int64)
+                        self._symbol_ids = symbol_ids.astype(np.int32)
+                        self._symbols = [str(s) for s in state["symbols"]]
+                        self._log_bytes = int(state["log_bytes"])
+                        self._snapshot_rows = len(index)
+                        self._ivf_rows = int(state.get("ivf_rows", 0))
+        except Exception as e:
+            logger.warning(f"Không thể nạp snapshot chỉ mục vector, sẽ dựng lại từ nhật ký: {e}")
+            self._reset()
+        replayed = self._replay_log()
+        logger.debug(
+            f"VectorStore {self.reports_dir}: {len(self.index)} vector "
+            f"({self._snapshot_rows} từ snapshot, {replayed} từ nhật ký)."
+        )
+        if self._ivf_due():
+            self.compact()
+
+    def _symbol_id(self, symbol: Any) -> int:
+        name = str(symbol or "")
+        try:
+            return self._symbols.index(name)
+        except ValueError:
+            self._symbols.append(name)
+            return len(self._symbols) - 1
+
+    def _replay_log(self) -> int:
+        if not self.log_path.exists():
+            return 0
+        vectors: list[list[float]] = []
+        offsets: list[int] = []
+        times: list[int] = []
+        symbol_ids: list[int] = []
+        dim = len(self.feature_names)
+        with open(self.log_path, "rb") as f:
+            f.seek(self._log_bytes)
+            pos = self._log_bytes
+            for line in f:
+                start, pos = pos, pos + len(line)
+                if not line.endswith(b"\n"):
+                    pos = start  # Dòng ghi dở, bỏ qua cho lần nạp sau.
+                    break
+                try:
+                    data = json.loads(line)
+                    vec = data.get("vector")
+                except (ValueError, AttributeError):
+                    continue
+                if isinstance(vec, list) and len(vec) == dim:
+                    vectors.append(vec)
+                    offsets.append(start)
+                    times.append(_epoch(data.get("timestamp_utc")))
+                    symbol_ids.append(self._symbol_id(data.get("symbol")))
+        if vectors:
+            self._add_rows(vectors, offsets, times, symbol_ids)
+        self._log_bytes = pos
+        return len(vectors)
+
+    def _add_rows(self, vectors: Any, offsets: list[int], times: list[int], symbol_ids: list[int]) -> int:
+        row = int(self.index.add(vectors)[0])
+        self._offsets.extend(offsets)
+        self._times = np.concatenate([self._times, np.asarray(times, dtype=np.int64)])
+        self._symbol_ids = np.concatenate([self._symbol_ids, np.asarray(symbol_ids, dtype=np.int32)])
+        return row
+
+    def append(self, vector: Sequence[float], meta: Optional[Mapping[str, Any]] = None) -> int:
+        """Ghi một snapshot vào nhật ký và chỉ mục; trả về chỉ số hàng."""
+        vec = [round(float(x), 6) for x in vector]
+        if len(vec) != len(self.feature_names):
+            raise ValueError(f"Vector có {len(vec)} chiều, cần {len(self.feature_names)}.")
+        now = datetime.now(timezone.utc)
+        record = {"timestamp_utc": now.isoformat(), **(meta or {}), "vector": vec}
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self.reports_dir.mkdir(parents=True, exist_ok=True)
+            # Nhận các dòng do tiến trình khác ghi thêm trước khi ghi dòng mới.
+            self._replay_log()
+            with open(self.log_path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            self._log_bytes = offset + len(line)
+            row = self._add_rows(
+                [vec], [offset], [_epoch(record["timestamp_utc"])], [self._symbol_id(record.get("symbol"))]
+            )
+            if len(self.index) - self._snapshot_rows >= self.compact_every or self._ivf_due():
+                self.compact()
+        return row
+
+    def _ivf_due(self) -> bool:
+        """Cần dựng (lại) IVF: vượt ngưỡng và chưa có IVF, hoặc số hàng đã gấp đôi lần dựng trước."""
+        rows = len(self.index)
+        if rows < self.ivf_min_rows:
+            return False
+        return not self.index.has_ivf or rows >= 2 * max(self._ivf_rows, 1)
+
+    def compact(self) -> None:
+        """Ghi snapshot `.npy` của chỉ mục để lần mở sau không phải parse lại nhật ký."""
+        with self._lock:
+            if self._ivf_due():
+                self.index.build_ivf()
+                self._ivf_rows = len(self.index)
+            self.index.save(self.index_dir)
+            _save_npy(self.index_dir / "offsets.npy", np.asarray(self._offsets, dtype=np.int64))
+            _save_npy(self.index_dir / "times.npy", self._times)
+            _save_npy(self.index_dir / "symbols.npy", self._symbol_ids)
+            tmp = self.index_dir / "state.json.tmp"
+            tmp.write_text(json.dumps(self._state()), encoding="utf-8")
+            os.replace(tmp, self.index_dir / "state.json")
+            self._snapshot_rows = len(self.index)
+        logger.debug(f"Đã ghi snapshot chỉ mục vector ({self._snapshot_rows} hàng).")
+
+    def record(self, row: int) -> dict[str, Any]:
+        """Đọc bản ghi (không kèm vector) của một hàng bằng vị trí byte đã lưu."""
+        with open(self.log_path, "rb") as f:
+            f.seek(self._offsets[row])
+            data = json.loads(f.readline())
+        data.pop("vector", None)
+        return data
+
+    def most_similar(
+        self,
+        vector: Sequence[float],
+        k: int = 10,
+        n_probe: int = 4,
+        symbol: Optional[str] = None,
+        exclude_recent_sec: float = 0.0,
+        now: Optional[float] = None,
+    ) -> list[dict[str, Any]]:
+        """
+        k snapshot gần nhất kèm `distance` (nhỏ hơn = giống hơn). Với `exclude_recent_sec > 0`,
+        các snapshot của `symbol` ghi trong khoảng đó trở lại đây bị loại: chúng gần như trùng
+        với snapshot hiện tại và chưa có kết quả.
+        """
+        with self._lock:
+            allowed = None
+            if exclude_recent_sec > 0:
+                cutoff = (time.time() if now is None else now) - exclude_recent_sec
+                recent = self._times >= cutoff
+                if symbol is not None:
+                    name = str(symbol)
+                    code = self._symbols.index(name) if name in self._symbols else -1
+                    recent &= self._symbol_ids == code
+                allowed = ~recent
+            rows, dist = self.index.search(np.asarray(vector, dtype=np.float32), k, n_probe, allowed)
+            out = []
+            for row, d in zip(rows[0], dist[0]):
+                if row < 0:
+                    break
+                item = self.record(int(row))
+                item["distance"] = round(float(d), 5)
+                out.append(item)
+        return out
+
+
+def _epoch(value: Any) -> int:
+    """Epoch giây từ chuỗi ISO của `timestamp_utc`; 0 nếu thiếu/hỏng (không bao giờ bị coi là gần đây)."""
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return 0
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+_stores: dict[Path, VectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(reports_dir: Path, feature_names: Sequence[str], metric: str = METRIC_COSINE) -> VectorStore:
+    """VectorStore dùng chung cho một thư mục Reports (chỉ nạp từ đĩa lần đầu)."""
+    key = Path(reports_dir).resolve()
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None or store.feature_names != tuple(feature_names) or store.metric != metric:
+            store = VectorStore(key, feature_names, metric)
+            _stores[key] = store
+        return store
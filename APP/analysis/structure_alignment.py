@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Chỉ số đồng thuận cấu trúc đa khung thời gian (H1/M15/M5/M1).
+
+Mỗi timeframe được chấm một vector bias gồm các thành phần trong [-1, 1]:
+- ``mss``: hướng MSS gần nhất (+1 Bullish, -1 Bearish).
+- ``zone``: vị trí trong dải swing (+1 Discount — thuận mua, -1 Premium — thuận bán).
+- ``ema``: vị trí giá so với EMA50 và EMA200 (trung bình dấu của hai khoảng cách).
+
+Bias của timeframe là trung bình các thành phần có dữ liệu; điểm đồng thuận tổng là
+trung bình có trọng số (H1 nặng nhất). Hàm `compute_alignment` dùng cho snapshot hiện
+tại từ payload `MT5_DATA`; các hàm dạng mảng (`bias_matrix`, `confluence_series`,
+`historical_components`) tính cùng chỉ số cho mọi nến phục vụ nghiên cứu và lọc trước
+các lượt phân tích tốn kém.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TIMEFRAMES = ("H1", "M15", "M5", "M1")
+TIMEFRAME_WEIGHTS: dict[str, float] = {"H1": 0.4, "M15": 0.3, "M5": 0.2, "M1": 0.1}
+COMPONENTS = ("mss", "zone", "ema")
+DIRECTION_THRESHOLD = 0.25
+
+
+@dataclass(frozen=True)
+class TimeframeBias:
+    """Vector bias của một timeframe (None nếu thiếu dữ liệu cho thành phần đó)."""
+
+    timeframe: str
+    mss: Optional[float]
+    zone: Optional[float]
+    ema: Optional[float]
+
+    @property
+    def bias(self) -> Optional[float]:
+        values = [v for v in (self.mss, self.zone, self.ema) if v is not None]
+        return sum(values) / len(values) if values else None
+
+    def to_dict(self) -> dict[str, Any]:
+        bias = self.bias
+        return {
+            "mss": self.mss,
+            "zone": self.zone,
+            "ema": self.ema,
+            "bias": round(bias, 3) if bias is not None else None,
+        }
+
+
+@dataclass(frozen=True)
+class AlignmentResult:
+    """Kết quả đồng thuận cấu trúc cho snapshot hiện tại."""
+
+    timeframes: tuple[TimeframeBias, ...]
+    score: Optional[float]
+    agreement: Optional[float]
+
+    @property
+    def direction(self) -> str:
+        return _direction_label(self.score)
+
+    def opposes(self, trade_direction: str, min_score: float = DIRECTION_THRESHOLD) -> bool:
+        """True nếu cấu trúc nghiêng rõ rệt ngược với hướng lệnh ("BUY"/"SELL")."""
+        if self.score is None:
+            return False
+        side = 1.0 if str(trade_direction).upper() in ("BUY", "LONG", "BULLISH") else -1.0
+        return self.score * side <= -abs(min_score)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "direction": self.direction,
+            "score": round(self.score, 3) if self.score is not None else None,
+            "agreement": round(self.agreement, 3) if self.agreement is not None else None,
+            "timeframes": {tb.timeframe: tb.to_dict() for tb in self.timeframes},
+        }
+
+
+def _direction_label(score: Optional[float]) -> str:
+    if score is None:
+        return "Neutral"
+    if score >= DIRECTION_THRESHOLD:
+        return "Bullish"
+    if score <= -DIRECTION_THRESHOLD:
+        return "Bearish"
+    return "Neutral"
+
+
+def _sign(value: float) -> float:
+    return 1.0 if value > 0 else (-1.0 if value < 0 else 0.0)
+
+
+def _mss_component(mss: Any) -> Optional[float]:
+    if not isinstance(mss, Mapping):
+        return None
+    return {"Bullish": 1.0, "Bearish": -1.0}.get(mss.get("type"))
+
+
+def _zone_component(pd_range: Any) -> Optional[float]:
+    if not isinstance(pd_range, Mapping):
+        return None
+    return {"Discount": 1.0, "Premium": -1.0}.get(pd_range.get("status"))
+
+
+def _ema_component(cp: float, ema_refs: Any) -> Optional[float]:
+    if not cp or not isinstance(ema_refs, Mapping):
+        return None
+    signs = [_sign(cp - float(v)) for v in (ema_refs.get("ema50"), ema_refs.get("ema200")) if v is not None]
+    return sum(signs) / len(signs) if signs else None
+
+
+def combine(biases: Mapping[str, Optional[float]]) -> tuple[Optional[float], Optional[float]]:
+    """Gộp bias các timeframe thành (điểm đồng thuận có trọng số, tỷ lệ timeframe cùng hướng)."""
+    available = {tf: b for tf, b in biases.items() if b is not None}
+    if not available:
+        return None, None
+    total_weight = sum(TIMEFRAME_WEIGHTS.get(tf, 0.0) for tf in available)
+    if total_weight <= 0:
+        return None, None
+    score = sum(TIMEFRAME_WEIGHTS.get(tf, 0.0) * b for tf, b in available.items()) / total_weight
+    overall = _sign(score)
+    agreement = sum(1 for b in available.values() if overall and _sign(b) == overall) / len(available)
+    return score, agreement
+
+
+def compute_alignment(mt5_data: Mapping[str, Any], cp: Optional[float] = None) -> AlignmentResult:
+    """
+    Tính đồng thuận cấu trúc từ payload `MT5_DATA` (các khóa `ict_patterns`,
+    `trend_refs.EMA`, `tick`).
+    """
+    patterns = mt5_data.get("ict_patterns") or {}
+    ema_block = (mt5_data.get("trend_refs") or {}).get("EMA") or {}
+    if cp is None:
+        tick = mt5_data.get("tick") or {}
+        cp = float(tick.get("bid") or tick.get("last") or 0.0)
+
+    timeframes = tuple(
+        TimeframeBias(
+            timeframe=tf,
+            mss=_mss_component(patterns.get(f"mss_{tf.lower()}")),
+            zone=_zone_component(patterns.get(f"premium_discount_{tf.lower()}")),
+            ema=_ema_component(cp, ema_block.get(tf)),
+        )
+        for tf in TIMEFRAMES
+    )
+    score, agreement = combine({tb.timeframe: tb.bias for tb in timeframes})
+    return AlignmentResult(timeframes=timeframes, score=score, agreement=agreement)
+
+
+# region Tính theo mảng cho dữ liệu lịch sử
+def bias_matrix(components: Mapping[str, np.ndarray]) -> np.ndarray:
+    """
+    Trung bình các thành phần (mỗi mảng dài n, NaN = thiếu dữ liệu) thành bias theo từng nến.
+    """
+    stacked = np.vstack([np.asarray(components[name], dtype=np.float64) for name in COMPONENTS if name in components])
+    counts = np.sum(~np.isnan(stacked), axis=0)
+    sums = np.nansum(stacked, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def confluence_series(biases: Mapping[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Phiên bản dạng mảng của `combine`: trả về (score, agreement) cho mọi nến.
+    Các mảng bias phải cùng được căn theo một trục thời gian (xem `align_to`).
+    """
+    tfs = [tf for tf in TIMEFRAMES if tf in biases]
+    mat = np.vstack([np.asarray(biases[tf], dtype=np.float64) for tf in tfs])
+    weights = np.array([TIMEFRAME_WEIGHTS[tf] for tf in tfs])[:, None]
+    present = ~np.isnan(mat)
+    w = np.where(present, weights, 0.0)
+    total_weight = w.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        score = np.where(total_weight > 0, np.nansum(mat * w, axis=0) / total_weight, np.nan)
+        overall = np.sign(score)
+        same = (np.sign(mat) == overall) & present & (overall != 0)
+        agreement = np.where(present.sum(axis=0) > 0, same.sum(axis=0) / present.sum(axis=0), np.nan)
+    return score, agreement
+
+
+def align_to(base_times: np.ndarray, tf_times: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Đưa chuỗi giá trị của một timeframe (theo `tf_times` tăng dần) về trục `base_times`:
+    mỗi điểm lấy giá trị của nến gần nhất có thời gian <= thời điểm đó (NaN nếu chưa có).
+    """
+    pos = np.searchsorted(tf_times, base_times, side="right") - 1
+    out = np.full(len(base_times), np.nan)
+    valid = pos >= 0
+    out[valid] = np.asarray(values, dtype=np.float64)[pos[valid]]
+    return out
+
+
+def ema_series(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    EMA cho mọi điểm (cùng công thức với `mt5_service.ema`), tính theo từng khối bằng
+    dạng đóng để tránh vòng lặp Python trên từng nến.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    out = np.empty_like(x)
+    if x.size == 0 or period <= 1:
+        out[:] = x
+        return out
+    alpha = 2.0 / (period + 1.0)
+    decay = 1.0 - alpha
+    # Giới hạn độ dài khối để decay**-k không tràn số.
+    block = max(1, int(30.0 / -math.log(decay)))
+    prev = x[0]
+    out[0] = prev
+    start = 1
+    while start < x.size:
+        seg = x[start : start + block]
+        k = np.arange(1, seg.size + 1)
+        powers = decay ** k
+        # e_t = decay^t * e_0 + alpha * sum_{j<=t} decay^(t-j) * x_j
+        acc = np.cumsum(seg * decay ** -k) * alpha
+        out[start : start + seg.size] = powers * (prev + acc)
+        prev = out[start + seg.size - 1]
+        start += seg.size
+    return out
+
+
+def historical_components(
+    close: np.ndarray,
+    events: Mapping[str, np.ndarray],
+    ema_fast: int = 50,
+    ema_slow: int = 200,
+) -> dict[str, np.ndarray]:
+    """
+    Tính các thành phần bias cho mọi nến của một timeframe.
+
+    Args:
+        close: Giá đóng cửa theo từng nến.
+        events: Kết quả của `ict_scanner.detect_events` trên cùng chuỗi nến (chỉ số cục bộ).
+
+    MSS lấy hướng sự kiện BOS/CHoCH gần nhất; vùng Premium/Discount dùng swing high/low
+    đã xác nhận gần nhất (2 nến sau đỉnh/đáy) nên không nhìn trước tương lai.
+    """
+    from APP.analysis import ict_scanner
+
+    close = np.asarray(close, dtype=np.float64)
+    n = close.size
+    kind = np.asarray(events["kind"])
+    bar = np.asarray(events["bar_index"], dtype=np.int64)
+    direction = np.asarray(events["direction"], dtype=np.float64)
+    top = np.asarray(events["top"], dtype=np.float64)
+
+    def _ffill(at: np.ndarray, vals: np.ndarray) -> np.ndarray:
+        series = np.full(n, np.nan)
+        ok = at < n
+        series[at[ok]] = vals[ok]
+        idx = np.where(~np.isnan(series), np.arange(n), -1)
+        np.maximum.accumulate(idx, out=idx)
+        return np.where(idx >= 0, series[np.maximum(idx, 0)], np.nan)
+
+    mss_mask = kind == ict_scanner.KIND_MSS
+    mss = _ffill(bar[mss_mask], direction[mss_mask])
+
+    hi_mask = kind == ict_scanner.KIND_SWING_HIGH
+    lo_mask = kind == ict_scanner.KIND_SWING_LOW
+    last_high = _ffill(bar[hi_mask] + 2, top[hi_mask])
+    last_low = _ffill(bar[lo_mask] + 2, top[lo_mask])
+    eq = (last_high + last_low) / 2.0
+    with np.errstate(invalid="ignore"):
+        zone = np.where(np.isnan(eq) | (last_high <= last_low), np.nan, np.where(close < eq, 1.0, -1.0))
+
+    ema = (np.sign(close - ema_series(close, ema_fast)) + np.sign(close - ema_series(close, ema_slow))) / 2.0
+    return {"mss": mss, "zone": zone, "ema": ema}
+# endregion
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Chuyển snapshot thị trường (payload `MT5_DATA`) thành vector đặc trưng cố định để tìm
+các tình huống tương tự trong quá khứ (xem `similarity_index`).
+
+Mọi thành phần đều được chuẩn hóa về khoảng [-1, 1] hoặc [0, 1] để khoảng cách giữa các
+snapshot không phụ thuộc symbol hay mức giá:
+- Khoảng cách tới các mức ICT/thanh khoản/ngày được chia cho ATR M5 và chặn ở `DISTANCE_CAP_ATR`.
+- ATR và spread dùng `tanh` trên giá trị tương đối.
+- Phiên (killzone) được mã hóa one-hot; bias cấu trúc lấy từ `structure_alignment`.
+Thành phần thiếu dữ liệu nhận giá trị trung tính (khoảng cách = xa nhất, bias = 0).
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from typing import Any, Iterable, Mapping, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DISTANCE_CAP_ATR = 5.0
+SESSIONS = ("asia", "london", "newyork_am", "newyork_pm")
+ALIGNMENT_TIMEFRAMES = ("H1", "M15", "M5", "M1")
+
+FEATURE_NAMES: tuple[str, ...] = (
+    "level_above_atr",
+    "level_below_atr",
+    "fvg_h1_above_atr",
+    "fvg_h1_below_atr",
+    "fvg_m15_above_atr",
+    "fvg_m15_below_atr",
+    "bsl_h1_above_atr",
+    "ssl_h1_below_atr",
+    "pdh_atr",
+    "pdl_atr",
+    "day_range_position",
+    "atr_rel",
+    "spread_atr",
+    *(f"session_{s}" for s in SESSIONS),
+    "volatility_trending",
+    *(f"bias_{tf.lower()}" for tf in ALIGNMENT_TIMEFRAMES),
+    "bias_score",
+)
+DIM = len(FEATURE_NAMES)
+
+
+def _num(value: Any) -> Optional[float]:
+    try:
+        out = float(value)
+    except (TypeError, ValueError):
+        return None
+    return out if math.isfinite(out) else None
+
+
+def _distance(delta: Optional[float], atr: float) -> float:
+    """Khoảng cách (>= 0) theo bội số ATR, chuẩn hóa về [0, 1]; thiếu dữ liệu = 1 (xa nhất)."""
+    if delta is None or atr <= 0:
+        return 1.0
+    return min(abs(delta) / atr, DISTANCE_CAP_ATR) / DISTANCE_CAP_ATR
+
+
+def _nearest_above(prices: Iterable[Optional[float]], cp: float) -> Optional[float]:
+    above = [p - cp for p in prices if p is not None and p > cp]
+    return min(above) if above else None
+
+
+def _nearest_below(prices: Iterable[Optional[float]], cp: float) -> Optional[float]:
+    below = [cp - p for p in prices if p is not None and p < cp]
+    return min(below) if below else None
+
+
+def _zone_edges(zones: Any) -> list[Optional[float]]:
+    edges: list[Optional[float]] = []
+    for z in zones or []:
+        if isinstance(z, Mapping):
+            edges.extend((_num(z.get("top")), _num(z.get("bottom"))))
+    return edges
+
+
+def vectorize_snapshot(mt5_data: Mapping[str, Any]) -> Optional[np.ndarray]:
+    """
+    Trả về vector float32 độ dài `DIM` theo thứ tự `FEATURE_NAMES`, hoặc None nếu thiếu
+    giá hiện tại/ATR (không thể chuẩn hóa).
+    """
+    tick = mt5_data.get("tick") or {}
+    cp = _num(tick.get("bid")) or _num(tick.get("last"))
+    atr = _num(((mt5_data.get("volatility") or {}).get("ATR") or {}).get("M5"))
+    if not cp or not atr or atr <= 0:
+        logger.debug("Thiếu giá hiện tại hoặc ATR M5, bỏ qua vector hóa snapshot.")
+        return None
+
+    level_map = mt5_data.get("level_map") or {}
+    patterns = mt5_data.get("ict_patterns") or {}
+    levels = mt5_data.get("levels") or {}
+    prev_day = levels.get("prev_day") or {}
+    info = mt5_data.get("info") or {}
+    liquidity_h1 = patterns.get("liquidity_h1") or {}
+
+    def _first_price(items: Any) -> Optional[float]:
+        return _num(items[0].get("price")) if items else None
+
+    level_above = _first_price(level_map.get("nearest_above"))
+    level_below = _first_price(level_map.get("nearest_below"))
+    fvg_h1 = _zone_edges(patterns.get("fvgs_h1"))
+    fvg_m15 = _zone_edges(patterns.get("fvgs_m15"))
+    bsl = [_num(lv.get("price")) for lv in liquidity_h1.get("swing_highs_BSL") or []]
+    ssl = [_num(lv.get("price")) for lv in liquidity_h1.get("swing_lows_SSL") or []]
+    pdh = _num(prev_day.get("high"))
+    pdl = _num(prev_day.get("low"))
+
+    pos = _num(mt5_data.get("position_in_day_range"))
+    point = _num(info.get("point")) or 0.0
+    spread_points = _num(info.get("spread_current")) or 0.0
+
+    alignment = mt5_data.get("structure_alignment") or {}
+    tf_biases = alignment.get("timeframes") or {}
+    regime = mt5_data.get("volatility_regime")
+    session = mt5_data.get("killzone_active")
+
+    values = [
+        _distance(level_above - cp if level_above else None, atr),
+        _distance(cp - level_below if level_below else None, atr),
+        _distance(_nearest_above(fvg_h1, cp), atr),
+        _distance(_nearest_below(fvg_h1, cp), atr),
+        _distance(_nearest_above(fvg_m15, cp), atr),
+        _distance(_nearest_below(fvg_m15, cp), atr),
+        _distance(_nearest_above(bsl, cp), atr),
+        _distance(_nearest_below(ssl, cp), atr),
+        _distance(pdh - cp if pdh else None, atr),
+        _distance(cp - pdl if pdl else None, atr),
+        (min(max(pos, 0.0), 1.0) * 2.0 - 1.0) if pos is not None else 0.0,
+        math.tanh(atr / cp * 1000.0),
+        math.tanh(spread_points * point / atr) if point else 0.0,
+        *(1.0 if session == s else 0.0 for s in SESSIONS),
+        {"trending": 1.0, "choppy": -1.0}.get(str(regime), 0.0),
+        *(_num((tf_biases.get(tf) or {}).get("bias")) or 0.0 for tf in ALIGNMENT_TIMEFRAMES),
+        _num(alignment.get("score")) or 0.0,
+    ]
+    return np.asarray(values, dtype=np.float32)
+
+
+def snapshot_meta(mt5_data: Mapping[str, Any]) -> dict[str, Any]:
+    """Thông tin mô tả ngắn gọn đi kèm vector khi ghi vào `vector_database.jsonl`."""
+    alignment = mt5_data.get("structure_alignment") or {}
+    tick = mt5_data.get("tick") or {}
+    return {
+        "symbol": mt5_data.get("symbol"),
+        "broker_time": mt5_data.get("broker_time"),
+        "price": _num(tick.get("bid")) or _num(tick.get("last")),
+        "session": mt5_data.get("killzone_active"),
+        "volatility_regime": mt5_data.get("volatility_regime"),
+        "bias": alignment.get("direction"),
+    }
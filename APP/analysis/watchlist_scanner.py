@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Quét nhanh danh sách symbol (watchlist) bằng các bộ phát hiện ICT cục bộ để quyết định có
+đáng chạy một phiên `AnalysisWorker` (chụp ảnh, upload, gọi Gemini) hay không.
+
+Mỗi symbol được chấm điểm trên vài trăm nến gần nhất của một timeframe:
+- MSS vừa xảy ra trong `fresh_mss_bars` nến cuối (CHoCH được cộng thêm).
+- Giá hiện tại đang nằm trong một FVG / Order Block chưa bị lấp/giảm thiểu trước nến hiện tại.
+- Đang trong killzone (chung cho mọi symbol).
+Các thành phần có hướng cộng theo dấu (+1 Bullish, -1 Bearish); điểm là tổng độ lớn các thành
+phần cùng hướng chiếm ưu thế cộng điểm killzone.
+
+Nến lấy từ MT5 bằng một lần `copy_rates_from_pos` (nến đã đóng đồng thời được ghi vào kho nến
+cục bộ); khi không có MT5, đọc phần đuôi của `bar_archive.BarArchive`. Bộ phát hiện dùng lại
+`ict_scanner.detect_events` dạng vector nên vài chục symbol chỉ mất vài chục mili giây.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional
+
+import numpy as np
+
+from APP.analysis import ict_scanner
+from APP.persistence import bar_archive
+from APP.services import mt5_service
+
+if TYPE_CHECKING:
+    from APP.configs.app_config import RunConfig
+
+logger = logging.getLogger(__name__)
+
+BarLoader = Callable[[str, str, int], Optional[np.ndarray]]
+
+
+@dataclass(frozen=True)
+class ScanWeights:
+    """Trọng số của từng tín hiệu trong điểm watchlist."""
+
+    fresh_mss: float = 2.0
+    choch_bonus: float = 0.5
+    in_fvg: float = 1.0
+    in_order_block: float = 1.0
+    killzone: float = 1.0
+
+
+@dataclass(frozen=True)
+class WatchlistScore:
+    """Kết quả chấm điểm một symbol."""
+
+    symbol: str
+    score: float
+    direction: int = 0
+    reasons: tuple[str, ...] = ()
+    price: Optional[float] = None
+    last_time: Optional[int] = None
+    bars: int = 0
+    components: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def direction_name(self) -> str:
+        return {1: "Bullish", -1: "Bearish"}.get(self.direction, "Neutral")
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "symbol": self.symbol,
+            "score": round(self.score, 3),
+            "direction": self.direction_name,
+            "reasons": list(self.reasons),
+            "price": self.price,
+            "last_time": self.last_time,
+            "bars": self.bars,
+        }
+
+
+def load_recent_bars(symbol: str, timeframe: str, count: int) -> Optional[np.ndarray]:
+    """Nến gần nhất của `symbol` từ MT5 (nếu đang kết nối), ngược lại từ kho nến cục bộ."""
+    rates = None
+    if mt5_service.mt5 is not None:
+        try:
+            rates = mt5_service.copy_recent_rates(symbol, timeframe, count)
+        except Exception as e:
+            logger.warning(f"Không lấy được nến {symbol} {timeframe} từ MT5 cho watchlist: {e}")
+    if rates is not None:
+        return bar_archive.to_archive_array(rates)
+    try:
+        bars = bar_archive.BarArchive(symbol, timeframe).tail(count, ("time", "open", "high", "low", "close"))
+    except ValueError as e:
+        logger.warning(f"Không đọc được kho nến {symbol} {timeframe}: {e}")
+        return None
+    return bars if len(bars) else None
+
+
+def score_bars(
+    symbol: str,
+    bars: np.ndarray,
+    *,
+    fresh_mss_bars: int = 12,
+    killzone: Optional[str] = None,
+    weights: ScanWeights = ScanWeights(),
+    params: ict_scanner.ScanParams = ict_scanner.ScanParams(),
+) -> WatchlistScore:
+    """Chấm điểm một chuỗi nến (nến cuối là nến hiện tại, có thể chưa đóng)."""
+    n = len(bars)
+    if n < 5:
+        return WatchlistScore(symbol, 0.0, reasons=("Không đủ dữ liệu nến.",), bars=n)
+
+    events = ict_scanner.detect_events(bars, params)
+    kind, bar_index, ref_bar = events["kind"], events["bar_index"], events["ref_bar"]
+    direction, top, bottom = events["direction"], events["top"], events["bottom"]
+    price = float(bars["close"][-1])
+    current = n - 1
+
+    signals: list[tuple[str, int, float, str]] = []
+
+    mss = np.nonzero((kind == ict_scanner.KIND_MSS) & (bar_index >= n - max(1, fresh_mss_bars)))[0]
+    if mss.size:
+        last = mss[np.argmax(bar_index[mss])]
+        is_choch = events["flag"][last] == ict_scanner.MSS_CHOCH
+        label = "CHoCH" if is_choch else "BOS"
+        d = int(direction[last])
+        signals.append(
+            (
+                "mss",
+                d,
+                weights.fresh_mss + (weights.choch_bonus if is_choch else 0.0),
+                f"{label} {'tăng' if d > 0 else 'giảm'} cách {current - int(bar_index[last])} nến",
+            )
+        )
+
+    # Vùng còn hiệu lực: chưa bị lấp/giảm thiểu trước nến hiện tại và giá đang ở trong vùng.
+    untouched = (ref_bar < 0) | (ref_bar >= current)
+    inside = (bottom <= price) & (price <= top) & (bar_index < current)
+    for code, key, weight, name in (
+        (ict_scanner.KIND_FVG, "fvg", weights.in_fvg, "FVG"),
+        (ict_scanner.KIND_ORDER_BLOCK, "order_block", weights.in_order_block, "Order Block"),
+    ):
+        hits = np.nonzero((kind == code) & untouched & inside)[0]
+        if hits.size:
+            newest = hits[np.argmax(bar_index[hits])]
+            d = int(direction[newest])
+            signals.append(
+                (key, d, weight, f"Giá trong {name} {'tăng' if d > 0 else 'giảm'} chưa lấp ({bottom[newest]:.5g}-{top[newest]:.5g})")
+            )
+
+    net = sum(d * w for _, d, w, _ in signals)
+    dominant = 1 if net > 0 else -1 if net < 0 else 0
+    components = {key: float(w) for key, d, w, _ in signals if dominant == 0 or d == dominant}
+    reasons = [text for key, d, _, text in signals if key in components]
+    if killzone:
+        components["killzone"] = weights.killzone
+        reasons.append(f"Killzone {killzone}")
+
+    return WatchlistScore(
+        symbol=symbol,
+        score=float(sum(components.values())),
+        direction=dominant,
+        reasons=tuple(reasons),
+        price=price,
+        last_time=int(bars["time"][-1]),
+        bars=n,
+        components=components,
+    )
+
+
+def watchlist_symbols(cfg: "RunConfig") -> list[str]:
+    """Các symbol cần quét: symbol đang phân tích luôn đứng đầu, sau đó là watchlist."""
+    symbols = [cfg.mt5.symbol] if cfg.mt5.symbol else []
+    return list(dict.fromkeys([*symbols, *cfg.watchlist.symbols]))
+
+
+def scan_watchlist(
+    cfg: "RunConfig",
+    symbols: Optional[Iterable[str]] = None,
+    *,
+    load_bars: BarLoader = load_recent_bars,
+    now: Optional[datetime] = None,
+    weights: ScanWeights = ScanWeights(),
+) -> list[WatchlistScore]:
+    """Chấm điểm toàn bộ watchlist, trả về danh sách giảm dần theo điểm."""
+    wl = cfg.watchlist
+    now = now or datetime.now(timezone.utc)
+    killzone = None
+    in_zone, zone_name = mt5_service.get_active_killzone(
+        d=now,
+        target_tz=cfg.no_run.timezone,
+        killzone_overrides={"summer": cfg.no_run.killzone_summer, "winter": cfg.no_run.killzone_winter},
+    )
+    if in_zone:
+        killzone = zone_name
+
+    t0 = time.perf_counter()
+    results: list[WatchlistScore] = []
+    for symbol in symbols if symbols is not None else watchlist_symbols(cfg):
+        try:
+            bars = load_bars(symbol, wl.timeframe, wl.lookback_bars)
+        except Exception as e:
+            logger.warning(f"Lỗi khi tải nến {symbol} cho watchlist: {e}")
+            bars = None
+        if bars is None or len(bars) == 0:
+            results.append(WatchlistScore(symbol, 0.0, reasons=("Không có dữ liệu nến.",)))
+            continue
+        results.append(
+            score_bars(symbol, bars, fresh_mss_bars=wl.fresh_mss_bars, killzone=killzone, weights=weights)
+        )
+    results.sort(key=lambda r: r.score, reverse=True)
+    logger.debug(f"Đã quét watchlist {len(results)} symbol trong {(time.perf_counter() - t0) * 1000:.1f} ms.")
+    return results
+
+
+def should_analyze(
+    cfg: "RunConfig",
+    *,
+    load_bars: BarLoader = load_recent_bars,
+    now: Optional[datetime] = None,
+) -> tuple[bool, str, list[WatchlistScore]]:
+    """
+    Cổng trước phiên autorun: chỉ chạy phân tích AI khi symbol đang cấu hình đạt `min_score`.
+
+    Returns:
+        (có chạy hay không, lý do, bảng điểm toàn watchlist).
+    """
+    if not cfg.watchlist.enabled:
+        return True, "", []
+    scores = scan_watchlist(cfg, load_bars=load_bars, now=now)
+    own = next((s for s in scores if s.symbol == cfg.mt5.symbol), None)
+    if own is None:
+        return True, "", scores
+    if own.score >= cfg.watchlist.min_score:
+        return True, f"{own.symbol} đạt {own.score:.1f} điểm: {', '.join(own.reasons)}", scores
+
+    others = [s for s in scores if s.symbol != own.symbol and s.score >= cfg.watchlist.min_score]
+    reason = f"{own.symbol} chỉ đạt {own.score:.1f}/{cfg.watchlist.min_score:.1f} điểm watchlist"
+    if others:
+        reason += "; đáng chú ý: " + ", ".join(f"{s.symbol} ({s.score:.1f} {s.direction_name})" for s in others[:3])
+    return False, reason, scores
@@ -61,6 +61,9 @@ class MT5Config:
     n_M5: int
     n_M15: int
     n_H1: int
+    archive_bars: bool = True  # Lưu nến đã đóng vào kho cục bộ (`persistence.bar_archive`)
+    archive_ticks: bool = True  # Lưu tick dùng cho thống kê spread (`persistence.tick_archive`)
+    broker_timezone: str = ""  # Múi giờ IANA của giờ server broker (ví dụ "Europe/Athens"); rỗng = đo từ tick
 
 
 @dataclass(frozen=True)
@@ -107,6 +110,8 @@ class AutoTradeConfig:
     move_to_be_after_tp1: bool
     trailing_atr_mult: float
     filling_type: str = "IOC"  # Thêm filling_type
+    max_trades_per_day: int = 0  # 0 = không giới hạn
+    require_structure_alignment: bool = False  # Bỏ lệnh tự động ngược đồng thuận cấu trúc đa khung
 
 
 @dataclass(frozen=True)
@@ -131,6 +136,8 @@ class PersistenceConfig:
     """Cấu hình liên quan đến việc lưu trữ dữ liệu."""
     max_md_reports: int = 10
     max_json_reports: int = 10
+    record_replay_snapshots: bool = False  # Ghi MT5_DATA mỗi phiên vào Reports/snapshots cho `param_sweep`
+    max_snapshot_files: int = 30  # Số file snapshot theo ngày được giữ lại
 
 
 @dataclass(frozen=True)
@@ -147,6 +154,21 @@ class ApiConfig:
     """Cấu hình cho các cuộc gọi API."""
     tries: int = 5
     delay: float = 2.0
+    prompt_cache_enabled: bool = False  # Gửi phần prompt tĩnh qua context caching của Gemini
+    prompt_cache_ttl_min: int = 60
+    response_cache_enabled: bool = False  # Phát lại phản hồi cho request giống hệt (cùng prompt + ảnh)
+    response_cache_ttl_min: int = 240
+    response_cache_max_mb: int = 50
+    rpm_limit: int = 0  # Giới hạn request/phút theo API key (0 = không giới hạn)
+    tpm_limit: int = 0  # Giới hạn token đầu vào/phút (ước lượng)
+    uploads_per_min: int = 0  # Giới hạn upload file/phút
+    async_stream: bool = False  # Stream qua API async với hạn chờ và hủy giữa chừng
+    first_token_timeout_sec: int = 120
+    idle_timeout_sec: int = 60
+    total_timeout_sec: int = 1200
+    hedge_enabled: bool = False  # Mở request thứ hai nếu chưa có chunk đầu sau `hedge_delay_sec`
+    hedge_delay_sec: float = 20.0
+    hedge_model: str = ""  # model cho request hedge; rỗng = cùng model
 
 
 @dataclass(frozen=True)
@@ -158,6 +180,48 @@ class ChartConfig:
     refresh_interval_secs: int = 5
 
 
+@dataclass(frozen=True)
+class IctConfig:
+    """Cấu hình cho khối phân tích ICT trong snapshot MT5."""
+    cache_enabled: bool = True
+    cache_capacity: int = 64
+    parallel_enabled: bool = False
+    parallel_workers: int = 4
+    parallel_min_bars: int = 2000
+
+
+@dataclass(frozen=True)
+class WatchlistConfig:
+    """Cấu hình quét nhanh danh sách symbol trước khi autorun gọi phân tích AI."""
+    enabled: bool = False
+    symbols: tuple[str, ...] = ()
+    timeframe: str = "M5"
+    lookback_bars: int = 300
+    fresh_mss_bars: int = 12
+    min_score: float = 2.0
+
+
+@dataclass(frozen=True)
+class MaterialityConfig:
+    """Cấu hình cổng bỏ qua/hạ cấp phiên autorun khi thị trường không thay đổi đáng kể."""
+    enabled: bool = False
+    skip_below: float = 1.0
+    full_above: float = 2.0
+    light_model: str = ""  # model rẻ hơn cho mức thay đổi trung bình; rỗng = chạy đầy đủ
+    max_skip_min: int = 60  # luôn chạy đầy đủ nếu báo cáo trước cũ hơn
+
+
+@dataclass(frozen=True)
+class CorrelationConfig:
+    """Cấu hình engine tương quan liên symbol / sức mạnh tiền tệ (watchlist + `symbols`)."""
+    enabled: bool = False
+    symbols: tuple[str, ...] = ()  # thêm vào watchlist, ví dụ DXY, XAUUSD
+    timeframe: str = "H1"
+    window: int = 120
+    min_abs_corr: float = 0.5
+    max_exposure_lots: float = 0.0  # 0 = chỉ báo cáo, không chặn lệnh
+
+
 @dataclass(frozen=True)
 class RunConfig:
     """
@@ -175,6 +239,10 @@ class RunConfig:
     news: NewsConfig
     persistence: PersistenceConfig
     chart: ChartConfig = field(default_factory=ChartConfig)
+    ict: IctConfig = field(default_factory=IctConfig)
+    watchlist: WatchlistConfig = field(default_factory=WatchlistConfig)
+    materiality: MaterialityConfig = field(default_factory=MaterialityConfig)
+    correlation: CorrelationConfig = field(default_factory=CorrelationConfig)
     api: ApiConfig = field(default_factory=ApiConfig)
     logging: LoggingConfig = field(default_factory=LoggingConfig)
 
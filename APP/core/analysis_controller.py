@@ -112,7 +112,9 @@ class AnalysisController:
     # ------------------------------------------------------------------
     def _start_session_locked(self, session_id, app, cfg, priority, on_start) -> None:  # type: ignore[no-untyped-def]
         token = self._tm.new_cancel_token()
-        worker = AnalysisWorker(app=app, cfg=cfg, cancel_token=token, session_id=session_id)
+        worker = AnalysisWorker(
+            app=app, cfg=cfg, cancel_token=token, session_id=session_id, prescan=priority == "autorun"
+        )
         record = self._tm.submit(
             func=worker.run,
             group="analysis.session",
@@ -1,24 +1,34 @@
 from __future__ import annotations
 
+import functools
 import logging
 import time
 import traceback
 from datetime import datetime, timezone
-from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError, as_completed
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 try:
     import google.generativeai as genai  # type: ignore[import]
 except ModuleNotFoundError:  # pragma: no cover - optional dependency
     genai = None
 
-from APP.analysis import context_builder, image_processor, prompt_builder
+from APP.analysis import (
+    context_builder,
+    correlation_engine,
+    image_processor,
+    materiality,
+    prompt_builder,
+    watchlist_scanner,
+)
+from APP.core.stream_accumulator import StreamAccumulator
 from APP.core.trading import actions as trade_actions
 from APP.core.trading import conditions as trade_conditions
+from APP.core.trading import param_sweep, trade_ledger
 from APP.persistence import md_handler
 from APP.persistence.json_handler import JsonSaver
-from APP.services import gemini_service, mt5_service
+from APP.services import gemini_async, gemini_service, hedging, mt5_service, prompt_cache, response_cache
 # Cập nhật import để nhận diện lớp lỗi mới
 from APP.services.gemini_service import StreamError
 from APP.utils import threading_utils
@@ -38,6 +48,23 @@ def _tnow() -> float:
     return time.perf_counter()
 
 
+def _timed_stage(label: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Ghi thời gian thực thi của một giai đoạn vào `worker.stage_timings[label]` (giây)."""
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(self: "AnalysisWorker", *args: Any, **kwargs: Any) -> Any:
+            t0 = _tnow()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self.stage_timings[label] = _tnow() - t0
+
+        return wrapper
+
+    return decorator
+
+
 class AnalysisWorker:
     """
     Lớp điều phối toàn bộ quy trình phân tích, chạy trong một luồng riêng biệt.
@@ -51,6 +78,8 @@ class AnalysisWorker:
         *,
         session_id: str | None = None,
         stop_event: Any | None = None,
+        clock: Callable[[], datetime] | None = None,
+        prescan: bool = False,
     ):
         """
         Khởi tạo worker với các đối tượng cần thiết.
@@ -59,6 +88,10 @@ class AnalysisWorker:
             app (AnalysisUi): Instance của ứng dụng UI chính.
             cfg (RunConfig): Đối tượng cấu hình cho lần chạy này.
             stop_event (threading.Event): Sự kiện để báo hiệu dừng worker.
+            clock: Nguồn thời gian UTC cho các điều kiện No-Run/No-Trade (chế độ replay
+                truyền thời điểm của snapshot); mặc định là thời gian hiện tại.
+            prescan: Quét watchlist trước khi chạy (dùng cho autorun); bỏ qua phiên nếu symbol
+                chưa đạt ngưỡng điểm `cfg.watchlist.min_score`.
         """
         self.app = app
         self.cfg = cfg
@@ -68,6 +101,12 @@ class AnalysisWorker:
         self.news_service: "NewsService" = app.news_service
         self.model_name: str = self.app.model_var.get()
         self.model: Optional[Any] = None
+        self._clock: Callable[[], datetime] = clock or (lambda: datetime.now(timezone.utc))
+        self.stage_timings: Dict[str, float] = {}
+        self.prescan = prescan
+        self.watchlist_scores: list[watchlist_scanner.WatchlistScore] = []
+        self.materiality_result: Optional[materiality.MaterialityResult] = None
+        self._fingerprint: Optional[materiality.Fingerprint] = None
 
         # State variables
         self.early_exit: bool = False
@@ -136,6 +175,9 @@ class AnalysisWorker:
                     image_config=self.cfg.image_processing,
                 )
                 cancel_token.raise_if_cancelled()
+                limiter = gemini_service.get_rate_limiter(self.app.api_key_var.get(), self.cfg.api)
+                if limiter is not None:
+                    limiter.acquire(uploads=1, cancel_token=cancel_token)
                 file_obj = image_processor.upload_image_to_gemini(prepared_path, display_name=name)
 
                 if file_obj:
@@ -182,13 +224,16 @@ class AnalysisWorker:
                 raise SystemExit("Thoát sớm do lỗi ở Giai đoạn 2 hoặc 3.")
 
             if not self._stage_4_call_ai_model():
-                return {"status": "failed"}
+                return {"status": "failed", "timings": self.stage_timings}
             if self._is_cancelled():
                 return {"status": "cancelled"}
             self._stage_5_execute_or_manage_trades()
+            self._remember_fingerprint()
 
         except SystemExit as e:
             logger.info(f"Worker đã thoát một cách có kiểm soát: {e}")
+        except CancelledError:
+            logger.info("Worker bị hủy khi đang chờ hạn mức API hoặc giữa stream.")
         except Exception:
             tb_str = traceback.format_exc()
             logger.exception("Lỗi nghiêm trọng trong worker.")
@@ -197,11 +242,15 @@ class AnalysisWorker:
             self.app.ui_queue.put(lambda: self.app.ui_detail_replace(self.combined_text))
         finally:
             self._stage_6_finalize_and_cleanup()
-        return {"status": "completed", "early_exit": self.early_exit}
+        return {"status": "completed", "early_exit": self.early_exit, "timings": self.stage_timings}
 
+    @_timed_stage("stage_1")
     def _stage_1_initialize_and_validate(self) -> None:
         """Giai đoạn 1: Khởi tạo và kiểm tra đầu vào."""
         logger.debug("GIAI ĐOẠN 1: Khởi tạo và kiểm tra đầu vào.")
+        if self.prescan and self.cfg.watchlist.enabled:
+            self._prescan_watchlist()
+
         self.paths = [r["path"] for r in self.app.results]
         self.names = [r["name"] for r in self.app.results]
         max_files = max(0, self.cfg.folder.max_files)
@@ -217,13 +266,39 @@ class AnalysisWorker:
             self.app.ui_queue.put(lambda: self.app.show_error_message("Lỗi API", "API Key không được tìm thấy."))
             raise SystemExit("API Key không được tìm thấy.")
 
-        self.model = gemini_service.initialize_model(api_key=api_key, model_name=self.model_name)
+        # Chỉ cấu hình SDK (cho upload ở GĐ 3); model lấy từ pool ngay trước GĐ 4 nên các phiên
+        # thoát sớm không tốn gì.
+        if not gemini_service.ensure_configured(api_key):
+            logger.warning("Chưa cấu hình được Gemini API; upload ảnh có thể thất bại.")
 
+    def _ensure_model(self) -> None:
+        """Lấy model từ pool nếu phiên chưa có (ví dụ chưa chọn model nhẹ ở GĐ 2)."""
+        if self.model:
+            return
+        self.model = gemini_service.initialize_model(api_key=self.app.api_key_var.get(), model_name=self.model_name)
         if not self.model:
             error_message = f"Không thể khởi tạo model '{self.model_name}'. Vui lòng kiểm tra API key và kết nối mạng."
             self.app.ui_queue.put(lambda: self.app.show_error_message("Lỗi Model", error_message))
             raise SystemExit(f"Lỗi khởi tạo model: {self.model_name}")
 
+    def _prescan_watchlist(self) -> None:
+        """Quét watchlist cục bộ; thoát sớm trước khi upload/gọi AI nếu chưa có setup."""
+        try:
+            should_run, reason, self.watchlist_scores = watchlist_scanner.should_analyze(
+                self.cfg, now=self._clock()
+            )
+        except Exception as e:
+            logger.warning(f"Lỗi khi quét watchlist, vẫn tiếp tục phân tích: {e}")
+            return
+        if should_run:
+            if reason:
+                logger.info(f"Watchlist: {reason}")
+            return
+        trade_conditions.handle_early_exit(self, "watchlist", reason)
+        self.early_exit = True
+        raise SystemExit(f"Watchlist: {reason}")
+
+    @_timed_stage("stage_2")
     def _execute_stage_2_logic(self) -> bool:
         """
         Thực thi logic của Giai đoạn 2. Trả về True nếu thành công, False nếu thất bại.
@@ -231,7 +306,7 @@ class AnalysisWorker:
         try:
             logger.debug("BẮT ĐẦU GIAI ĐOẠN 2: Xây dựng ngữ cảnh và kiểm tra điều kiện.")
             should_run, no_run_reason = trade_conditions.check_no_run_conditions(
-                self.cfg, self.news_service
+                self.cfg, self.news_service, now_utc=self._clock()
             )
             if not should_run:
                 trade_conditions.handle_early_exit(
@@ -258,6 +333,7 @@ class AnalysisWorker:
                                 "summer": self.cfg.no_run.killzone_summer,
                                 "winter": self.cfg.no_run.killzone_winter,
                             },
+                            "ict_config": self.cfg.ict,
                         },
                     ),
                 (
@@ -290,6 +366,21 @@ class AnalysisWorker:
                 concept_table = context_builder.create_concept_value_table(self.safe_mt5_data)
                 self.safe_mt5_data.raw["concept_value_table"] = concept_table
 
+            if self.safe_mt5_data.raw:
+                try:
+                    self.safe_mt5_data.raw["similar_setups"] = context_builder.find_similar_setups(
+                        reports_dir, self.safe_mt5_data.raw, cfg=self.cfg
+                    )
+                except Exception as e:
+                    logger.warning(f"Lỗi khi tìm các tình huống tương tự: {e}")
+                if self.cfg.correlation.enabled:
+                    try:
+                        self.safe_mt5_data.raw["correlation"] = correlation_engine.snapshot_summary(
+                            self.cfg, mt5_service.get_open_positions()
+                        )
+                    except Exception as e:
+                        logger.warning(f"Lỗi khi tính tương quan liên symbol: {e}")
+
             self.mt5_dict = self.safe_mt5_data.raw
             self.mt5_json_full = self.safe_mt5_data.to_json(indent=2)
             self.context_block = (
@@ -304,22 +395,52 @@ class AnalysisWorker:
                 )
             )
 
+            ledger = None
+            try:
+                ledger = trade_ledger.get_ledger(timezone_name=self.cfg.no_run.timezone)
+                ledger.reconcile(
+                    self.cfg.mt5.symbol,
+                    self.safe_mt5_data.get("positions", []) or [],
+                    at=self._clock().timestamp(),
+                    realized_profit=mt5_service.position_realized_profit,
+                )
+            except Exception as e:
+                logger.warning(f"Không thể đối chiếu sổ cái lệnh: {e}")
+
             no_trade_result = trade_conditions.check_no_trade_conditions(
                 self.safe_mt5_data,
                 self.cfg,
                 self.news_service,
-                now_utc=datetime.now(timezone.utc),
+                now_utc=self._clock(),
+                ledger=ledger,
             )
             self.no_trade_result = no_trade_result
 
+            if self.cfg.persistence.record_replay_snapshots:
+                try:
+                    param_sweep.record_snapshot(
+                        reports_dir,
+                        self.mt5_dict,
+                        self.news_service.get_upcoming_events(self.cfg.mt5.symbol),
+                        now_utc=self._clock(),
+                        retention_files=self.cfg.persistence.max_snapshot_files,
+                    )
+                except Exception as e:
+                    logger.warning(f"Không thể ghi snapshot cho quét tham số: {e}")
+
             serialized_no_trade = no_trade_result.to_dict(include_messages=True)
-            serialized_no_trade["evaluated_at"] = datetime.now(timezone.utc).isoformat()
+            serialized_no_trade["evaluated_at"] = self._clock().isoformat()
+            self.materiality_result = self._evaluate_materiality(reports_dir)
 
             if isinstance(self.mt5_dict, dict):
                 evaluations = self.mt5_dict.setdefault("evaluations", {})
                 evaluations["no_trade"] = serialized_no_trade
+                if self.materiality_result:
+                    evaluations["materiality"] = self.materiality_result.to_dict()
             if self.safe_mt5_data:
                 self.safe_mt5_data.raw.setdefault("evaluations", {})["no_trade"] = serialized_no_trade
+                if self.materiality_result:
+                    self.safe_mt5_data.raw["evaluations"]["materiality"] = self.materiality_result.to_dict()
                 self.mt5_json_full = self.safe_mt5_data.to_json(indent=2)
 
             self.app.ui_queue.put(
@@ -341,6 +462,7 @@ class AnalysisWorker:
                 self.early_exit = True
                 raise SystemExit(f"Điều kiện No-Trade: {reason_str}")
 
+            self._apply_materiality_decision()
             return True
         except SystemExit as e:
             logger.info(f"Giai đoạn 2 thoát sớm: {e}")
@@ -357,6 +479,46 @@ class AnalysisWorker:
             self.app.ui_queue.put(lambda: self.app.show_error_message("Lỗi Context", error_msg))
             return False
 
+    def _evaluate_materiality(self, reports_dir: Path) -> Optional[materiality.MaterialityResult]:
+        """So sánh snapshot hiện tại với snapshot của báo cáo hoàn chỉnh gần nhất (chỉ cho autorun)."""
+        if not isinstance(self.mt5_dict, dict):
+            return None
+        self._fingerprint = materiality.Fingerprint.from_snapshot(self.mt5_dict)
+        if not (self.prescan and self.cfg.materiality.enabled):
+            return None
+        previous, saved_at = materiality.load_state(reports_dir)
+        result = materiality.evaluate(
+            self.cfg.materiality, self._fingerprint, previous, saved_at, now=self._clock().timestamp()
+        )
+        logger.info(f"Materiality: {result.decision}, {result.summary()}")
+        return result
+
+    def _apply_materiality_decision(self) -> None:
+        """Bỏ qua phiên hoặc chuyển sang model nhẹ theo kết quả materiality."""
+        result = self.materiality_result
+        if result is None or result.decision == materiality.DECISION_FULL:
+            return
+        if result.decision == materiality.DECISION_SKIP:
+            trade_conditions.handle_early_exit(self, "materiality", f"Thị trường chưa đổi đáng kể: {result.summary()}")
+            self.early_exit = True
+            raise SystemExit(f"Materiality: {result.summary()}")
+
+        light_model = self.cfg.materiality.light_model
+        model = gemini_service.initialize_model(api_key=self.app.api_key_var.get(), model_name=light_model)
+        if model:
+            self.model, self.model_name = model, light_model
+            self.app.ui_queue.put(lambda: self.app.ui_status(f"Thay đổi nhỏ, dùng model nhẹ {light_model}."))
+        else:
+            logger.warning(f"Không khởi tạo được model nhẹ '{light_model}', giữ model mặc định.")
+
+    def _remember_fingerprint(self) -> None:
+        """Lưu fingerprint của snapshot vừa tạo ra báo cáo hoàn chỉnh."""
+        if self._fingerprint is None:
+            return
+        reports_dir = Path(self.app.folder_path.get()) / "Reports"
+        materiality.save_state(reports_dir, self._fingerprint, now=self._clock().timestamp())
+
+    @_timed_stage("stage_3")
     def _execute_stage_3_logic(self) -> bool:
         """Thực thi logic upload ảnh với TaskGroup `analysis.upload`."""
 
@@ -459,12 +621,14 @@ class AnalysisWorker:
 
         return files_processed, images_changed
 
+    @_timed_stage("stage_4")
     def _stage_4_call_ai_model(self) -> bool:
         """
         Giai đoạn 4: Gọi model AI và xử lý kết quả.
         Trả về True nếu thành công, False nếu có lỗi API không thể phục hồi.
         """
         logger.debug("BẮT ĐẦU GIAI ĐOẠN 4: Gọi Model AI")
+        self._ensure_model()
         self.app.ui_queue.put(lambda: self.app.ui_status("Giai đoạn 4/6: Đang nhận phân tích từ AI..."))
 
         all_media = [f for f in self.file_slots if f is not None]
@@ -477,24 +641,32 @@ class AnalysisWorker:
         prompt = prompt_builder.select_prompt(
             self.app, self.cfg, self.safe_mt5_data, prompt_no_entry, prompt_entry_run
         )
-        prompt_final = prompt_builder.construct_prompt(
+        static_part, dynamic_part = prompt_builder.construct_prompt_parts(
             self.app, prompt, self.mt5_dict, self.context_block, self.paths
         )
+        prompt_final = f"{static_part}\n\n{dynamic_part}".strip()
 
         logger.debug(f"--- PROMPT FINAL GỬI ĐẾN AI ---\n{prompt_final}\n--- KẾT THÚC PROMPT ---")
 
+        model = self.model
         parts = all_media + [prompt_final]
+        cached_model = self._prompt_cache_model(static_part) if self.cfg.api.prompt_cache_enabled else None
+        if cached_model is not None:
+            model, parts = cached_model, all_media + [dynamic_part.strip()]
         t_llm0 = _tnow()
         self.combined_text = ""
 
-        if not self.model:
-            raise SystemExit("Model chưa được khởi tạo.")
-
-        stream_generator = gemini_service.stream_gemini_response(
-            model=self.model, parts=parts, tries=self.cfg.api.tries, base_delay=self.cfg.api.delay
-        )
+        if self.cfg.api.hedge_enabled:
+            stream_generator = self._hedged_stream(model, parts, all_media + [prompt_final])
+        else:
+            stream_generator = self._open_stream(model, parts, self.cancel_token)
 
         self.app.ui_queue.put(lambda: self.app.ui_detail_replace("Đang nhận dữ liệu từ AI..."))
+        # Delta được bind vào lambda qua tham số mặc định: mỗi callback giữ đúng phần của nó.
+        accumulator = StreamAccumulator(
+            on_replace=lambda text: self.app.ui_queue.put(lambda t=text: self.app.ui_detail_replace(t)),
+            on_append=lambda delta: self.app.ui_queue.put(lambda d=delta: self.app.ui_detail_append(d)),
+        )
 
         for chunk in stream_generator:
             if self._is_cancelled():
@@ -503,25 +675,95 @@ class AnalysisWorker:
 
             if isinstance(chunk, StreamError):
                 logger.error(f"Lỗi nghiêm trọng khi streaming từ Gemini: {chunk}")
+                if cached_model is not None:
+                    self._invalidate_prompt_cache()
                 error_message = f"Không thể nhận phản hồi từ model AI.\n\nChi tiết:\n{chunk}"
                 self.combined_text = f"[LỖI PHÂN TÍCH] {error_message}"
                 self.app.ui_queue.put(lambda: self.app.ui_detail_replace(self.combined_text))
                 self.app.ui_queue.put(lambda: self.app.show_error_message("Lỗi Kết Nối AI", error_message))
                 return False
 
-            chunk_text = getattr(chunk, "text", "")
-            if chunk_text:
-                self.combined_text += chunk_text
-                self.app.ui_queue.put(lambda: self.app.ui_detail_replace(self.combined_text))
+            accumulator.add(getattr(chunk, "text", ""))
 
+        accumulator.flush()
+        self.combined_text = accumulator.text
+        logger.debug(f"Đã nhận {len(self.combined_text)} ký tự, {accumulator.emits} lần cập nhật UI.")
         if not self.combined_text:
             self.combined_text = "[LỖI PHÂN TÍCH] AI không trả về nội dung nào."
             logger.warning("AI không trả về nội dung nào sau khi stream kết thúc.")
 
+        limiter = gemini_service.get_rate_limiter(self.app.api_key_var.get(), self.cfg.api)
+        if limiter is not None:
+            logger.debug(f"Mức sử dụng hạn mức API: {limiter.metrics()}")
         self.app.ui_queue.put(lambda: self.app.ui_status(f"Model trả lời trong {(_tnow() - t_llm0):.2f}s"))
         self.app.ui_queue.put(lambda: self.app._update_progress(self.steps_upload + 1, self.steps_upload + 2))
         return True
 
+    def _open_stream(self, model: Any, parts: List[Any], cancel_token: CancelToken) -> Iterator[Any]:
+        return gemini_service.stream_gemini_response(
+            model=model,
+            parts=parts,
+            tries=self.cfg.api.tries,
+            base_delay=self.cfg.api.delay,
+            response_cache=response_cache.get_response_cache(self.cfg.api),
+            rate_limiter=gemini_service.get_rate_limiter(self.app.api_key_var.get(), self.cfg.api),
+            cancel_token=cancel_token,
+            timeouts=gemini_async.StreamTimeouts.from_api(self.cfg.api) if self.cfg.api.async_stream else None,
+        )
+
+    def _hedged_stream(self, model: Any, parts: List[Any], full_parts: List[Any]) -> Iterator[Any]:
+        """Stream chính + một request hedge (model dự phòng, prompt đầy đủ không dùng context cache)."""
+        candidates = [
+            hedging.HedgeCandidate(
+                "primary", self.model_name, lambda token: self._open_stream(model, parts, token),
+                gemini_service.estimate_request_tokens(parts),
+            )
+        ]
+        hedge_name = self.cfg.api.hedge_model or self.model_name
+        hedge_model = gemini_service.initialize_model(api_key=self.app.api_key_var.get(), model_name=hedge_name)
+        if hedge_model is not None:
+            candidates.append(
+                hedging.HedgeCandidate(
+                    "hedge", hedge_name, lambda token: self._open_stream(hedge_model, full_parts, token),
+                    gemini_service.estimate_request_tokens(full_parts),
+                )
+            )
+        hedged = hedging.HedgedStream(candidates, self.cfg.api.hedge_delay_sec, self.cancel_token)
+        try:
+            yield from hedged.stream()
+        finally:
+            hedging.append_ledger(
+                Path(self.app.folder_path.get()) / "Reports" / hedging.LEDGER_FILENAME,
+                hedged.attempts,
+                t=datetime.now().isoformat(),
+                symbol=self.cfg.mt5.symbol,
+            )
+
+    def _prompt_cache_model(self, static_part: str) -> Optional[Any]:
+        """Model gắn với context cache của phần prompt tĩnh; None nếu không dùng được cache."""
+        cache = prompt_cache.get_prefix_cache()
+        if cache is None or not static_part.strip():
+            return None
+        api_key = self.app.api_key_var.get()
+        scope = gemini_service.key_fingerprint(api_key)
+        ttl_sec = max(5, self.cfg.api.prompt_cache_ttl_min) * 60
+        for _ in range(2):
+            entry = cache.acquire(scope, self.model_name, static_part, ttl_sec)
+            if entry is None:
+                return None
+            try:
+                return cache.backend.model_for(entry.name, api_key)
+            except Exception as e:
+                logger.warning(f"Prompt cache {entry.name} không dùng được ({e}), tạo lại.")
+                cache.invalidate(scope, self.model_name)
+        return None
+
+    def _invalidate_prompt_cache(self) -> None:
+        cache = prompt_cache.get_prefix_cache()
+        if cache is not None:
+            cache.invalidate(gemini_service.key_fingerprint(self.app.api_key_var.get()), self.model_name)
+
+    @_timed_stage("stage_5")
     def _stage_5_execute_or_manage_trades(self) -> None:
         """Giai đoạn 5: Thực thi hoặc quản lý giao dịch."""
         logger.debug("GIAI ĐOẠN 5: Thực thi hoặc quản lý giao dịch.")
@@ -535,6 +777,7 @@ class AnalysisWorker:
             logger.info(f"Có {len(positions)} lệnh. Thực hiện quản lý.")
             trade_actions.manage_existing_trades(self.app, self.combined_text, self.mt5_dict, self.cfg)
 
+    @_timed_stage("stage_6")
     def _stage_6_finalize_and_cleanup(self) -> None:
         """Giai đoạn 6: Hoàn tất, lưu trữ và dọn dẹp."""
         logger.debug("GIAI ĐOẠN 6: Hoàn tất và dọn dẹp.")
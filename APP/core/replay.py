@@ -0,0 +1,662 @@
+# -*- coding: utf-8 -*-
+"""
+Chạy lại toàn bộ pipeline `AnalysisWorker` (GĐ 1–6) hoàn toàn offline để profile và kiểm thử hồi quy.
+
+Các phụ thuộc bên ngoài được thay bằng bản giả lập tất định:
+- MT5: luồng snapshot đã ghi (`Reports/snapshots`, xem `param_sweep.record_snapshot`) thay cho
+  `mt5_service.get_market_data_async`; đồng hồ của worker và NewsService được ghim vào thời điểm snapshot.
+- Gemini: `StubGeminiModel` stream báo cáo soạn sẵn theo từng chunk với độ trễ cấu hình được.
+- File API: `FakeFileStore` giữ file "đã upload" trong bộ nhớ (kể cả cache upload).
+- Lệnh: `FakeOrderBackend` đóng vai module `MetaTrader5` để `build_trade_requests`/`order_send_smart`
+  chạy đúng code thật và ghi lại mọi request.
+Phần còn lại (context, điều kiện, parse báo cáo, lưu MD/JSON, log lệnh) chạy code thật trên một
+workspace riêng. Mỗi phiên trả về thời gian từng giai đoạn (`AnalysisWorker.stage_timings`).
+
+Ví dụ:
+    python -m APP.core.replay --snapshots <Reports> --sessions 300 --chunk-delay-ms 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import copy
+import hashlib
+import itertools
+import json
+import logging
+import queue
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Callable, Iterator, Optional, Sequence, Union
+from unittest import mock
+
+import numpy as np
+
+from APP.analysis import image_processor
+from APP.core import analysis_worker
+from APP.core.analysis_worker import AnalysisWorker
+from APP.core.trading import actions as trade_actions
+from APP.core.trading import param_sweep, trade_ledger
+from APP.core.trading.param_sweep import ReplaySnapshot
+from APP.services import gemini_service, mt5_service
+from APP.utils.safe_data import SafeData
+from APP.utils.threading_utils import ThreadingManager
+
+if TYPE_CHECKING:
+    from APP.configs.app_config import RunConfig
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("stage_1", "stage_2", "stage_3", "stage_4", "stage_5", "stage_6")
+DEFAULT_IMAGE_NAMES = ("H1.png", "M15.png", "M5.png", "M1.png")
+
+ReportSource = Union[Sequence[str], Callable[[ReplaySnapshot, int], str]]
+
+
+# region Stub Gemini
+@dataclass(frozen=True)
+class StubChunk:
+    """Chunk giống `GenerateContentResponse` ở mức worker sử dụng (chỉ thuộc tính `text`)."""
+
+    text: str
+
+
+def canned_report(snapshot: ReplaySnapshot, index: int = 0) -> str:
+    """
+    Báo cáo mặc định cho một snapshot: nếu snapshot có proposal đã ghi thì tái tạo đúng
+    setup đó (để GĐ 5 đặt lệnh), ngược lại trả về báo cáo "không có setup".
+    """
+    p = snapshot.proposal
+    if p is None:
+        payload: dict[str, Any] = {"setup_grade": "C", "proposed_plan": {}}
+        headline = "Không có setup đạt chuẩn."
+    else:
+        payload = {
+            "setup_grade": p.grade,
+            "proposed_plan": {
+                "direction": "BUY" if p.side > 0 else "SELL",
+                "entry": p.entry,
+                "sl": p.sl,
+                "tp1": p.tp1,
+                "tp2": p.tp2,
+                "risk_multiplier": param_sweep._GRADE_RISK.get(p.grade, 0.0),
+            },
+        }
+        headline = f"Setup {payload['setup_grade']} {payload['proposed_plan']['direction']} tại {p.entry}."
+    return (
+        f"### NHIỆM VỤ 1 - TÓM TẮT\n{headline}\n\n"
+        f"### NHIỆM VỤ 2 - KẾ HOẠCH\n```json\n{json.dumps(payload, ensure_ascii=False, indent=2)}\n```\n"
+    )
+
+
+class StubGeminiModel:
+    """
+    Model giả lập: `stream()` có cùng chữ ký với `gemini_service.stream_gemini_response` và
+    stream báo cáo đã chọn cho phiên hiện tại thành các chunk `chunk_chars` ký tự.
+
+    `first_chunk_delay`/`chunk_delay` (giây) mô phỏng độ trễ mạng; báo cáo được chọn tất định
+    theo thứ tự phiên (vòng tròn) hoặc bởi hàm `reports(snapshot, index)`.
+    """
+
+    def __init__(
+        self,
+        reports: ReportSource = canned_report,
+        *,
+        chunk_chars: int = 120,
+        chunk_delay: float = 0.0,
+        first_chunk_delay: float = 0.0,
+    ) -> None:
+        if not callable(reports) and not reports:
+            raise ValueError("Cần ít nhất một báo cáo soạn sẵn.")
+        self._reports = reports
+        self.chunk_chars = max(1, int(chunk_chars))
+        self.chunk_delay = max(0.0, float(chunk_delay))
+        self.first_chunk_delay = max(0.0, float(first_chunk_delay))
+        self._text = ""
+        self.calls: list[dict[str, Any]] = []
+
+    def prepare(self, snapshot: ReplaySnapshot, index: int) -> str:
+        """Chọn báo cáo cho phiên sắp chạy."""
+        if callable(self._reports):
+            self._text = self._reports(snapshot, index)
+        else:
+            self._text = self._reports[index % len(self._reports)]
+        return self._text
+
+    def stream(
+        self,
+        model: Any,
+        parts: list[Any],
+        tries: int = 1,
+        base_delay: float = 0.0,
+        response_cache: Any = None,
+        rate_limiter: Any = None,
+        cancel_token: Any = None,
+        timeouts: Any = None,
+    ) -> Iterator[StubChunk]:
+        prompt = parts[-1] if parts and isinstance(parts[-1], str) else ""
+        self.calls.append({"media": len(parts) - (1 if prompt else 0), "prompt_chars": len(prompt)})
+        if self.first_chunk_delay:
+            time.sleep(self.first_chunk_delay)
+        text = self._text
+        for start in range(0, len(text), self.chunk_chars):
+            if start and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield StubChunk(text[start : start + self.chunk_chars])
+
+
+# endregion
+
+
+# region Fake File API
+class FakeFileStore:
+    """
+    Thay thế Gemini File API: `upload()` cho `image_processor.upload_image_to_gemini`,
+    `get_file()`/`delete_file()` cho module `genai` mà worker dùng. Cache upload cũng được
+    giữ trong bộ nhớ để không đụng tới `upload_cache.json` thật.
+    """
+
+    def __init__(self, upload_delay: float = 0.0) -> None:
+        self.upload_delay = max(0.0, float(upload_delay))
+        self.files: dict[str, SimpleNamespace] = {}
+        self.upload_cache: dict[str, Any] = {}
+        self.uploads = 0
+        self.deletes = 0
+        self._lock = threading.Lock()
+
+    def upload(self, image_path: Path, display_name: str | None = None, timeout: int = 60) -> SimpleNamespace:
+        if self.upload_delay:
+            time.sleep(self.upload_delay)
+        digest = hashlib.sha1(Path(image_path).read_bytes()).hexdigest()[:16]
+        file_obj = SimpleNamespace(
+            name=f"files/{digest}",
+            display_name=display_name or Path(image_path).name,
+            uri=f"replay://files/{digest}",
+            state=SimpleNamespace(name="ACTIVE"),
+        )
+        with self._lock:
+            self.files[file_obj.name] = file_obj
+            self.uploads += 1
+        return file_obj
+
+    def get_file(self, name: str) -> SimpleNamespace:
+        with self._lock:
+            if name not in self.files:
+                raise KeyError(f"File '{name}' không tồn tại.")
+            return self.files[name]
+
+    def delete_file(self, name: str) -> None:
+        with self._lock:
+            self.files.pop(name, None)
+            self.deletes += 1
+
+    def load_cache(self) -> dict[str, Any]:
+        return dict(self.upload_cache)
+
+    def save_cache(self, cache: dict[str, Any]) -> None:
+        self.upload_cache = dict(cache)
+
+
+# endregion
+
+
+# region Fake order backend
+class FakeOrderBackend:
+    """
+    Đóng vai module `MetaTrader5` ở mức các đường giao dịch sử dụng: hằng số, `order_send`,
+    `positions_get`, `symbol_info_tick`, `last_error`. Mọi request được ghi vào `requests`.
+    """
+
+    ORDER_TYPE_BUY = 0
+    ORDER_TYPE_SELL = 1
+    ORDER_FILLING_FOK = 0
+    ORDER_FILLING_IOC = 1
+    ORDER_FILLING_RETURN = 2
+    ORDER_TIME_GTC = 0
+    TRADE_ACTION_DEAL = 1
+    TRADE_ACTION_SLTP = 6
+    TRADE_RETCODE_REQUOTE = 10004
+    TRADE_RETCODE_DONE = 10009
+    TRADE_RETCODE_TIMEOUT = 10012
+    TRADE_RETCODE_PRICE_OFF = 10021
+    TRADE_RETCODE_CONNECTION = 10031
+    TIMEFRAME_M5 = 5
+
+    def __init__(self, retcode: int | None = None) -> None:
+        self.retcode = self.TRADE_RETCODE_DONE if retcode is None else retcode
+        self.requests: list[dict[str, Any]] = []
+        self._tickets = itertools.count(1)
+        self._positions: list[SimpleNamespace] = []
+        self._tick: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def load_snapshot(self, mt5_data: dict[str, Any]) -> None:
+        """Đồng bộ vị thế/tick với snapshot của phiên sắp chạy."""
+        self._positions = [SimpleNamespace(**p) for p in mt5_data.get("positions") or [] if isinstance(p, dict)]
+        self._tick = dict(mt5_data.get("tick") or {})
+
+    def order_send(self, request: dict[str, Any]) -> SimpleNamespace:
+        with self._lock:
+            self.requests.append(dict(request))
+            ticket = next(self._tickets)
+        return SimpleNamespace(retcode=self.retcode, order=ticket, deal=ticket, comment="replay", request=request)
+
+    def positions_get(self, ticket: int | None = None, symbol: str | None = None) -> tuple[SimpleNamespace, ...]:
+        return tuple(
+            p for p in self._positions
+            if (ticket is None or getattr(p, "ticket", None) == ticket)
+            and (symbol is None or getattr(p, "symbol", None) == symbol)
+        )
+
+    def symbol_info_tick(self, symbol: str) -> SimpleNamespace:
+        return SimpleNamespace(bid=self._tick.get("bid", 0.0), ask=self._tick.get("ask", 0.0))
+
+    def symbol_info(self, symbol: str) -> None:
+        return None
+
+    def last_error(self) -> tuple[int, str]:
+        return (1, "Success")
+
+
+# endregion
+
+
+# region Headless UI
+class _Var:
+    def __init__(self, value: Any = None) -> None:
+        self._value = value
+
+    def get(self) -> Any:
+        return self._value
+
+    def set(self, value: Any) -> None:
+        self._value = value
+
+
+class ReplayUi:
+    """Cài đặt `AnalysisUi` không giao diện; callback trong `ui_queue` được chạy bởi `drain()`."""
+
+    def __init__(
+        self,
+        workspace: Path,
+        images: Sequence[Path],
+        threading_manager: ThreadingManager,
+        news_service: Any,
+        prompts: dict[str, str],
+        model_name: str = "replay-stub",
+    ) -> None:
+        from APP.ui.utils.timeframe_detector import TimeframeDetector
+
+        self.ui_queue: queue.Queue[Any] = queue.Queue()
+        self.threading_manager = threading_manager
+        self.news_service = news_service
+        self.prompt_manager = SimpleNamespace(get_prompts=lambda: prompts, load_prompts_from_disk=lambda silent=False: None)
+        self.history_manager = SimpleNamespace(refresh_all_lists=lambda: None)
+        self.timeframe_detector = TimeframeDetector()
+        self.folder_path = _Var(str(workspace))
+        self.api_key_var = _Var("replay")
+        self.model_var = _Var(model_name)
+        self._images = [Path(p) for p in images]
+        self.results: list[dict[str, Any]] = []
+        self.combined_report_text = ""
+        self.stop_flag = False
+        self.statuses: list[str] = []
+        self.errors: list[tuple[str, str]] = []
+        self.detail_text = ""
+        self.finalized: Optional[str] = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.results = [{"path": str(p), "name": p.name, "status": "Chưa xử lý"} for p in self._images]
+        self.combined_report_text = ""
+        self.statuses.clear()
+        self.errors.clear()
+        self.detail_text = ""
+        self.finalized = None
+
+    def drain(self) -> int:
+        count = 0
+        while True:
+            try:
+                callback = self.ui_queue.get_nowait()
+            except queue.Empty:
+                return count
+            count += 1
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Callback UI lỗi khi replay: {e}")
+
+    def ui_status(self, message: str) -> None:
+        self.statuses.append(message)
+
+    def ui_progress(self, value: float | None, *, indeterminate: bool = False) -> None:
+        pass
+
+    def ui_detail_replace(self, text: str) -> None:
+        self.detail_text = text
+
+    def ui_detail_append(self, text: str) -> None:
+        self.detail_text += text
+
+    def show_error_message(self, title: str, message: str) -> None:
+        self.errors.append((title, message))
+
+    def _update_tree_row(self, index: int, status: str) -> None:
+        pass
+
+    def _update_progress(self, current_step: int, total_steps: int) -> None:
+        pass
+
+    def _finalize_done(self) -> None:
+        self.finalized = "done"
+
+    def _finalize_stopped(self) -> None:
+        self.finalized = "stopped"
+
+
+# endregion
+
+
+# region Harness
+@dataclass
+class SessionResult:
+    """Kết quả một phiên replay."""
+
+    index: int
+    snapshot_time: datetime
+    status: str
+    early_exit: bool
+    timings: dict[str, float]
+    total: float
+    orders: int
+    report_chars: int
+    ui_events: int
+    errors: list[tuple[str, str]] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "index": self.index,
+            "snapshot_time": self.snapshot_time.isoformat(),
+            "status": self.status,
+            "early_exit": self.early_exit,
+            "timings": dict(self.timings),
+            "total": self.total,
+            "orders": self.orders,
+            "report_chars": self.report_chars,
+            "ui_events": self.ui_events,
+            "errors": [list(e) for e in self.errors],
+        }
+
+
+def _write_placeholder_images(directory: Path, names: Sequence[str]) -> list[Path]:
+    """Ảnh giả (nội dung khác nhau theo tên) cho GĐ 3; Pillow không bắt buộc."""
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name in names:
+        path = directory / name
+        if not path.exists():
+            path.write_bytes(b"\x89PNG\r\n\x1a\n" + hashlib.sha256(name.encode()).digest())
+        paths.append(path)
+    return paths
+
+
+def _load_prompts() -> dict[str, str]:
+    from APP.configs.constants import PATHS
+
+    prompts = {}
+    for key, filename in (("no_entry", "prompt_no_entry_vision.txt"), ("entry_run", "prompt_entry_run_vision.txt")):
+        path = PATHS.PROMPTS_DIR / filename
+        prompts[key] = path.read_text(encoding="utf-8") if path.exists() else ""
+    return prompts
+
+
+class ReplayHarness:
+    """
+    Chạy nhiều phiên `AnalysisWorker` liên tiếp trên luồng snapshot đã ghi.
+
+    `cfg` được điều chỉnh cho replay: workspace riêng, symbol theo snapshot và auto-trade bật
+    (không dry-run) để GĐ 5 gửi lệnh vào `FakeOrderBackend`, Telegram tắt; `overrides` (`"section.field": v`)
+    áp dụng sau đó. Các đường gọi SDK Gemini không đi qua model giả (context cache, response cache,
+    hedge, stream async) luôn bị tắt, kể cả khi `overrides` bật. Sổ cái lệnh nằm trong workspace và
+    dùng giờ của snapshot, nên `cooldown_min` được áp dụng theo thời gian replay.
+    """
+
+    def __init__(
+        self,
+        cfg: "RunConfig",
+        snapshots: Sequence[ReplaySnapshot],
+        workspace: Path,
+        *,
+        model: Optional[StubGeminiModel] = None,
+        file_store: Optional[FakeFileStore] = None,
+        order_backend: Optional[FakeOrderBackend] = None,
+        images: Optional[Sequence[Path]] = None,
+        overrides: Optional[dict[str, Any]] = None,
+        max_workers: int = 4,
+    ) -> None:
+        if not snapshots:
+            raise ValueError("Cần ít nhất một snapshot để replay.")
+        self.snapshots = list(snapshots)
+        self.workspace = Path(workspace)
+        self.model = model or StubGeminiModel()
+        self.file_store = file_store or FakeFileStore()
+        self.order_backend = order_backend or FakeOrderBackend()
+
+        symbol = self.snapshots[0].mt5_data.get("symbol") or cfg.mt5.symbol
+        cfg = replace(
+            cfg,
+            folder=replace(cfg.folder, folder=str(self.workspace)),
+            mt5=replace(cfg.mt5, symbol=symbol),
+            auto_trade=replace(cfg.auto_trade, enabled=True, dry_run=False),
+            telegram=replace(cfg.telegram, enabled=False),
+        )
+        cfg = param_sweep.apply_overrides(cfg, overrides or {})
+        self.cfg = replace(
+            cfg,
+            api=replace(
+                cfg.api,
+                prompt_cache_enabled=False,
+                response_cache_enabled=False,
+                hedge_enabled=False,
+                async_stream=False,
+            ),
+        )
+
+        self.images = list(images) if images else _write_placeholder_images(self.workspace / "images", DEFAULT_IMAGE_NAMES)
+        self.threading_manager = ThreadingManager(max_workers=max_workers)
+        self.ui = ReplayUi(self.workspace, self.images, self.threading_manager, None, _load_prompts())
+        self._current: Optional[ReplaySnapshot] = None
+        self.ledger = trade_ledger.TradeLedger(
+            self.workspace / trade_ledger.JOURNAL_FILENAME,
+            timezone_name=self.cfg.no_run.timezone,
+            clock=self._snapshot_timestamp,
+        )
+
+    def _snapshot_timestamp(self) -> float:
+        snap = self._current or self.snapshots[0]
+        return snap.time_utc.timestamp()
+
+    # -- patching -------------------------------------------------------
+    def _market_data_feed(self) -> Callable[..., SafeData]:
+        harness = self
+
+        def get_market_data_async(*args: Any, **kwargs: Any) -> SafeData:
+            # Giữ tên hàm gốc: `run_in_parallel` lấy kết quả theo `__name__`.
+            snap = harness._current
+            return SafeData(copy.deepcopy(snap.mt5_data) if snap else None)
+
+        return get_market_data_async
+
+    @contextlib.contextmanager
+    def patched(self) -> Iterator[None]:
+        """Thay các điểm nối ra bên ngoài của pipeline bằng bản giả lập trong phạm vi `with`."""
+        store = self.file_store
+        fake_genai = SimpleNamespace(get_file=store.get_file, delete_file=store.delete_file)
+        with contextlib.ExitStack() as stack:
+            for target, attr, value in (
+                (gemini_service, "ensure_configured", lambda api_key: True),
+                (gemini_service, "initialize_model", lambda api_key, model_name: self.model),
+                (gemini_service, "stream_gemini_response", self.model.stream),
+                (mt5_service, "get_market_data_async", self._market_data_feed()),
+                (mt5_service, "mt5", self.order_backend),
+                (trade_actions, "mt5", self.order_backend),
+                (analysis_worker, "genai", fake_genai),
+                (image_processor, "upload_image_to_gemini", store.upload),
+                (image_processor.UploadCache, "load", staticmethod(store.load_cache)),
+                (image_processor.UploadCache, "save", staticmethod(store.save_cache)),
+                (trade_ledger, "get_ledger", lambda *args, **kwargs: self.ledger),
+            ):
+                stack.enter_context(mock.patch.object(target, attr, value))
+            yield
+
+    # -- chạy -----------------------------------------------------------
+    def run_session(self, index: int) -> SessionResult:
+        snap = self.snapshots[index % len(self.snapshots)]
+        self._current = snap
+        self.order_backend.load_snapshot(snap.mt5_data)
+        report = self.model.prepare(snap, index)
+        orders_before = len(self.order_backend.requests)
+
+        self.ui.reset()
+        self.ui.news_service = param_sweep._ReplayNewsService(self.cfg, snap.news_events, snap.time_utc)
+        worker = AnalysisWorker(
+            self.ui,
+            self.cfg,
+            session_id=f"replay-{index}",
+            clock=lambda: snap.time_utc,
+        )
+        t0 = time.perf_counter()
+        outcome = worker.run()
+        total = time.perf_counter() - t0
+        ui_events = self.ui.drain()
+
+        return SessionResult(
+            index=index,
+            snapshot_time=snap.time_utc,
+            status=outcome.get("status", "unknown"),
+            early_exit=bool(outcome.get("early_exit")),
+            timings=dict(worker.stage_timings),
+            total=total,
+            orders=len(self.order_backend.requests) - orders_before,
+            report_chars=len(report),
+            ui_events=ui_events,
+            errors=list(self.ui.errors),
+        )
+
+    def run(self, sessions: int) -> list[SessionResult]:
+        """Chạy `sessions` phiên liên tiếp, lặp vòng qua các snapshot."""
+        results = []
+        with self.patched():
+            for i in range(sessions):
+                results.append(self.run_session(i))
+        return results
+
+    def close(self) -> None:
+        self.threading_manager.shutdown(wait=True)
+
+    def __enter__(self) -> "ReplayHarness":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def summarize(results: Sequence[SessionResult]) -> dict[str, Any]:
+    """Thống kê thời gian (ms) theo giai đoạn: mean/p50/p95/max, cùng số phiên và lệnh."""
+    stats: dict[str, Any] = {}
+    for stage in (*STAGES, "total"):
+        values = [r.total if stage == "total" else r.timings.get(stage) for r in results]
+        arr = np.asarray([v for v in values if v is not None], dtype=np.float64) * 1000.0
+        if arr.size == 0:
+            continue
+        stats[stage] = {
+            "n": int(arr.size),
+            "mean_ms": float(arr.mean()),
+            "p50_ms": float(np.percentile(arr, 50)),
+            "p95_ms": float(np.percentile(arr, 95)),
+            "max_ms": float(arr.max()),
+        }
+    return {
+        "sessions": len(results),
+        "completed": sum(1 for r in results if r.status == "completed" and not r.early_exit),
+        "early_exit": sum(1 for r in results if r.early_exit),
+        "orders": sum(r.orders for r in results),
+        "stages": stats,
+    }
+
+
+def format_summary(summary: dict[str, Any]) -> str:
+    lines = [
+        f"Phiên: {summary['sessions']} | hoàn tất: {summary['completed']} | "
+        f"thoát sớm: {summary['early_exit']} | lệnh: {summary['orders']}",
+        f"{'stage':<8} {'n':>5} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}  (ms)",
+    ]
+    for stage, s in summary["stages"].items():
+        lines.append(
+            f"{stage:<8} {s['n']:>5} {s['mean_ms']:>9.2f} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['max_ms']:>9.2f}"
+        )
+    return "\n".join(lines)
+
+
+# endregion
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from APP.configs import workspace_config
+    from APP.ui.state.config_state import UiConfigState
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snapshots", required=True, type=Path, help="Thư mục Reports chứa snapshots/.")
+    parser.add_argument("--workspace", type=Path, default=None, help="File workspace.json làm cấu hình gốc.")
+    parser.add_argument("--out-dir", type=Path, default=None, help="Workspace cho báo cáo replay (mặc định: thư mục tạm).")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--report", type=Path, nargs="*", default=[], help="Báo cáo soạn sẵn (mặc định: dựng từ proposal).")
+    parser.add_argument("--chunk-chars", type=int, default=120)
+    parser.add_argument("--chunk-delay-ms", type=float, default=0.0)
+    parser.add_argument("--first-chunk-delay-ms", type=float, default=0.0)
+    parser.add_argument("--upload-delay-ms", type=float, default=0.0)
+    parser.add_argument("--out", type=Path, default=None, help="Ghi kết quả từng phiên dạng JSON.")
+    args = parser.parse_args(argv)
+
+    base_cfg = UiConfigState.from_workspace_config(
+        workspace_config.load_config_from_file(args.workspace)
+    ).to_run_config()
+    snapshots = param_sweep.load_snapshots(args.snapshots)
+    if not snapshots:
+        parser.error(f"Không tìm thấy snapshot trong {args.snapshots}")
+
+    reports: ReportSource = [p.read_text(encoding="utf-8") for p in args.report] or canned_report
+    model = StubGeminiModel(
+        reports,
+        chunk_chars=args.chunk_chars,
+        chunk_delay=args.chunk_delay_ms / 1000.0,
+        first_chunk_delay=args.first_chunk_delay_ms / 1000.0,
+    )
+
+    with contextlib.ExitStack() as stack:
+        out_dir = args.out_dir or Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="replay_")))
+        harness = stack.enter_context(
+            ReplayHarness(
+                base_cfg,
+                snapshots,
+                out_dir,
+                model=model,
+                file_store=FakeFileStore(upload_delay=args.upload_delay_ms / 1000.0),
+            )
+        )
+        results = harness.run(args.sessions)
+
+    print(format_summary(summarize(results)))
+    if args.out:
+        args.out.write_text(json.dumps([r.to_dict() for r in results], ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
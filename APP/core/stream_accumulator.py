@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Gom văn bản stream từ model AI và đẩy lên UI theo nhịp giới hạn.
+
+Các chunk được giữ trong một list (nối một lần khi cần toàn văn), nên chi phí tích lũy là O(n)
+thay vì O(n²) của `text += chunk`. UI chỉ nhận phần mới (delta) tối đa `max_hz` lần mỗi giây:
+lần phát đầu tiên thay thế nội dung chờ ("Đang nhận dữ liệu..."), các lần sau chỉ nối thêm, và
+`flush()` ở cuối stream đẩy nốt phần còn lại.
+"""
+
+from __future__ import annotations
+
+import logging
+from time import monotonic
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_HZ = 15.0
+
+
+class StreamAccumulator:
+    """Bộ đệm chunk với các lần phát delta được gộp theo tần số tối đa."""
+
+    def __init__(
+        self,
+        on_replace: Callable[[str], None],
+        on_append: Callable[[str], None],
+        max_hz: float = DEFAULT_MAX_HZ,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.on_replace = on_replace
+        self.on_append = on_append
+        self.min_interval = 1.0 / max_hz if max_hz > 0 else 0.0
+        self.clock = clock
+        self._chunks: list[str] = []
+        self._pending: list[str] = []
+        self._last_emit: float | None = None
+        self._emitted_any = False
+        self.emits = 0
+
+    def add(self, text: str) -> None:
+        """Thêm một chunk; phát delta nếu đã qua đủ khoảng thời gian tối thiểu."""
+        if not text:
+            return
+        self._chunks.append(text)
+        self._pending.append(text)
+        now = self.clock()
+        if self._last_emit is None or now - self._last_emit >= self.min_interval:
+            self._emit(now)
+
+    def flush(self) -> None:
+        """Phát toàn bộ phần chưa gửi (gọi khi stream kết thúc)."""
+        if self._pending:
+            self._emit(self.clock())
+
+    def _emit(self, now: float) -> None:
+        delta = "".join(self._pending)
+        self._pending.clear()
+        self._last_emit = now
+        self.emits += 1
+        if self._emitted_any:
+            self.on_append(delta)
+        else:
+            self._emitted_any = True
+            self.on_replace(delta)
+
+    @property
+    def text(self) -> str:
+        """Toàn văn đã nhận; gộp các chunk lại thành một phần tử để lần gọi sau rẻ."""
+        if len(self._chunks) > 1:
+            self._chunks[:] = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
@@ -8,7 +8,8 @@ try:
 except ImportError:
     mt5 = None
 
-from APP.analysis import report_parser
+from APP.analysis import report_parser, structure_alignment
+from APP.core.trading import trade_ledger
 from APP.persistence import log_handler
 from APP.services import mt5_service
 
@@ -34,6 +35,16 @@ def execute_trade_action(
         logger.debug(f"Không có setup chất lượng cao (Grade: {grade}). Bỏ qua.")
         return False
 
+    if cfg.auto_trade.require_structure_alignment:
+        alignment = structure_alignment.compute_alignment(mt5_ctx)
+        if alignment.opposes(plan["direction"]):
+            logger.info(
+                f"Đồng thuận cấu trúc: bỏ qua lệnh {plan['direction']} vì cấu trúc đa khung đang "
+                f"{alignment.direction} (score {alignment.score:+.2f})."
+            )
+            app.ui_queue.put(lambda: app.ui_status("Lệnh ngược đồng thuận cấu trúc đa khung, bỏ qua."))
+            return False
+
     try:
         risk_multiplier = float(plan.get("risk_multiplier", 0.0))
     except (ValueError, TypeError):
@@ -43,6 +54,14 @@ def execute_trade_action(
         logger.warning(f"Risk multiplier không hợp lệ hoặc bằng 0 ({risk_multiplier}). Bỏ qua.")
         return False
 
+    symbol = mt5_ctx.get("symbol", "") or cfg.mt5.symbol
+    ledger = trade_ledger.get_ledger(timezone_name=cfg.no_run.timezone)
+    limits = ledger.status_for(symbol, cfg.auto_trade)
+    if limits.blocked:
+        logger.info(f"Bỏ qua lệnh {grade}: {limits.reason()}")
+        app.ui_queue.put(lambda: app.ui_status(limits.reason()))
+        return False
+
     lots = mt5_service.calculate_lots(
         cfg, mt5_ctx.get("symbol", ""), plan["entry"], plan["sl"],
         mt5_ctx.get("info", {}), mt5_ctx.get("account", {}), risk_multiplier
@@ -53,6 +72,17 @@ def execute_trade_action(
         app.ui_queue.put(lambda: app.ui_status("Lỗi tính toán khối lượng."))
         return False
 
+    max_exposure = cfg.correlation.max_exposure_lots
+    exposure = (mt5_ctx.get("correlation") or {}).get("exposure") or {}
+    if cfg.correlation.enabled and max_exposure > 0 and exposure:
+        side = "long" if str(plan["direction"]).upper() == "BUY" else "short"
+        current = float(exposure.get(side) or 0.0)
+        if current + lots > max_exposure:
+            msg = f"Phơi nhiễm tương quan {current:.2f} + {lots:.2f} lot vượt {max_exposure:.2f}, bỏ qua lệnh."
+            logger.info(msg)
+            app.ui_queue.put(lambda: app.ui_status(msg))
+            return False
+
     reqs = mt5_service.build_trade_requests(
         symbol=mt5_ctx.get("symbol", ""),
         direction=plan["direction"],
@@ -75,12 +105,20 @@ def execute_trade_action(
         return True
 
     has_errors = False
+    tickets: list[int] = []
     for req in reqs:
         res = mt5_service.order_send_smart(req)
         if not res or res.retcode != mt5.TRADE_RETCODE_DONE:
             has_errors = True
             app.ui_queue.put(lambda: app.ui_status(f"Lỗi gửi lệnh: {getattr(res, 'comment', 'Không rõ')}"))
-    
+        else:
+            tickets.append(int(getattr(res, "order", 0) or 0))
+
+    if tickets:
+        ledger.record_entry(
+            symbol, tickets=tickets, direction=plan["direction"], volume=lots, price=plan["entry"], grade=grade
+        )
+
     if not has_errors:
         app.ui_queue.put(lambda: app.ui_status(f"Đã đặt lệnh cho setup hạng {grade}."))
         return True
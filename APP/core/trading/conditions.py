@@ -20,6 +20,7 @@ from APP.utils.safe_data import SafeData
 if TYPE_CHECKING:
     from APP.configs.app_config import RunConfig
     from APP.core.analysis_worker import AnalysisWorker
+    from APP.core.trading.trade_ledger import TradeLedger
 
 
 logger = logging.getLogger(__name__)
@@ -31,13 +32,14 @@ logger = logging.getLogger(__name__)
 
 
 def check_no_run_conditions(
-    cfg: RunConfig, news_service: NewsService
+    cfg: RunConfig, news_service: NewsService, now_utc: Optional[datetime] = None
 ) -> tuple[bool, str]:
     """Kiểm tra các điều kiện NO-RUN cấp cao nhất.
 
     Args:
         cfg: Đối tượng cấu hình RunConfig.
         news_service: Instance của dịch vụ tin tức.
+        now_utc: Thời điểm đánh giá (mặc định là hiện tại); chế độ replay truyền thời điểm snapshot.
 
     Returns:
         Tuple (bool, str): (True, "Lý do chạy") hoặc (False, "Lý do dừng").
@@ -55,7 +57,7 @@ def check_no_run_conditions(
         tz = ZoneInfo(mt5_service.DEFAULT_TIMEZONE)
         tz_name = mt5_service.DEFAULT_TIMEZONE
 
-    now = datetime.now(tz)
+    now = (now_utc or datetime.now(timezone.utc)).astimezone(tz)
     reasons: list[str] = []
 
     # 1. Kiểm tra cuối tuần
@@ -533,12 +535,40 @@ class UpcomingNewsWarningCondition(AbstractCondition):
         return None
 
 
+class TradeLimitCondition(AbstractCondition):
+    """
+    Cảnh báo khi đang trong cooldown hoặc đã đạt số lệnh tối đa trong ngày. Không chặn phiên để
+    việc quản lý lệnh đang mở vẫn chạy; lệnh mới bị chặn tại `actions.execute_trade_action`.
+    """
+
+    condition_id = "trade_limits"
+
+    def check(
+        self, safe_mt5_data: Optional[SafeData], cfg: RunConfig, **kwargs: Any
+    ) -> NoTradeViolation | None:
+        ledger: TradeLedger | None = kwargs.get("ledger")
+        if ledger is None or not cfg.auto_trade.enabled:
+            return None
+
+        now = kwargs.get("now_utc") or datetime.now(timezone.utc)
+        status = ledger.status_for(cfg.mt5.symbol, cfg.auto_trade, at=now.timestamp())
+        if not status.blocked:
+            return None
+        return self.violation(
+            status.reason() or "Đã chạm giới hạn giao dịch.",
+            severity="warning",
+            blocking=False,
+            data=status.to_dict(),
+        )
+
+
 def check_no_trade_conditions(
     safe_mt5_data: Optional[SafeData],
     cfg: RunConfig,
     news_service: NewsService,
     *,
     now_utc: datetime | None = None,
+    ledger: TradeLedger | None = None,
 ) -> NoTradeCheckResult:
     """
     Đánh giá các điều kiện NO-TRADE bằng cách sử dụng Strategy Pattern.
@@ -547,6 +577,7 @@ def check_no_trade_conditions(
         safe_mt5_data: Dữ liệu an toàn từ MT5.
         cfg: Đối tượng cấu hình RunConfig.
         news_service: Instance của dịch vụ tin tức.
+        ledger: Sổ cái lệnh để kiểm tra cooldown/giới hạn lệnh mỗi ngày (bỏ qua nếu None).
 
     Returns:
         Danh sách các lý do vi phạm. Rỗng nếu không có vi phạm nào.
@@ -569,6 +600,7 @@ def check_no_trade_conditions(
         SessionCondition(),
         KeyLevelCondition(),
         UpcomingNewsWarningCondition(),
+        TradeLimitCondition(),
     ]
 
     # Truyền news_service vào kwargs để các điều kiện con có thể sử dụng
@@ -576,6 +608,7 @@ def check_no_trade_conditions(
         "news_service": news_service,
         "now_utc": now_utc,
         "metrics": metrics,
+        "ledger": ledger,
     }
 
     blocking: list[NoTradeViolation] = []
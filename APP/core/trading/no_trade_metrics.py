@@ -3,6 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any, Optional
 
+from APP.analysis import level_index
 from APP.configs.app_config import RunConfig
 from APP.services import mt5_service
 from APP.utils.safe_data import SafeData
@@ -179,7 +180,9 @@ def collect_no_trade_metrics(
     )
 
     key_levels = _build_key_level_snapshots(safe_mt5_data.get("key_levels_nearby"))
-    nearest_level = _pick_nearest_level(key_levels)
+    nearest_level = _pick_nearest_level(
+        key_levels, safe_mt5_data.get("symbol"), _try_float(tick.get("bid") or tick.get("last"))
+    )
 
     key_level_metrics = KeyLevelMetrics(
         nearest=nearest_level,
@@ -197,7 +200,19 @@ def collect_no_trade_metrics(
     )
 
 
-def _pick_nearest_level(levels: tuple[KeyLevelSnapshot, ...]) -> Optional[KeyLevelSnapshot]:
+def _pick_nearest_level(
+    levels: tuple[KeyLevelSnapshot, ...], symbol: Optional[str] = None, cp: Optional[float] = None
+) -> Optional[KeyLevelSnapshot]:
+    # Cùng chỉ mục mức ngày mà `mt5_service` đã dựng cho symbol (trúng cache), tra bằng bisect.
+    if symbol and cp and levels and all(lv.name and lv.price for lv in levels):
+        index = level_index.key_level_index(
+            symbol,
+            [level_index.PriceLevel(lv.price, lv.name, level_index.SOURCE_DAILY) for lv in levels],
+        )
+        found = index.nearest(cp)
+        if found is not None:
+            return next(lv for lv in levels if lv.name == found.name and lv.price == found.price)
+
     nearest: Optional[KeyLevelSnapshot] = None
     nearest_dist = float("inf")
     for level in levels:
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""
+Quét tham số (grid hoặc lấy mẫu ngẫu nhiên) cho các ngưỡng `NoTradeConfig`,
+`NewsConfig` và `AutoTradeConfig` trên các snapshot thị trường đã ghi lại.
+
+Khi bật `persistence.record_replay_snapshots` (mặc định tắt), mỗi lần phân tích worker ghi
+snapshot `MT5_DATA` cùng danh sách tin tức sắp tới vào `Reports/snapshots/snapshots_YYYYMMDD.jsonl`
+(`record_snapshot`, chỉ giữ `persistence.max_snapshot_files` file gần nhất). Công cụ quét phát lại
+các snapshot này qua đúng các lớp điều kiện thật (`check_no_trade_conditions`), cổng R:R
+tối thiểu TP2 và `mt5_service.calculate_lots` cho từng tổ hợp cấu hình, rồi tổng hợp:
+số lần bị chặn/được phép (theo từng điều kiện), số lệnh sẽ được đặt và kết quả của chúng
+(R-multiple từ `backtester` nếu có kho nến M1 và đề xuất tương ứng).
+
+Chạy:
+    python -m APP.core.trading.param_sweep --reports <thư mục Reports> \\
+        --grid no_trade.spread_max_pips=1.5,2,2.5,3 no_trade.min_atr_m5_pips=2,3,4 \\
+        --grid news.block_before_min=10,15,30 --workers 4
+    python -m APP.core.trading.param_sweep --reports <...> --grid ... --sample 50 --seed 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import itertools
+import json
+import logging
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields, replace
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Iterable, Mapping, Optional, Sequence
+
+from APP.analysis import backtester
+from APP.core.trading.conditions import check_no_trade_conditions
+from APP.services import mt5_service
+from APP.services.news_service import NewsService
+from APP.utils import general_utils
+from APP.utils.safe_data import SafeData
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from APP.configs.app_config import RunConfig
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIRNAME = "snapshots"
+SNAPSHOT_RETENTION_FILES = 30  # số file ngày được giữ lại (mặc định của `persistence.max_snapshot_files`)
+PROPOSAL_LINK_WINDOW = timedelta(minutes=30)
+# Các khóa được thêm vào payload sau khi lấy dữ liệu; không cần cho việc phát lại.
+_SNAPSHOT_EXCLUDE = ("evaluations", "similar_setups", "concept_value_table", "news_analysis")
+SWEEPABLE_SECTIONS = ("no_trade", "news", "auto_trade")
+_GRADE_RISK = {"A+": 1.0, "B": 0.5}
+
+
+# region Ghi / đọc snapshot
+@dataclass(frozen=True)
+class ReplaySnapshot:
+    """Một snapshot đã ghi lại, kèm đề xuất giao dịch phát sinh từ lần chạy đó (nếu có)."""
+
+    time_utc: datetime
+    mt5_data: dict[str, Any]
+    news_events: tuple[dict[str, Any], ...] = ()
+    proposal: Optional[backtester.Proposal] = None
+
+
+def _event_to_json(event: Mapping[str, Any]) -> dict[str, Any]:
+    out = {k: v for k, v in event.items() if k not in ("when_local", "time_remaining")}
+    when = out.get("when_utc")
+    if isinstance(when, datetime):
+        out["when_utc"] = when.astimezone(timezone.utc).isoformat()
+    return out
+
+
+def _event_from_json(event: Mapping[str, Any]) -> Optional[dict[str, Any]]:
+    try:
+        when = datetime.fromisoformat(str(event.get("when_utc")))
+    except ValueError:
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return {**event, "when_utc": when}
+
+
+def record_snapshot(
+    reports_dir: Path,
+    mt5_data: Mapping[str, Any],
+    news_events: Iterable[Mapping[str, Any]] = (),
+    now_utc: Optional[datetime] = None,
+    retention_files: int = SNAPSHOT_RETENTION_FILES,
+) -> Path:
+    """
+    Ghi thêm một snapshot vào file JSONL theo ngày (UTC) trong `Reports/snapshots`; khi mở file
+    ngày mới thì chỉ giữ lại `retention_files` file gần nhất.
+    """
+    now_utc = now_utc or datetime.now(timezone.utc)
+    snap_dir = Path(reports_dir) / SNAPSHOT_DIRNAME
+    snap_dir.mkdir(parents=True, exist_ok=True)
+    path = snap_dir / f"snapshots_{now_utc:%Y%m%d}.jsonl"
+    record = {
+        "time_utc": now_utc.isoformat(),
+        "mt5_data": {k: v for k, v in mt5_data.items() if k not in _SNAPSHOT_EXCLUDE},
+        "news_events": [_event_to_json(e) for e in news_events],
+    }
+    is_new = not path.exists()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    if is_new:
+        general_utils.cleanup_old_files(snap_dir, "snapshots_*.jsonl", max(1, int(retention_files)))
+    logger.debug(f"Đã ghi snapshot phát lại vào {path.name}.")
+    return path
+
+
+def load_snapshots(reports_dir: Path, symbol: Optional[str] = None) -> list[ReplaySnapshot]:
+    """
+    Đọc mọi snapshot đã ghi (chỉ của `symbol` nếu có), gắn mỗi snapshot với đề xuất giao dịch
+    đầu tiên cùng symbol được log trong `PROPOSAL_LINK_WINDOW` sau đó (xem `backtester.load_proposals`).
+    Đề xuất không ghi symbol không được gắn với snapshot nào.
+    """
+    reports_dir = Path(reports_dir)
+    raw: list[tuple[datetime, dict, tuple]] = []
+    for path in sorted((reports_dir / SNAPSHOT_DIRNAME).glob("snapshots_*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rec = json.loads(line)
+                    t = datetime.fromisoformat(rec["time_utc"])
+                except (ValueError, KeyError, TypeError):
+                    logger.debug(f"Bỏ qua dòng snapshot lỗi trong {path.name}.")
+                    continue
+                if t.tzinfo is None:
+                    t = t.replace(tzinfo=timezone.utc)
+                data = rec.get("mt5_data") or {}
+                if symbol and data.get("symbol") != symbol:
+                    continue
+                events = tuple(e for e in map(_event_from_json, rec.get("news_events") or []) if e)
+                raw.append((t, data, events))
+    raw.sort(key=lambda item: item[0])
+
+    by_symbol: dict[str, list[backtester.Proposal]] = {}
+    for p in backtester.load_proposals(reports_dir):
+        if p.symbol:
+            by_symbol.setdefault(p.symbol, []).append(p)
+    times = {sym: [p.time for p in items] for sym, items in by_symbol.items()}
+    out: list[ReplaySnapshot] = []
+    for t, data, events in raw:
+        ts = int(t.timestamp())
+        sym = str(data.get("symbol") or "")
+        proposals = by_symbol.get(sym, [])
+        j = bisect.bisect_left(times.get(sym, []), ts)
+        linked = None
+        if j < len(proposals) and proposals[j].time - ts <= PROPOSAL_LINK_WINDOW.total_seconds():
+            linked = proposals[j]
+        out.append(ReplaySnapshot(time_utc=t, mt5_data=data, news_events=events, proposal=linked))
+    logger.debug(f"Đã nạp {len(out)} snapshot ({sum(s.proposal is not None for s in out)} có đề xuất).")
+    return out
+# endregion
+
+
+# region Không gian tham số
+def apply_overrides(cfg: "RunConfig", overrides: Mapping[str, Any]) -> "RunConfig":
+    """Tạo RunConfig mới với các giá trị `"section.field": value` được thay thế."""
+    by_section: dict[str, dict[str, Any]] = {}
+    for key, value in overrides.items():
+        section, _, name = key.partition(".")
+        if section not in SWEEPABLE_SECTIONS:
+            raise ValueError(f"Không hỗ trợ quét nhóm cấu hình '{section}'.")
+        by_section.setdefault(section, {})[name] = value
+    changes = {section: replace(getattr(cfg, section), **values) for section, values in by_section.items()}
+    return replace(cfg, **changes)
+
+
+def grid(space: Mapping[str, Sequence[Any]]) -> list[dict[str, Any]]:
+    """Mọi tổ hợp của không gian tham số."""
+    keys = list(space)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(space[k] for k in keys))]
+
+
+def random_sample(space: Mapping[str, Sequence[Any]], n: int, seed: int = 0) -> list[dict[str, Any]]:
+    """n tổ hợp khác nhau lấy ngẫu nhiên từ tích Descartes (không liệt kê toàn bộ)."""
+    keys = list(space)
+    sizes = [len(space[k]) for k in keys]
+    total = 1
+    for size in sizes:
+        total *= size
+    rng = random.Random(seed)
+    out = []
+    for flat in rng.sample(range(total), min(n, total)):
+        combo = {}
+        for key, size in zip(reversed(keys), reversed(sizes)):
+            flat, idx = divmod(flat, size)
+            combo[key] = space[key][idx]
+        out.append({k: combo[k] for k in keys})
+    return out
+
+
+def parse_space(specs: Iterable[str], cfg: "RunConfig") -> dict[str, list[Any]]:
+    """Parse các chuỗi `section.field=v1,v2,...`, ép kiểu theo kiểu hiện tại của trường."""
+    space: dict[str, list[Any]] = {}
+    for spec in specs:
+        key, _, raw_values = spec.partition("=")
+        section, _, name = key.strip().partition(".")
+        if section not in SWEEPABLE_SECTIONS or name not in {f.name for f in fields(getattr(cfg, section))}:
+            raise ValueError(f"Tham số không hợp lệ: {key}")
+        current = getattr(getattr(cfg, section), name)
+        values: list[Any] = []
+        for token in raw_values.split(","):
+            token = token.strip()
+            if isinstance(current, bool):
+                values.append(token.lower() in ("1", "true", "yes", "on"))
+            elif isinstance(current, int):
+                values.append(int(float(token)))
+            elif isinstance(current, float):
+                values.append(float(token))
+            else:
+                values.append(token)
+        space[key.strip()] = values
+    return space
+# endregion
+
+
+# region Đánh giá
+class _ReplayNewsService(NewsService):
+    """NewsService dùng danh sách tin đã ghi và coi "bây giờ" là thời điểm của snapshot."""
+
+    def __init__(self, cfg: "RunConfig", events: Sequence[dict[str, Any]], now_utc: datetime) -> None:
+        super().__init__()
+        self.update_config(cfg)
+        self._cache = list(events)
+        self._replay_now = now_utc
+
+    def is_in_news_blackout(self, symbol: str, now: Optional[datetime] = None) -> tuple[bool, str | None]:
+        return super().is_in_news_blackout(symbol, now or self._replay_now)
+
+    def get_upcoming_events(self, symbol: str, now: Optional[datetime] = None) -> list[dict[str, Any]]:
+        return super().get_upcoming_events(symbol, now or self._replay_now)
+
+
+def _rr_tp2(p: backtester.Proposal) -> Optional[float]:
+    risk = abs(p.entry - p.sl)
+    target = p.tp2 or p.tp1
+    return abs(target - p.entry) / risk if risk > 0 and target else None
+
+
+def evaluate_combination(
+    cfg: "RunConfig",
+    snapshots: Sequence[ReplaySnapshot],
+    bars: Optional[Mapping[str, "np.ndarray"]] = None,
+    backtest_params: Optional[Mapping[str, backtester.BacktestParams]] = None,
+) -> dict[str, Any]:
+    """
+    Phát lại toàn bộ snapshot với một cấu hình và tổng hợp kết quả. `bars` là nến M1 theo symbol;
+    mỗi đề xuất chỉ được backtest trên nến của symbol của nó. `backtest_params` (theo symbol) là
+    tham số backtest đã xác định giờ broker (xem `run_sweep`); phần phụ thuộc tổ hợp lấy lại từ `cfg`.
+    """
+    blocked_by: Counter[str] = Counter()
+    blocked = allowed = rr_rejected = grade_rejected = 0
+    lots: list[float] = []
+    traded: list[backtester.Proposal] = []
+    skipped: list[backtester.Proposal] = []
+
+    for snap in snapshots:
+        news = _ReplayNewsService(cfg, snap.news_events, snap.time_utc)
+        result = check_no_trade_conditions(SafeData(snap.mt5_data), cfg, news, now_utc=snap.time_utc)
+        if result.has_blockers():
+            blocked += 1
+            blocked_by.update(v.condition_id for v in result.blocking)
+            if snap.proposal:
+                skipped.append(snap.proposal)
+            continue
+        allowed += 1
+        p = snap.proposal
+        if p is None:
+            continue
+        if p.grade not in _GRADE_RISK:
+            grade_rejected += 1
+            skipped.append(p)
+            continue
+        rr = _rr_tp2(p)
+        if rr is None or rr < cfg.auto_trade.min_rr_tp2:
+            rr_rejected += 1
+            skipped.append(p)
+            continue
+        size = mt5_service.calculate_lots(
+            cfg,
+            snap.mt5_data.get("symbol", ""),
+            p.entry,
+            p.sl,
+            snap.mt5_data.get("info") or {},
+            snap.mt5_data.get("account") or {},
+            _GRADE_RISK[p.grade],
+        )
+        if size:
+            lots.append(size)
+        traded.append(p)
+
+    row: dict[str, Any] = {
+        "runs": len(snapshots),
+        "blocked": blocked,
+        "allowed": allowed,
+        "blocked_by": dict(sorted(blocked_by.items())),
+        "trades": len(traded),
+        "rr_rejected": rr_rejected,
+        "grade_rejected": grade_rejected,
+        "avg_lots": round(sum(lots) / len(lots), 4) if lots else None,
+    }
+    if bars:
+        params = {sym: _combination_backtest_params(cfg, (backtest_params or {}).get(sym)) for sym in bars}
+        for label, group in (("traded", traded), ("skipped", skipped)):
+            outcomes = []
+            for sym, sym_bars in bars.items():
+                props = [p for p in group if p.symbol == sym]
+                if props and len(sym_bars):
+                    outcomes += backtester.simulate(props, sym_bars, params[sym])
+            r = [o.r_multiple for o in outcomes if o.status == backtester.STATUS_FILLED]
+            row[f"{label}_filled"] = len(r)
+            row[f"{label}_total_r"] = round(sum(r), 3) if r else 0.0
+            row[f"{label}_win_rate"] = round(sum(x > 0 for x in r) / len(r), 3) if r else None
+    return row
+
+
+def _combination_backtest_params(
+    cfg: "RunConfig", base: Optional[backtester.BacktestParams]
+) -> backtester.BacktestParams:
+    # Độ lệch giờ broker được đo một lần ở tiến trình cha (MT5 không khởi tạo trong tiến trình con);
+    # chia TP/hạn chờ khớp có thể khác theo tổ hợp nên vẫn đọc từ `cfg`.
+    if base is None:
+        return backtester.BacktestParams.from_config(cfg)
+    return backtester.BacktestParams.from_config(
+        cfg, time_offset_sec=base.time_offset_sec, broker_timezone=base.broker_timezone
+    )
+
+
+_worker_state: dict[str, Any] = {}
+
+
+def _init_worker(
+    base_cfg: "RunConfig",
+    snapshots: Sequence[ReplaySnapshot],
+    bars: Optional[Mapping[str, "np.ndarray"]],
+    backtest_params: Optional[Mapping[str, backtester.BacktestParams]],
+) -> None:
+    # Các điều kiện ghi log INFO cho mỗi lần vi phạm; tắt trong tiến trình con để không làm nhiễu.
+    logging.disable(logging.INFO)
+    _worker_state["cfg"] = base_cfg
+    _worker_state["snapshots"] = snapshots
+    _worker_state["bars"] = bars
+    _worker_state["backtest_params"] = backtest_params
+
+
+def _evaluate_in_worker(overrides: dict[str, Any]) -> dict[str, Any]:
+    cfg = apply_overrides(_worker_state["cfg"], overrides)
+    row = evaluate_combination(
+        cfg, _worker_state["snapshots"], _worker_state["bars"], _worker_state["backtest_params"]
+    )
+    return {"params": overrides, **row}
+
+
+def run_sweep(
+    base_cfg: "RunConfig",
+    snapshots: Sequence[ReplaySnapshot],
+    combos: Sequence[Mapping[str, Any]],
+    *,
+    workers: int = 4,
+    bars: Optional[Mapping[str, "np.ndarray"]] = None,
+) -> list[dict[str, Any]]:
+    """
+    Đánh giá mọi tổ hợp, mỗi tiến trình con nhận cấu hình gốc, snapshot và nến M1 theo symbol
+    (`bars`, xem `load_sweep_bars`) một lần qua initializer. `workers <= 1` chạy ngay trong tiến
+    trình hiện tại. Tham số backtest (giờ broker) của từng symbol được xác định một lần ở đây, khi
+    MT5 còn khả dụng.
+    """
+    combos = [dict(c) for c in combos]
+    bars = {sym: arr for sym, arr in (bars or {}).items() if arr is not None and len(arr)}
+    backtest_params = {
+        sym: backtester.BacktestParams.from_config(replace(base_cfg, mt5=replace(base_cfg.mt5, symbol=sym)))
+        for sym in bars
+    }
+    logger.info(f"Bắt đầu quét {len(combos)} tổ hợp trên {len(snapshots)} snapshot (workers={workers}).")
+    if workers <= 1 or len(combos) <= 1:
+        _init_worker(base_cfg, snapshots, bars, backtest_params)
+        try:
+            return [_evaluate_in_worker(c) for c in combos]
+        finally:
+            logging.disable(logging.NOTSET)
+            _worker_state.clear()
+    chunksize = max(1, len(combos) // (workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(base_cfg, list(snapshots), bars, backtest_params)
+    ) as pool:
+        return list(pool.map(_evaluate_in_worker, combos, chunksize=chunksize))
+# endregion
+
+
+def load_sweep_bars(snapshots: Sequence[ReplaySnapshot], root: Optional[Path] = None) -> dict[str, "np.ndarray"]:
+    """
+    Nến M1 từ kho `BarArchive` cho từng symbol có đề xuất trong snapshot. Mỗi symbol được đọc từ
+    trước đề xuất sớm nhất của nó một ngày (đủ cho mọi độ lệch giờ broker) tới hết kho, vì tổ hợp
+    có thể đổi thời gian chờ/giữ lệnh.
+    """
+    first: dict[str, int] = {}
+    for s in snapshots:
+        if s.proposal is not None and s.proposal.symbol:
+            first[s.proposal.symbol] = min(s.proposal.time, first.get(s.proposal.symbol, s.proposal.time))
+    out: dict[str, "np.ndarray"] = {}
+    for symbol, t in first.items():
+        bars = backtester.load_bars(symbol, start=t - 86400, root=root)
+        if bars is not None:
+            out[symbol] = bars
+    return out
+
+
+def format_table(rows: Sequence[Mapping[str, Any]]) -> str:
+    """Bảng văn bản: mỗi dòng một tổ hợp, sắp xếp theo tổng R của lệnh được đặt (nếu có)."""
+    if not rows:
+        return "(không có kết quả)"
+    param_keys = list(rows[0]["params"])
+    metric_keys = [k for k in rows[0] if k not in ("params", "blocked_by", "runs")]
+    ordered = sorted(rows, key=lambda r: (r.get("traded_total_r") or 0.0, r["trades"]), reverse=True)
+    header = param_keys + metric_keys + ["blocked_by"]
+    lines = [" | ".join(header)]
+    for row in ordered:
+        cells = [str(row["params"][k]) for k in param_keys]
+        cells += ["" if row.get(k) is None else str(row[k]) for k in metric_keys]
+        cells.append(", ".join(f"{k}:{v}" for k, v in row["blocked_by"].items()))
+        lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from APP.configs import workspace_config
+    from APP.ui.state.config_state import UiConfigState
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", required=True, type=Path, help="Thư mục Reports chứa snapshots/.")
+    parser.add_argument("--workspace", type=Path, default=None, help="File workspace.json làm cấu hình gốc.")
+    parser.add_argument("--grid", nargs="+", action="extend", default=[], metavar="SECTION.FIELD=V1,V2")
+    parser.add_argument("--sample", type=int, default=0, help="Chỉ đánh giá N tổ hợp ngẫu nhiên.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--symbol", default=None, help="Chỉ phát lại snapshot của symbol này (mặc định: tất cả).")
+    parser.add_argument(
+        "--bars-root", type=Path, default=None, help="Thư mục gốc kho nến (BarArchive) để tính kết quả lệnh."
+    )
+    parser.add_argument("--out", type=Path, default=None, help="Ghi kết quả dạng JSON.")
+    args = parser.parse_args(argv)
+
+    base_cfg = UiConfigState.from_workspace_config(
+        workspace_config.load_config_from_file(args.workspace)
+    ).to_run_config()
+    space = parse_space(args.grid, base_cfg)
+    combos = random_sample(space, args.sample, args.seed) if args.sample else grid(space)
+    snapshots = load_snapshots(args.reports, args.symbol)
+    bars = load_sweep_bars(snapshots, args.bars_root)
+
+    rows = run_sweep(base_cfg, snapshots, combos, workers=args.workers, bars=bars)
+    print(format_table(rows))
+    if args.out:
+        args.out.write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
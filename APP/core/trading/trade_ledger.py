@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Sổ cái các lệnh do ứng dụng tự đặt, dùng để áp dụng `cooldown_min` và giới hạn số lệnh mỗi ngày.
+
+Trạng thái được giữ trong bộ nhớ (bộ đếm theo symbol/ngày, thời điểm vào lệnh và thua lỗ gần nhất)
+nên mọi truy vấn đều O(1); mỗi thay đổi được ghi nối tiếp vào journal JSONL và sổ cái tự dựng lại
+từ journal khi khởi động. Sự kiện cũ hơn `JOURNAL_RETENTION_DAYS` bị lược khỏi journal khi nạp.
+
+Lệnh đóng được phát hiện khi ticket đang theo dõi biến mất khỏi danh sách `positions` của MT5
+(`reconcile`); thắng/thua lấy theo lợi nhuận thực nhận từ lịch sử deal của vị thế
+(`mt5_service.position_realized_profit`), chỉ dùng lợi nhuận thả nổi gần nhất khi không tra được.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Mapping, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from APP.configs.constants import PATHS
+
+if TYPE_CHECKING:
+    from APP.configs.app_config import AutoTradeConfig
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = "trade_ledger.jsonl"
+JOURNAL_RETENTION_DAYS = 14
+
+EVENT_ENTRY = "entry"
+EVENT_EXIT = "exit"
+
+
+@dataclass(frozen=True)
+class LedgerStatus:
+    """Kết quả kiểm tra cooldown/giới hạn cho một symbol tại một thời điểm."""
+
+    symbol: str
+    trades_today: int
+    max_trades_per_day: int
+    cooldown_remaining_sec: float
+    last_entry: Optional[float]
+    last_loss: Optional[float]
+
+    @property
+    def in_cooldown(self) -> bool:
+        return self.cooldown_remaining_sec > 0
+
+    @property
+    def limit_reached(self) -> bool:
+        return self.max_trades_per_day > 0 and self.trades_today >= self.max_trades_per_day
+
+    @property
+    def blocked(self) -> bool:
+        return self.in_cooldown or self.limit_reached
+
+    def reason(self) -> Optional[str]:
+        if self.limit_reached:
+            return f"Đã đạt giới hạn {self.max_trades_per_day} lệnh/ngày cho {self.symbol}."
+        if self.in_cooldown:
+            return f"Đang trong thời gian nghỉ giữa các lệnh (còn {self.cooldown_remaining_sec / 60:.1f} phút)."
+        return None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "symbol": self.symbol,
+            "trades_today": self.trades_today,
+            "max_trades_per_day": self.max_trades_per_day,
+            "cooldown_remaining_sec": round(self.cooldown_remaining_sec, 1),
+            "last_entry": self.last_entry,
+            "last_loss": self.last_loss,
+        }
+
+
+class TradeLedger:
+    """Sổ cái lệnh trong bộ nhớ với journal trên đĩa."""
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        timezone_name: str = "UTC",
+        clock: Optional[Callable[[], float]] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.timezone_name = timezone_name
+        try:
+            self._tz = ZoneInfo(timezone_name)
+        except ZoneInfoNotFoundError:
+            logger.warning(f"Không tải được timezone '{timezone_name}', dùng UTC cho sổ cái lệnh.")
+            self._tz = timezone.utc
+        self._clock = clock or time.time
+        self._lock = threading.Lock()
+
+        self._day_counts: Counter[tuple[str, str]] = Counter()
+        self._last_entry: dict[str, float] = {}
+        self._last_loss: dict[str, float] = {}
+        self._open: dict[int, dict[str, Any]] = {}
+        self._load()
+
+    # region Journal
+    def _day(self, ts: float) -> str:
+        return datetime.fromtimestamp(ts, self._tz).strftime("%Y-%m-%d")
+
+    def _apply(self, event: Mapping[str, Any]) -> None:
+        symbol = str(event.get("symbol", ""))
+        ts = float(event["time"])
+        if event.get("event") == EVENT_ENTRY:
+            self._day_counts[(symbol, self._day(ts))] += 1
+            self._last_entry[symbol] = max(ts, self._last_entry.get(symbol, ts))
+            for ticket in event.get("tickets") or ():
+                self._open[int(ticket)] = {"symbol": symbol, "time": ts, "profit": None}
+        elif event.get("event") == EVENT_EXIT:
+            ticket = event.get("ticket")
+            if ticket is not None:
+                self._open.pop(int(ticket), None)
+            profit = event.get("profit")
+            if profit is not None and float(profit) < 0:
+                self._last_loss[symbol] = max(ts, self._last_loss.get(symbol, ts))
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        cutoff = self._clock() - JOURNAL_RETENTION_DAYS * 86400
+        events: list[tuple[dict[str, Any], str]] = []
+        total = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                total += 1
+                try:
+                    event = json.loads(line)
+                    float(event["time"])
+                except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                    logger.warning(f"Bỏ qua dòng journal lỗi trong {self.path.name}: {line[:80]}")
+                    continue
+                self._apply(event)
+                events.append((event, line))
+
+        # Giữ sự kiện còn trong hạn và lệnh vào của các ticket vẫn đang mở.
+        kept = [
+            line
+            for event, line in events
+            if float(event["time"]) >= cutoff
+            or (event.get("event") == EVENT_ENTRY and any(t in self._open for t in event.get("tickets") or ()))
+        ]
+        if len(kept) < total:
+            self._write_all(kept)
+        logger.debug(
+            f"Đã dựng lại sổ cái lệnh từ {self.path} ({len(self._open)} lệnh mở, lược {total - len(kept)} dòng)."
+        )
+
+    def _write_all(self, lines: Iterable[str]) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line + "\n")
+        tmp.replace(self.path)
+
+    def _journal(self, event: dict[str, Any]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    # endregion
+
+    # region Ghi nhận
+    def record_entry(
+        self,
+        symbol: str,
+        *,
+        tickets: Iterable[int] = (),
+        direction: Optional[str] = None,
+        volume: Optional[float] = None,
+        price: Optional[float] = None,
+        grade: Optional[str] = None,
+        at: Optional[float] = None,
+    ) -> None:
+        """
+        Ghi nhận một setup vừa vào lệnh thành công. Một setup chia TP gồm nhiều ticket nhưng chỉ tính
+        là một lệnh trong giới hạn mỗi ngày.
+        """
+        event = {
+            "event": EVENT_ENTRY,
+            "time": float(at if at is not None else self._clock()),
+            "symbol": symbol,
+            "tickets": [int(t) for t in tickets if t],
+            "direction": direction,
+            "volume": volume,
+            "price": price,
+            "grade": grade,
+        }
+        with self._lock:
+            self._apply(event)
+            self._journal(event)
+
+    def record_exit(
+        self, symbol: str, *, ticket: Optional[int] = None, profit: Optional[float] = None, at: Optional[float] = None
+    ) -> None:
+        """Ghi nhận một lệnh đã đóng; `profit < 0` cập nhật mốc thua lỗ gần nhất."""
+        event = {
+            "event": EVENT_EXIT,
+            "time": float(at if at is not None else self._clock()),
+            "symbol": symbol,
+            "ticket": ticket,
+            "profit": profit,
+        }
+        with self._lock:
+            self._apply(event)
+            self._journal(event)
+
+    def reconcile(
+        self,
+        symbol: str,
+        positions: Iterable[Mapping[str, Any]],
+        at: Optional[float] = None,
+        realized_profit: Optional[Callable[[int], Optional[float]]] = None,
+    ) -> int:
+        """
+        Đối chiếu với các vị thế đang mở của MT5: cập nhật lợi nhuận thả nổi và ghi nhận đóng lệnh
+        cho ticket đã biến mất, với lợi nhuận thực nhận `realized_profit(ticket)` nếu tra được.
+        Trả về số lệnh được đánh dấu đóng.
+        """
+        current: dict[int, Mapping[str, Any]] = {}
+        for pos in positions or []:
+            ticket = pos.get("ticket")
+            if ticket is not None:
+                current[int(ticket)] = pos
+        with self._lock:
+            tracked = [t for t, info in self._open.items() if info["symbol"] == symbol]
+            closed = []
+            for ticket in tracked:
+                if ticket in current:
+                    profit = current[ticket].get("profit")
+                    if profit is not None:
+                        self._open[ticket]["profit"] = float(profit)
+                else:
+                    closed.append((ticket, self._open[ticket].get("profit")))
+        for ticket, profit in closed:
+            if realized_profit is not None:
+                try:
+                    realized = realized_profit(ticket)
+                except Exception as e:
+                    logger.warning(f"Không tra được lợi nhuận thực nhận của ticket {ticket}: {e}")
+                    realized = None
+                if realized is not None:
+                    profit = float(realized)
+            self.record_exit(symbol, ticket=ticket, profit=profit, at=at)
+        return len(closed)
+
+    # endregion
+
+    # region Truy vấn
+    def trades_today(self, symbol: str, at: Optional[float] = None) -> int:
+        return self._day_counts.get((symbol, self._day(at if at is not None else self._clock())), 0)
+
+    def open_tickets(self, symbol: Optional[str] = None) -> list[int]:
+        return [t for t, info in self._open.items() if symbol is None or info["symbol"] == symbol]
+
+    def status(
+        self,
+        symbol: str,
+        cooldown_min: int,
+        max_trades_per_day: int = 0,
+        at: Optional[float] = None,
+    ) -> LedgerStatus:
+        """Trạng thái cooldown (tính từ lần vào lệnh hoặc thua lỗ gần nhất) và số lệnh trong ngày."""
+        now = float(at if at is not None else self._clock())
+        last_entry = self._last_entry.get(symbol)
+        last_loss = self._last_loss.get(symbol)
+        anchor = max((t for t in (last_entry, last_loss) if t is not None), default=None)
+        remaining = 0.0
+        if anchor is not None and cooldown_min > 0:
+            remaining = max(0.0, anchor + cooldown_min * 60 - now)
+        return LedgerStatus(
+            symbol=symbol,
+            trades_today=self.trades_today(symbol, now),
+            max_trades_per_day=max(0, int(max_trades_per_day)),
+            cooldown_remaining_sec=remaining,
+            last_entry=last_entry,
+            last_loss=last_loss,
+        )
+
+    def status_for(self, symbol: str, cfg: "AutoTradeConfig", at: Optional[float] = None) -> LedgerStatus:
+        return self.status(symbol, cfg.cooldown_min, getattr(cfg, "max_trades_per_day", 0), at)
+
+    # endregion
+
+
+_ledgers: dict[Path, TradeLedger] = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_ledger(path: Optional[Path] = None, timezone_name: str = "UTC") -> TradeLedger:
+    """Sổ cái dùng chung cho một file journal (mặc định trong thư mục dữ liệu ứng dụng)."""
+    key = Path(path or PATHS.APP_DIR / JOURNAL_FILENAME).resolve()
+    with _ledgers_lock:
+        ledger = _ledgers.get(key)
+        if ledger is None or ledger.timezone_name != timezone_name:
+            ledger = TradeLedger(key, timezone_name=timezone_name)
+            _ledgers[key] = ledger
+        return ledger
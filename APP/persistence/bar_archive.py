@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+"""
+Kho nến cục bộ dạng cột cho từng cặp (symbol, timeframe).
+
+Bố cục trên đĩa (mỗi tháng một partition, mỗi cột một file nhị phân độ rộng cố định):
+
+    <root>/<symbol>/<timeframe>/<YYYYMM>/time.bin   (<i8, epoch giây giờ broker)
+                                        open.bin   (<f8)   high.bin, low.bin, close.bin
+                                        volume.bin (<i8, tick volume)
+                                        spread.bin (<i4, điểm)
+
+- Ghi nối tiếp (append) chỉ thêm byte vào cuối mỗi file cột; nến trùng thời gian với dữ liệu đã
+  có bị bỏ qua nên gọi lại nhiều lần với cùng dữ liệu là idempotent. Nến chèn vào giữa (backfill
+  khoảng trống) chỉ buộc ghi lại đúng partition tháng đó.
+- Đọc theo khoảng thời gian mở các cột bằng memmap và dùng `searchsorted` trên cột `time`
+  (O(log n) mỗi partition), chỉ sao chép đoạn được yêu cầu.
+- Đọc theo vị trí (`read_rows`) coi toàn bộ kho là một dãy nến liên tục, dùng cho các bộ quét
+  chia chunk theo chỉ số nến (`ict_scanner`).
+- `backfill` ghi các khoảng đã hỏi nguồn mà vẫn thiếu nến vào `unfillable.json` để không hỏi lại.
+- Khi mở, các cột có độ dài lệch nhau (ghi nối tiếp dở do crash) được cắt về độ dài ngắn nhất.
+- Ghi lại partition đi qua thư mục tạm `<YYYYMM>.new` rồi đổi tên cả thư mục; lần ghi lại bị ngắt
+  được hoàn tất hoặc bỏ khi mở kho, nên không bao giờ trộn cột của hai phiên bản.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence, Union
+
+import numpy as np
+
+from APP.configs.constants import PATHS
+
+logger = logging.getLogger(__name__)
+
+# Các cột theo đúng thứ tự của `ict_scanner.BAR_DTYPE`, thêm `spread`.
+ARCHIVE_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<i8"),
+        ("spread", "<i4"),
+    ]
+)
+COLUMNS: tuple[str, ...] = ARCHIVE_DTYPE.names or ()
+
+TIMEFRAME_SECONDS: dict[str, int] = {
+    "M1": 60,
+    "M5": 300,
+    "M15": 900,
+    "M30": 1800,
+    "H1": 3600,
+    "H4": 14400,
+    "D1": 86400,
+}
+
+WEEKEND_GAP_MAX_SEC = 3 * 86400
+UNFILLABLE_FILE = "unfillable.json"  # các khoảng đã hỏi nguồn mà không có nến
+
+RatesLike = Union[np.ndarray, Sequence[Mapping[str, Any]]]
+RangeFetcher = Callable[[datetime, datetime], Optional[RatesLike]]
+
+# Một khóa cho mỗi thư mục kho để nhiều instance cùng trỏ tới một kho vẫn ghi tuần tự.
+_locks: dict[Path, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def default_root() -> Path:
+    """Thư mục gốc mặc định của kho nến."""
+    return PATHS.APP_DIR / "bars"
+
+
+def _archive_lock(path: Path) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def _parse_time(value: Any) -> int:
+    if isinstance(value, datetime):
+        return int(value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp())
+    if isinstance(value, str):
+        return int(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+    return int(value or 0)
+
+
+def to_archive_array(rates: RatesLike) -> np.ndarray:
+    """
+    Chuẩn hóa nến về `ARCHIVE_DTYPE`, sắp theo thời gian, bỏ trùng (giữ bản cuối).
+
+    Nhận mảng có cấu trúc của MT5 (`tick_volume`, `spread`), mảng `BAR_DTYPE`, hoặc list dict
+    như `mt5_service._series_from_mt5` (`vol`, thời gian dạng chuỗi).
+    """
+    if isinstance(rates, np.ndarray) and rates.dtype.names:
+        names = set(rates.dtype.names)
+        out = np.zeros(len(rates), dtype=ARCHIVE_DTYPE)
+        for col in ("time", "open", "high", "low", "close"):
+            out[col] = rates[col]
+        for src in ("volume", "tick_volume", "real_volume"):
+            if src in names:
+                out["volume"] = rates[src]
+                break
+        if "spread" in names:
+            out["spread"] = rates["spread"]
+    else:
+        out = np.zeros(len(rates), dtype=ARCHIVE_DTYPE)
+        for i, r in enumerate(rates):
+            volume = r.get("volume", r.get("tick_volume", r.get("vol", 0)))
+            out[i] = (
+                _parse_time(r.get("time")),
+                r["open"],
+                r["high"],
+                r["low"],
+                r["close"],
+                int(volume or 0),
+                int(r.get("spread", 0) or 0),
+            )
+    if out.size == 0:
+        return out
+    out = out[np.argsort(out["time"], kind="stable")]
+    # Giữ phần tử cuối của mỗi nhóm trùng thời gian.
+    keep = np.append(out["time"][1:] != out["time"][:-1], True)
+    return out[keep]
+
+
+def _month_keys(times: np.ndarray) -> np.ndarray:
+    """Khóa partition YYYYMM (int) cho từng epoch giây."""
+    months = times.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    return (months // 12 + 1970) * 100 + months % 12 + 1
+
+
+def _is_weekend_gap(last_time: int, next_time: int) -> bool:
+    """Khoảng trống nằm trọn trong nghỉ cuối tuần (thứ Sáu/Bảy -> Chủ nhật/thứ Hai, < 3 ngày)."""
+    if next_time - last_time > WEEKEND_GAP_MAX_SEC:
+        return False
+    start = datetime.fromtimestamp(last_time, timezone.utc).weekday()
+    end = datetime.fromtimestamp(next_time, timezone.utc).weekday()
+    return start in (4, 5) and end in (6, 0)
+
+
+class BarArchive:
+    """Kho nến dạng cột, phân vùng theo tháng, cho một cặp (symbol, timeframe)."""
+
+    def __init__(self, symbol: str, timeframe: str = "M1", root: Optional[Path] = None) -> None:
+        if timeframe not in TIMEFRAME_SECONDS:
+            raise ValueError(f"Timeframe không được hỗ trợ: {timeframe}")
+        safe_symbol = "".join(c for c in symbol if c.isalnum() or c in ("-", "_"))
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.period = TIMEFRAME_SECONDS[timeframe]
+        self.root = Path(root or default_root())
+        self.path = self.root / safe_symbol / timeframe
+        self._lock = _archive_lock(self.path.resolve())
+        with self._lock:
+            self._recover_rewrites()
+
+    # region Partition
+    def partitions(self) -> list[int]:
+        """Danh sách khóa partition (YYYYMM) hiện có, tăng dần."""
+        if not self.path.is_dir():
+            return []
+        return sorted(int(p.name) for p in self.path.iterdir() if p.is_dir() and p.name.isdigit())
+
+    def _partition_dir(self, key: int) -> Path:
+        return self.path / f"{key:06d}"
+
+    def _open_partition(self, key: int, columns: Sequence[str] = COLUMNS) -> dict[str, np.ndarray]:
+        """Mở các cột `columns` của partition bằng memmap (chỉ đọc), cắt về độ dài chung ngắn nhất."""
+        part = self._partition_dir(key)
+        lengths = []
+        for col in COLUMNS:
+            f = part / f"{col}.bin"
+            lengths.append(f.stat().st_size // ARCHIVE_DTYPE[col].itemsize if f.exists() else 0)
+        n = min(lengths) if lengths else 0
+        if n == 0:
+            return {col: np.empty(0, dtype=ARCHIVE_DTYPE[col]) for col in columns}
+        if len(set(lengths)) > 1:
+            logger.warning(f"Partition {part} có các cột lệch độ dài {lengths}; chỉ dùng {n} nến đầu.")
+        return {
+            col: np.memmap(part / f"{col}.bin", dtype=ARCHIVE_DTYPE[col], mode="r", shape=(n,))
+            for col in columns
+        }
+
+    def _repair_partition(self, key: int) -> int:
+        """Cắt các file cột về cùng độ dài trước khi ghi nối tiếp; trả về số nến hợp lệ."""
+        part = self._partition_dir(key)
+        n = len(self._open_partition(key, ("time",))["time"])
+        for col in COLUMNS:
+            f = part / f"{col}.bin"
+            size = n * ARCHIVE_DTYPE[col].itemsize
+            if f.exists() and f.stat().st_size != size:
+                with open(f, "r+b") as fh:
+                    fh.truncate(size)
+        return n
+
+    def _append_columns(self, key: int, bars: np.ndarray) -> None:
+        part = self._partition_dir(key)
+        part.mkdir(parents=True, exist_ok=True)
+        self._repair_partition(key)
+        for col in COLUMNS:
+            with open(part / f"{col}.bin", "ab") as fh:
+                fh.write(np.ascontiguousarray(bars[col]).tobytes())
+
+    def _rewrite_partition(self, key: int, bars: np.ndarray) -> None:
+        """
+        Ghi đủ các cột vào `<key>.new`, rồi đổi tên partition cũ thành `<key>.old` và `.new` thành
+        partition. Bị ngắt ở bước nào thì `_recover_rewrites` cũng đưa về một phiên bản đầy đủ.
+        """
+        part = self._partition_dir(key)
+        staged = part.with_name(f"{part.name}.new")
+        old = part.with_name(f"{part.name}.old")
+        for leftover in (staged, old):
+            shutil.rmtree(leftover, ignore_errors=True)
+        staged.mkdir(parents=True)
+        for col in COLUMNS:
+            with open(staged / f"{col}.bin", "wb") as fh:
+                fh.write(np.ascontiguousarray(bars[col]).tobytes())
+                fh.flush()
+                os.fsync(fh.fileno())
+        if part.exists():
+            os.replace(part, old)
+        os.replace(staged, part)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def _recover_rewrites(self) -> None:
+        """Hoàn tất hoặc bỏ các lần ghi lại partition bị ngắt (thư mục `.new`/`.old` còn sót)."""
+        if not self.path.is_dir():
+            return
+        for name in sorted(p.name for p in self.path.iterdir() if p.is_dir()):
+            stem, _, suffix = name.partition(".")
+            if suffix not in ("new", "old") or not stem.isdigit():
+                continue
+            part = self.path / stem
+            staged, old = self.path / f"{stem}.new", self.path / f"{stem}.old"
+            if not part.exists() and old.exists():
+                # Ngắt giữa hai lần đổi tên: có `.old` nghĩa là `.new` đã được ghi đủ.
+                source = staged if staged.exists() else old
+                os.replace(source, part)
+                logger.warning(f"Khôi phục partition {part} từ {source.name} sau lần ghi lại bị ngắt.")
+            for leftover in (staged, old):
+                shutil.rmtree(leftover, ignore_errors=True)
+
+    # endregion
+
+    # region Ghi
+    def append(self, rates: RatesLike, closed_before: Optional[int] = None) -> int:
+        """
+        Ghi thêm các nến chưa có trong kho; trả về số nến mới được ghi.
+
+        Args:
+            rates: Nến đầu vào (xem `to_archive_array`).
+            closed_before: Epoch giây (giờ broker); nến có `time + period > closed_before` được coi là
+                chưa đóng và bị bỏ qua.
+        """
+        bars = to_archive_array(rates)
+        if closed_before is not None and bars.size:
+            bars = bars[bars["time"] + self.period <= int(closed_before)]
+        if bars.size == 0:
+            return 0
+
+        written = 0
+        keys = _month_keys(bars["time"])
+        with self._lock:
+            for key in np.unique(keys):
+                chunk = bars[keys == key]
+                existing = self._open_partition(int(key))
+                times = np.asarray(existing["time"])
+                if times.size:
+                    pos = np.searchsorted(times, chunk["time"])
+                    dup = (pos < times.size) & (times[np.minimum(pos, times.size - 1)] == chunk["time"])
+                    chunk = chunk[~dup]
+                if chunk.size == 0:
+                    continue
+                if times.size == 0 or chunk["time"][0] > times[-1]:
+                    self._append_columns(int(key), chunk)
+                else:
+                    merged = np.empty(times.size + chunk.size, dtype=ARCHIVE_DTYPE)
+                    for col in COLUMNS:
+                        merged[col][: times.size] = existing[col]
+                    merged[times.size :] = chunk
+                    merged = merged[np.argsort(merged["time"], kind="stable")]
+                    del existing, times
+                    self._rewrite_partition(int(key), merged)
+                    logger.debug(f"Ghi lại partition {key} của {self.symbol} {self.timeframe} ({merged.size} nến).")
+                written += int(chunk.size)
+        if written:
+            logger.debug(f"Đã ghi {written} nến {self.symbol} {self.timeframe} vào kho.")
+        return written
+
+    # endregion
+
+    # region Đọc
+    def __len__(self) -> int:
+        return sum(len(self._open_partition(k, ("time",))["time"]) for k in self.partitions())
+
+    def first_time(self) -> Optional[int]:
+        for key in self.partitions():
+            times = self._open_partition(key, ("time",))["time"]
+            if len(times):
+                return int(times[0])
+        return None
+
+    def last_time(self) -> Optional[int]:
+        for key in reversed(self.partitions()):
+            times = self._open_partition(key, ("time",))["time"]
+            if len(times):
+                return int(times[-1])
+        return None
+
+    def read(
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        columns: Optional[Iterable[str]] = None,
+    ) -> np.ndarray:
+        """
+        Trả về các nến có `start <= time < end` (epoch giây, None = không giới hạn) dưới dạng
+        mảng có cấu trúc (toàn bộ `ARCHIVE_DTYPE` hoặc chỉ các cột `columns`).
+        """
+        cols = tuple(columns) if columns else COLUMNS
+        unknown = set(cols) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Cột không tồn tại: {sorted(unknown)}")
+        dtype = np.dtype([(c, ARCHIVE_DTYPE[c]) for c in cols])
+
+        keys = self.partitions()
+        if start is not None:
+            first = int(_month_keys(np.asarray([start], dtype=np.int64))[0])
+            keys = [k for k in keys if k >= first]
+        if end is not None:
+            last = int(_month_keys(np.asarray([end], dtype=np.int64))[0])
+            keys = [k for k in keys if k <= last]
+
+        pieces: list[tuple[dict[str, np.ndarray], int, int]] = []
+        total = 0
+        for key in keys:
+            times = self._open_partition(key, ("time",))["time"]
+            lo = int(np.searchsorted(times, start, "left")) if start is not None else 0
+            hi = int(np.searchsorted(times, end, "left")) if end is not None else len(times)
+            if hi > lo:
+                pieces.append((self._open_partition(key, cols), lo, hi))
+                total += hi - lo
+
+        out = np.empty(total, dtype=dtype)
+        offset = 0
+        for part, lo, hi in pieces:
+            for col in cols:
+                out[col][offset : offset + hi - lo] = part[col][lo:hi]
+            offset += hi - lo
+        return out
+
+    def read_rows(self, start: int, stop: int, columns: Optional[Iterable[str]] = None) -> np.ndarray:
+        """
+        Các nến ở vị trí [start, stop) tính trên toàn kho (nến đầu tiên của partition sớm nhất là 0),
+        chỉ sao chép đoạn được yêu cầu.
+        """
+        cols = tuple(columns) if columns else COLUMNS
+        dtype = np.dtype([(c, ARCHIVE_DTYPE[c]) for c in cols])
+        start, stop = max(0, int(start)), int(stop)
+        pieces: list[np.ndarray] = []
+        offset = 0
+        for key in self.partitions():
+            if offset >= stop:
+                break
+            size = len(self._open_partition(key, ("time",))["time"])
+            lo, hi = max(start - offset, 0), min(stop - offset, size)
+            if hi > lo:
+                part = self._open_partition(key, cols)
+                piece = np.empty(hi - lo, dtype=dtype)
+                for col in cols:
+                    piece[col] = part[col][lo:hi]
+                pieces.append(piece)
+            offset += size
+        return np.concatenate(pieces) if pieces else np.empty(0, dtype=dtype)
+
+    def tail(self, n: int, columns: Optional[Iterable[str]] = None) -> np.ndarray:
+        """`n` nến cuối cùng trong kho, chỉ mở các partition cuối cần thiết."""
+        cols = tuple(columns) if columns else COLUMNS
+        dtype = np.dtype([(c, ARCHIVE_DTYPE[c]) for c in cols])
+        pieces: list[np.ndarray] = []
+        need = max(0, int(n))
+        for key in reversed(self.partitions()):
+            if need <= 0:
+                break
+            part = self._open_partition(key, cols)
+            size = len(part[cols[0]])
+            take = min(need, size)
+            if take:
+                piece = np.empty(take, dtype=dtype)
+                for col in cols:
+                    piece[col] = part[col][size - take :]
+                pieces.append(piece)
+                need -= take
+        return np.concatenate(pieces[::-1]) if pieces else np.empty(0, dtype=dtype)
+
+    # endregion
+
+    # region Khoảng trống
+    def _unfillable_path(self) -> Path:
+        return self.path / UNFILLABLE_FILE
+
+    def unfillable_gaps(self) -> list[tuple[int, int]]:
+        """Các khoảng đã thử lấp nhưng nguồn không có nến (nghỉ lễ, nghỉ giữa ngày, M1 thưa)."""
+        try:
+            data = json.loads(self._unfillable_path().read_text(encoding="utf-8"))
+            return sorted((int(g0), int(g1)) for g0, g1 in data)
+        except FileNotFoundError:
+            return []
+        except (ValueError, TypeError) as e:
+            logger.warning(f"File khoảng không lấp được của {self.symbol} {self.timeframe} hỏng, bỏ qua: {e}")
+            return []
+
+    def _save_unfillable(self, gaps: Iterable[tuple[int, int]]) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self._unfillable_path().with_suffix(".tmp")
+        tmp.write_text(json.dumps(sorted(set(gaps))), encoding="utf-8")
+        os.replace(tmp, self._unfillable_path())
+
+    def find_gaps(
+        self,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        *,
+        skip_weekends: bool = True,
+        skip_unfillable: bool = True,
+    ) -> list[tuple[int, int]]:
+        """
+        Các khoảng thiếu nến giữa hai nến liên tiếp trong kho, dạng `(from_time, to_time)` là thời
+        gian mở của nến thiếu đầu tiên và cuối cùng. Nghỉ cuối tuần được bỏ qua nếu `skip_weekends`;
+        khoảng nằm trọn trong một khoảng đã ghi nhận là không lấp được bị bỏ qua nếu `skip_unfillable`.
+        """
+        times = self.read(start, end, columns=("time",))["time"]
+        if times.size < 2:
+            return []
+        known = self.unfillable_gaps() if skip_unfillable else []
+        known_starts = np.asarray([g0 for g0, _ in known], dtype=np.int64)
+        # Khoảng đã biết có thể lồng nhau: dùng điểm kết thúc lớn nhất tính tới mỗi vị trí.
+        known_ends = np.maximum.accumulate(np.asarray([g1 for _, g1 in known], dtype=np.int64))
+        idx = np.nonzero(np.diff(times) > self.period)[0]
+        gaps = []
+        for i in idx:
+            prev_t, next_t = int(times[i]), int(times[i + 1])
+            if skip_weekends and _is_weekend_gap(prev_t, next_t):
+                continue
+            g0, g1 = prev_t + self.period, next_t - self.period
+            k = int(np.searchsorted(known_starts, g0, "right")) - 1
+            if k >= 0 and known_ends[k] >= g1:
+                continue
+            gaps.append((g0, g1))
+        return gaps
+
+    def backfill(
+        self,
+        fetch: RangeFetcher,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        *,
+        skip_weekends: bool = True,
+    ) -> int:
+        """
+        Lấp các khoảng trống bằng `fetch(date_from, date_to)` (vd. `mt5_service.copy_rates_range`);
+        trả về tổng số nến mới được ghi. Khoảng đã được nguồn trả lời (kể cả rỗng) được ghi nhận để
+        không hỏi lại ở các lần sau: phần còn thiếu trong đó là lúc thị trường không có giao dịch.
+        Lỗi khi lấy (ngoại lệ hoặc `None`) không được ghi nhận để thử lại lần sau.
+        """
+        total = 0
+        answered: list[tuple[int, int]] = []
+        for g0, g1 in self.find_gaps(start, end, skip_weekends=skip_weekends):
+            try:
+                rates = fetch(
+                    datetime.fromtimestamp(g0, timezone.utc), datetime.fromtimestamp(g1, timezone.utc)
+                )
+            except Exception as e:
+                logger.warning(f"Không thể lấy nến để lấp khoảng {g0}-{g1} cho {self.symbol} {self.timeframe}: {e}")
+                continue
+            if rates is None:
+                continue
+            if len(rates):
+                total += self.append(rates)
+            answered.append((g0, g1))
+        if answered:
+            # Khoảng kết thúc trước cửa sổ đang lấp sẽ không bao giờ được hỏi lại: bỏ cho gọn file.
+            kept = [g for g in self.unfillable_gaps() if start is None or g[1] >= start]
+            self._save_unfillable(kept + answered)
+        if total:
+            logger.info(f"Đã lấp {total} nến thiếu cho {self.symbol} {self.timeframe}.")
+        return total
+
+    # endregion
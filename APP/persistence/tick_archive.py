@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+Kho tick cục bộ: lưu bid/ask/time_msc/flags theo partition ngày, nén và mã hóa delta.
+
+Bố cục: `<root>/<symbol>/ticks/<YYYYMMDD>/<first_msc>_<last_msc>.npz`. Mỗi lần xả bộ đệm tạo một
+chunk (`np.savez_compressed`) gồm:
+- `t0` + `dt`: time_msc đầu tiên và chênh lệch giữa các tick liên tiếp (int32 khi vừa).
+- `bid0` + `dbid`: giá bid quy về số nguyên theo `point`, mã hóa delta.
+- `spread`: ask - bid (điểm), `flags`: cờ tick MT5; `point` để giải mã.
+Tên file mang sẵn khoảng thời gian nên lọc theo khoảng không cần giải nén.
+
+`append` được gọi ở mỗi lần làm mới biểu đồ nên tick chỉ được gom vào bộ nhớ và xả xuống đĩa khi
+đủ `flush_ticks`, sau `flush_interval_sec`, khi sang ngày mới hoặc trước khi đọc. Mốc thời gian
+cuối và các tick tại mốc đó được giữ trong bộ nhớ để chống ghi trùng mà không phải quét thư mục;
+việc gộp chunk của các ngày đã đóng chỉ chạy khi sang ngày.
+
+Trình đọc trả về từng chunk dưới dạng mảng NumPy nên các thống kê (phân vị spread, tốc độ tick)
+có thể tính trên nhiều tuần dữ liệu mà không cần giữ toàn bộ trong RAM.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import atexit
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from time import monotonic
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+import numpy as np
+
+from APP.configs.constants import PATHS
+
+logger = logging.getLogger(__name__)
+
+TICK_DTYPE = np.dtype(
+    [
+        ("time_msc", "<i8"),
+        ("bid", "<f8"),
+        ("ask", "<f8"),
+        ("flags", "<u4"),
+    ]
+)
+DAY_MS = 86_400_000
+FLUSH_TICKS = 20_000
+FLUSH_INTERVAL_SEC = 300.0
+
+_locks: dict[Path, threading.Lock] = {}
+_locks_guard = threading.Lock()
+_archives: dict[Path, "TickArchive"] = {}
+
+
+def default_root() -> Path:
+    """Thư mục gốc mặc định của kho tick (cùng gốc với kho nến)."""
+    return PATHS.APP_DIR / "bars"
+
+
+def _archive_lock(path: Path) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def _day_key(time_msc: int) -> int:
+    return int(datetime.fromtimestamp(time_msc // 1000, timezone.utc).strftime("%Y%m%d"))
+
+
+def _day_start_msc(key: int) -> int:
+    day = datetime.strptime(str(key), "%Y%m%d").replace(tzinfo=timezone.utc)
+    return int(day.timestamp()) * 1000
+
+
+def _chunk_range(path: Path) -> tuple[int, int]:
+    first, _, last = path.stem.partition("_")
+    return int(first), int(last.partition("-")[0])
+
+
+def _narrow(values: np.ndarray) -> np.ndarray:
+    """Ép về int32 nếu không tràn để file nén nhỏ hơn."""
+    if values.size and (values.min() < np.iinfo(np.int32).min or values.max() > np.iinfo(np.int32).max):
+        return values.astype(np.int64)
+    return values.astype(np.int32)
+
+
+def encode_ticks(ticks: np.ndarray, point: float) -> dict[str, np.ndarray]:
+    """Mã hóa delta một khối tick (đã sắp theo `time_msc`) thành các cột nén được."""
+    times = ticks["time_msc"].astype(np.int64)
+    bid = np.rint(ticks["bid"] / point).astype(np.int64)
+    ask = np.rint(ticks["ask"] / point).astype(np.int64)
+    return {
+        "t0": times[:1],
+        "dt": _narrow(np.diff(times)),
+        "bid0": bid[:1],
+        "dbid": _narrow(np.diff(bid)),
+        "spread": _narrow(ask - bid),
+        "flags": ticks["flags"].astype(np.uint16) if np.all(ticks["flags"] <= 0xFFFF) else ticks["flags"],
+        "point": np.asarray([point], dtype=np.float64),
+    }
+
+
+def decode_ticks(payload: Any) -> np.ndarray:
+    """Giải mã một chunk về mảng `TICK_DTYPE`."""
+    point = float(payload["point"][0])
+    digits = max(0, int(round(-math.log10(point)))) if point > 0 else 8
+    times = np.concatenate([payload["t0"], payload["t0"][0] + np.cumsum(payload["dt"], dtype=np.int64)])
+    bid = np.concatenate([payload["bid0"], payload["bid0"][0] + np.cumsum(payload["dbid"], dtype=np.int64)])
+    out = np.empty(times.size, dtype=TICK_DTYPE)
+    out["time_msc"] = times
+    out["bid"] = np.round(bid * point, digits)
+    out["ask"] = np.round((bid + payload["spread"]) * point, digits)
+    out["flags"] = payload["flags"]
+    return out
+
+
+def to_tick_array(ticks: Any) -> np.ndarray:
+    """Chuẩn hóa mảng tick MT5 (`copy_ticks_range`) hoặc list dict về `TICK_DTYPE`, sắp theo thời gian."""
+    if isinstance(ticks, np.ndarray) and ticks.dtype.names:
+        out = np.zeros(len(ticks), dtype=TICK_DTYPE)
+        names = set(ticks.dtype.names)
+        out["time_msc"] = ticks["time_msc"] if "time_msc" in names else ticks["time"].astype(np.int64) * 1000
+        out["bid"] = ticks["bid"]
+        out["ask"] = ticks["ask"]
+        if "flags" in names:
+            out["flags"] = ticks["flags"]
+    else:
+        out = np.zeros(len(ticks), dtype=TICK_DTYPE)
+        for i, t in enumerate(ticks):
+            msc = t.get("time_msc") or int(t.get("time", 0)) * 1000
+            out[i] = (int(msc), float(t["bid"]), float(t["ask"]), int(t.get("flags", 0) or 0))
+    valid = (out["bid"] > 0) & (out["ask"] > 0)
+    out = out[valid]
+    return out[np.argsort(out["time_msc"], kind="stable")]
+
+
+class TickArchive:
+    """Kho tick nén theo ngày cho một symbol."""
+
+    def __init__(
+        self,
+        symbol: str,
+        point: float,
+        root: Optional[Path] = None,
+        flush_ticks: int = FLUSH_TICKS,
+        flush_interval_sec: float = FLUSH_INTERVAL_SEC,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        if not point or point <= 0:
+            raise ValueError("`point` phải dương để mã hóa giá.")
+        safe_symbol = "".join(c for c in symbol if c.isalnum() or c in ("-", "_"))
+        self.symbol = symbol
+        self.point = float(point)
+        self.path = Path(root or default_root()) / safe_symbol / "ticks"
+        self.flush_ticks = max(1, int(flush_ticks))
+        self.flush_interval_sec = float(flush_interval_sec)
+        self.clock = clock
+        self._lock = _archive_lock(self.path.resolve())
+        self._buffer: list[np.ndarray] = []
+        self._buffered = 0
+        self._last_flush = clock()
+        # Trạng thái đuôi kho: None cho tới lần ghi đầu tiên (đọc từ đĩa đúng một lần).
+        self._tail_loaded = False
+        self._last_msc: Optional[int] = None
+        self._boundary: set[tuple[int, int, int, int]] = set()
+        self._open_day: Optional[int] = None
+
+    # region Partition
+    def days(self) -> list[int]:
+        """Các partition ngày (YYYYMMDD) hiện có, tăng dần."""
+        if not self.path.is_dir():
+            return []
+        return sorted(int(p.name) for p in self.path.iterdir() if p.is_dir() and p.name.isdigit())
+
+    def _chunks(self, key: int) -> list[Path]:
+        day_dir = self.path / str(key)
+        if not day_dir.is_dir():
+            return []
+        return sorted(day_dir.glob("*.npz"), key=lambda p: (_chunk_range(p), p.stem))
+
+    def last_time_msc(self) -> Optional[int]:
+        """time_msc của tick mới nhất đã nhận (kể cả tick còn trong bộ đệm)."""
+        with self._lock:
+            self._load_tail()
+            return self._last_msc
+
+    def _last_chunk_on_disk(self) -> Optional[Path]:
+        for key in reversed(self.days()):
+            chunks = self._chunks(key)
+            if chunks:
+                return chunks[-1]
+        return None
+
+    def _load_tail(self) -> None:
+        """Nạp mốc cuối và các tick tại mốc đó từ chunk mới nhất (chỉ lần đầu)."""
+        if self._tail_loaded:
+            return
+        self._tail_loaded = True
+        last_chunk = self._last_chunk_on_disk()
+        if last_chunk is None:
+            return
+        ticks = self._load(last_chunk)
+        if ticks.size == 0:
+            return
+        self._last_msc = int(ticks["time_msc"][-1])
+        self._boundary = set(self._tick_keys(ticks[ticks["time_msc"] == self._last_msc]))
+        self._open_day = _day_key(self._last_msc)
+
+    def _tick_keys(self, ticks: np.ndarray) -> list[tuple[int, int, int, int]]:
+        """Khóa chống trùng (time_msc, bid, ask, flags) với giá quy về điểm."""
+        bid = np.rint(ticks["bid"] / self.point).astype(np.int64)
+        ask = np.rint(ticks["ask"] / self.point).astype(np.int64)
+        return list(zip(ticks["time_msc"].tolist(), bid.tolist(), ask.tolist(), ticks["flags"].tolist()))
+
+    def _write_chunk(self, key: int, ticks: np.ndarray) -> Path:
+        day_dir = self.path / str(key)
+        day_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{int(ticks['time_msc'][0])}_{int(ticks['time_msc'][-1])}"
+        # Các tick cùng mili giây có thể rơi vào hai lần xả khác nhau: thêm hậu tố để không ghi đè.
+        seq = 1
+        while (day_dir / f"{name}.npz").exists():
+            seq += 1
+            name = f"{int(ticks['time_msc'][0])}_{int(ticks['time_msc'][-1])}-{seq}"
+        tmp = day_dir / f"{name}.part"
+        with open(tmp, "wb") as fh:
+            np.savez_compressed(fh, **encode_ticks(ticks, self.point))
+        final = day_dir / f"{name}.npz"
+        os.replace(tmp, final)
+        return final
+
+    # endregion
+
+    # region Ghi
+    def append(self, ticks: Any) -> int:
+        """
+        Nhận các tick chưa có trong kho; trả về số tick được nhận. Gọi lặp lại với các cửa sổ chồng
+        nhau (5m/30m) là an toàn: tick cũ hơn mốc cuối bị bỏ, tick cùng mốc được so theo
+        (time_msc, bid, ask, flags) nên tick đến sau trong cùng mili giây không bị mất.
+        """
+        arr = to_tick_array(ticks)
+        if arr.size == 0:
+            return 0
+        with self._lock:
+            self._load_tail()
+            if self._last_msc is not None:
+                times = arr["time_msc"]
+                keep = times > self._last_msc
+                same = np.flatnonzero(times == self._last_msc)
+                for i, key in zip(same, self._tick_keys(arr[same])):
+                    keep[i] = key not in self._boundary
+                arr = arr[keep]
+            if arr.size == 0:
+                return 0
+
+            last = int(arr["time_msc"][-1])
+            tail = set(self._tick_keys(arr[arr["time_msc"] == last]))
+            self._boundary = self._boundary | tail if last == self._last_msc else tail
+            self._last_msc = last
+            self._buffer.append(arr)
+            self._buffered += int(arr.size)
+
+            day = _day_key(last)
+            previous_day = self._open_day if self._open_day is not None else _day_key(int(arr["time_msc"][0]))
+            rolled = day != previous_day
+            self._open_day = day
+            due = self.clock() - self._last_flush >= self.flush_interval_sec
+            if rolled or due or self._buffered >= self.flush_ticks:
+                self._flush_locked()
+            if rolled:
+                self._compact_closed_days(day)
+        return int(arr.size)
+
+    def flush(self) -> int:
+        """Ghi bộ đệm xuống đĩa; trả về số tick đã ghi."""
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        self._last_flush = self.clock()
+        if not self._buffer:
+            return 0
+        arr = np.concatenate(self._buffer) if len(self._buffer) > 1 else self._buffer[0]
+        self._buffer = []
+        self._buffered = 0
+        keys = (arr["time_msc"] // DAY_MS).astype(np.int64)
+        for day_index in np.unique(keys):
+            chunk = arr[keys == day_index]
+            self._write_chunk(_day_key(int(chunk["time_msc"][0])), chunk)
+        logger.debug(f"Đã ghi {arr.size} tick {self.symbol} vào kho.")
+        return int(arr.size)
+
+    def compact(self, key: int) -> None:
+        """Gộp mọi chunk của một ngày thành một file."""
+        chunks = self._chunks(key)
+        if len(chunks) < 2:
+            return
+        merged = np.concatenate([self._load(p) for p in chunks])
+        merged = merged[np.argsort(merged["time_msc"], kind="stable")]
+        self._write_chunk(key, merged)
+        for p in chunks:
+            p.unlink(missing_ok=True)
+        logger.debug(f"Đã gộp {len(chunks)} chunk tick ngày {key} của {self.symbol}.")
+
+    def _compact_closed_days(self, current_key: int) -> None:
+        for key in self.days():
+            if key < current_key and len(self._chunks(key)) > 1:
+                self.compact(key)
+
+    # endregion
+
+    # region Đọc
+    @staticmethod
+    def _load(path: Path) -> np.ndarray:
+        with np.load(path) as payload:
+            return decode_ticks(payload)
+
+    def iter_chunks(self, start_msc: Optional[int] = None, end_msc: Optional[int] = None) -> Iterator[np.ndarray]:
+        """Lần lượt trả về các khối tick có `start_msc <= time_msc < end_msc`."""
+        self.flush()
+        for key in self.days():
+            day0 = _day_start_msc(key)
+            if end_msc is not None and day0 >= end_msc:
+                break
+            if start_msc is not None and day0 + DAY_MS <= start_msc:
+                continue
+            for path in self._chunks(key):
+                first, last = _chunk_range(path)
+                if (start_msc is not None and last < start_msc) or (end_msc is not None and first >= end_msc):
+                    continue
+                ticks = self._load(path)
+                if start_msc is not None or end_msc is not None:
+                    times = ticks["time_msc"]
+                    lo = int(np.searchsorted(times, start_msc, "left")) if start_msc is not None else 0
+                    hi = int(np.searchsorted(times, end_msc, "left")) if end_msc is not None else times.size
+                    ticks = ticks[lo:hi]
+                if ticks.size:
+                    yield ticks
+
+    def read(self, start_msc: Optional[int] = None, end_msc: Optional[int] = None) -> np.ndarray:
+        chunks = list(self.iter_chunks(start_msc, end_msc))
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=TICK_DTYPE)
+
+    def spread_stats(
+        self,
+        start_msc: Optional[int] = None,
+        end_msc: Optional[int] = None,
+        percentiles: Sequence[float] = (50, 90, 99),
+    ) -> dict[str, Any]:
+        """
+        Phân vị spread (điểm, chính xác nhờ histogram số nguyên) và số tick mỗi phút, tính dần
+        theo từng chunk.
+        """
+        hist = np.zeros(0, dtype=np.int64)
+        count = 0
+        t_first: Optional[int] = None
+        t_last: Optional[int] = None
+        for ticks in self.iter_chunks(start_msc, end_msc):
+            spread = np.rint((ticks["ask"] - ticks["bid"]) / self.point).astype(np.int64).clip(min=0)
+            counts = np.bincount(spread)
+            if counts.size > hist.size:
+                hist = np.pad(hist, (0, counts.size - hist.size))
+            hist[: counts.size] += counts
+            count += int(ticks.size)
+            t_first = int(ticks["time_msc"][0]) if t_first is None else t_first
+            t_last = int(ticks["time_msc"][-1])
+        if count == 0:
+            return {"ticks": 0}
+        cdf = np.cumsum(hist)
+        span_ms = (end_msc - start_msc) if start_msc is not None and end_msc is not None else (t_last - t_first)
+        stats: dict[str, Any] = {
+            "ticks": count,
+            "ticks_per_min": count / max(span_ms / 60_000, 1e-9),
+            "mean_spread": float(np.dot(np.arange(hist.size), hist) / count),
+        }
+        for q in percentiles:
+            rank = max(1, math.ceil(count * q / 100.0))
+            stats[f"p{q:g}_spread"] = int(np.searchsorted(cdf, rank))
+        return stats
+
+    # endregion
+
+
+def get_tick_archive(symbol: str, point: float, root: Optional[Path] = None) -> TickArchive:
+    """Kho tick dùng chung cho `symbol` (giữ bộ đệm và mốc cuối giữa các lần làm mới)."""
+    archive = TickArchive(symbol, point, root=root)
+    key = archive.path.resolve()
+    with _locks_guard:
+        cached = _archives.get(key)
+        if cached is not None and cached.point == archive.point:
+            return cached
+        _archives[key] = archive
+    if cached is not None:
+        cached.flush()
+    return archive
+
+
+def flush_all() -> None:
+    """Xả bộ đệm của mọi kho tick dùng chung (gọi khi thoát ứng dụng)."""
+    with _locks_guard:
+        archives = list(_archives.values())
+    for archive in archives:
+        try:
+            archive.flush()
+        except Exception as e:
+            logger.warning(f"Không thể xả bộ đệm tick {archive.symbol}: {e}")
+
+
+atexit.register(flush_all)
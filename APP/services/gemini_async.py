@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming Gemini qua API async của SDK (`generate_content_async`).
+
+Luồng đồng bộ chỉ kiểm tra `CancelToken` giữa các chunk, nên một stream bị treo giữ phiên
+tới `REQUEST_TIMEOUT`. Ở đây mỗi lần chờ chunk là một `asyncio.wait_for` với hạn riêng:
+- `first_token_sec`: từ lúc gửi request tới chunk đầu tiên;
+- `idle_sec`: khoảng lặng tối đa giữa hai chunk;
+- `total_sec`: trần cho toàn bộ stream.
+Hết hạn -> `StreamTimeoutError(phase)`; hủy -> task bị cancel, iterator của SDK được `aclose()`
+nên kết nối bên dưới đóng ngay.
+
+`AsyncStreamBridge` chạy một event loop riêng trên luồng nền và trả về iterator đồng bộ để
+worker (chạy trên thread) dùng như stream của `generate_content(stream=True)`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import queue
+import threading
+from concurrent.futures import CancelledError
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator, Optional
+
+if TYPE_CHECKING:
+    from APP.configs.app_config import ApiConfig
+    from APP.utils.threading_utils import CancelToken
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SEC = 0.1
+_DONE = object()
+
+
+@dataclass(frozen=True)
+class StreamTimeouts:
+    """Các hạn chờ của một stream (giây)."""
+
+    first_token_sec: float = 120.0
+    idle_sec: float = 60.0
+    total_sec: float = 1200.0
+
+    @classmethod
+    def from_api(cls, api_cfg: "ApiConfig") -> "StreamTimeouts":
+        return cls(
+            first_token_sec=float(api_cfg.first_token_timeout_sec),
+            idle_sec=float(api_cfg.idle_timeout_sec),
+            total_sec=float(api_cfg.total_timeout_sec),
+        )
+
+
+class StreamTimeoutError(TimeoutError):
+    """Stream vượt một trong các hạn chờ; `phase` là 'first_token', 'idle' hoặc 'total'."""
+
+    def __init__(self, phase: str, seconds: float) -> None:
+        super().__init__(f"Stream Gemini quá hạn chờ '{phase}' ({seconds:.1f}s).")
+        self.phase = phase
+        self.seconds = seconds
+
+
+def supports_async(model: Any) -> bool:
+    return callable(getattr(model, "generate_content_async", None))
+
+
+async def astream(model: Any, parts: list[Any], timeouts: StreamTimeouts) -> AsyncIterator[Any]:
+    """Stream các chunk của `model.generate_content_async(parts, stream=True)` với hạn chờ."""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    total_deadline = start + timeouts.total_sec
+    first_deadline = start + timeouts.first_token_sec
+
+    def budget(phase: str, phase_deadline: float, limit: float) -> tuple[float, str, float]:
+        """(số giây được chờ, pha, hạn cấu hình) — pha 'total' nếu trần tổng đến trước."""
+        if total_deadline <= phase_deadline:
+            phase, phase_deadline, limit = "total", total_deadline, timeouts.total_sec
+        return max(0.0, phase_deadline - loop.time()), phase, limit
+
+    timeout, phase, limit = budget("first_token", first_deadline, timeouts.first_token_sec)
+    try:
+        response = await asyncio.wait_for(
+            model.generate_content_async(parts, stream=True, request_options={"timeout": timeouts.total_sec}),
+            timeout,
+        )
+    except asyncio.TimeoutError:
+        raise StreamTimeoutError(phase, limit) from None
+
+    iterator = response.__aiter__()
+    received_first = False
+    try:
+        while True:
+            if received_first:
+                timeout, phase, limit = budget("idle", loop.time() + timeouts.idle_sec, timeouts.idle_sec)
+            else:
+                timeout, phase, limit = budget("first_token", first_deadline, timeouts.first_token_sec)
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                raise StreamTimeoutError(phase, limit) from None
+            received_first = True
+            yield chunk
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            with contextlib.suppress(Exception):
+                await aclose()
+
+
+class AsyncStreamBridge:
+    """Event loop nền + cầu nối thread-safe từ `astream` sang iterator đồng bộ."""
+
+    def __init__(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="GeminiAsyncLoop", daemon=True)
+        self._thread.start()
+
+    def stream(
+        self,
+        model: Any,
+        parts: list[Any],
+        timeouts: StreamTimeouts,
+        cancel_token: Optional["CancelToken"] = None,
+    ) -> Iterator[Any]:
+        """Iterator chunk; hủy `cancel_token` sẽ cancel task async (đóng kết nối) và ném `CancelledError`."""
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        out: "queue.Queue[tuple[Any, Optional[BaseException]]]" = queue.Queue()
+
+        async def pump() -> None:
+            try:
+                async for chunk in astream(model, parts, timeouts):
+                    out.put((chunk, None))
+            except Exception as e:
+                out.put((_DONE, e))
+            else:
+                out.put((_DONE, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                if cancel_token is not None and cancel_token.is_cancelled():
+                    logger.info("Hủy stream Gemini đang chạy theo yêu cầu.")
+                    raise CancelledError()
+                try:
+                    item, error = out.get(timeout=POLL_INTERVAL_SEC)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def close(self) -> None:
+        """Hủy các stream còn chạy rồi dừng event loop."""
+
+        async def shutdown() -> None:
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._thread.join(timeout=2.0)
+
+
+_bridge: Optional[AsyncStreamBridge] = None
+_bridge_guard = threading.Lock()
+
+
+def get_bridge() -> AsyncStreamBridge:
+    """Bridge dùng chung (một event loop nền cho cả tiến trình)."""
+    global _bridge
+    with _bridge_guard:
+        if _bridge is None:
+            _bridge = AsyncStreamBridge()
+        return _bridge
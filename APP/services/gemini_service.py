@@ -1,23 +1,38 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
 import random
+import threading
 import time
-from typing import Any, Generator, List, Optional, Union
+from concurrent.futures import CancelledError
+from typing import TYPE_CHECKING, Any, Generator, List, Mapping, Optional, Union
 
+from APP.services import gemini_async
+from APP.services.response_cache import ResponseCache, request_key
+from APP.utils import rate_limiter as rate_limiting
 from APP.utils.google_ai import (
     GEMINI_AVAILABLE,
+    CachedContent,
     GenerativeModel,
     configure,
     exceptions,
     list_models,
 )
 
+if TYPE_CHECKING:
+    from APP.configs.app_config import ApiConfig
+    from APP.utils.threading_utils import CancelToken
+
 # Khởi tạo logger cho service này
 logger = logging.getLogger(__name__)
 
 # Hằng số cho việc gọi API
 REQUEST_TIMEOUT: int = 1200
+# Ước lượng token đầu vào cho rate limiter: ~4 ký tự/token, mỗi ảnh tính cố định.
+CHARS_PER_TOKEN: int = 4
+IMAGE_TOKENS: int = 258
 
 
 class StreamError:
@@ -32,13 +47,122 @@ class StreamError:
         return f"StreamError: {self.message}"
 
 
-def initialize_model(api_key: str, model_name: str) -> Optional[GenerativeModel]:
+# region Model pool
+# `configure` thay client mặc định của SDK (kéo theo transport HTTP mới), nên chỉ gọi lại khi API
+# key đổi. Model được giữ theo (key, tên model, generation config) và dùng lại giữa các phiên.
+_pool_lock = threading.Lock()
+_models: dict[tuple[str, str, str], GenerativeModel] = {}
+_configured_key: Optional[str] = None
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Định danh ngắn của API key (dùng làm khóa pool/cache thay cho key gốc)."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _generation_key(generation_config: Optional[Mapping[str, Any]]) -> str:
+    return json.dumps(generation_config, sort_keys=True, default=str) if generation_config else ""
+
+
+def _ensure_configured_locked(api_key: str) -> None:
+    global _configured_key
+    key_id = key_fingerprint(api_key)
+    if _configured_key == key_id:
+        return
+    configure(api_key=api_key)
+    # Model tạo dưới key cũ có thể đã gắn client cũ: bỏ khỏi pool.
+    for pooled in [k for k in _models if k[0] != key_id]:
+        del _models[pooled]
+    if _configured_key is not None:
+        logger.info("API key Gemini đã đổi, cấu hình lại client và làm mới pool model.")
+    _configured_key = key_id
+
+
+def ensure_configured(api_key: str) -> bool:
+    """Cấu hình SDK với `api_key` nếu key khác lần cấu hình trước; trả về False nếu thất bại."""
+    if not api_key or not GEMINI_AVAILABLE:
+        return False
+    try:
+        with _pool_lock:
+            _ensure_configured_locked(api_key)
+        return True
+    except Exception as e:
+        logger.error(f"Không thể cấu hình Gemini API: {e}")
+        return False
+
+
+def get_model(
+    api_key: str, model_name: str, generation_config: Optional[Mapping[str, Any]] = None
+) -> GenerativeModel:
+    """Model trong pool cho (key, model, generation config); tạo mới nếu chưa có."""
+    pool_key = (key_fingerprint(api_key), model_name, _generation_key(generation_config))
+    with _pool_lock:
+        _ensure_configured_locked(api_key)
+        model = _models.get(pool_key)
+        if model is None:
+            kwargs: dict[str, Any] = {"model_name": model_name}
+            if generation_config:
+                kwargs["generation_config"] = dict(generation_config)
+            model = _models[pool_key] = GenerativeModel(**kwargs)
+            logger.info(f"Đã khởi tạo model '{model_name}' và đưa vào pool.")
+        else:
+            logger.debug(f"Dùng lại model '{model_name}' từ pool.")
+        return model
+
+
+def get_cached_model(api_key: str, cache_name: str) -> GenerativeModel:
+    """Model gắn với một context cache (`cachedContents/...`), cũng được giữ trong pool."""
+    if CachedContent is None:
+        raise RuntimeError("SDK hiện tại không hỗ trợ context caching.")
+    pool_key = (key_fingerprint(api_key), f"cache:{cache_name}", "")
+    with _pool_lock:
+        _ensure_configured_locked(api_key)
+        model = _models.get(pool_key)
+        if model is None:
+            cached = CachedContent.get(cache_name)
+            model = _models[pool_key] = GenerativeModel.from_cached_content(cached_content=cached)
+            logger.info(f"Đã khởi tạo model từ context cache '{cache_name}'.")
+        return model
+
+
+def forget_cached_model(cache_name: str) -> None:
+    """Bỏ các model gắn với `cache_name` khỏi pool (cache đã bị xóa hoặc hết hạn)."""
+    with _pool_lock:
+        for pooled in [k for k in _models if k[1] == f"cache:{cache_name}"]:
+            del _models[pooled]
+
+
+def reset_model_pool() -> None:
+    """Xóa pool; lần gọi sau sẽ cấu hình lại SDK."""
+    global _configured_key
+    with _pool_lock:
+        _models.clear()
+        _configured_key = None
+
+
+# endregion
+
+
+class CachedChunk:
+    """Chunk giả lập khi phát lại phản hồi từ `ResponseCache`; chỉ có thuộc tính `text`."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+CACHED_CHUNK_CHARS = 400
+
+
+def initialize_model(
+    api_key: str, model_name: str, generation_config: Optional[Mapping[str, Any]] = None
+) -> Optional[GenerativeModel]:
     """
-    Khởi tạo GenerativeModel với API key được cung cấp.
+    Lấy GenerativeModel cho API key được cung cấp từ pool (tạo mới khi cần).
 
     Args:
         api_key: Khóa API của Google AI.
         model_name: Tên của model cần khởi tạo.
+        generation_config: Cấu hình sinh nội dung (tùy chọn), là một phần của khóa pool.
 
     Returns:
         Một instance của GenerativeModel nếu thành công, ngược lại trả về None.
@@ -52,15 +176,7 @@ def initialize_model(api_key: str, model_name: str) -> Optional[GenerativeModel]
         )
         return None
     try:
-        # Cấu hình API key trước khi khởi tạo model.
-        # Đây là cách làm đúng và an toàn, thay vì gán trực tiếp vào client.
-        configure(api_key=api_key)
-
-        # Khởi tạo model sau khi đã cấu hình.
-        model = GenerativeModel(model_name=model_name)
-
-        logger.info(f"Đã khởi tạo model '{model_name}' thành công.")
-        return model
+        return get_model(api_key, model_name, generation_config)
     except exceptions.PermissionDenied as e:
         # Bắt lỗi cụ thể hơn để cung cấp thông báo hữu ích
         logger.error(f"Lỗi quyền API (PermissionDenied) khi khởi tạo model '{model_name}': {e}. Vui lòng kiểm tra API key.")
@@ -89,7 +205,8 @@ def configure_and_get_models(api_key: str) -> List[str]:
         )
         return []
     try:
-        configure(api_key=api_key)
+        with _pool_lock:
+            _ensure_configured_locked(api_key)
         available_models = [
             m.name
             for m in list_models()
@@ -141,11 +258,41 @@ def _handle_api_exception(
     time.sleep(total_wait)
 
 
+def get_rate_limiter(api_key: str, api_cfg: "ApiConfig") -> Optional[rate_limiting.RateLimiter]:
+    """Limiter dùng chung cho `api_key`; None nếu không đặt giới hạn nào."""
+    limits = (api_cfg.rpm_limit, api_cfg.tpm_limit, api_cfg.uploads_per_min)
+    if not api_key or all(limit <= 0 for limit in limits):
+        return None
+    return rate_limiting.get_rate_limiter(key_fingerprint(api_key), *limits)
+
+
+def estimate_request_tokens(parts: List[Any]) -> int:
+    """Ước lượng thô số token đầu vào của `parts` (chỉ dùng để xếp hàng theo TPM)."""
+    total = 0
+    for part in parts:
+        total += len(part) // CHARS_PER_TOKEN if isinstance(part, str) else IMAGE_TOKENS
+    return max(1, total)
+
+
+def _acquire_request_slot(
+    limiter: Optional[rate_limiting.RateLimiter], parts: List[Any], cancel_token: Optional["CancelToken"]
+) -> None:
+    if limiter is None:
+        return
+    waited = limiter.acquire(requests=1, tokens=estimate_request_tokens(parts), cancel_token=cancel_token)
+    if waited > 0:
+        logger.info(f"Chờ {waited:.1f}s theo giới hạn tốc độ trước khi gọi Gemini.")
+
+
 def stream_gemini_response(
     model: Any,
     parts: List[Any],
     tries: int = 5,
     base_delay: float = 2.0,
+    response_cache: Optional[ResponseCache] = None,
+    rate_limiter: Optional[rate_limiting.RateLimiter] = None,
+    cancel_token: Optional["CancelToken"] = None,
+    timeouts: Optional[gemini_async.StreamTimeouts] = None,
 ) -> Generator[Union[Any, StreamError], None, None]:
     """
     Tạo một generator để gọi API Gemini streaming với cơ chế thử lại (retry).
@@ -158,6 +305,12 @@ def stream_gemini_response(
         parts: Danh sách các phần nội dung để gửi đến API.
         tries: Số lần thử lại tối đa.
         base_delay: Thời gian chờ cơ bản (tính bằng giây).
+        response_cache: Nếu có, request giống hệt lần trước được phát lại từ cache dưới dạng
+            các `CachedChunk`; stream hoàn tất được lưu vào cache.
+        rate_limiter: Nếu có, mỗi lần thử chờ đủ hạn mức request/token trước khi gọi API.
+        cancel_token: Hủy việc chờ hạn mức (ném `CancelledError`); với `timeouts`, hủy cả stream đang chạy.
+        timeouts: Nếu có và model hỗ trợ API async, stream qua `gemini_async` với hạn chờ
+            chunk đầu/giữa các chunk/tổng; quá hạn được tính là một lần thử thất bại.
 
     Yields:
         Các chunk dữ liệu từ API trả về.
@@ -165,19 +318,47 @@ def stream_gemini_response(
     Raises:
         Exception: Ném ra lỗi cuối cùng nếu tất cả các lần thử đều thất bại.
     """
+    cache_key = request_key(model, parts) if response_cache is not None else None
+    if cache_key is not None:
+        cached_text = response_cache.get(cache_key)
+        if cached_text:
+            logger.info(f"Trúng cache phản hồi ({cache_key[:12]}), phát lại {len(cached_text)} ký tự.")
+            for start in range(0, len(cached_text), CACHED_CHUNK_CHARS):
+                yield CachedChunk(cached_text[start : start + CACHED_CHUNK_CHARS])
+            return
+
     logger.debug(f"Bắt đầu stream tới Gemini API với {tries} lần thử.")
     last_exception: Exception | None = None
 
     for i in range(tries):
+        _acquire_request_slot(rate_limiter, parts, cancel_token)
+        yielded = False
         try:
-            response_stream = model.generate_content(
-                parts, stream=True, request_options={"timeout": REQUEST_TIMEOUT}
-            )
+            if timeouts is not None and gemini_async.supports_async(model):
+                response_stream = gemini_async.get_bridge().stream(model, parts, timeouts, cancel_token)
+            else:
+                response_stream = model.generate_content(
+                    parts, stream=True, request_options={"timeout": REQUEST_TIMEOUT}
+                )
             logger.info(f"Lần thử {i+1}: Kết nối stream tới Gemini API thành công.")
-            yield from response_stream
+            received: list[str] = []
+            for chunk in response_stream:
+                if cache_key is not None:
+                    received.append(getattr(chunk, "text", "") or "")
+                yielded = True
+                yield chunk
             logger.debug("Stream từ Gemini API hoàn tất.")
+            if cache_key is not None:
+                response_cache.put(cache_key, "".join(received), model=getattr(model, "model_name", ""))
             return  # Thoát khỏi hàm khi stream thành công
+        except CancelledError:
+            raise
         except (exceptions.ResourceExhausted, Exception) as e:
+            if yielded:
+                # Người gọi đã nhận một phần phản hồi: thử lại sẽ phát lại từ đầu và nhân đôi văn bản.
+                logger.error(f"Stream Gemini bị ngắt giữa chừng ở lần thử {i+1}: {e}")
+                yield StreamError(message="Stream bị ngắt sau khi đã nhận một phần phản hồi.", exception=e)
+                return
             last_exception = e
             _handle_api_exception(e, attempt=i, tries=tries, base_delay=base_delay)
 
@@ -200,6 +381,8 @@ def gemini_api_call(
     parts: List[Any],
     tries: int = 5,
     base_delay: float = 2.0,
+    rate_limiter: Optional[rate_limiting.RateLimiter] = None,
+    cancel_token: Optional["CancelToken"] = None,
 ) -> str:
     """
     Thực hiện một cuộc gọi API Gemini không streaming với cơ chế thử lại (retry).
@@ -212,6 +395,8 @@ def gemini_api_call(
         parts: Danh sách các phần nội dung để gửi đến API.
         tries: Số lần thử lại tối đa.
         base_delay: Thời gian chờ cơ bản (tính bằng giây).
+        rate_limiter: Nếu có, mỗi lần thử chờ đủ hạn mức request/token trước khi gọi API.
+        cancel_token: Hủy việc chờ hạn mức (ném `CancelledError`).
 
     Returns:
         Nội dung văn bản đầy đủ từ phản hồi của API.
@@ -223,6 +408,7 @@ def gemini_api_call(
     last_exception: Exception | None = None
 
     for i in range(tries):
+        _acquire_request_slot(rate_limiter, parts, cancel_token)
         try:
             response = model.generate_content(
                 parts, request_options={"timeout": REQUEST_TIMEOUT}
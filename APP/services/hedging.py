@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Hedged request cho stream Gemini: stream nào ra nội dung hợp lệ trước thì thắng.
+
+Ứng viên chính được mở ngay; nếu sau `delay_sec` vẫn chưa có chunk hợp lệ (có văn bản, không
+phải `StreamError`) thì mở ứng viên tiếp theo (cùng model hoặc model dự phòng), và cứ thế.
+Ứng viên thất bại trước khi ra nội dung sẽ kích hoạt ứng viên kế tiếp ngay lập tức. Khi có
+người thắng, các stream còn lại bị hủy qua `CancelToken` riêng của chúng.
+
+Mọi lần mở stream (kể cả bên thua) được ghi thành `HedgeAttempt` để tính chi phí;
+`append_ledger` ghi chúng vào file JSONL. `StubStream` là backend giả lập độ trễ để test
+tail latency mà không gọi API.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import CancelledError
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from time import monotonic
+from types import SimpleNamespace
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from APP.services.gemini_service import StreamError
+from APP.utils.threading_utils import CancelToken
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SEC = 0.05
+LEDGER_FILENAME = "hedge_ledger.jsonl"
+
+
+@dataclass(frozen=True)
+class HedgeCandidate:
+    """Một cách mở stream; `open_stream(token)` phải dừng sớm khi token bị hủy."""
+
+    label: str
+    model_name: str
+    open_stream: Callable[[CancelToken], Iterable[Any]]
+    input_tokens: int = 0
+
+
+@dataclass
+class HedgeAttempt:
+    """Bản ghi chi phí của một stream đã mở (thời gian tính bằng giây từ lúc bắt đầu)."""
+
+    label: str
+    model_name: str
+    launched_at: float
+    input_tokens: int = 0
+    first_chunk_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    outcome: str = "running"  # won / cancelled / failed
+    output_chars: int = 0
+    error: str = ""
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def is_valid_chunk(chunk: Any) -> bool:
+    return not isinstance(chunk, StreamError) and bool(getattr(chunk, "text", ""))
+
+
+class HedgedStream:
+    """Chạy các ứng viên trên luồng riêng và chuyển tiếp stream của bên thắng."""
+
+    def __init__(
+        self,
+        candidates: list[HedgeCandidate],
+        delay_sec: float,
+        cancel_token: Optional[CancelToken] = None,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        if not candidates:
+            raise ValueError("Cần ít nhất một ứng viên cho hedged stream.")
+        self.candidates = candidates
+        self.delay_sec = max(0.0, delay_sec)
+        self.cancel_token = cancel_token or CancelToken()
+        self.clock = clock
+        self.attempts: list[HedgeAttempt] = []
+        self.winner: Optional[HedgeAttempt] = None
+        self._tokens: list[CancelToken] = []
+        self._events: "queue.Queue[tuple[int, str, Any]]" = queue.Queue()
+        self._start = 0.0
+
+    def _elapsed(self) -> float:
+        return round(self.clock() - self._start, 3)
+
+    def _launch(self) -> None:
+        idx = len(self.attempts)
+        cand = self.candidates[idx]
+        token = self.cancel_token.derive()
+        self._tokens.append(token)
+        self.attempts.append(HedgeAttempt(cand.label, cand.model_name, self._elapsed(), cand.input_tokens))
+        if idx > 0:
+            logger.info(f"Hedge: mở stream '{cand.label}' ({cand.model_name}) sau {self._elapsed():.1f}s.")
+
+        def run() -> None:
+            # Stream bị hủy thường kết thúc bình thường hoặc ném lỗi bất kỳ: luôn báo "cancelled"
+            # khi token đã hủy để không ghi nhầm thành "failed".
+            kind, payload = "done", None
+            try:
+                for chunk in cand.open_stream(token):
+                    if token.is_cancelled():
+                        break
+                    if isinstance(chunk, StreamError):
+                        kind, payload = "error", chunk
+                        break
+                    self._events.put((idx, "chunk", chunk))
+            except CancelledError:
+                kind, payload = "cancelled", None
+            except Exception as e:
+                kind, payload = "error", e
+            if token.is_cancelled():
+                kind, payload = "cancelled", None
+            self._events.put((idx, kind, payload))
+
+        threading.Thread(target=run, name=f"Hedge-{cand.label}", daemon=True).start()
+
+    def _finish(self, idx: int, outcome: str, error: Any = None) -> None:
+        attempt = self.attempts[idx]
+        if attempt.outcome != "running":
+            return
+        attempt.outcome = outcome
+        attempt.finished_at = self._elapsed()
+        if error is not None:
+            attempt.error = str(error)
+
+    def _cancel_losers(self) -> None:
+        for idx, token in enumerate(self._tokens):
+            if self.attempts[idx].outcome == "running":
+                token.cancel()
+                self._finish(idx, "cancelled")
+
+    def stream(self) -> Iterator[Any]:
+        """Iterator chunk của bên thắng; `StreamError` nếu mọi ứng viên đều thất bại."""
+        self._start = self.clock()
+        buffers: dict[int, list[Any]] = {}
+        winner: Optional[int] = None
+        last_error: Any = None
+        self._launch()
+        next_launch = self._start + self.delay_sec
+        try:
+            while winner is None:
+                self.cancel_token.raise_if_cancelled()
+                has_more = len(self.attempts) < len(self.candidates)
+                running = [i for i, a in enumerate(self.attempts) if a.outcome == "running"]
+                if not running and not has_more:
+                    logger.error(f"Hedge: cả {len(self.attempts)} stream đều thất bại.")
+                    yield last_error if isinstance(last_error, StreamError) else StreamError(
+                        message=f"Cả {len(self.attempts)} stream hedge đều thất bại.",
+                        exception=last_error if isinstance(last_error, Exception) else None,
+                    )
+                    return
+                if has_more and (not running or self.clock() >= next_launch):
+                    self._launch()
+                    next_launch = self.clock() + self.delay_sec
+                    continue
+                wait = POLL_INTERVAL_SEC
+                if has_more:
+                    wait = max(0.0, min(wait, next_launch - self.clock()))
+                try:
+                    idx, kind, payload = self._events.get(timeout=wait)
+                except queue.Empty:
+                    continue
+                if self.attempts[idx].outcome != "running":
+                    continue
+                if kind == "chunk":
+                    buffers.setdefault(idx, []).append(payload)
+                    if is_valid_chunk(payload):
+                        winner = idx
+                elif kind == "cancelled":
+                    self._finish(idx, "cancelled")
+                    buffers.pop(idx, None)
+                else:
+                    last_error = payload if kind == "error" else "Stream kết thúc mà không có nội dung."
+                    self._finish(idx, "failed", last_error)
+                    buffers.pop(idx, None)
+
+            attempt = self.attempts[winner]
+            attempt.outcome = "won"
+            attempt.first_chunk_at = self._elapsed()
+            self.winner = attempt
+            self._cancel_losers()
+            if len(self.attempts) > 1:
+                logger.info(f"Hedge: '{attempt.label}' thắng sau {attempt.first_chunk_at:.1f}s.")
+
+            pending = buffers.pop(winner, [])
+            while True:
+                for chunk in pending:
+                    attempt.output_chars += len(getattr(chunk, "text", "") or "")
+                    yield chunk
+                pending = []
+                self.cancel_token.raise_if_cancelled()
+                try:
+                    idx, kind, payload = self._events.get(timeout=POLL_INTERVAL_SEC)
+                except queue.Empty:
+                    continue
+                if idx != winner:
+                    continue
+                if kind == "chunk":
+                    pending = [payload]
+                    continue
+                if kind == "cancelled":
+                    self.cancel_token.raise_if_cancelled()
+                if kind == "error":
+                    attempt.error = str(payload)
+                    yield payload if isinstance(payload, StreamError) else StreamError(
+                        message=f"Stream '{attempt.label}' lỗi sau khi đã thắng.",
+                        exception=payload if isinstance(payload, Exception) else None,
+                    )
+                return
+        finally:
+            self._cancel_losers()
+            if winner is not None:
+                self.attempts[winner].finished_at = self._elapsed()
+            # Bên thắng cũng dừng nếu người gọi đóng iterator giữa chừng.
+            for token in self._tokens:
+                token.cancel()
+
+
+def append_ledger(path: Path, attempts: list[HedgeAttempt], **meta: Any) -> None:
+    """Ghi mỗi lần mở stream thành một dòng JSONL (kèm `meta`, ví dụ symbol/session)."""
+    if not attempts:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as fh:
+            for attempt in attempts:
+                fh.write(json.dumps({**meta, **attempt.to_dict()}, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning(f"Không thể ghi sổ hedge {path}: {e}")
+
+
+class StubStream:
+    """Stream giả lập: chờ `first_chunk_sec`, sau đó phát `chunks` cách nhau `interval_sec`.
+
+    `fail=True` ném lỗi thay vì phát chunk đầu. Việc chờ được chia nhỏ để phản hồi hủy.
+    """
+
+    def __init__(
+        self,
+        chunks: list[str],
+        first_chunk_sec: float = 0.0,
+        interval_sec: float = 0.0,
+        fail: bool = False,
+        sleeper: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.chunks = chunks
+        self.first_chunk_sec = first_chunk_sec
+        self.interval_sec = interval_sec
+        self.fail = fail
+        self.sleeper = sleeper
+        self.opened = 0
+        self.cancelled = False
+
+    def _wait(self, seconds: float, token: CancelToken) -> bool:
+        deadline = monotonic() + seconds
+        while monotonic() < deadline:
+            if token.is_cancelled():
+                self.cancelled = True
+                return False
+            self.sleeper(min(0.01, max(0.0, deadline - monotonic())))
+        return not token.is_cancelled()
+
+    def __call__(self, token: CancelToken) -> Iterator[Any]:
+        self.opened += 1
+        if not self._wait(self.first_chunk_sec, token):
+            return
+        if self.fail:
+            raise RuntimeError("Stub stream lỗi.")
+        for i, text in enumerate(self.chunks):
+            if i and not self._wait(self.interval_sec, token):
+                return
+            yield SimpleNamespace(text=text)
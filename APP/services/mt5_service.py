@@ -5,8 +5,7 @@ import logging
 import math
 import threading
 import time
-from dataclasses import asdict
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from statistics import median
 from typing import TYPE_CHECKING, Any, Iterable, Optional, Sequence
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
@@ -16,8 +15,8 @@ try:
 except ModuleNotFoundError:  # pragma: no cover - optional dependency
     mt5_lib = None
 
-from APP.analysis import ict_analyzer
-from APP.analysis.ict_analyzer import LiquidityLevel
+from APP.analysis import ict_analyzer, ict_cache, ict_parallel, level_index, session_stats, structure_alignment
+from APP.persistence import bar_archive, tick_archive
 from APP.utils.safe_data import SafeData
 
 logger = logging.getLogger(__name__)
@@ -31,11 +30,15 @@ if mt5 is None:
     )
 
 if TYPE_CHECKING:
-    from APP.configs.app_config import MT5Config, RunConfig
+    from APP.configs.app_config import IctConfig, MT5Config, RunConfig
 
 
 # Khóa toàn cục để đảm bảo chỉ một luồng truy cập thư viện MT5 tại một thời điểm
 _mt5_lock = threading.Lock()
+# Luồng nền lấp khoảng trống kho nến, mỗi (symbol, timeframe) một lần trong phiên chạy này.
+_backfill_threads: dict[tuple[str, str], threading.Thread] = {}
+_backfilled_guard = threading.Lock()
+BACKFILL_WINDOW_SEC = 14 * 86400  # chỉ lấp khoảng trống trong cửa sổ gần đây này
 
 DEFAULT_TIMEZONE = "Asia/Ho_Chi_Minh"
 
@@ -285,7 +288,8 @@ def value_per_point(symbol: str, info_obj: Any | None = None) -> float | None:
     Tries broker-provided tick value/size, falls back to order_calc_profit, then contract size.
     """
     logger.debug(f"Bắt đầu value_per_point cho symbol: {symbol}")
-    if mt5 is None:
+    # Khi đã có info (vd. snapshot đã ghi lại), vẫn tính được từ tick_value/contract_size mà không cần MT5.
+    if mt5 is None and info_obj is None:
         logger.warning("MetaTrader5 module not installed, cannot get value_per_point.")
         return None
     with _mt5_lock:
@@ -608,8 +612,175 @@ def get_active_killzone(
         return False, None
 
 
-def _series_from_mt5(symbol: str, tf_code: int, bars: int) -> list[dict]:
-    """Lấy dữ liệu chuỗi thời gian từ MT5 với cơ chế thử lại."""
+def _archive_closed_bars(symbol: str, tf_name: str, arr: Any) -> None:
+    """
+    Ghi các nến đã đóng (bỏ nến cuối đang hình thành) vào kho nến cục bộ. Lần ghi đầu tiên của
+    mỗi (symbol, timeframe) trong phiên còn mở một luồng nền lấp khoảng trống trong
+    `BACKFILL_WINDOW_SEC` gần nhất, để không chặn việc lấy dữ liệu cho phân tích.
+    """
+    try:
+        archive = bar_archive.BarArchive(symbol, tf_name)
+        key = (symbol, tf_name)
+        with _backfilled_guard:
+            first_write = key not in _backfill_threads
+        previous_last = archive.last_time() if first_write else None
+        written = archive.append(arr[:-1])
+        if written:
+            logger.debug(f"Đã lưu {written} nến {symbol} {tf_name} mới vào kho cục bộ.")
+        if first_write and len(arr) > 1:
+            first_time = int(arr["time"][0])
+            worker = threading.Thread(
+                target=_backfill_archive,
+                args=(archive, previous_last, first_time),
+                name=f"BarBackfill-{symbol}-{tf_name}",
+                daemon=True,
+            )
+            with _backfilled_guard:
+                if key in _backfill_threads:
+                    return
+                _backfill_threads[key] = worker
+            worker.start()
+    except Exception as e:
+        logger.warning(f"Không thể lưu nến {symbol} {tf_name} vào kho cục bộ: {e}")
+
+
+def _backfill_archive(archive: bar_archive.BarArchive, previous_last: int | None, first_time: int) -> None:
+    """
+    Lấp khoảng trống của kho nến từ MT5 trong cửa sổ gần đây: đoạn ứng dụng đã tắt (từ nến cuối
+    trong kho tới nến đầu vừa lấy) và các lỗ bên trong kho. Chạy trên luồng nền.
+    """
+
+    def fetch(date_from: datetime, date_to: datetime) -> Any | None:
+        return copy_rates_range(archive.symbol, archive.timeframe, date_from, date_to)
+
+    try:
+        window_start = first_time - BACKFILL_WINDOW_SEC
+        if previous_last is not None:
+            gap_start = max(int(previous_last) + archive.period, window_start)
+            gap_end = first_time - archive.period
+            if gap_end >= gap_start:
+                rates = fetch(
+                    datetime.fromtimestamp(gap_start, timezone.utc), datetime.fromtimestamp(gap_end, timezone.utc)
+                )
+                if rates is not None and len(rates):
+                    filled = archive.append(rates)
+                    logger.info(f"Đã lấp {filled} nến {archive.symbol} {archive.timeframe} từ lần chạy trước.")
+        archive.backfill(fetch, start=window_start)
+    except Exception as e:
+        logger.warning(f"Không thể lấp khoảng trống kho nến {archive.symbol} {archive.timeframe}: {e}")
+
+
+def _archive_ticks(symbol: str, ticks: Any, point: float) -> None:
+    """Lưu tick đã lấy để tính thống kê spread vào kho tick cục bộ."""
+    try:
+        tick_archive.get_tick_archive(symbol, point).append(ticks)
+    except Exception as e:
+        logger.warning(f"Không thể lưu tick {symbol} vào kho cục bộ: {e}")
+
+
+def _session_stats_cube(
+    symbol: str, overrides: dict[str, dict[str, dict[str, str]]]
+) -> session_stats.SessionStatsCube | None:
+    """Khối thống kê phiên của `symbol` (M15 trong kho nến), bổ sung các ngày vừa đóng."""
+    try:
+        cube = session_stats.get_cube(
+            symbol,
+            "M15",
+            schedule=lambda d: _killzone_ranges_vn(
+                d=d, summer_override=overrides.get("summer"), winter_override=overrides.get("winter")
+            ),
+            signature=json.dumps(overrides, sort_keys=True),
+        )
+        cube.update()
+        return cube
+    except Exception as e:
+        logger.warning(f"Không thể cập nhật thống kê phiên cho {symbol}: {e}")
+        return None
+
+
+def copy_rates_range(symbol: str, timeframe: str, date_from: datetime, date_to: datetime) -> Any | None:
+    """
+    Lấy nến trong khoảng thời gian (giờ broker) từ MT5; dùng làm nguồn lấp khoảng trống cho
+    `bar_archive.BarArchive.backfill`.
+    """
+    if mt5 is None:
+        return None
+    tf_code = getattr(mt5, f"TIMEFRAME_{timeframe}", None)
+    if tf_code is None:
+        logger.warning(f"Timeframe MT5 không hợp lệ: {timeframe}")
+        return None
+    with _mt5_lock:
+        rates = mt5.copy_rates_range(symbol, tf_code, date_from, date_to)
+    if rates is None:
+        logger.warning(f"copy_rates_range trả về None cho {symbol} {timeframe}: {mt5.last_error()}")
+    return rates
+
+
+def copy_recent_rates(symbol: str, timeframe: str, count: int, archive: bool = True) -> Any | None:
+    """
+    Lấy `count` nến gần nhất (gồm nến đang hình thành) bằng một lần gọi MT5, không thử lại.
+    Các nến đã đóng được ghi vào kho nến cục bộ nếu `archive`.
+    """
+    if mt5 is None:
+        return None
+    tf_code = getattr(mt5, f"TIMEFRAME_{timeframe}", None)
+    if tf_code is None:
+        logger.warning(f"Timeframe MT5 không hợp lệ: {timeframe}")
+        return None
+    with _mt5_lock:
+        rates = mt5.copy_rates_from_pos(symbol, tf_code, 0, max(1, int(count)))
+    if rates is None or len(rates) == 0:
+        logger.debug(f"copy_rates_from_pos không có dữ liệu cho {symbol} {timeframe}.")
+        return None
+    if archive and len(rates) > 1:
+        _archive_closed_bars(symbol, timeframe, rates)
+    return rates
+
+
+def broker_utc_offset_sec(symbol: str) -> int | None:
+    """
+    Độ lệch giờ server broker so với UTC (giây), đo từ thời gian tick cuối cùng.
+
+    Epoch của nến/tick MT5 là giờ broker "giả UTC", nên `tick.time - now_utc` chính là độ lệch;
+    làm tròn tới 15 phút để bỏ qua độ trễ tick. None nếu không có MT5 hoặc tick quá cũ (thị
+    trường đóng cửa) khiến phép đo không tin cậy.
+    """
+    if mt5 is None:
+        return None
+    with _mt5_lock:
+        tick = mt5.symbol_info_tick(symbol)
+    tick_time = int(getattr(tick, "time", 0) or 0)
+    if tick_time <= 0:
+        return None
+    raw = tick_time - time.time()
+    offset = int(round(raw / 900.0)) * 900
+    if abs(raw - offset) > 300:
+        return None
+    return offset
+
+
+def get_open_positions(symbol: str | None = None) -> list[dict]:
+    """Các vị thế đang mở (mọi symbol nếu `symbol` là None) dưới dạng dict gọn."""
+    if mt5 is None:
+        return []
+    with _mt5_lock:
+        positions = mt5.positions_get(symbol=symbol) if symbol else mt5.positions_get()
+    return [
+        {
+            "ticket": pos.ticket,
+            "symbol": pos.symbol,
+            "type": "BUY" if pos.type == 0 else "SELL",
+            "volume": pos.volume,
+        }
+        for pos in positions or ()
+    ]
+
+
+def _series_from_mt5(symbol: str, tf_code: int, bars: int, archive_tf: str | None = None) -> list[dict]:
+    """
+    Lấy dữ liệu chuỗi thời gian từ MT5 với cơ chế thử lại.
+    Nếu có `archive_tf`, các nến đã đóng cũng được lưu vào kho nến cục bộ.
+    """
     logger.debug(f"Bắt đầu _series_from_mt5 cho symbol: {symbol}, tf_code: {tf_code}, bars: {bars}")
     arr = None
     # Cải tiến: Thêm vòng lặp thử lại để tăng độ tin cậy
@@ -627,6 +798,8 @@ def _series_from_mt5(symbol: str, tf_code: int, bars: int) -> list[dict]:
         time.sleep(0.2)
 
     rows: list[dict] = []
+    if arr is not None and archive_tf and len(arr) > 1:
+        _archive_closed_bars(symbol, archive_tf, arr)
     if arr is not None:
         for r in arr:
             rows.append(
@@ -671,48 +844,141 @@ def _calculate_hl_from_series(
 
 
 def _nearby_key_levels(
-    cp: float, info: Any, daily: dict | None, prev_day: dict | None
+    symbol: str, cp: float, info: Any, daily: dict | None, prev_day: dict | None
 ) -> list[dict]:
     logger.debug(f"Bắt đầu _nearby_key_levels cho cp: {cp}, daily: {daily}, prev_day: {prev_day}")
-    lv: list[dict] = []
-    if prev_day:
-        if "high" in prev_day:
-            lv.append({"name": "PDH", "price": float(prev_day["high"])})
-            logger.debug(f"Thêm PDH: {prev_day['high']}")
-        if "low" in prev_day:
-            lv.append({"name": "PDL", "price": float(prev_day["low"])})
-            logger.debug(f"Thêm PDL: {prev_day['low']}")
-    if daily:
-        if daily.get("eq50") is not None:
-            lv.append({"name": "EQ50_D", "price": float(daily["eq50"])})
-            logger.debug(f"Thêm EQ50_D: {daily['eq50']}")
-        if daily.get("open") is not None:
-            lv.append({"name": "DO", "price": float(daily["open"])})
-            logger.debug(f"Thêm DO: {daily['open']}")
+    index = level_index.key_level_index(symbol, level_index.collect_key_levels(daily, prev_day))
 
     out = []
-    point = float(getattr(info, "point", 0.0) or 0.0)
-    for x in lv:
-        rel = "ABOVE" if x["price"] > cp else ("BELOW" if x["price"] < cp else "INSIDE")
-        dist = abs(x["price"] - cp) / (point or 0.01) if cp and point else None
+    pip = pip_size_from_info(info)
+    for x in index.levels:
+        rel = "ABOVE" if x.price > cp else ("BELOW" if x.price < cp else "INSIDE")
+        dist = abs(x.price - cp) / pip if cp and pip else None
         out.append(
             {
-                "name": x["name"],
-                "price": x["price"],
+                "name": x.name,
+                "price": x.price,
                 "relation": rel,
                 "distance_pips": dist,
             }
         )
-        logger.debug(f"Key level: {x['name']}, Price: {x['price']}, Relation: {rel}, Distance: {dist}")
+        logger.debug(f"Key level: {x.name}, Price: {x.price}, Relation: {rel}, Distance: {dist}")
     logger.debug(f"Kết thúc _nearby_key_levels. Số key levels: {len(out)}")
     return out
 
 
+def _context_levels_signature(mt5_data: dict[str, Any], ict_signature: tuple) -> tuple:
+    """Chữ ký rẻ cho các mức tuần/phiên/ICT: giá trị thô của khối tuần, phiên và cấu trúc ICT đã cache."""
+    levels_block = mt5_data.get("levels") or {}
+    weekly = levels_block.get("weekly") or {}
+    prev_week = levels_block.get("prev_week") or {}
+    return (
+        weekly.get("high"),
+        weekly.get("low"),
+        prev_week.get("high"),
+        prev_week.get("low"),
+        tuple((mt5_data.get("session_liquidity") or {}).items()),
+        ict_signature,
+    )
+
+
+def _build_level_map(
+    symbol: str, mt5_data: dict[str, Any], cp: float, pip: float, ict_signature: tuple = (), k: int = 3
+) -> dict[str, Any]:
+    """
+    Tóm tắt k mức gần nhất phía trên/dưới giá hiện tại từ mọi nguồn (ngày, tuần,
+    số tròn, phiên, FVG/OB, thanh khoản). Chỉ mục gộp từ các chỉ mục con đã cache theo symbol
+    (mức ngày, số tròn, phần còn lại) và chỉ dựng lại khi một phần thay đổi.
+    """
+    cache = level_index.get_level_index_cache()
+    levels_block = mt5_data.get("levels") or {}
+    parts = [
+        level_index.key_level_index(
+            symbol, level_index.collect_key_levels(levels_block.get("daily"), levels_block.get("prev_day"))
+        ),
+        cache.get(
+            (symbol, "context"),
+            lambda: level_index.collect_context_levels(mt5_data),
+            signature=_context_levels_signature(mt5_data, ict_signature),
+        ),
+    ]
+    if cp and pip:
+        parts.append(level_index.round_level_index(symbol, cp, pip, int(mt5_data.get("info", {}).get("digits") or 5)))
+    index = cache.merged((symbol, "all"), parts)
+    return {
+        "nearest_above": [lv.to_dict(cp, pip) for lv in index.above(cp, k)],
+        "nearest_below": [lv.to_dict(cp, pip) for lv in index.below(cp, k)],
+    }
+
+
+def _analyze_ict_patterns(
+    symbol: str,
+    series: dict[str, list[dict]],
+    cp: float,
+    ict_config: "IctConfig | None" = None,
+) -> tuple[dict[str, Any], tuple]:
+    """
+    Chạy khối phân tích ICT cho H1/M15/M5/M1; trả về (`ict_patterns`, chữ ký) với chữ ký gồm
+    các cấu trúc đã cache và FVG gần nhất của từng timeframe (dùng cho cache chỉ mục mức giá).
+
+    Phần không phụ thuộc giá (liquidity, FVG chưa lấp, OB, void, MSS) được tính trên
+    các nến đã đóng và cache theo (symbol, timeframe, thời gian nến đóng gần nhất);
+    FVG gần nhất và trạng thái Premium/Discount được đánh giá lại theo `cp` mỗi lần gọi.
+    Các timeframe không trúng cache có thể được phân tích trên process pool
+    (`IctConfig.parallel_enabled`).
+    """
+    cache_enabled = ict_config.cache_enabled if ict_config else True
+    cache = (
+        ict_cache.get_default_cache(ict_config.cache_capacity if ict_config else ict_cache.DEFAULT_CAPACITY)
+        if cache_enabled
+        else None
+    )
+
+    timeframes_to_analyze = {"h1": "H1", "m15": "M15", "m5": "M5", "m1": "M1"}
+    structures: dict[str, ict_analyzer.TimeframeStructure] = {}
+    pending: dict[str, list[dict]] = {}
+    pending_keys: dict[str, ict_cache.CacheKey | None] = {}
+    for tf_name in timeframes_to_analyze.values():
+        tf_series = series.get(tf_name, [])
+        if not tf_series:
+            continue
+
+        # Nến cuối cùng là nến đang hình thành, chỉ phân tích các nến đã đóng.
+        closed_rates = tf_series[:-1]
+        key = ict_cache.make_cache_key(symbol, tf_name, closed_rates) if cache is not None else None
+        cached = cache.get(key) if cache is not None and key is not None else None
+        if cached is not None:
+            structures[tf_name] = cached
+        else:
+            pending[tf_name] = closed_rates
+            pending_keys[tf_name] = key
+
+    # Các timeframe chưa có trong cache được phân tích cùng lúc (song song nếu bật).
+    for tf_name, structure in ict_parallel.analyze_structures(pending, ict_config).items():
+        structures[tf_name] = structure
+        key = pending_keys.get(tf_name)
+        if cache is not None and key is not None:
+            cache.put(key, structure)
+
+    ict_patterns: dict[str, Any] = {}
+    signature: list[tuple] = []
+    for tf_key, tf_name in timeframes_to_analyze.items():
+        structure = structures.get(tf_name)
+        if structure is None:
+            continue
+        ict_patterns.update(ict_analyzer.build_timeframe_patterns(structure, cp, tf_key))
+        nearest = ict_analyzer.select_nearest_fvgs(structure.unfilled_fvgs, cp)
+        signature.append((tf_key, structure, *nearest))
+        logger.debug(f"Đã hoàn thành phân tích ICT cho timeframe {tf_name}.")
+    return ict_patterns, tuple(signature)
+
+
 def get_market_data_async(
     cfg: "MT5Config",
     plan: dict | None = None,
     timezone_name: str | None = None,
     killzone_overrides: dict[str, dict[str, dict[str, str]]] | None = None,
+    ict_config: "IctConfig | None" = None,
 ) -> SafeData:
     """
     Hàm worker công khai để lấy dữ liệu thị trường, được thiết kế để chạy song song
@@ -727,6 +993,7 @@ def get_market_data_async(
             plan=plan,
             timezone_name=timezone_name,
             killzone_overrides=killzone_overrides,
+            ict_config=ict_config,
         )
         if isinstance(result, SafeData):
             return result
@@ -745,6 +1012,7 @@ def get_market_data(
     plan: dict | None = None,
     timezone_name: str | None = None,
     killzone_overrides: dict[str, dict[str, dict[str, str]]] | None = None,
+    ict_config: "IctConfig | None" = None,
 ) -> SafeData | str:
     symbol = cfg.symbol
     """
@@ -909,6 +1177,8 @@ def get_market_data(
                 else:
                     tick_stats_30m = {}
                 continue
+            if minutes == 30 and getattr(cfg, "archive_ticks", False):
+                _archive_ticks(symbol, ticks, getattr(info, "point", 0.0))
             spreads: list[int] = []
             for t in ticks:
                 b, a = float(t["bid"]), float(t["ask"])  # type: ignore[index]
@@ -937,11 +1207,12 @@ def get_market_data(
         pass
 
     # OHLCV series
+    archive = getattr(cfg, "archive_bars", False)
     series = {
-        "M1": _series_from_mt5(symbol, mt5.TIMEFRAME_M1, cfg.n_M1),
-        "M5": _series_from_mt5(symbol, mt5.TIMEFRAME_M5, cfg.n_M5),
-        "M15": _series_from_mt5(symbol, mt5.TIMEFRAME_M15, cfg.n_M15),
-        "H1": _series_from_mt5(symbol, mt5.TIMEFRAME_H1, cfg.n_H1),
+        "M1": _series_from_mt5(symbol, mt5.TIMEFRAME_M1, cfg.n_M1, "M1" if archive else None),
+        "M5": _series_from_mt5(symbol, mt5.TIMEFRAME_M5, cfg.n_M5, "M5" if archive else None),
+        "M15": _series_from_mt5(symbol, mt5.TIMEFRAME_M15, cfg.n_M15, "M15" if archive else None),
+        "H1": _series_from_mt5(symbol, mt5.TIMEFRAME_H1, cfg.n_H1, "H1" if archive else None),
     }
     logger.debug("Đã lấy OHLCV series cho các khung thời gian.")
 
@@ -1099,11 +1370,12 @@ def get_market_data(
         pass
 
     # Key levels around cp
-    key_near = _nearby_key_levels(cp, info, daily, prev_day)
+    key_near = _nearby_key_levels(symbol, cp, info, daily, prev_day)
     logger.debug(f"Key levels nearby: {key_near}")
 
-    # ADR and day position
-    adr = adr_stats(symbol, n=20)
+    # ADR and day position: ưu tiên khối thống kê phiên từ kho nến (không gọi lại MT5 D1).
+    stats_cube = _session_stats_cube(symbol, normalized_overrides) if archive else None
+    adr = (stats_cube.adr() if stats_cube and len(stats_cube) >= 20 else None) or adr_stats(symbol, n=20)
     # day_open = daily.get("open") if daily else None
     prev_close = None
     with _mt5_lock:
@@ -1185,25 +1457,15 @@ def get_market_data(
     # Round levels around current price (25/50/75 pip) – optional simple set
     round_levels = []
     try:
-        ppp = points_per_pip_from_info(info_obj)
-        point = float(info_obj.get("point") or 0.0)
-        pip = point * ppp if point else 0.0
+        pip = pip_size_from_info(info_obj)
         if cp and pip:
-            pivots = [
-                int(math.floor((cp / pip))) * pip + (s * pip / 100.0)
-                for s in (0, 25, 50, 75)
-            ]
-            seen: set[float] = set()
-            for price in pivots:
-                if price in seen:
-                    continue
-                seen.add(price)
-                dist_pips = abs(cp - price) / (point * ppp)
+            index = level_index.round_level_index(symbol, cp, pip, int(info_obj.get("digits") or 5))
+            for lv in index.levels:
                 round_levels.append(
                     {
-                        "level": f"{int(round((price % 1) / pip * 100)) if pip > 0 else 0:02d}",
-                        "price": round(price, int(info_obj.get("digits") or 5)),
-                        "distance_pips": round(dist_pips, 2),
+                        "level": lv.name.removeprefix("ROUND_"),
+                        "price": lv.price,
+                        "distance_pips": round(abs(cp - lv.price) / pip, 2),
                     }
                 )
         logger.debug(f"Round levels: {round_levels}")
@@ -1250,41 +1512,9 @@ def get_market_data(
 
     # ICT Patterns
     ict_patterns = {}
+    ict_signature: tuple = ()
     try:
-        timeframes_to_analyze = {"h1": "H1", "m15": "M15", "m5": "M5", "m1": "M1"}
-        for tf_key, tf_name in timeframes_to_analyze.items():
-            tf_series = series.get(tf_name, [])
-            if not tf_series:
-                continue
-
-            # 1. Liquidity Levels (nền tảng cho các phân tích khác)
-            liquidity_data = ict_analyzer.find_liquidity_levels(tf_series)
-            swing_highs: list[LiquidityLevel] = liquidity_data.get("swing_highs_BSL", [])
-            swing_lows: list[LiquidityLevel] = liquidity_data.get("swing_lows_SSL", [])
-            ict_patterns[f"liquidity_{tf_key}"] = {
-                "swing_highs_BSL": [asdict(h) for h in swing_highs],
-                "swing_lows_SSL": [asdict(low) for low in swing_lows],
-            }
-
-            # 2. Các mẫu hình ICT khác
-            fvgs = ict_analyzer.find_fvgs(tf_series, cp)
-            ict_patterns[f"fvgs_{tf_key}"] = [asdict(fvg) for fvg in fvgs]
-
-            order_blocks = ict_analyzer.find_order_blocks(tf_series)
-            ict_patterns[f"order_blocks_{tf_key}"] = [asdict(ob) for ob in order_blocks]
-            
-            liquidity_voids = ict_analyzer.find_liquidity_voids(tf_series)
-            ict_patterns[f"liquidity_voids_{tf_key}"] = [asdict(v) for v in liquidity_voids]
-
-            # 3. Các phân tích phụ thuộc (sử dụng kết quả từ bước 1)
-            pd_range = ict_analyzer.analyze_premium_discount(cp, swing_highs, swing_lows)
-            ict_patterns[f"premium_discount_{tf_key}"] = asdict(pd_range) if pd_range else None
-
-            mss = ict_analyzer.find_market_structure_shift(tf_series, swing_highs, swing_lows)
-            ict_patterns[f"mss_{tf_key}"] = asdict(mss) if mss else None
-            
-            logger.debug(f"Đã hoàn thành phân tích ICT cho timeframe {tf_name}.")
-
+        ict_patterns, ict_signature = _analyze_ict_patterns(symbol, series, cp, ict_config)
     except Exception:
         logger.exception("Lỗi nghiêm trọng trong quá trình phân tích ICT.")
         ict_patterns = {}
@@ -1328,6 +1558,7 @@ def get_market_data(
                 float(pos_in_day) if pos_in_day is not None else None
             ),
             "sessions_today": sessions_today or {},
+            "session_stats": stats_cube.context(broker_time, day_range) if stats_cube else {},
             "session_liquidity": session_liquidity or {},
             "volatility": {"ATR": atr_block or {}},
             "volatility_regime": vol_regime,
@@ -1345,6 +1576,20 @@ def get_market_data(
             "rr_projection": rr_projection or {},
         }
     }
+    try:
+        payload["MT5_DATA"]["level_map"] = _build_level_map(
+            symbol, payload["MT5_DATA"], cp, pip_size_from_info(info_obj or {}), ict_signature
+        )
+    except Exception as e:
+        payload["MT5_DATA"]["level_map"] = {}
+        logger.warning(f"Lỗi khi dựng level map: {e}")
+    try:
+        payload["MT5_DATA"]["structure_alignment"] = structure_alignment.compute_alignment(
+            payload["MT5_DATA"], cp
+        ).to_dict()
+    except Exception as e:
+        payload["MT5_DATA"]["structure_alignment"] = {}
+        logger.warning(f"Lỗi khi tính đồng thuận cấu trúc: {e}")
     logger.debug("Đã xây dựng payload MT5_DATA.")
 
     # Always wrap in SafeData. The caller can decide to get the raw dict or json.
@@ -1387,6 +1632,29 @@ def shutdown():
             logger.info("Đã ngắt kết nối MT5 thành công.")
 
 
+def position_realized_profit(ticket: int) -> float | None:
+    """
+    Lợi nhuận thực nhận của một vị thế đã đóng (profit + swap + commission + fee của mọi deal
+    thuộc `position=ticket`); None nếu MT5 không có lịch sử cho vị thế này.
+    """
+    if mt5 is None:
+        return None
+    with _mt5_lock:
+        deals = mt5.history_deals_get(position=int(ticket))
+    if not deals:
+        logger.debug(f"Không có deal nào cho vị thế {ticket}: {mt5.last_error()}")
+        return None
+    return float(
+        sum(
+            float(getattr(d, "profit", 0.0) or 0.0)
+            + float(getattr(d, "swap", 0.0) or 0.0)
+            + float(getattr(d, "commission", 0.0) or 0.0)
+            + float(getattr(d, "fee", 0.0) or 0.0)
+            for d in deals
+        )
+    )
+
+
 def get_history_deals(symbol: str, days: int = 7) -> list[dict[str, Any]] | None:
     """
     Lấy lịch sử các giao dịch (deals) cho một symbol trong khoảng thời gian gần đây.
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Context caching cho phần tĩnh của prompt (nội dung file prompt: hướng dẫn, quy tắc no-trade).
+
+Phần tĩnh được upload một lần lên Gemini (`CachedContent`) với TTL; các request sau chỉ gửi
+phần động (MT5 JSON, bối cảnh, ảnh) và tham chiếu cache qua tên. Sổ ghi cục bộ
+(`prompt_cache.json`) lưu tên cache, hash nội dung và thời điểm hết hạn cho từng
+(API key, model), nên:
+- Nội dung prompt đổi (hash khác) -> xóa cache cũ, tạo cache mới.
+- Sắp hết hạn -> gia hạn TTL thay vì tạo lại.
+- Lỗi backend (prompt quá ngắn để cache, SDK cũ, mạng) -> trả về None, người gọi gửi prompt đầy đủ.
+
+Backend được tách riêng (`CacheBackend`); `InMemoryCacheBackend` là backend giả lập cục bộ để test.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass, replace
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable, Optional, Protocol
+
+from APP.configs.constants import PATHS
+from APP.services import gemini_service
+from APP.utils.google_ai import CachedContent
+
+logger = logging.getLogger(__name__)
+
+STATE_FILENAME = "prompt_cache.json"
+REFRESH_MARGIN_SEC = 120
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """Một prefix đã được cache phía server."""
+
+    name: str
+    model_name: str
+    content_hash: str
+    expire_at: float
+
+
+class CacheBackend(Protocol):
+    def create(self, model_name: str, text: str, ttl_sec: int, display_name: str) -> str: ...
+
+    def refresh(self, name: str, ttl_sec: int) -> None: ...
+
+    def delete(self, name: str) -> None: ...
+
+    def model_for(self, name: str, api_key: str) -> Any: ...
+
+
+class GeminiCacheBackend:
+    """Backend dùng `google.generativeai.caching.CachedContent`."""
+
+    def create(self, model_name: str, text: str, ttl_sec: int, display_name: str) -> str:
+        cached = CachedContent.create(
+            model=model_name,
+            display_name=display_name,
+            contents=[{"role": "user", "parts": [text]}],
+            ttl=timedelta(seconds=ttl_sec),
+        )
+        return cached.name
+
+    def refresh(self, name: str, ttl_sec: int) -> None:
+        CachedContent.get(name).update(ttl=timedelta(seconds=ttl_sec))
+
+    def delete(self, name: str) -> None:
+        gemini_service.forget_cached_model(name)
+        CachedContent.get(name).delete()
+
+    def model_for(self, name: str, api_key: str) -> Any:
+        return gemini_service.get_cached_model(api_key, name)
+
+
+class InMemoryCacheBackend:
+    """Backend giả lập trong bộ nhớ: cùng ngữ nghĩa TTL, ghi lại các lời gọi để kiểm tra."""
+
+    def __init__(self, clock: Callable[[], float] = time.time) -> None:
+        self.clock = clock
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.calls: list[tuple[str, str]] = []
+        self._ids = itertools.count(1)
+
+    def _live(self, name: str) -> dict[str, Any]:
+        entry = self.entries.get(name)
+        if entry is None or entry["expire_at"] <= self.clock():
+            self.entries.pop(name, None)
+            raise KeyError(f"Cache không tồn tại hoặc đã hết hạn: {name}")
+        return entry
+
+    def create(self, model_name: str, text: str, ttl_sec: int, display_name: str) -> str:
+        name = f"cachedContents/local-{next(self._ids)}"
+        self.entries[name] = {"model": model_name, "text": text, "expire_at": self.clock() + ttl_sec}
+        self.calls.append(("create", name))
+        return name
+
+    def refresh(self, name: str, ttl_sec: int) -> None:
+        self._live(name)["expire_at"] = self.clock() + ttl_sec
+        self.calls.append(("refresh", name))
+
+    def delete(self, name: str) -> None:
+        self.entries.pop(name, None)
+        self.calls.append(("delete", name))
+
+    def model_for(self, name: str, api_key: str) -> Any:
+        entry = self._live(name)
+        return {"cached_content": name, "model_name": entry["model"], "prefix": entry["text"]}
+
+
+class PromptPrefixCache:
+    """Quản lý vòng đời cache prefix theo (scope, model), với sổ ghi cục bộ tùy chọn."""
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        state_path: Optional[Path] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.backend = backend
+        self.state_path = state_path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: dict[str, CacheEntry] = self._load()
+        # Prefix mà backend đã từ chối (ví dụ dưới số token tối thiểu): không thử lại trong tiến trình.
+        self._rejected: dict[str, str] = {}
+
+    # region Sổ ghi
+    def _load(self) -> dict[str, CacheEntry]:
+        if self.state_path is None:
+            return {}
+        try:
+            raw = json.loads(self.state_path.read_text(encoding="utf-8"))
+            return {slot: CacheEntry(**data) for slot, data in raw.items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Không đọc được sổ prompt cache {self.state_path}: {e}")
+            return {}
+
+    def _save(self) -> None:
+        if self.state_path is None:
+            return
+        payload = {slot: asdict(entry) for slot, entry in self._entries.items()}
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp.replace(self.state_path)
+        except OSError as e:
+            logger.warning(f"Không thể lưu sổ prompt cache {self.state_path}: {e}")
+
+    # endregion
+
+    def acquire(self, scope: str, model_name: str, prefix: str, ttl_sec: int) -> Optional[CacheEntry]:
+        """Cache còn hiệu lực cho `prefix`; tạo mới/gia hạn khi cần, None nếu không dùng được."""
+        slot = f"{scope}:{model_name}"
+        digest = content_hash(prefix)
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(slot)
+            if entry is not None and entry.content_hash == digest:
+                if entry.expire_at - now > REFRESH_MARGIN_SEC:
+                    return entry
+                if entry.expire_at > now:
+                    try:
+                        self.backend.refresh(entry.name, ttl_sec)
+                        entry = self._entries[slot] = replace(entry, expire_at=now + ttl_sec)
+                        self._save()
+                        logger.debug(f"Đã gia hạn prompt cache {entry.name}.")
+                        return entry
+                    except Exception as e:
+                        logger.info(f"Không gia hạn được prompt cache {entry.name}, tạo lại: {e}")
+            elif entry is not None:
+                logger.info(f"Nội dung prompt đã đổi, thay prompt cache {entry.name}.")
+                self._delete_quietly(entry.name)
+
+            self._entries.pop(slot, None)
+            if self._rejected.get(slot) == digest:
+                self._save()
+                return None
+            try:
+                name = self.backend.create(model_name, prefix, ttl_sec, display_name=f"prompt-{digest[:12]}")
+            except Exception as e:
+                logger.warning(f"Không tạo được prompt cache cho '{model_name}', gửi prompt đầy đủ: {e}")
+                self._rejected[slot] = digest
+                self._save()
+                return None
+            entry = self._entries[slot] = CacheEntry(name, model_name, digest, now + ttl_sec)
+            self._save()
+            logger.info(f"Đã tạo prompt cache {name} cho '{model_name}' (TTL {ttl_sec}s).")
+            return entry
+
+    def invalidate(self, scope: str, model_name: str) -> None:
+        """Bỏ cache của (scope, model) — ví dụ khi request dùng cache thất bại."""
+        with self._lock:
+            entry = self._entries.pop(f"{scope}:{model_name}", None)
+            if entry is not None:
+                self._delete_quietly(entry.name)
+                self._save()
+
+    def _delete_quietly(self, name: str) -> None:
+        try:
+            self.backend.delete(name)
+        except Exception as e:
+            logger.debug(f"Bỏ qua lỗi khi xóa prompt cache {name}: {e}")
+
+
+_instance: Optional[PromptPrefixCache] = None
+_instance_guard = threading.Lock()
+
+
+def get_prefix_cache() -> Optional[PromptPrefixCache]:
+    """Instance dùng chung với backend Gemini; None nếu SDK không hỗ trợ context caching."""
+    global _instance
+    if CachedContent is None:
+        return None
+    with _instance_guard:
+        if _instance is None:
+            _instance = PromptPrefixCache(GeminiCacheBackend(), PATHS.APP_DIR / STATE_FILENAME)
+        return _instance
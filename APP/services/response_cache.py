@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Cache phản hồi Gemini theo nội dung request.
+
+Khóa là SHA-256 của (model, generation config, context cache đang gắn, văn bản prompt, chữ ký
+các file ảnh đã upload). Chữ ký ảnh ưu tiên `sha256_hash` của File API nên cùng một ảnh upload
+lại dưới tên khác vẫn trùng khóa. Toàn bộ văn bản đã stream được lưu thành một file JSON trong
+`<root>/<2 ký tự đầu>/<khóa>.json`; mục quá `ttl_sec` bị bỏ qua và tổng dung lượng được giữ dưới
+`max_bytes` bằng cách xóa các mục ít được dùng gần đây nhất (mtime được cập nhật khi trúng cache).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional
+
+from APP.configs.constants import PATHS
+
+if TYPE_CHECKING:
+    from APP.configs.app_config import ApiConfig
+
+logger = logging.getLogger(__name__)
+
+
+def _part_signature(part: Any) -> Any:
+    if isinstance(part, str):
+        return part
+    if isinstance(part, (dict, list, int, float)) or part is None:
+        return part
+    for attr in ("sha256_hash", "uri", "name"):
+        value = getattr(part, attr, None)
+        if value:
+            return {attr: value if isinstance(value, str) else repr(value)}
+    return repr(part)
+
+
+def request_key(model: Any, parts: Iterable[Any]) -> str:
+    """Khóa nội dung của một request `generate_content(parts)` trên `model`."""
+    payload = {
+        "model": getattr(model, "model_name", None) or repr(type(model)),
+        "generation_config": getattr(model, "_generation_config", None) or {},
+        "cached_content": getattr(model, "cached_content", None),
+        "parts": [_part_signature(p) for p in parts],
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=repr)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Cache văn bản phản hồi trên đĩa với TTL và giới hạn dung lượng."""
+
+    def __init__(
+        self,
+        root: Path,
+        ttl_sec: float = 4 * 3600,
+        max_bytes: int = 50 * 1024 * 1024,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.root = Path(root)
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Mục cache phản hồi hỏng {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        if self.clock() - float(data.get("created_at", 0.0)) > self.ttl_sec:
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data.get("text")
+
+    def put(self, key: str, text: str, **meta: Any) -> None:
+        if not text:
+            return
+        path = self._path(key)
+        payload = {"created_at": self.clock(), "text": text, **meta}
+        with self._lock:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+                tmp.replace(path)
+            except OSError as e:
+                logger.warning(f"Không thể ghi cache phản hồi {path}: {e}")
+                return
+            self._enforce_cap()
+
+    def _enforce_cap(self) -> None:
+        entries = []
+        for path in self.root.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
+        logger.debug(f"Đã dọn cache phản hồi xuống {total} bytes.")
+
+
+_instances: dict[tuple[float, int], ResponseCache] = {}
+_instances_guard = threading.Lock()
+
+
+def get_response_cache(api_cfg: "ApiConfig") -> Optional[ResponseCache]:
+    """Cache dùng chung theo cấu hình; None nếu tắt."""
+    if not api_cfg.response_cache_enabled:
+        return None
+    key = (api_cfg.response_cache_ttl_min * 60.0, api_cfg.response_cache_max_mb * 1024 * 1024)
+    with _instances_guard:
+        cache = _instances.get(key)
+        if cache is None:
+            cache = _instances[key] = ResponseCache(PATHS.APP_DIR / "response_cache", *key)
+        return cache
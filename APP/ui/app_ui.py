@@ -1549,6 +1549,14 @@ class AppUI:
             self.detail_text.config(state=tk.DISABLED)
             self.detail_text.see(tk.END)
 
+    def ui_detail_append(self, text: str):
+        """Nối thêm văn bản vào cuối ô chi tiết (dùng khi stream phản hồi AI)."""
+        if self.detail_text:
+            self.detail_text.config(state=tk.NORMAL)
+            self.detail_text.insert(tk.END, text)
+            self.detail_text.config(state=tk.DISABLED)
+            self.detail_text.see(tk.END)
+
     def show_error_message(self, title: str, message: str):
         """Hiển thị một hộp thoại thông báo lỗi."""
         ui_builder.show_message(title=title, message=message, parent=self.root)
@@ -475,6 +475,7 @@ class ChartTab:
                 "summer": run_config.no_run.killzone_summer,
                 "winter": run_config.no_run.killzone_winter,
             },
+            ict_config=run_config.ict,
         )
         cancel_token.raise_if_cancelled()
         if not isinstance(safe_mt5_data, SafeData) or not safe_mt5_data.is_valid():
@@ -518,6 +519,7 @@ class ChartTab:
                 "summer": run_config.no_run.killzone_summer,
                 "winter": run_config.no_run.killzone_winter,
             },
+            ict_config=run_config.ict,
         )
         if not safe_mt5_data.is_valid():
             return {"mt5_data": None, "status_message": "Không lấy được dữ liệu MT5."}
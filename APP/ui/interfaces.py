@@ -58,6 +58,9 @@ class AnalysisUi(Protocol):
     def ui_detail_replace(self, text: str) -> None:
         ...
 
+    def ui_detail_append(self, text: str) -> None:
+        ...
+
     def show_error_message(self, title: str, message: str) -> None:
         ...
 
@@ -189,6 +189,9 @@ class PyQtAnalysisAppAdapter:
     def ui_detail_replace(self, text: str) -> None:
         self._window.ui_detail_replace(text)
 
+    def ui_detail_append(self, text: str) -> None:
+        self._window.ui_detail_append(text)
+
     def show_error_message(self, title: str, message: str) -> None:
         self._window.show_error_message(title, message)
 
@@ -1264,6 +1267,21 @@ class TradingMainWindow(QMainWindow):
         api_state = ApiConfig(
             tries=int(api_cfg.get("tries", base.api.tries)),
             delay=float(api_cfg.get("delay", base.api.delay)),
+            prompt_cache_enabled=bool(api_cfg.get("prompt_cache_enabled", base.api.prompt_cache_enabled)),
+            prompt_cache_ttl_min=int(api_cfg.get("prompt_cache_ttl_min", base.api.prompt_cache_ttl_min)),
+            response_cache_enabled=bool(api_cfg.get("response_cache_enabled", base.api.response_cache_enabled)),
+            response_cache_ttl_min=int(api_cfg.get("response_cache_ttl_min", base.api.response_cache_ttl_min)),
+            response_cache_max_mb=int(api_cfg.get("response_cache_max_mb", base.api.response_cache_max_mb)),
+            rpm_limit=int(api_cfg.get("rpm_limit", base.api.rpm_limit)),
+            tpm_limit=int(api_cfg.get("tpm_limit", base.api.tpm_limit)),
+            uploads_per_min=int(api_cfg.get("uploads_per_min", base.api.uploads_per_min)),
+            async_stream=bool(api_cfg.get("async_stream", base.api.async_stream)),
+            first_token_timeout_sec=int(api_cfg.get("first_token_timeout_sec", base.api.first_token_timeout_sec)),
+            idle_timeout_sec=int(api_cfg.get("idle_timeout_sec", base.api.idle_timeout_sec)),
+            total_timeout_sec=int(api_cfg.get("total_timeout_sec", base.api.total_timeout_sec)),
+            hedge_enabled=bool(api_cfg.get("hedge_enabled", base.api.hedge_enabled)),
+            hedge_delay_sec=float(api_cfg.get("hedge_delay_sec", base.api.hedge_delay_sec)),
+            hedge_model=str(api_cfg.get("hedge_model", base.api.hedge_model) or ""),
         )
 
         context_cfg = options.get("context", {})
@@ -1296,6 +1314,9 @@ class TradingMainWindow(QMainWindow):
             n_M5=int(mt5_cfg.get("n_M5", base.mt5.n_M5)),
             n_M15=int(mt5_cfg.get("n_M15", base.mt5.n_M15)),
             n_H1=int(mt5_cfg.get("n_H1", base.mt5.n_H1)),
+            archive_bars=bool(mt5_cfg.get("archive_bars", base.mt5.archive_bars)),
+            archive_ticks=bool(mt5_cfg.get("archive_ticks", base.mt5.archive_ticks)),
+            broker_timezone=str(mt5_cfg.get("broker_timezone", base.mt5.broker_timezone) or ""),
         )
 
         no_run_cfg = options.get("no_run", {})
@@ -1353,6 +1374,10 @@ class TradingMainWindow(QMainWindow):
                 auto_trade_cfg.get("trailing_atr_mult", base.auto_trade.trailing_atr_mult)
             ),
             filling_type=str(auto_trade_cfg.get("filling_type", base.auto_trade.filling_type)),
+            max_trades_per_day=int(auto_trade_cfg.get("max_trades_per_day", base.auto_trade.max_trades_per_day)),
+            require_structure_alignment=bool(
+                auto_trade_cfg.get("require_structure_alignment", base.auto_trade.require_structure_alignment)
+            ),
         )
 
         news_cfg = options.get("news", {})
@@ -1392,6 +1417,10 @@ class TradingMainWindow(QMainWindow):
                 persistence_cfg.get("max_md_reports", base.persistence.max_md_reports)
             ),
             max_json_reports=base.persistence.max_json_reports,
+            record_replay_snapshots=bool(
+                persistence_cfg.get("record_replay_snapshots", base.persistence.record_replay_snapshots)
+            ),
+            max_snapshot_files=int(persistence_cfg.get("max_snapshot_files", base.persistence.max_snapshot_files)),
         )
 
         chart_stream = self.chart_tab.current_config()
@@ -1423,6 +1452,10 @@ class TradingMainWindow(QMainWindow):
             model=self._config_state.model,
             autorun=autorun_state,
             prompt=prompt_state,
+            ict=self._config_state.ict,
+            watchlist=self._config_state.watchlist,
+            materiality=self._config_state.materiality,
+            correlation=self._config_state.correlation,
         )
 
         self._config_state = state
@@ -1533,6 +1566,11 @@ class TradingMainWindow(QMainWindow):
 
         self.reports_tab.set_detail_text(text)
 
+    def ui_detail_append(self, text: str) -> None:
+        """Nối thêm văn bản vào cuối khu vực chi tiết báo cáo."""
+
+        self.reports_tab.append_detail_text(text)
+
     def append_log(self, message: str) -> None:
         """Thêm thông điệp vào nhật ký tổng quan."""
 
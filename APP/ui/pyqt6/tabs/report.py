@@ -7,6 +7,7 @@ from pathlib import Path
 from typing import Iterable, Sequence
 
 from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtGui import QTextCursor
 from PyQt6.QtWidgets import (
     QAbstractItemView,
     QGridLayout,
@@ -165,6 +166,12 @@ class ReportTabWidget(QWidget):
     def set_detail_text(self, text: str) -> None:
         self.detail_output.setPlainText(text)
 
+    def append_detail_text(self, text: str) -> None:
+        """Chèn `text` vào cuối mà không dựng lại toàn bộ tài liệu."""
+        self.detail_output.moveCursor(QTextCursor.MoveOperation.End)
+        self.detail_output.insertPlainText(text)
+        self.detail_output.ensureCursorVisible()
+
     def append_detail_line(self, line: str) -> None:
         current = self.detail_output.toPlainText()
         if current:
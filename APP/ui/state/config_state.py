@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Dict, Iterable, Mapping, Sequence
 
 from APP.configs.app_config import (
@@ -11,8 +11,11 @@ from APP.configs.app_config import (
     AutoTradeConfig,
     ChartConfig,
     ContextConfig,
+    CorrelationConfig,
     FolderConfig,
+    IctConfig,
     ImageProcessingConfig,
+    MaterialityConfig,
     MT5Config,
     NewsConfig,
     NoRunConfig,
@@ -21,6 +24,7 @@ from APP.configs.app_config import (
     RunConfig,
     TelegramConfig,
     UploadConfig,
+    WatchlistConfig,
 )
 
 
@@ -68,6 +72,10 @@ class UiConfigState:
     model: str
     autorun: AutorunState
     prompt: PromptState
+    ict: IctConfig = field(default_factory=IctConfig)
+    watchlist: WatchlistConfig = field(default_factory=WatchlistConfig)
+    materiality: MaterialityConfig = field(default_factory=MaterialityConfig)
+    correlation: CorrelationConfig = field(default_factory=CorrelationConfig)
 
     def to_run_config(self) -> RunConfig:
         """Convert the state snapshot into a RunConfig used by services."""
@@ -85,6 +93,10 @@ class UiConfigState:
             news=self.news,
             persistence=self.persistence,
             chart=self.chart,
+            ict=self.ict,
+            watchlist=self.watchlist,
+            materiality=self.materiality,
+            correlation=self.correlation,
             api=self.api,
         )
 
@@ -114,6 +126,21 @@ class UiConfigState:
             "api": {
                 "tries": self.api.tries,
                 "delay": self.api.delay,
+                "prompt_cache_enabled": self.api.prompt_cache_enabled,
+                "prompt_cache_ttl_min": self.api.prompt_cache_ttl_min,
+                "response_cache_enabled": self.api.response_cache_enabled,
+                "response_cache_ttl_min": self.api.response_cache_ttl_min,
+                "response_cache_max_mb": self.api.response_cache_max_mb,
+                "rpm_limit": self.api.rpm_limit,
+                "tpm_limit": self.api.tpm_limit,
+                "uploads_per_min": self.api.uploads_per_min,
+                "async_stream": self.api.async_stream,
+                "first_token_timeout_sec": self.api.first_token_timeout_sec,
+                "idle_timeout_sec": self.api.idle_timeout_sec,
+                "total_timeout_sec": self.api.total_timeout_sec,
+                "hedge_enabled": self.api.hedge_enabled,
+                "hedge_delay_sec": self.api.hedge_delay_sec,
+                "hedge_model": self.api.hedge_model,
             },
             "telegram": {
                 "enabled": self.telegram.enabled,
@@ -139,6 +166,9 @@ class UiConfigState:
                 "n_M5": self.mt5.n_M5,
                 "n_M15": self.mt5.n_M15,
                 "n_H1": self.mt5.n_H1,
+                "archive_bars": self.mt5.archive_bars,
+                "archive_ticks": self.mt5.archive_ticks,
+                "broker_timezone": self.mt5.broker_timezone,
             },
             "no_run": {
                 "weekend_enabled": self.no_run.weekend_enabled,
@@ -174,6 +204,8 @@ class UiConfigState:
                 "move_to_be_after_tp1": self.auto_trade.move_to_be_after_tp1,
                 "trailing_atr_mult": self.auto_trade.trailing_atr_mult,
                 "filling_type": self.auto_trade.filling_type,
+                "max_trades_per_day": self.auto_trade.max_trades_per_day,
+                "require_structure_alignment": self.auto_trade.require_structure_alignment,
             },
             "news": {
                 "block_enabled": self.news.block_enabled,
@@ -193,6 +225,8 @@ class UiConfigState:
             },
             "persistence": {
                 "max_md_reports": self.persistence.max_md_reports,
+                "record_replay_snapshots": self.persistence.record_replay_snapshots,
+                "max_snapshot_files": self.persistence.max_snapshot_files,
             },
             "prompts": {
                 "prompt_file_path": self.prompt.file_path,
@@ -207,6 +241,36 @@ class UiConfigState:
                 "chart_type": self.chart.chart_type,
                 "refresh_interval_secs": self.chart.refresh_interval_secs,
             },
+            "ict": {
+                "cache_enabled": self.ict.cache_enabled,
+                "cache_capacity": self.ict.cache_capacity,
+                "parallel_enabled": self.ict.parallel_enabled,
+                "parallel_workers": self.ict.parallel_workers,
+                "parallel_min_bars": self.ict.parallel_min_bars,
+            },
+            "watchlist": {
+                "enabled": self.watchlist.enabled,
+                "symbols": list(self.watchlist.symbols),
+                "timeframe": self.watchlist.timeframe,
+                "lookback_bars": self.watchlist.lookback_bars,
+                "fresh_mss_bars": self.watchlist.fresh_mss_bars,
+                "min_score": self.watchlist.min_score,
+            },
+            "materiality": {
+                "enabled": self.materiality.enabled,
+                "skip_below": self.materiality.skip_below,
+                "full_above": self.materiality.full_above,
+                "light_model": self.materiality.light_model,
+                "max_skip_min": self.materiality.max_skip_min,
+            },
+            "correlation": {
+                "enabled": self.correlation.enabled,
+                "symbols": list(self.correlation.symbols),
+                "timeframe": self.correlation.timeframe,
+                "window": self.correlation.window,
+                "min_abs_corr": self.correlation.min_abs_corr,
+                "max_exposure_lots": self.correlation.max_exposure_lots,
+            },
         }
 
         if self.no_run.killzone_summer:
@@ -345,6 +409,21 @@ class UiConfigState:
         api = ApiConfig(
             tries=_as_int(api_cfg.get("tries"), 5),
             delay=_as_float(api_cfg.get("delay"), 2.0),
+            prompt_cache_enabled=_as_bool(api_cfg.get("prompt_cache_enabled"), False),
+            prompt_cache_ttl_min=max(5, _as_int(api_cfg.get("prompt_cache_ttl_min"), 60)),
+            response_cache_enabled=_as_bool(api_cfg.get("response_cache_enabled"), False),
+            response_cache_ttl_min=max(1, _as_int(api_cfg.get("response_cache_ttl_min"), 240)),
+            response_cache_max_mb=max(1, _as_int(api_cfg.get("response_cache_max_mb"), 50)),
+            rpm_limit=max(0, _as_int(api_cfg.get("rpm_limit"), 0)),
+            tpm_limit=max(0, _as_int(api_cfg.get("tpm_limit"), 0)),
+            uploads_per_min=max(0, _as_int(api_cfg.get("uploads_per_min"), 0)),
+            async_stream=_as_bool(api_cfg.get("async_stream"), False),
+            first_token_timeout_sec=max(5, _as_int(api_cfg.get("first_token_timeout_sec"), 120)),
+            idle_timeout_sec=max(5, _as_int(api_cfg.get("idle_timeout_sec"), 60)),
+            total_timeout_sec=max(30, _as_int(api_cfg.get("total_timeout_sec"), 1200)),
+            hedge_enabled=_as_bool(api_cfg.get("hedge_enabled"), False),
+            hedge_delay_sec=max(1.0, _as_float(api_cfg.get("hedge_delay_sec"), 20.0)),
+            hedge_model=str(api_cfg.get("hedge_model", "") or "").strip(),
         )
 
         telegram_cfg = data.get("telegram") or {}
@@ -365,6 +444,9 @@ class UiConfigState:
             n_M5=_as_int(mt5_cfg.get("n_M5"), 180),
             n_M15=_as_int(mt5_cfg.get("n_M15"), 96),
             n_H1=_as_int(mt5_cfg.get("n_H1"), 120),
+            archive_bars=_as_bool(mt5_cfg.get("archive_bars"), True),
+            archive_ticks=_as_bool(mt5_cfg.get("archive_ticks"), True),
+            broker_timezone=str(mt5_cfg.get("broker_timezone", "") or "").strip(),
         )
         mt5_terminal_path = _clean_str(mt5_cfg.get("terminal_path"))
 
@@ -412,6 +494,8 @@ class UiConfigState:
             move_to_be_after_tp1=_as_bool(auto_trade_cfg.get("move_to_be_after_tp1"), True),
             trailing_atr_mult=_as_float(auto_trade_cfg.get("trailing_atr_mult"), 0.5),
             filling_type=_clean_str(auto_trade_cfg.get("filling_type"), "IOC") or "IOC",
+            max_trades_per_day=max(0, _as_int(auto_trade_cfg.get("max_trades_per_day"), 0)),
+            require_structure_alignment=_as_bool(auto_trade_cfg.get("require_structure_alignment"), False),
         )
 
         news_cfg = data.get("news") or {}
@@ -438,6 +522,8 @@ class UiConfigState:
         persistence = PersistenceConfig(
             max_md_reports=_as_int(persistence_cfg.get("max_md_reports"), 10),
             max_json_reports=_as_int(persistence_cfg.get("max_json_reports"), 10),
+            record_replay_snapshots=_as_bool(persistence_cfg.get("record_replay_snapshots"), False),
+            max_snapshot_files=_as_int(persistence_cfg.get("max_snapshot_files"), 30),
         )
 
         prompts_cfg = data.get("prompts") or {}
@@ -462,6 +548,59 @@ class UiConfigState:
             ),
         )
 
+        ict_cfg = data.get("ict") or {}
+        ict_defaults = IctConfig()
+        ict = IctConfig(
+            cache_enabled=_as_bool(ict_cfg.get("cache_enabled"), ict_defaults.cache_enabled),
+            cache_capacity=max(1, _as_int(ict_cfg.get("cache_capacity"), ict_defaults.cache_capacity)),
+            parallel_enabled=_as_bool(ict_cfg.get("parallel_enabled"), ict_defaults.parallel_enabled),
+            parallel_workers=max(1, _as_int(ict_cfg.get("parallel_workers"), ict_defaults.parallel_workers)),
+            parallel_min_bars=max(0, _as_int(ict_cfg.get("parallel_min_bars"), ict_defaults.parallel_min_bars)),
+        )
+
+        watchlist_cfg = data.get("watchlist") or {}
+        watchlist_defaults = WatchlistConfig()
+        raw_symbols = watchlist_cfg.get("symbols") or []
+        if isinstance(raw_symbols, str):
+            raw_symbols = raw_symbols.split(",")
+        watchlist_symbols = tuple(dict.fromkeys(_clean_str(sym) for sym in raw_symbols if _clean_str(sym)))
+        watchlist = WatchlistConfig(
+            enabled=_as_bool(watchlist_cfg.get("enabled"), watchlist_defaults.enabled),
+            symbols=watchlist_symbols,
+            timeframe=_clean_str(watchlist_cfg.get("timeframe"), watchlist_defaults.timeframe)
+            or watchlist_defaults.timeframe,
+            lookback_bars=max(50, _as_int(watchlist_cfg.get("lookback_bars"), watchlist_defaults.lookback_bars)),
+            fresh_mss_bars=max(1, _as_int(watchlist_cfg.get("fresh_mss_bars"), watchlist_defaults.fresh_mss_bars)),
+            min_score=_as_float(watchlist_cfg.get("min_score"), watchlist_defaults.min_score),
+        )
+
+        materiality_cfg = data.get("materiality") or {}
+        materiality_defaults = MaterialityConfig()
+        materiality = MaterialityConfig(
+            enabled=_as_bool(materiality_cfg.get("enabled"), materiality_defaults.enabled),
+            skip_below=_as_float(materiality_cfg.get("skip_below"), materiality_defaults.skip_below),
+            full_above=_as_float(materiality_cfg.get("full_above"), materiality_defaults.full_above),
+            light_model=_clean_str(materiality_cfg.get("light_model"), materiality_defaults.light_model),
+            max_skip_min=max(0, _as_int(materiality_cfg.get("max_skip_min"), materiality_defaults.max_skip_min)),
+        )
+
+        correlation_cfg = data.get("correlation") or {}
+        correlation_defaults = CorrelationConfig()
+        raw_symbols = correlation_cfg.get("symbols") or []
+        if isinstance(raw_symbols, str):
+            raw_symbols = raw_symbols.split(",")
+        correlation = CorrelationConfig(
+            enabled=_as_bool(correlation_cfg.get("enabled"), correlation_defaults.enabled),
+            symbols=tuple(dict.fromkeys(_clean_str(sym) for sym in raw_symbols if _clean_str(sym))),
+            timeframe=_clean_str(correlation_cfg.get("timeframe"), correlation_defaults.timeframe)
+            or correlation_defaults.timeframe,
+            window=max(10, _as_int(correlation_cfg.get("window"), correlation_defaults.window)),
+            min_abs_corr=_as_float(correlation_cfg.get("min_abs_corr"), correlation_defaults.min_abs_corr),
+            max_exposure_lots=max(
+                0.0, _as_float(correlation_cfg.get("max_exposure_lots"), correlation_defaults.max_exposure_lots)
+            ),
+        )
+
         model_name = _clean_str(data.get("model"), MODELS.DEFAULT_VISION) or MODELS.DEFAULT_VISION
 
         return cls(
@@ -482,6 +621,10 @@ class UiConfigState:
             model=model_name,
             autorun=autorun_state,
             prompt=prompt_state,
+            ict=ict,
+            watchlist=watchlist,
+            materiality=materiality,
+            correlation=correlation,
         )
 
 
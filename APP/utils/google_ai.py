@@ -66,6 +66,11 @@ except ModuleNotFoundError:  # pragma: no cover - fallback path for sandbox
 
 GenerativeModel = _GenerativeModel
 
+try:  # pragma: no cover - context caching chỉ có ở các bản SDK mới
+    from google.generativeai.caching import CachedContent  # type: ignore
+except (ModuleNotFoundError, ImportError):  # pragma: no cover - fallback path for sandbox
+    CachedContent = None  # type: ignore[assignment,misc]
+
 
 def configure(*args, **kwargs):
     if _configure is None:
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Giới hạn tốc độ dạng token bucket dùng chung cho mọi lời gọi Gemini trong tiến trình.
+
+Mỗi API key có một `RateLimiter` gồm tối đa ba bucket: request/phút, token/phút và
+upload file/phút. `acquire()` chặn (theo đồng hồ monotonic) đúng khoảng thời gian cần để mọi
+bucket liên quan đủ hạn mức rồi trừ đồng thời, thay vì gọi API rồi mới backoff khi gặp
+`ResourceExhausted`. Việc chờ có thể hủy qua `CancelToken`.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from dataclasses import dataclass
+from time import monotonic, sleep
+from typing import Callable, Optional
+
+from APP.utils.threading_utils import CancelToken
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = ("requests", "tokens", "uploads")
+POLL_INTERVAL_SEC = 0.25
+
+
+class TokenBucket:
+    """Bucket nạp lại liên tục `rate_per_min` đơn vị mỗi phút, sức chứa một phút."""
+
+    def __init__(self, rate_per_min: float, now: float) -> None:
+        self.rate_per_min = float(rate_per_min)
+        self.available = self.capacity
+        self._stamp = now
+
+    @property
+    def capacity(self) -> float:
+        return self.rate_per_min
+
+    def refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self._stamp)
+        self._stamp = now
+        self.available = min(self.capacity, self.available + elapsed * self.rate_per_min / 60.0)
+
+    def wait_for(self, amount: float) -> float:
+        """Số giây còn phải chờ để lấy `amount` (0 nếu lấy được ngay).
+
+        Yêu cầu lớn hơn sức chứa chỉ cần bucket đầy; phần vượt để lại nợ (available âm)
+        mà các lời gọi sau phải chờ trả.
+        """
+        needed = min(amount, self.capacity)
+        if self.available >= needed:
+            return 0.0
+        return (needed - self.available) * 60.0 / self.rate_per_min
+
+    def utilisation(self) -> float:
+        return min(1.0, max(0.0, 1.0 - self.available / self.capacity))
+
+
+@dataclass
+class BucketStats:
+    granted: float = 0.0
+    waits: int = 0
+    waited_sec: float = 0.0
+
+
+class RateLimiter:
+    """Nhóm các bucket của một API key; giới hạn <= 0 nghĩa là không giới hạn."""
+
+    def __init__(
+        self,
+        rpm: float = 0,
+        tpm: float = 0,
+        uploads_per_min: float = 0,
+        clock: Callable[[], float] = monotonic,
+        sleeper: Callable[[float], None] = sleep,
+    ) -> None:
+        self.clock = clock
+        self.sleeper = sleeper
+        self._lock = threading.Lock()
+        self._buckets: dict[str, TokenBucket] = {}
+        self._stats = {name: BucketStats() for name in BUCKETS}
+        self.configure(rpm, tpm, uploads_per_min)
+
+    def configure(self, rpm: float, tpm: float, uploads_per_min: float) -> None:
+        """Cập nhật giới hạn; bucket giữ lại mức đã dùng nếu chỉ đổi tốc độ."""
+        limits = {"requests": rpm, "tokens": tpm, "uploads": uploads_per_min}
+        with self._lock:
+            now = self.clock()
+            for name, limit in limits.items():
+                bucket = self._buckets.get(name)
+                if not limit or limit <= 0:
+                    self._buckets.pop(name, None)
+                elif bucket is None:
+                    self._buckets[name] = TokenBucket(limit, now)
+                elif bucket.rate_per_min != float(limit):
+                    bucket.refill(now)
+                    bucket.rate_per_min = float(limit)
+                    bucket.available = min(bucket.available, bucket.capacity)
+
+    def acquire(
+        self,
+        requests: float = 0,
+        tokens: float = 0,
+        uploads: float = 0,
+        cancel_token: Optional[CancelToken] = None,
+        timeout: Optional[float] = None,
+    ) -> float:
+        """Chờ đến khi đủ hạn mức cho mọi bucket rồi trừ đồng thời; trả về số giây đã chờ.
+
+        Raises:
+            CancelledError: `cancel_token` bị hủy trong lúc chờ.
+            TimeoutError: không đủ hạn mức trong `timeout` giây.
+        """
+        wanted = {k: v for k, v in (("requests", requests), ("tokens", tokens), ("uploads", uploads)) if v > 0}
+        start = self.clock()
+        waited_on: set[str] = set()
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            with self._lock:
+                now = self.clock()
+                waits: dict[str, float] = {}
+                for name, amount in wanted.items():
+                    bucket = self._buckets.get(name)
+                    if bucket is None:
+                        continue
+                    bucket.refill(now)
+                    wait = bucket.wait_for(amount)
+                    if wait > 0:
+                        waits[name] = wait
+                if not waits:
+                    for name, amount in wanted.items():
+                        if name in self._buckets:
+                            self._buckets[name].available -= amount
+                        self._stats[name].granted += amount
+                    waited = now - start
+                    for name in waited_on:
+                        self._stats[name].waits += 1
+                        self._stats[name].waited_sec += waited
+                    return waited
+                delay = max(waits.values())
+                waited_on.update(waits)
+            if timeout is not None and now + delay - start > timeout:
+                raise TimeoutError(f"Không đủ hạn mức {sorted(waits)} trong {timeout:.1f}s.")
+            logger.debug(f"Rate limiter chờ {delay:.2f}s cho {sorted(waits)}.")
+            # Chờ từng đoạn ngắn để phản hồi kịp khi bị hủy.
+            self.sleeper(min(delay, POLL_INTERVAL_SEC) if cancel_token is not None else delay)
+
+    def metrics(self) -> dict[str, dict[str, float]]:
+        """Mức sử dụng hiện tại và thống kê chờ của từng bucket đang bật."""
+        with self._lock:
+            now = self.clock()
+            out: dict[str, dict[str, float]] = {}
+            for name, bucket in self._buckets.items():
+                bucket.refill(now)
+                stats = self._stats[name]
+                out[name] = {
+                    "limit_per_min": bucket.rate_per_min,
+                    "available": round(bucket.available, 3),
+                    "utilisation": round(bucket.utilisation(), 4),
+                    "granted": stats.granted,
+                    "waits": stats.waits,
+                    "waited_sec": round(stats.waited_sec, 3),
+                }
+            return out
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_guard = threading.Lock()
+
+
+def get_rate_limiter(scope: str, rpm: float, tpm: float, uploads_per_min: float) -> RateLimiter:
+    """Limiter dùng chung cho `scope` (thường là fingerprint của API key)."""
+    with _limiters_guard:
+        limiter = _limiters.get(scope)
+        if limiter is None:
+            limiter = _limiters[scope] = RateLimiter(rpm, tpm, uploads_per_min)
+        else:
+            limiter.configure(rpm, tpm, uploads_per_min)
+        return limiter
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark cho các hàm phân tích nóng (ICT + chỉ báo trong `mt5_service`).
+
+Chạy:
+    python -m benchmarks.bench_analysis                         # toàn bộ: 4 kịch bản x 1k/10k/100k/1M
+    python -m benchmarks.bench_analysis --sizes 1000 10000 --kinds random_walk
+    python -m benchmarks.bench_analysis --save-baseline main    # lưu benchmarks/baselines/main.json
+    python -m benchmarks.bench_analysis --compare main          # so sánh với baseline đã lưu
+
+Mỗi dòng kết quả gồm ops/sec (số lần gọi hàm mỗi giây, trung vị của nhiều lượt) và
+bộ nhớ đỉnh (tracemalloc, đo trong một lượt gọi riêng để không ảnh hưởng thời gian).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+from APP.analysis import ict_analyzer
+from APP.services import mt5_service
+from tests.synthetic import GENERATORS, generate
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+MIN_TIME_SEC = 0.2
+REPEAT = 5
+
+
+def _cases(rates: list[dict]) -> dict[str, Callable[[], Any]]:
+    """Các hàm cần đo, đã gắn sẵn dữ liệu đầu vào (phần chuẩn bị không tính giờ)."""
+    cp = rates[-1]["close"]
+    closes = [r["close"] for r in rates]
+    liquidity = ict_analyzer.find_liquidity_levels(rates)
+    highs = liquidity["swing_highs_BSL"]
+    lows = liquidity["swing_lows_SSL"]
+    return {
+        "find_fvgs": lambda: ict_analyzer.find_fvgs(rates, cp),
+        "find_liquidity_levels": lambda: ict_analyzer.find_liquidity_levels(rates),
+        "find_order_blocks": lambda: ict_analyzer.find_order_blocks(rates),
+        "find_liquidity_voids": lambda: ict_analyzer.find_liquidity_voids(rates),
+        "find_market_structure_shift": lambda: ict_analyzer.find_market_structure_shift(rates, highs, lows),
+        "ema": lambda: mt5_service.ema(closes, 50),
+        "atr_series": lambda: mt5_service.atr_series(rates, 14),
+        "vwap_from_rates": lambda: mt5_service.vwap_from_rates(rates),
+    }
+
+
+def _ops_per_sec(fn: Callable[[], Any]) -> float:
+    # Ước lượng số lần gọi để mỗi lượt kéo dài ít nhất MIN_TIME_SEC.
+    t0 = time.perf_counter()
+    fn()
+    single = max(time.perf_counter() - t0, 1e-7)
+    loops = max(1, int(MIN_TIME_SEC / single))
+    rates = []
+    for _ in range(REPEAT if single < 1.0 else 1):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        rates.append(loops / (time.perf_counter() - t0))
+    return statistics.median(rates)
+
+
+def _peak_memory(fn: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes: list[int], kinds: list[str], functions: list[str] | None, seed: int) -> list[dict]:
+    results: list[dict] = []
+    for kind in kinds:
+        for n in sizes:
+            rates = generate(kind, n, seed=seed)
+            for name, fn in _cases(rates).items():
+                if functions and name not in functions:
+                    continue
+                ops = _ops_per_sec(fn)
+                peak = _peak_memory(fn)
+                results.append({"function": name, "kind": kind, "bars": n, "ops_per_sec": ops, "peak_bytes": peak})
+                print(f"{name:<28} {kind:<12} {n:>9} {ops:>14.1f} ops/s {peak / 1024:>10.1f} KiB", flush=True)
+            del rates
+    return results
+
+
+def _key(row: dict) -> tuple[str, str, int]:
+    return row["function"], row["kind"], row["bars"]
+
+
+def save_baseline(name: str, results: list[dict]) -> Path:
+    BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+    path = BASELINE_DIR / f"{name}.json"
+    payload = {
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def compare(name: str, results: list[dict]) -> None:
+    path = BASELINE_DIR / f"{name}.json"
+    baseline = {_key(r): r for r in json.loads(path.read_text(encoding="utf-8"))["results"]}
+    print(f"\nSo sánh với baseline '{name}' (>1.00x là nhanh hơn / ít bộ nhớ hơn):")
+    print(f"{'hàm':<28} {'kịch bản':<12} {'nến':>9} {'tốc độ':>9} {'bộ nhớ':>9}")
+    for row in results:
+        base = baseline.get(_key(row))
+        if not base:
+            continue
+        speed = row["ops_per_sec"] / base["ops_per_sec"] if base["ops_per_sec"] else float("nan")
+        mem = base["peak_bytes"] / row["peak_bytes"] if row["peak_bytes"] else float("nan")
+        print(f"{row['function']:<28} {row['kind']:<12} {row['bars']:>9} {speed:>8.2f}x {mem:>8.2f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--kinds", nargs="+", choices=sorted(GENERATORS), default=list(GENERATORS))
+    parser.add_argument("--functions", nargs="+", default=None, help="Chỉ đo các hàm này.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    args = parser.parse_args()
+
+    # Các hàm được đo ghi log debug; tắt để không đo chi phí logging.
+    logging.disable(logging.CRITICAL)
+    print(f"{'hàm':<28} {'kịch bản':<12} {'nến':>9} {'ops/sec':>18} {'bộ nhớ đỉnh':>14}")
+    results = run(args.sizes, args.kinds, args.functions, args.seed)
+    if args.save_baseline:
+        print(f"\nĐã lưu baseline: {save_baseline(args.save_baseline, results)}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
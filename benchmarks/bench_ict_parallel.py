@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark: phân tích ICT tuần tự so với process pool theo số lượng nến.
+
+Chạy:  python -m benchmarks.bench_ict_parallel [--sizes 100 500 1000 5000] [--repeat 5]
+
+In ra bảng thời gian cho 4 timeframe (mỗi timeframe N nến) và điểm giao cắt —
+số nến nhỏ nhất mà process pool nhanh hơn chạy trên luồng hiện tại. Giá trị này
+dùng để đặt `IctConfig.parallel_min_bars` (so sánh với tổng số nến của 4 timeframe).
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+from APP.analysis import ict_parallel
+from APP.analysis.ict_analyzer import analyze_timeframe_structure
+from tests.synthetic import random_walk
+
+TIMEFRAMES = ("H1", "M15", "M5", "M1")
+
+
+def _time_it(fn, repeat: int) -> tuple[float, float]:
+    """Trả về (thời gian thực, CPU của luồng gọi) trung vị, tính bằng giây."""
+    wall, cpu = [], []
+    for _ in range(repeat):
+        t0, c0 = time.perf_counter(), time.thread_time()
+        fn()
+        wall.append(time.perf_counter() - t0)
+        cpu.append(time.thread_time() - c0)
+    return statistics.median(wall), statistics.median(cpu)
+
+
+def run(sizes: list[int], repeat: int, workers: int) -> list[tuple[int, tuple[float, float], tuple[float, float]]]:
+    # Khởi động pool trước để không tính chi phí spawn vào lần đo đầu tiên.
+    ict_parallel.analyze_structures_in_process_pool({"warmup": random_walk(50)}, workers)
+
+    rows = []
+    for n in sizes:
+        jobs = {tf: random_walk(n, seed=i) for i, tf in enumerate(TIMEFRAMES)}
+        seq = _time_it(lambda: [analyze_timeframe_structure(r) for r in jobs.values()], repeat)
+        par = _time_it(lambda: ict_parallel.analyze_structures_in_process_pool(jobs, workers), repeat)
+        rows.append((n, seq, par))
+    ict_parallel.shutdown_executor()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 250, 500, 1000, 2500, 5000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=len(TIMEFRAMES))
+    args = parser.parse_args()
+
+    rows = run(args.sizes, args.repeat, args.workers)
+    print(
+        f"{'bars/tf':>8} {'tổng':>8} {'tuần tự ms':>11} {'pool ms':>9} {'tăng tốc':>9}"
+        f" {'CPU gọi (tt) ms':>16} {'CPU gọi (pool) ms':>18}"
+    )
+    wall_crossover = cpu_crossover = None
+    for n, (seq, seq_cpu), (par, par_cpu) in rows:
+        print(
+            f"{n:>8} {n * len(TIMEFRAMES):>8} {seq * 1000:>11.2f} {par * 1000:>9.2f} {seq / par:>8.2f}x"
+            f" {seq_cpu * 1000:>16.2f} {par_cpu * 1000:>18.2f}"
+        )
+        if wall_crossover is None and par < seq:
+            wall_crossover = n
+        if cpu_crossover is None and par_cpu < seq_cpu:
+            cpu_crossover = n
+
+    # "CPU gọi" là thời gian luồng gọi giữ GIL — chính là khoảng UI bị đứng.
+    for label, crossover in (("thời gian thực", wall_crossover), ("CPU luồng gọi", cpu_crossover)):
+        if crossover is None:
+            print(f"[{label}] Process pool không có lợi ở các kích thước đã đo.")
+        else:
+            print(
+                f"[{label}] Điểm giao cắt: ~{crossover} nến/timeframe "
+                f"(parallel_min_bars ≈ {crossover * len(TIMEFRAMES)})."
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import json
+from dataclasses import replace
+
+import numpy as np
+
+from APP.analysis import backtester, ict_scanner
+from APP.analysis.backtester import BacktestParams, Proposal
+from APP.ui.state.config_state import UiConfigState
+
+T0 = 1_700_000_000
+
+
+def _bars(path: list[tuple[float, float]]) -> np.ndarray:
+    """Mỗi phần tử (high, low) là một nến M1 liên tiếp."""
+    arr = np.zeros(len(path), dtype=ict_scanner.BAR_DTYPE)
+    arr["time"] = T0 + 60 * np.arange(len(path))
+    arr["high"] = [h for h, _ in path]
+    arr["low"] = [lo for _, lo in path]
+    arr["open"] = arr["low"]
+    arr["close"] = (arr["high"] + arr["low"]) / 2
+    return arr
+
+
+def _buy(**kw) -> Proposal:
+    values = dict(time=T0, side=1, entry=100.0, sl=99.0, tp1=101.0, tp2=102.0)
+    values.update(kw)
+    return Proposal(**values)
+
+
+def test_split_tp_hits_both_targets() -> None:
+    bars = _bars([(100.5, 99.8), (101.2, 100.1), (102.3, 100.9)])
+    (out,) = backtester.simulate([_buy()], bars, BacktestParams(split_tp_ratio=50))
+
+    assert out.status == backtester.STATUS_FILLED
+    assert out.outcome == backtester.OUTCOME_TP2
+    assert out.r_multiple == 1.5
+    assert out.mfe_r == 2.3 and out.mae_r == 0.2
+
+
+def test_breakeven_after_tp1_protects_runner() -> None:
+    bars = _bars([(100.5, 99.8), (101.2, 100.1), (100.4, 99.95), (98.0, 97.0)])
+    params = BacktestParams(split_tp_ratio=50, move_to_be_after_tp1=True)
+    (out,) = backtester.simulate([_buy()], bars, params)
+    assert out.outcome == backtester.OUTCOME_BREAKEVEN
+    assert out.r_multiple == 0.5
+
+    (no_be,) = backtester.simulate([_buy()], bars, BacktestParams(split_tp_ratio=50))
+    assert no_be.outcome == backtester.OUTCOME_TP1
+    assert no_be.r_multiple == 0.0
+
+
+def test_same_bar_sl_and_tp_counts_as_stop_and_sell_side_mirrors() -> None:
+    bars = _bars([(100.2, 99.9), (101.5, 98.5)])
+    (buy,) = backtester.simulate([_buy(tp2=None)], bars)
+    assert buy.outcome == backtester.OUTCOME_SL and buy.r_multiple == -1.0
+
+    mirrored = _bars([(-lo + 200, -h + 200) for h, lo in [(100.2, 99.9), (102.1, 100.5)]])
+    sell = Proposal(time=T0, side=-1, entry=100.0, sl=101.0, tp1=99.0, tp2=98.0)
+    (out,) = backtester.simulate([sell], mirrored, BacktestParams(split_tp_ratio=50))
+    assert out.outcome == backtester.OUTCOME_TP2 and out.r_multiple == 1.5
+
+
+def test_unfilled_invalid_and_missing_data() -> None:
+    bars = _bars([(105.0, 104.0)] * 10)
+    params = BacktestParams(entry_expiry_bars=5)
+    outs = backtester.simulate(
+        [_buy(), _buy(sl=100.5), _buy(time=T0 + 3600)],
+        bars,
+        params,
+    )
+    assert [o.status for o in outs] == [
+        backtester.STATUS_NOT_FILLED,
+        backtester.STATUS_INVALID,
+        backtester.STATUS_NO_DATA,
+    ]
+
+
+def test_matches_bar_by_bar_reference_on_random_walk() -> None:
+    rng = np.random.default_rng(3)
+    close = 100 + np.cumsum(rng.normal(0, 0.05, 3000))
+    spread = np.abs(rng.normal(0, 0.04, close.size))
+    bars = _bars(list(zip(close + spread, close - spread)))
+    props = [
+        _buy(time=int(T0 + 60 * i), entry=float(close[i]), sl=float(close[i] - 0.3), tp1=float(close[i] + 0.3), tp2=None)
+        for i in range(0, 2500, 37)
+    ]
+    params = BacktestParams(max_hold_bars=400)
+    outs = backtester.simulate(props, bars, params)
+
+    for p, o in zip(props, outs):
+        i = (p.time - T0) // 60
+        expected = "open"
+        for j in range(i, min(i + params.max_hold_bars, close.size)):
+            if bars["low"][j] <= p.sl:
+                expected = "sl"
+                break
+            if bars["high"][j] >= p.tp1:
+                expected = "tp1"
+                break
+        assert o.outcome == expected
+
+
+def test_load_proposals_and_summary(tmp_path) -> None:
+    record = {
+        "timestamp_utc": "2023-11-14T22:13:20+00:00",
+        "report_file": "r.json",
+        "setup": {"direction": "long", "entry": "100.0", "sl": "99.0", "tp1": "101.0", "tp2": "102.0", "risk_multiplier": "1.0"},
+        "context_snapshot": {"session": "london"},
+    }
+    (tmp_path / "trade_log_20231114.jsonl").write_text(
+        json.dumps(record) + "\n" + json.dumps({"stage": "other"}) + "\n", encoding="utf-8"
+    )
+
+    proposals = backtester.load_proposals(tmp_path)
+    assert proposals == [_buy(grade="A+", session="london", report_file="r.json")]
+
+    bars = _bars([(100.5, 99.8), (101.2, 100.1), (102.3, 100.9)])
+    result = backtester.evaluate_trade_outcomes(proposals, bars)
+    assert result["status"] == "ok"
+    assert result["by_grade"]["A+"]["win_rate"] == 1.0
+    assert result["by_session"]["london"]["avg_r"] == 1.5
+    assert backtester.evaluate_trade_outcomes(proposals, None)["status"] == "no_bar_data"
+
+
+
+def test_broker_time_offset_aligns_utc_proposals_with_bars() -> None:
+    # Kho nến theo giờ broker UTC+3; 3 giờ đầu là vùng quét SL, sau đó là đường chạm TP2.
+    offset = 3 * 3600
+    bars = _bars([(100.2, 98.5)] * 180 + [(100.5, 99.8), (101.2, 100.1), (102.3, 100.9)])
+    proposal = _buy(time=T0 + 180 * 60 - offset)  # UTC của nến broker thứ 180
+
+    (naive,) = backtester.simulate([proposal], bars, BacktestParams(split_tp_ratio=50))
+    assert naive.outcome == backtester.OUTCOME_SL
+
+    for params in (
+        BacktestParams(split_tp_ratio=50, time_offset_sec=offset),
+        BacktestParams(split_tp_ratio=50, broker_timezone="Etc/GMT-3"),
+    ):
+        (out,) = backtester.simulate([proposal], bars, params)
+        assert out.outcome == backtester.OUTCOME_TP2 and out.bars_to_fill == 0
+
+
+def test_market_entry_fills_at_next_bar_open_like_live_deal_orders() -> None:
+    bars = _bars([(100.6, 100.3), (101.2, 100.4), (102.3, 100.9)])
+    bars["open"][0] = 100.5
+    proposal = _buy(time=T0 - 30)  # đề xuất giữa nến trước: khớp ở open của nến T0
+
+    (limit,) = backtester.simulate([proposal], bars, BacktestParams(split_tp_ratio=50, entry_expiry_bars=3))
+    assert limit.status == backtester.STATUS_NOT_FILLED
+
+    market = BacktestParams(split_tp_ratio=50, entry_fill=backtester.ENTRY_FILL_MARKET)
+    (out,) = backtester.simulate([proposal], bars, market)
+    assert out.status == backtester.STATUS_FILLED and out.bars_to_fill == 0
+    assert out.outcome == backtester.OUTCOME_TP2
+    # R tính theo giá khớp 100.5 (rủi ro 1.5), không theo entry đề xuất.
+    assert out.r_multiple == round(0.5 * 0.5 / 1.5 + 0.5 * 1.5 / 1.5, 4)
+
+    # Giá mở đã vượt SL: broker từ chối stops, coi là không hợp lệ.
+    bars["open"][0] = 98.5
+    (gapped,) = backtester.simulate([proposal], bars, market)
+    assert gapped.status == backtester.STATUS_INVALID
+
+    cfg = UiConfigState.from_workspace_config({"mt5": {"symbol": "EURUSD"}}).to_run_config()
+    assert BacktestParams.from_config(cfg, time_offset_sec=0).entry_fill == backtester.ENTRY_FILL_MARKET
+
+
+def test_from_config_uses_broker_timezone_per_proposal() -> None:
+    cfg = UiConfigState.from_workspace_config({"mt5": {"symbol": "EURUSD"}}).to_run_config()
+    cfg = replace(cfg, mt5=replace(cfg.mt5, broker_timezone="Europe/Athens"))
+    params = BacktestParams.from_config(cfg)
+
+    winter, summer = 1_705_000_000, 1_720_000_000  # tháng 1 và tháng 7
+    assert params.bar_time(winter) - winter == 2 * 3600
+    assert params.bar_time(summer) - summer == 3 * 3600
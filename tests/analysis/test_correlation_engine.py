@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from dataclasses import replace
+
+import numpy as np
+
+from APP.analysis import correlation_engine
+from APP.analysis.ict_scanner import BAR_DTYPE
+from APP.ui.state.config_state import UiConfigState
+
+
+def _bars(closes, t0: int = 1_700_000_000, period: int = 3600, skip: tuple[int, ...] = ()) -> np.ndarray:
+    arr = np.zeros(len(closes), dtype=BAR_DTYPE)
+    arr["time"] = t0 + np.arange(len(closes)) * period
+    arr["open"] = arr["high"] = arr["low"] = arr["close"] = closes
+    keep = np.ones(len(closes), bool)
+    keep[list(skip)] = False
+    return arr[keep]
+
+
+def _market(n: int = 300, seed: int = 7) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    usd = rng.normal(0, 0.002, n).cumsum()
+    noise = lambda: rng.normal(0, 0.0005, n).cumsum()  # noqa: E731
+    return {
+        "EURUSD": 1.10 * np.exp(-usd + noise()),
+        "GBPUSD": 1.25 * np.exp(-usd + noise()),
+        "USDJPY": 150.0 * np.exp(usd + noise()),
+        "DXY": 104.0 * np.exp(usd + noise()),
+    }
+
+
+def test_split_currencies_handles_suffixes_and_indices() -> None:
+    assert correlation_engine.split_currencies("EURUSDm") == ("EUR", "USD")
+    assert correlation_engine.split_currencies("XAUUSD.r") == ("XAU", "USD")
+    assert correlation_engine.split_currencies("DXY") == ("USD", None)
+    assert correlation_engine.split_currencies("US30") == (None, None)
+
+
+def test_incremental_window_matches_full_recomputation() -> None:
+    closes = np.column_stack(list(_market(500).values()))
+    rolling = correlation_engine.RollingReturns(["a", "b", "c", "d"], window=60)
+    for t, row in enumerate(closes):
+        rolling.push(t, row)
+    assert not rolling.push(10, closes[10])  # thời điểm cũ bị bỏ qua
+
+    returns = np.diff(np.log(closes), axis=0)[-60:]
+    assert len(rolling) == 60
+    assert np.allclose(rolling.correlation(), np.corrcoef(returns.T), atol=1e-9)
+    assert np.allclose(rolling.cumulative(), returns.sum(axis=0))
+
+
+def test_engine_aligns_feeds_and_ranks_currency_strength() -> None:
+    market = _market()
+    feeds = {s: _bars(c, skip=(5, 17) if s == "USDJPY" else ()) for s, c in market.items()}
+    engine = correlation_engine.CorrelationEngine(list(feeds), "H1", window=100)
+    loader = lambda symbol, tf, count: feeds[symbol][-count:]  # noqa: E731
+    assert engine.update(loader) == 100
+    assert engine.update(loader) == 0
+
+    corr = engine.correlation()
+    i = engine.symbols.index
+    assert corr[i("EURUSD"), i("GBPUSD")] > 0.8
+    assert corr[i("EURUSD"), i("DXY")] < -0.8
+
+    before = engine.currency_strength()
+    for s in feeds:
+        extra = market[s][-1] * (1.01 if s in ("USDJPY", "DXY") else 0.99)
+        feeds[s] = np.concatenate([feeds[s], _bars([extra, extra], t0=int(feeds[s]["time"][-1]) + 3600)])
+    assert engine.update(loader) == 2  # nến cũ vừa đóng + nến mới đầu tiên
+    strength = engine.currency_strength()
+    assert set(strength) == {"EUR", "GBP", "JPY", "USD"}
+    assert strength["USD"] - strength["EUR"] > before["USD"] - before["EUR"] + 1.0
+
+
+def test_exposure_and_snapshot_summary() -> None:
+    market = _market()
+    feeds = {s: _bars(c) for s, c in market.items()}
+    cfg = UiConfigState.from_workspace_config({"mt5": {"symbol": "EURUSD"}}).to_run_config()
+    cfg = replace(
+        cfg,
+        watchlist=replace(cfg.watchlist, symbols=("GBPUSD",)),
+        correlation=replace(cfg.correlation, enabled=True, symbols=("DXY",), window=100),
+    )
+    positions = [
+        {"symbol": "GBPUSD", "type": "BUY", "volume": 1.0},
+        {"symbol": "EURUSD", "type": "SELL", "volume": 0.5},
+        {"symbol": "US30", "type": "BUY", "volume": 2.0},
+    ]
+    summary = correlation_engine.snapshot_summary(
+        cfg, positions, load_bars=lambda symbol, tf, count: feeds[symbol][-count:]
+    )
+    assert [p["symbol"] for p in summary["correlated_with"]][:2] in (["GBPUSD", "DXY"], ["DXY", "GBPUSD"])
+    assert summary["exposure"]["long"] > 0.3 and summary["exposure"]["short"] < -0.3
+    assert summary["strongest"] in ("USD", "EUR", "GBP")
+
+    alone = replace(cfg, watchlist=replace(cfg.watchlist, symbols=()), correlation=replace(cfg.correlation, symbols=()))
+    assert correlation_engine.snapshot_summary(alone, positions) == {}
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import math
+
+from APP.analysis import ict_analyzer
+from APP.analysis.ict_cache import IctResultCache, make_cache_key
+
+
+def _make_rates(n: int = 240) -> list[dict]:
+    rates = []
+    price = 100.0
+    for i in range(n):
+        drift = math.sin(i / 7.0) * 0.8 + (0.6 if i % 23 == 0 else 0.0)
+        open_ = price
+        close = price + drift
+        high = max(open_, close) + 0.3 + (i % 5) * 0.05
+        low = min(open_, close) - 0.3 - (i % 3) * 0.05
+        rates.append(
+            {
+                "time": f"2024-01-{1 + i // 24:02d} {i % 24:02d}:00:00",
+                "open": open_,
+                "high": high,
+                "low": low,
+                "close": close,
+                "vol": 100,
+            }
+        )
+        price = close
+    return rates
+
+
+def test_find_fvgs_matches_unfilled_then_nearest() -> None:
+    rates = _make_rates()
+    cp = rates[-1]["close"]
+    unfilled = ict_analyzer.find_unfilled_fvgs(rates)
+    assert ict_analyzer.find_fvgs(rates, cp) == ict_analyzer.select_nearest_fvgs(unfilled, cp)
+
+
+
+def test_patterns_reevaluate_price_dependent_parts() -> None:
+    structure = ict_analyzer.analyze_timeframe_structure(_make_rates())
+    assert structure.swing_highs and structure.swing_lows
+
+    high = max(h.price for h in structure.swing_highs) + 50
+    low = min(s.price for s in structure.swing_lows) - 50
+    above = ict_analyzer.build_timeframe_patterns(structure, high, "h1")
+    below = ict_analyzer.build_timeframe_patterns(structure, low, "h1")
+
+    assert above["liquidity_h1"] == below["liquidity_h1"]
+    assert above["mss_h1"] == below["mss_h1"]
+    if above["premium_discount_h1"]:
+        assert above["premium_discount_h1"]["status"] == "Premium"
+        assert below["premium_discount_h1"]["status"] == "Discount"
+    assert all(f["type"] == "Bullish" for f in above["fvgs_h1"])
+    assert all(f["type"] == "Bearish" for f in below["fvgs_h1"])
+
+
+def test_cache_lru_eviction_and_disk_spill(tmp_path) -> None:
+    rates = _make_rates()
+    spill = tmp_path / "ict_cache.json"
+    cache = IctResultCache(capacity=2, spill_path=spill)
+    calls: list[int] = []
+
+    def compute(n: int):
+        calls.append(n)
+        return ict_analyzer.analyze_timeframe_structure(rates[:n])
+
+    keys = [make_cache_key("XAUUSD", "H1", rates[:n]) for n in (100, 150, 200)]
+    for key, n in zip(keys, (100, 150, 200)):
+        cache.get_or_compute(key, lambda n=n: compute(n))
+    assert calls == [100, 150, 200]
+    assert len(cache) == 2
+
+    # Mục cũ nhất đã bị loại bỏ, hai mục mới nhất phải trúng cache.
+    cache.get_or_compute(keys[2], lambda: compute(200))
+    cache.get_or_compute(keys[0], lambda: compute(100))
+    assert calls == [100, 150, 200, 100]
+
+    warm = IctResultCache(capacity=2, spill_path=spill)
+    assert warm.get(keys[2]) == ict_analyzer.analyze_timeframe_structure(rates[:200])
+    assert warm.get(keys[1]) is None
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import pytest
+
+from APP.analysis import ict_parallel
+from APP.analysis.ict_analyzer import analyze_timeframe_structure
+from APP.configs.app_config import IctConfig
+from tests.synthetic import random_walk
+
+
+@pytest.fixture(autouse=True)
+def _shutdown_pool():
+    yield
+    ict_parallel.shutdown_executor()
+
+
+def _jobs() -> dict[str, list[dict]]:
+    return {tf: random_walk(300, seed=i) for i, tf in enumerate(("H1", "M15", "M5", "M1"))}
+
+
+@pytest.mark.skipif(not ict_parallel.PARALLEL_AVAILABLE, reason="numpy không khả dụng")
+def test_process_pool_matches_in_thread_results() -> None:
+    jobs = _jobs()
+    expected = {name: analyze_timeframe_structure(rates) for name, rates in jobs.items()}
+    assert ict_parallel.analyze_structures_in_process_pool(jobs, workers=2) == expected
+
+
+def test_falls_back_to_in_thread_when_pool_fails(monkeypatch) -> None:
+    def _boom(*_args, **_kwargs):
+        raise RuntimeError("pool hỏng")
+
+    monkeypatch.setattr(ict_parallel, "PARALLEL_AVAILABLE", True)
+    monkeypatch.setattr(ict_parallel, "analyze_structures_in_process_pool", _boom)
+    jobs = _jobs()
+    cfg = IctConfig(parallel_enabled=True, parallel_min_bars=0)
+
+    result = ict_parallel.analyze_structures(jobs, cfg)
+
+    assert result == {name: analyze_timeframe_structure(rates) for name, rates in jobs.items()}
+
+
+def test_small_inputs_stay_in_thread(monkeypatch) -> None:
+    monkeypatch.setattr(
+        ict_parallel,
+        "analyze_structures_in_process_pool",
+        lambda *_a, **_k: pytest.fail("không được dùng process pool dưới ngưỡng"),
+    )
+    cfg = IctConfig(parallel_enabled=True, parallel_min_bars=10_000)
+    assert set(ict_parallel.analyze_structures(_jobs(), cfg)) == {"H1", "M15", "M5", "M1"}
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import numpy as np
+
+from APP.analysis import ict_scanner
+from APP.analysis.ict_analyzer import find_unfilled_fvgs
+from APP.persistence.bar_archive import BarArchive
+from tests.synthetic import random_walk
+
+
+def _archive(tmp_path, n: int):
+    rates = random_walk(n, seed=3)
+    for i, r in enumerate(rates):
+        r["time"] = 1_700_000_000 + 60 * i
+    archive = BarArchive("EURUSD", "M1", root=tmp_path / "bars")
+    archive.append(rates)
+    return rates, archive
+
+
+def test_chunked_parallel_scan_matches_single_pass(tmp_path) -> None:
+    _, archive = _archive(tmp_path, 8000)
+
+    single = ict_scanner.scan_archive(archive, tmp_path / "single", params=ict_scanner.ScanParams(chunk_bars=10**9))
+    chunked = ict_scanner.scan_archive(
+        archive, tmp_path / "chunked", params=ict_scanner.ScanParams(chunk_bars=1500), workers=2
+    )
+
+    assert single["counts"] == chunked["counts"]
+    _, a = ict_scanner.load_scan_result(tmp_path / "single")
+    _, b = ict_scanner.load_scan_result(tmp_path / "chunked")
+    for name in ict_scanner.RESULT_COLUMNS:
+        assert np.array_equal(a[name], b[name]), name
+    assert np.all(np.diff(a["bar_index"]) >= 0)
+    assert np.array_equal(a["time"], 1_700_000_000 + 60 * a["bar_index"])
+
+
+def test_unfilled_fvgs_match_ict_analyzer(tmp_path) -> None:
+    rates, archive = _archive(tmp_path, 400)
+    events = ict_scanner.detect_events(archive.read())
+
+    sel = (events["kind"] == ict_scanner.KIND_FVG) & (events["ref_bar"] == -1)
+    scanned = sorted(
+        zip(np.where(events["direction"][sel] == 1, "Bullish", "Bearish"), events["top"][sel], events["bottom"][sel])
+    )
+    expected = sorted((f.type, f.top, f.bottom) for f in find_unfilled_fvgs(rates))
+    assert scanned == expected
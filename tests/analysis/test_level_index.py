@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from APP.analysis import level_index
+from APP.analysis.level_index import LevelIndexCache, PriceLevel, PriceLevelIndex
+from APP.core.trading.conditions import KeyLevelCondition
+from APP.services import mt5_service
+from APP.utils.safe_data import SafeData
+
+
+def _levels(n: int = 60, seed: int = 1) -> list[PriceLevel]:
+    rng = random.Random(seed)
+    return [PriceLevel(price=round(rng.uniform(1900, 2100), 2), name=f"L{i}", source="round") for i in range(n)]
+
+
+def test_queries_match_linear_scan() -> None:
+    levels = _levels()
+    index = PriceLevelIndex(levels)
+    rng = random.Random(7)
+    for _ in range(200):
+        cp = rng.uniform(1880, 2120)
+        above = sorted((lv for lv in levels if lv.price > cp), key=lambda lv: lv.price - cp)[:3]
+        below = sorted((lv for lv in levels if lv.price < cp), key=lambda lv: cp - lv.price)[:3]
+        near = sorted(levels, key=lambda lv: abs(lv.price - cp))[0]
+
+        assert [lv.price for lv in index.above(cp, 3)] == [lv.price for lv in above]
+        assert [lv.price for lv in index.below(cp, 3)] == [lv.price for lv in below]
+        assert abs(index.nearest(cp).price - cp) == abs(near.price - cp)
+        assert sorted(lv.price for lv in index.within(cp, 5.0)) == sorted(
+            lv.price for lv in levels if abs(lv.price - cp) <= 5.0
+        )
+
+
+def test_empty_index() -> None:
+    index = PriceLevelIndex([])
+    assert index.nearest(2000.0) is None
+    assert index.above(2000.0, 3) == [] and index.below(2000.0, 3) == []
+
+
+def test_cache_rebuilds_only_when_levels_change() -> None:
+    cache = LevelIndexCache()
+    levels = _levels(10)
+    first = cache.get("XAUUSD", levels)
+    assert cache.get("XAUUSD", list(levels)) is first
+    assert cache.builds == 1
+
+    cache.get("XAUUSD", levels + [PriceLevel(2000.0, "PDH", "daily")])
+    assert cache.builds == 2
+
+
+def test_cache_keeps_one_index_per_symbol_and_skips_collection_on_signature_hit() -> None:
+    cache = LevelIndexCache()
+    collected = []
+
+    def build(symbol: str):
+        return lambda: collected.append(symbol) or _levels(10, seed=len(symbol))
+
+    # Xen kẽ hai symbol không làm dựng lại chỉ mục của nhau.
+    for _ in range(3):
+        eur = cache.get(("EURUSD", "context"), build("EURUSD"), signature=("d1", 1))
+        xau = cache.get(("XAUUSD", "context"), build("XAUUSD"), signature=("d1", 1))
+    assert cache.builds == 2 and collected == ["EURUSD", "XAUUSD"]
+    assert cache.merged(("EURUSD", "all"), [eur, xau]) is cache.merged(("EURUSD", "all"), [eur, xau])
+
+    a = level_index.round_level_index("EURUSD", 1.08501, 0.0001, 5)
+    assert level_index.round_level_index("EURUSD", 1.08509, 0.0001, 5) is a
+    assert level_index.round_level_index("EURUSD", 1.08511, 0.0001, 5) is not a
+    assert PriceLevel(1.0851, "X", "round").to_dict(1.0850, 0.0001)["distance_pips"] == pytest.approx(1.0)
+
+
+def test_collect_levels_from_mt5_payload_tags_sources() -> None:
+    payload = {
+        "levels": {
+            "prev_day": {"high": 2010.0, "low": 1990.0},
+            "daily": {"open": 2000.0, "eq50": None},
+            "weekly": {"high": 2030.0, "low": 1970.0},
+            "prev_week": {},
+        },
+        "round_levels": [{"level": "50", "price": 2000.5}],
+        "session_liquidity": {"asia_high": 2004.0},
+        "ict_patterns": {
+            "fvgs_h1": [{"type": "Bullish", "top": 1995.0, "bottom": 1993.0}],
+            "order_blocks_m15": [{"type": "Bearish", "top": 2012.0, "bottom": 2011.0, "bar_index": 5}],
+            "liquidity_h1": {"swing_highs_BSL": [{"price": 2020.0, "bar_index": 3}], "swing_lows_SSL": []},
+        },
+    }
+
+    levels = level_index.collect_levels_from_mt5_data(payload)
+    by_name = {lv.name: lv.source for lv in levels}
+
+    assert by_name["PDH"] == level_index.SOURCE_DAILY
+    assert "EQ50_D" not in by_name
+    assert by_name["WH"] == level_index.SOURCE_WEEKLY
+    assert by_name["ROUND_50"] == level_index.SOURCE_ROUND
+    assert by_name["ASIA_HIGH"] == level_index.SOURCE_SESSION
+    assert by_name["FVG_Bullish_H1_TOP"] == level_index.SOURCE_FVG
+    assert by_name["OB_Bearish_M15_BOTTOM"] == level_index.SOURCE_ORDER_BLOCK
+    assert by_name["BSL_H1"] == level_index.SOURCE_LIQUIDITY
+
+
+def test_key_level_distance_is_in_pips_against_pips_threshold() -> None:
+    # Symbol 5 chữ số: 1 pip = 10 point. PDH cách giá 8 pip (80 point).
+    info = SimpleNamespace(point=0.00001, digits=5)
+    levels = mt5_service._nearby_key_levels(
+        "EURUSD_PIPS", 1.10000, info, None, {"high": 1.10080, "low": 1.09000}
+    )
+    pdh = next(lv for lv in levels if lv["name"] == "PDH")
+    assert pdh["distance_pips"] == pytest.approx(8.0)
+
+    data = SafeData(
+        {
+            "symbol": "EURUSD_PIPS",
+            "tick": {"bid": 1.10000, "ask": 1.10001},
+            "info": {"point": 0.00001, "digits": 5},
+            "key_levels_nearby": levels,
+        }
+    )
+
+    def _check(min_pips: float):
+        cfg = SimpleNamespace(no_trade=SimpleNamespace(min_dist_keylvl_pips=min_pips))
+        return KeyLevelCondition().check(data, cfg)
+
+    assert _check(10.0) is not None
+    assert _check(5.0) is None
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import replace
+
+from APP.analysis import materiality
+from APP.ui.state.config_state import UiConfigState
+
+
+def _snapshot(**overrides):
+    data = {
+        "symbol": "EURUSD",
+        "info": {"digits": 5},
+        "tick": {"bid": 1.10000},
+        "volatility": {"ATR": {"M5": 0.0010}},
+        "killzone_active": "london",
+        "atr_norm": {"spread_as_pct_of_atr_m5": 5.0},
+        "ict_patterns": {
+            "fvgs_h1": [{"type": "Bullish", "top": 1.1010, "bottom": 1.1000, "bar_index": 4}],
+            "order_blocks_m5": [{"type": "Bearish", "top": 1.1030, "bottom": 1.1025, "bar_index": 9}],
+            "mss_m15": {"type": "Bullish", "event": "BOS", "price_level": 1.0990, "break_bar_index": 3},
+        },
+        "positions": [],
+    }
+    data.update(overrides)
+    return data
+
+
+def _cfg(**materiality_cfg):
+    cfg = UiConfigState.from_workspace_config({"mt5": {"symbol": "EURUSD"}}).to_run_config()
+    return replace(cfg.materiality, enabled=True, **materiality_cfg)
+
+
+def test_score_components_cover_price_ict_killzone_and_positions() -> None:
+    prev = materiality.Fingerprint.from_snapshot(_snapshot())
+    drifted = _snapshot(ict_patterns=dict(_snapshot()["ict_patterns"]))
+    # bar_index trôi theo nến mới không được tính là đối tượng mới.
+    drifted["ict_patterns"]["fvgs_h1"] = [{"type": "Bullish", "top": 1.1010, "bottom": 1.1000, "bar_index": 7}]
+    assert materiality.score_change(prev, materiality.Fingerprint.from_snapshot(drifted))[0] == 0.0
+
+    patterns = dict(_snapshot()["ict_patterns"])
+    patterns["fvgs_m5"] = [{"type": "Bearish", "top": 1.1008, "bottom": 1.1004}]
+    cur = materiality.Fingerprint.from_snapshot(
+        _snapshot(
+            tick={"bid": 1.10050},
+            killzone_active=None,
+            ict_patterns=patterns,
+            positions=[{"ticket": 7, "volume": 0.1, "sl": 1.09, "tp": 1.12}],
+        )
+    )
+    score, components, reasons = materiality.score_change(prev, cur)
+    assert math.isclose(components["price"], 0.5)
+    assert components["ict"] == 0.5
+    assert components["killzone"] == materiality.KILLZONE_WEIGHT
+    assert components["positions"] == materiality.POSITIONS_WEIGHT
+    assert math.isclose(score, sum(components.values())) and len(reasons) == 4
+
+
+def test_decisions_skip_light_full_and_forced_refresh() -> None:
+    cfg = _cfg(skip_below=1.0, full_above=2.0, light_model="gemini-flash-lite", max_skip_min=60)
+    prev = materiality.Fingerprint.from_snapshot(_snapshot())
+    now = 1_700_000_000.0
+
+    same = materiality.evaluate(cfg, prev, prev, now - 600, now=now)
+    assert same.decision == materiality.DECISION_SKIP and same.previous_age_min == 10
+
+    small = materiality.Fingerprint.from_snapshot(_snapshot(tick={"bid": 1.10150}))
+    assert materiality.evaluate(cfg, small, prev, now - 600, now=now).decision == materiality.DECISION_LIGHT
+    no_light = replace(cfg, light_model="")
+    assert materiality.evaluate(no_light, small, prev, now - 600, now=now).decision == materiality.DECISION_FULL
+
+    big = materiality.Fingerprint.from_snapshot(_snapshot(tick={"bid": 1.10300}))
+    assert materiality.evaluate(cfg, big, prev, now - 600, now=now).decision == materiality.DECISION_FULL
+
+    stale = materiality.evaluate(cfg, prev, prev, now - 3600, now=now)
+    assert stale.decision == materiality.DECISION_FULL and "60 phút" in stale.reasons[-1]
+
+    first = materiality.evaluate(cfg, prev, None, now=now)
+    assert first.decision == materiality.DECISION_FULL and first.to_dict()["score"] is None
+    other = replace(prev, symbol="GBPUSD")
+    assert materiality.evaluate(cfg, other, prev, now - 60, now=now).decision == materiality.DECISION_FULL
+
+
+def test_state_round_trip(tmp_path) -> None:
+    assert materiality.load_state(tmp_path) == (None, None)
+    fp = materiality.Fingerprint.from_snapshot(
+        _snapshot(positions=[{"ticket": 3, "volume": 0.2, "sl": 1.09, "tp": None}])
+    )
+    materiality.save_state(tmp_path / "Reports", fp, now=123.0)
+    loaded, saved_at = materiality.load_state(tmp_path / "Reports")
+    assert loaded == fp and saved_at == 123.0
+
+    (tmp_path / materiality.STATE_FILENAME).write_text("{broken", encoding="utf-8")
+    assert materiality.load_state(tmp_path) == (None, None)
+
+
+def test_fingerprint_and_evaluate_stay_under_a_millisecond() -> None:
+    cfg = _cfg()
+    prev = materiality.Fingerprint.from_snapshot(_snapshot())
+    snapshot = _snapshot(tick={"bid": 1.10020})
+    runs = 1000
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        materiality.evaluate(cfg, materiality.Fingerprint.from_snapshot(snapshot), prev, 0.0, now=60.0)
+    assert (time.perf_counter() - t0) / runs < 0.001
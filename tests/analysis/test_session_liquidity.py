@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from APP.analysis import ict_analyzer
+from tests.synthetic import generate
+
+SESSIONS = {
+    "asia": {"start": "06:00", "end": "09:00"},
+    "london": {"start": "14:00", "end": "17:00"},
+    "newyork_am": {"start": "19:30", "end": "22:00"},
+    "newyork_pm": {"start": "23:00", "end": "02:00"},
+}
+
+
+def _bar(time: str, high: float, low: float) -> dict:
+    return {"time": time, "open": low, "high": high, "low": low, "close": high, "vol": 1}
+
+
+def _manual(rates: list[dict], day: str, start: str, end: str) -> dict[str, float] | None:
+    picked = [r for r in rates if r["time"].startswith(day) and start <= r["time"][11:16] < end]
+    if not picked:
+        return None
+    return {"high": max(r["high"] for r in picked), "low": min(r["low"] for r in picked)}
+
+
+def test_by_day_matches_manual_filter_for_every_past_day() -> None:
+    rates = generate("random_walk", 4 * 96, seed=7)
+    for r, i in zip(rates, range(len(rates))):
+        r["time"] = f"2024-03-{4 + i // 96:02d} {(i % 96) // 4:02d}:{(i % 4) * 15:02d}:00"
+
+    by_day = ict_analyzer.session_liquidity_by_day(rates, SESSIONS)
+
+    for day in ("2024-03-04", "2024-03-05", "2024-03-06", "2024-03-07"):
+        for name in ("asia", "london", "newyork_am"):
+            rng = SESSIONS[name]
+            assert by_day[day][name] == _manual(rates, day, rng["start"], rng["end"])
+
+
+def test_overnight_session_belongs_to_start_day() -> None:
+    rates = [
+        _bar("2024-03-04 23:15:00", 10.0, 9.0),
+        _bar("2024-03-05 01:30:00", 12.0, 8.5),
+        _bar("2024-03-05 02:00:00", 99.0, 1.0),  # ngoài phiên (end không tính)
+        _bar("2024-03-05 23:30:00", 20.0, 19.0),
+    ]
+
+    by_day = ict_analyzer.session_liquidity_by_day(rates, SESSIONS)
+
+    assert by_day["2024-03-04"]["newyork_pm"] == {"high": 12.0, "low": 8.5}
+    assert by_day["2024-03-05"]["newyork_pm"] == {"high": 20.0, "low": 19.0}
+
+
+def test_get_session_liquidity_only_reports_completed_sessions() -> None:
+    rates = [
+        _bar("2024-03-05 06:15:00", 5.0, 4.0),
+        _bar("2024-03-05 07:00:00", 6.0, 3.5),
+        _bar("2024-03-05 14:30:00", 8.0, 7.0),
+    ]
+
+    before_london = ict_analyzer.get_session_liquidity(rates, SESSIONS, datetime(2024, 3, 5, 10, 0))
+    during_london = ict_analyzer.get_session_liquidity(rates, SESSIONS, datetime(2024, 3, 5, 15, 0))
+    after_ny_open = ict_analyzer.get_session_liquidity(rates, SESSIONS, datetime(2024, 3, 5, 20, 0))
+
+    assert before_london == {}
+    assert during_london == {"asia_high": 6.0, "asia_low": 3.5}
+    assert after_ny_open == {"asia_high": 6.0, "asia_low": 3.5, "london_high": 8.0, "london_low": 7.0}
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from APP.analysis import session_stats
+from APP.persistence import bar_archive
+
+SCHEDULE = {
+    "asia": {"start": "02:00", "end": "05:00"},
+    "london": {"start": "08:00", "end": "11:00"},
+    "newyork_am": {"start": "13:00", "end": "16:00"},
+    "newyork_pm": {"start": "18:00", "end": "20:00"},
+}
+T0 = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())  # Thứ Hai
+
+
+def _schedule(_d):
+    return SCHEDULE
+
+
+def _days(n_days: int, start_day: int = 0) -> np.ndarray:
+    """Nến M15: London luôn quét high Asia, NY AM quét low London, high ngày lúc 09h."""
+    times = T0 + start_day * 86400 + np.arange(n_days * 96) * 900
+    hours = (times % 86400) / 3600.0
+    day_idx = (times - T0) // 86400
+    base = 1.1 + 0.0001 * (day_idx % 7)
+    high = base + 0.0005
+    low = base - 0.0005
+    london = (hours >= 8) & (hours < 11)
+    ny_am = (hours >= 13) & (hours < 16)
+    high = np.where(london, base + 0.0010 + 0.0010 * (hours == 9), high)
+    low = np.where(ny_am, base - 0.0015, low)
+    arr = np.zeros(times.size, dtype=bar_archive.ARCHIVE_DTYPE)
+    arr["time"], arr["high"], arr["low"] = times, high, low
+    arr["open"] = arr["close"] = base
+    return arr
+
+
+def test_day_records_capture_sessions_and_sweeps() -> None:
+    records = session_stats.build_day_records(_days(3), _schedule)
+    assert len(records) == 3 and records["weekday"].tolist() == [0, 1, 2]
+    first = records[0]
+    assert first["high_hour"] == 9 and first["low_hour"] == 13
+    assert first["asia_took_high"] == -1
+    assert first["london_took_high"] == 1 and first["london_took_low"] == 0
+    assert first["newyork_am_took_low"] == 1
+    assert np.isclose(first["london_high"] - first["london_low"], 0.0025)
+    # Asia ngày sau so với NY PM ngày trước.
+    assert records[1]["asia_took_high"] in (0, 1)
+
+    assert len(session_stats.build_day_records(_days(3), _schedule, until_day=T0 // 86400 + 2)) == 2
+
+
+def test_incremental_update_matches_full_build_and_persists(tmp_path) -> None:
+    archive = bar_archive.BarArchive("EURUSD", "M15", root=tmp_path)
+    archive.append(_days(10))
+    cube = session_stats.SessionStatsCube("EURUSD", "M15", schedule=_schedule, signature="a", root=tmp_path)
+    assert cube.update() == 9  # ngày cuối chưa đóng
+    assert cube.update() == 0
+
+    archive.append(_days(25, start_day=10))
+    assert cube.update() == 25
+    full = session_stats.build_day_records(archive.read(columns=("time", "high", "low")), _schedule)[:-1]
+    assert cube.records.tobytes() == full.tobytes()
+
+    reloaded = session_stats.SessionStatsCube("EURUSD", "M15", schedule=_schedule, signature="a", root=tmp_path)
+    assert len(reloaded) == 34 and reloaded.update() == 0
+    changed = session_stats.SessionStatsCube("EURUSD", "M15", schedule=_schedule, signature="b", root=tmp_path)
+    assert len(changed) == 0
+
+
+def test_lookup_falls_back_and_context_is_complete(tmp_path) -> None:
+    bar_archive.BarArchive("EURUSD", "M15", root=tmp_path).append(_days(36))
+    cube = session_stats.SessionStatsCube("EURUSD", "M15", schedule=_schedule, root=tmp_path)
+    cube.update()
+
+    monday = cube.lookup(0, "london", 1, min_samples=5)
+    assert monday is not None and monday.n == 5
+    assert monday.p_take_prev_high == 1.0
+    assert cube.lookup(0, "london", 1, min_samples=6).n == 31  # lùi về (ALL, london, tháng 1)
+    assert cube.lookup(0, "london", 1, min_samples=32).n == 35  # lùi về (ALL, london, ALL)
+
+    daily = cube.lookup(session_stats.ALL_WEEKDAYS, session_stats.DAY, session_stats.ALL_MONTHS)
+    assert daily.high_hour_probs[9] == 1.0
+    assert cube.adr()["d20"] is not None
+
+    ctx = cube.context(datetime(2024, 2, 5, 10, 0), day_range=0.0030)
+    assert ctx["days"] == 35 and ctx["weekday"] == "Mon"
+    assert ctx["daily"]["high_hour_top"][0] == {"hour": 9, "p": 1.0}
+    assert set(ctx["sessions"]) == set(SCHEDULE)
+    assert ctx["sessions"]["newyork_am"]["p_take_prev_low"] == 1.0
+    assert 0.0 <= ctx["day_range_percentile"] <= 100.0
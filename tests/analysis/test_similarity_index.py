@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from APP.analysis import backtester, context_builder, similarity_index, vectorizer
+from APP.analysis.similarity_index import SimilarityIndex, VectorStore
+
+
+def _brute_force(data: np.ndarray, q: np.ndarray, k: int, metric: str) -> np.ndarray:
+    if metric == similarity_index.METRIC_COSINE:
+        dn = data / np.linalg.norm(data, axis=1, keepdims=True)
+        dist = 1.0 - dn @ (q / np.linalg.norm(q))
+    else:
+        dist = ((data - q) ** 2).sum(axis=1)
+    return np.argsort(dist, kind="stable")[:k]
+
+
+def test_flat_search_matches_brute_force() -> None:
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(2000, 16)).astype(np.float32)
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+    for metric in (similarity_index.METRIC_COSINE, similarity_index.METRIC_L2):
+        index = SimilarityIndex(16, metric)
+        index.add(data[:1500])
+        index.add(data[1500:])
+        rows, dist = index.search(queries, k=10)
+        for q, got in zip(queries, rows):
+            assert set(got) == set(_brute_force(data, q, 10, metric))
+        assert np.all(np.diff(dist, axis=1) >= -1e-6)
+
+
+def test_ivf_finds_clustered_neighbours() -> None:
+    rng = np.random.default_rng(1)
+    centers = rng.normal(scale=10.0, size=(20, 8))
+    data = (centers[rng.integers(0, 20, 5000)] + rng.normal(size=(5000, 8))).astype(np.float32)
+    index = SimilarityIndex(8, similarity_index.METRIC_L2)
+    index.add(data)
+    index.build_ivf(n_lists=20)
+
+    q = data[123]
+    rows, dist = index.search(q, k=5, n_probe=3)
+    assert rows[0, 0] == 123 and dist[0, 0] == 0.0
+    assert set(rows[0]) == set(_brute_force(data, q, 5, similarity_index.METRIC_L2))
+
+
+def test_search_pads_when_fewer_than_k() -> None:
+    index = SimilarityIndex(3)
+    index.add([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    rows, dist = index.search([1.0, 0.0, 0.0], k=4)
+    assert rows[0].tolist() == [0, 1, -1, -1]
+    assert np.isinf(dist[0, 2:]).all()
+
+
+def test_store_replays_log_after_snapshot(tmp_path) -> None:
+    names = ("a", "b", "c")
+    store = VectorStore(tmp_path, names, compact_every=3)
+    for i in range(5):
+        store.append([1.0, float(i), 0.0], {"n": i})
+    assert (tmp_path / "vector_index" / "vectors.npy").exists()
+
+    reopened = VectorStore(tmp_path, names)
+    assert len(reopened) == 5
+    best = reopened.most_similar([1.0, 4.0, 0.0], k=2)
+    assert [r["n"] for r in best] == [4, 3]
+    assert "vector" not in best[0]
+
+    # Tập đặc trưng thay đổi -> bỏ snapshot, vector sai số chiều bị bỏ qua.
+    assert len(VectorStore(tmp_path, ("a", "b"))) == 0
+
+
+def test_vectorize_snapshot_normalizes_features() -> None:
+    payload = {
+        "tick": {"bid": 2000.0},
+        "volatility": {"ATR": {"M5": 2.0}},
+        "level_map": {"nearest_above": [{"price": 2004.0}], "nearest_below": []},
+        "ict_patterns": {"fvgs_h1": [{"top": 1999.0, "bottom": 1998.0}]},
+        "levels": {"prev_day": {"high": 2100.0, "low": 1990.0}},
+        "position_in_day_range": 0.75,
+        "killzone_active": "london",
+        "structure_alignment": {"score": 0.5, "timeframes": {"H1": {"bias": 1.0}}},
+    }
+    vec = vectorizer.vectorize_snapshot(payload)
+    features = dict(zip(vectorizer.FEATURE_NAMES, vec.tolist()))
+
+    assert vec.shape == (vectorizer.DIM,)
+    assert features["level_above_atr"] == pytest.approx(0.4)
+    assert features["level_below_atr"] == 1.0
+    assert features["fvg_h1_below_atr"] == pytest.approx(0.1)
+    assert features["pdh_atr"] == 1.0 and features["pdl_atr"] == 1.0
+    assert features["day_range_position"] == 0.5
+    assert features["session_london"] == 1.0 and features["session_asia"] == 0.0
+    assert features["bias_h1"] == 1.0 and features["bias_score"] == 0.5
+    assert vectorizer.vectorize_snapshot({"tick": {"bid": 2000.0}}) is None
+
+
+def test_recent_snapshots_of_same_symbol_are_excluded(tmp_path) -> None:
+    store = VectorStore(tmp_path, ("a", "b"))
+    store.append([1.0, 0.0], {"symbol": "XAUUSD", "n": 0})
+    store.append([1.0, 0.0], {"symbol": "EURUSD", "n": 1})
+    store.append([1.0, 0.1], {"symbol": "XAUUSD", "n": 2})
+
+    assert len(store.most_similar([1.0, 0.0], k=5)) == 3
+    kept = store.most_similar([1.0, 0.0], k=5, symbol="XAUUSD", exclude_recent_sec=3600)
+    assert [r["n"] for r in kept] == [1]
+    later = store.most_similar([1.0, 0.0], k=5, symbol="XAUUSD", exclude_recent_sec=3600, now=time.time() + 7200)
+    assert len(later) == 3
+
+
+def test_store_builds_ivf_once_rows_pass_threshold(tmp_path) -> None:
+    rng = np.random.default_rng(2)
+    store = VectorStore(tmp_path, ("a", "b", "c"), compact_every=1000, ivf_min_rows=8)
+    for vec in rng.normal(size=(7, 3)):
+        store.append(vec.tolist())
+    assert not store.index.has_ivf
+
+    store.append([1.0, 2.0, 3.0], {"n": "last"})
+    assert store.index.has_ivf
+    assert store.most_similar([1.0, 2.0, 3.0], k=1, n_probe=100)[0]["n"] == "last"
+    assert VectorStore(tmp_path, ("a", "b", "c"), ivf_min_rows=8).index.has_ivf
+
+
+def test_similar_setups_carry_backtested_proposal_outcome(tmp_path, monkeypatch) -> None:
+    store = VectorStore(tmp_path, ("x",))
+    monkeypatch.setattr(similarity_index, "get_store", lambda *a, **kw: store)
+    monkeypatch.setattr(vectorizer, "vectorize_snapshot", lambda data: np.array([1.0], dtype=np.float32))
+    store.append([1.0], {"symbol": "EURUSD", "n": 0})
+    snap_time = datetime.fromisoformat(store.record(0)["timestamp_utc"])
+    proposal = {"timestamp_utc": (snap_time + timedelta(minutes=2)).isoformat(), "symbol": "EURUSD",
+                "direction": "BUY", "entry": 1.1000, "sl": 1.0990, "tp1": 1.1010}
+    # Đề xuất gần hơn nhưng khác symbol hoặc không ghi symbol thì không được ghép.
+    other = {"timestamp_utc": (snap_time + timedelta(minutes=1)).isoformat(), "symbol": "XAUUSD",
+             "direction": "SELL", "entry": 2000.0, "sl": 2010.0, "tp1": 1990.0}
+    unknown = dict(other, symbol=None, timestamp_utc=snap_time.isoformat())
+    lines = [json.dumps(r) for r in (unknown, other, proposal)]
+    (tmp_path / "proposed_trades.jsonl").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    t0 = backtester._as_epoch(proposal["timestamp_utc"]) // 60 * 60
+    bars = np.zeros(5, dtype=[("time", "<i8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8")])
+    bars["time"] = t0 + 60 * np.arange(5)
+    bars["high"], bars["low"], bars["close"] = [1.1002, 1.1012, 1.1012, 1.1012, 1.1012], 1.0995, 1.1005
+    monkeypatch.setattr(backtester, "load_bars_for", lambda symbol, props, params: bars)
+
+    found = context_builder.find_similar_setups(tmp_path, {"symbol": "EURUSD"}, record=False, exclude_recent_sec=0)
+    assert found[0]["n"] == 0
+    assert found[0]["outcome"]["direction"] == "BUY"
+    assert found[0]["outcome"]["status"] == backtester.STATUS_FILLED
+    assert found[0]["outcome"]["r_multiple"] > 0
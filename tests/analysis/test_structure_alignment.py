@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import numpy as np
+
+from APP.analysis import ict_scanner, structure_alignment
+from APP.analysis.structure_alignment import compute_alignment
+from tests.synthetic import generate
+
+
+def _payload(mss: str, zone: str, ema50: float, ema200: float) -> dict:
+    patterns = {}
+    for tf in ("h1", "m15", "m5", "m1"):
+        patterns[f"mss_{tf}"] = {"type": mss, "event": "BOS", "price_level": 1.0, "break_bar_index": 1}
+        patterns[f"premium_discount_{tf}"] = {"status": zone}
+    ema = {tf: {"ema50": ema50, "ema200": ema200} for tf in ("H1", "M15", "M5", "M1")}
+    return {"ict_patterns": patterns, "trend_refs": {"EMA": ema}, "tick": {"bid": 2000.0}}
+
+
+def test_fully_aligned_bullish_snapshot() -> None:
+    result = compute_alignment(_payload("Bullish", "Discount", 1990.0, 1980.0))
+
+    assert result.score == 1.0 and result.agreement == 1.0
+    assert result.direction == "Bullish"
+    assert result.opposes("SELL") and not result.opposes("BUY")
+
+
+def test_mixed_components_and_missing_data() -> None:
+    payload = _payload("Bearish", "Discount", 2010.0, 1990.0)
+    payload["ict_patterns"]["mss_m1"] = None
+
+    result = compute_alignment(payload)
+    h1 = result.to_dict()["timeframes"]["H1"]
+
+    assert h1 == {"mss": -1.0, "zone": 1.0, "ema": 0.0, "bias": 0.0}
+    assert result.to_dict()["timeframes"]["M1"]["mss"] is None
+    assert result.direction == "Neutral"
+    assert not result.opposes("BUY") and not result.opposes("SELL")
+    assert compute_alignment({}).score is None
+
+
+def test_confluence_series_matches_scalar_combine() -> None:
+    rng = np.random.default_rng(3)
+    biases = {tf: rng.choice([-1.0, -0.5, 0.0, 0.5, 1.0, np.nan], 50) for tf in structure_alignment.TIMEFRAMES}
+
+    score, agreement = structure_alignment.confluence_series(biases)
+
+    for i in range(50):
+        row = {tf: (None if np.isnan(b[i]) else float(b[i])) for tf, b in biases.items()}
+        exp_score, exp_agreement = structure_alignment.combine(row)
+        if exp_score is None:
+            assert np.isnan(score[i])
+        else:
+            assert np.isclose(score[i], exp_score) and np.isclose(agreement[i], exp_agreement)
+
+
+def test_historical_components_cover_every_bar() -> None:
+    rates = generate("trending", 3000, seed=2)
+    for i, r in enumerate(rates):
+        r["time"] = i * 60
+    bars = np.zeros(len(rates), dtype=ict_scanner.BAR_DTYPE)
+    for name in ("open", "high", "low", "close"):
+        bars[name] = [r[name] for r in rates]
+    bars["time"] = [r["time"] for r in rates]
+
+    comps = structure_alignment.historical_components(bars["close"], ict_scanner.detect_events(bars))
+    bias = structure_alignment.bias_matrix(comps)
+
+    assert all(len(v) == len(rates) for v in comps.values())
+    assert np.nanmean(bias[500:]) > 0  # chuỗi tăng phải nghiêng Bullish
+    aligned = structure_alignment.align_to(np.array([30, 90, 10_000_000]), bars["time"], bias)
+    assert np.isnan(aligned[0]) or aligned[0] == bias[0]
+    assert aligned[-1] == bias[-1] or (np.isnan(aligned[-1]) and np.isnan(bias[-1]))
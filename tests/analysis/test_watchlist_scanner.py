@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import time
+from dataclasses import replace
+from datetime import datetime, timezone
+
+import numpy as np
+
+from APP.analysis import ict_scanner, watchlist_scanner
+from APP.persistence import bar_archive
+from APP.ui.state.config_state import UiConfigState
+
+
+def _bars(closes, t0: int = 1_700_000_000, period: int = 300) -> np.ndarray:
+    c = np.asarray(closes, dtype=float)
+    o = np.concatenate([c[:1], c[:-1]])
+    arr = np.zeros(c.size, dtype=ict_scanner.BAR_DTYPE)
+    arr["time"] = t0 + np.arange(c.size) * period
+    arr["open"], arr["close"] = o, c
+    arr["high"] = np.where(c > o, c + 0.0002, o + 0.0001)
+    arr["low"] = np.where(c < o, c - 0.0002, o - 0.0001)
+    return arr
+
+
+def _uptrend_then_break() -> np.ndarray:
+    closes, p = [1.1], 1.1
+    for _ in range(5):
+        up = np.linspace(p, p + 0.0030, 8)[1:]
+        down = np.linspace(up[-1], up[-1] - 0.0015, 6)[1:]
+        closes += [*up, *down]
+        p = down[-1]
+    closes += list(np.linspace(p, p - 0.0060, 5)[1:])
+    return _bars(closes)
+
+
+def _flat(n: int = 60) -> np.ndarray:
+    return _bars([1.1, 1.1002] * (n // 2))
+
+
+def _cfg(**watchlist):
+    cfg = UiConfigState.from_workspace_config({"mt5": {"symbol": "EURUSD"}}).to_run_config()
+    return replace(cfg, watchlist=replace(cfg.watchlist, **watchlist))
+
+
+def test_fresh_choch_scores_in_its_direction() -> None:
+    score = watchlist_scanner.score_bars("EURUSD", _uptrend_then_break(), fresh_mss_bars=12)
+    assert score.direction == -1
+    assert score.components["mss"] == 2.5
+    assert score.reasons[0].startswith("CHoCH giảm")
+
+    stale = watchlist_scanner.score_bars("EURUSD", _uptrend_then_break(), fresh_mss_bars=1)
+    assert "mss" not in stale.components
+
+
+def test_price_retracing_into_unfilled_fvg_counts() -> None:
+    bars = _bars([1.1, 1.1002] * 6 + [1.1010, 1.1030, 1.1050, 1.1060, 1.1052, 1.1045, 1.1026])
+    score = watchlist_scanner.score_bars("EURUSD", bars, killzone="london")
+    assert score.direction == 1
+    assert score.components == {"fvg": 1.0, "killzone": 1.0}
+    assert score.score == 2.0 and score.reasons[-1] == "Killzone london"
+
+
+def test_gate_skips_quiet_symbol_and_points_at_active_ones() -> None:
+    feeds = {"EURUSD": _flat(), "GBPUSD": _uptrend_then_break(), "USDJPY": None}
+    loader = lambda symbol, timeframe, count: feeds[symbol]  # noqa: E731
+    now = datetime(2024, 3, 5, 12, 0, tzinfo=timezone.utc)
+
+    cfg = _cfg(enabled=True, symbols=("GBPUSD", "USDJPY"), min_score=2.0)
+    run, reason, scores = watchlist_scanner.should_analyze(cfg, load_bars=loader, now=now)
+    assert run is False
+    assert [s.symbol for s in scores][0] == "GBPUSD"
+    assert "GBPUSD" in reason and "USDJPY" not in reason
+
+    assert watchlist_scanner.should_analyze(replace(cfg, mt5=replace(cfg.mt5, symbol="GBPUSD")), load_bars=loader, now=now)[0]
+    assert watchlist_scanner.should_analyze(_cfg(enabled=False), load_bars=loader) == (True, "", [])
+
+
+def test_archive_fallback_scans_many_symbols_quickly(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(bar_archive, "default_root", lambda: tmp_path)
+    bars = _uptrend_then_break()
+    rates = np.concatenate([_flat(400), bars])
+    rates["time"] = 1_700_000_000 + 300 * np.arange(rates.size)
+    symbols = [f"SYM{i:02d}" for i in range(40)]
+    for symbol in symbols:
+        bar_archive.BarArchive(symbol, "M5").append(rates)
+
+    tail = bar_archive.BarArchive("SYM00", "M5").tail(65)
+    assert np.array_equal(tail["close"], bars["close"])
+
+    cfg = _cfg(enabled=True, symbols=tuple(symbols), lookback_bars=300)
+    t0 = time.perf_counter()
+    scores = watchlist_scanner.scan_watchlist(cfg, symbols)
+    assert time.perf_counter() - t0 < 1.0
+    assert len(scores) == 40 and all(s.bars == 300 and s.direction == -1 for s in scores)
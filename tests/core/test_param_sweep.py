@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from APP.analysis import backtester
+from APP.core.trading import param_sweep
+from APP.services import mt5_service
+from APP.ui.state.config_state import UiConfigState
+
+T0 = datetime(2024, 3, 5, 14, 30, tzinfo=timezone.utc)
+
+
+def _cfg():
+    return UiConfigState.from_workspace_config({"mt5": {"symbol": "EURUSD"}}).to_run_config()
+
+
+def _mt5_data(spread_points: float = 15) -> dict:
+    return {
+        "symbol": "EURUSD",
+        "broker_time": "2024-03-05T16:30:00",
+        "info": {
+            "digits": 5,
+            "point": 0.00001,
+            "spread_current": spread_points,
+            "trade_tick_value": 1.0,
+            "trade_tick_size": 0.00001,
+            "volume_step": 0.01,
+            "volume_min": 0.01,
+            "volume_max": 100.0,
+        },
+        "account": {"balance": 10_000.0},
+        "tick": {"bid": 1.1, "ask": 1.10015},
+        "volatility": {"ATR": {"M5": 0.0008}},
+        "adr": {"d20": 0.008},
+        "killzone_active": "london",
+        "key_levels_nearby": [{"name": "PDH", "price": 1.102, "relation": "ABOVE", "distance_pips": 20.0}],
+    }
+
+
+def _snapshot(**kw) -> param_sweep.ReplaySnapshot:
+    values = {"time_utc": T0, "mt5_data": _mt5_data()}
+    values.update(kw)
+    return param_sweep.ReplaySnapshot(**values)
+
+
+def test_spread_threshold_sweep_uses_real_conditions() -> None:
+    snaps = [_snapshot(mt5_data=_mt5_data(s)) for s in (10, 25, 40)]
+    combos = param_sweep.grid({"no_trade.spread_max_pips": [1.0, 3.0, 5.0]})
+
+    rows = param_sweep.run_sweep(_cfg(), snaps, combos, workers=1)
+
+    assert [r["blocked"] for r in rows] == [2, 1, 0]
+    assert rows[0]["blocked_by"] == {"spread": 2}
+    assert all(r["runs"] == 3 for r in rows)
+
+
+def test_news_window_replays_against_snapshot_time() -> None:
+    event = {"title": "CPI", "country": "United States", "when_utc": T0 + timedelta(minutes=20)}
+    snaps = [_snapshot(news_events=(event,))]
+    combos = param_sweep.grid({"news.block_before_min": [15, 30]})
+
+    rows = param_sweep.run_sweep(_cfg(), snaps, combos, workers=1)
+
+    assert [r["blocked_by"].get("news_blackout", 0) for r in rows] == [0, 1]
+
+
+def test_recorded_snapshots_link_proposals_and_apply_rr_and_lots(tmp_path) -> None:
+    event = {"title": "CPI", "country": "United States", "when_utc": T0 + timedelta(hours=3), "when_local": T0}
+    param_sweep.record_snapshot(tmp_path, {**_mt5_data(), "evaluations": {"x": 1}}, [event], now_utc=T0)
+    param_sweep.record_snapshot(tmp_path, {**_mt5_data(), "symbol": "XAUUSD"}, now_utc=T0)
+    trade = {
+        "timestamp_utc": (T0 + timedelta(minutes=5)).isoformat(),
+        "symbol": "EURUSD",
+        "setup": {"direction": "long", "entry": 1.1, "sl": 1.099, "tp1": 1.101, "tp2": 1.1025, "risk_multiplier": 1.0},
+    }
+    # Đề xuất của symbol khác (sớm hơn) không được gắn vào snapshot EURUSD.
+    other = {**trade, "timestamp_utc": (T0 + timedelta(minutes=2)).isoformat(), "symbol": "XAUUSD",
+             "setup": {"direction": "short", "entry": 2000.0, "sl": 2010.0, "tp1": 1990.0}}
+    lines = "".join(json.dumps(t) + "\n" for t in (other, trade))
+    (tmp_path / "trade_log_20240305.jsonl").write_text(lines, encoding="utf-8")
+
+    assert [s.proposal.symbol for s in param_sweep.load_snapshots(tmp_path)] == ["EURUSD", "XAUUSD"]
+    (snap,) = param_sweep.load_snapshots(tmp_path, "EURUSD")
+    assert "evaluations" not in snap.mt5_data
+    assert snap.news_events[0]["when_utc"] == T0 + timedelta(hours=3)
+    assert snap.proposal is not None and snap.proposal.grade == "A+" and snap.proposal.entry == 1.1
+
+    rows = param_sweep.run_sweep(
+        _cfg(), [snap], param_sweep.grid({"auto_trade.min_rr_tp2": [2.0, 3.0]}), workers=1
+    )
+    assert [(r["trades"], r["rr_rejected"]) for r in rows] == [(1, 0), (0, 1)]
+    assert rows[0]["avg_lots"] == pytest.approx(0.5)
+
+
+def test_space_parsing_and_random_sample() -> None:
+    cfg = _cfg()
+    space = param_sweep.parse_space(
+        ["no_trade.spread_max_pips=1,2.5", "auto_trade.split_tp_ratio=30,50,70", "no_trade.allow_session_asia=true,false"],
+        cfg,
+    )
+    assert space["no_trade.spread_max_pips"] == [1.0, 2.5]
+    assert space["auto_trade.split_tp_ratio"] == [30, 50, 70]
+    assert space["no_trade.allow_session_asia"] == [True, False]
+
+    full = param_sweep.grid(space)
+    sample = param_sweep.random_sample(space, 5, seed=3)
+    assert len(full) == 12 and len(sample) == 5
+    assert all(combo in full for combo in sample)
+    assert len({tuple(c.values()) for c in sample}) == 5
+
+    with pytest.raises(ValueError):
+        param_sweep.parse_space(["mt5.symbol=XAUUSD"], cfg)
+
+
+def test_process_pool_matches_in_process() -> None:
+    snaps = [_snapshot(mt5_data=_mt5_data(s)) for s in (10, 25, 40)]
+    combos = param_sweep.grid({"no_trade.spread_max_pips": [1.0, 3.0], "no_trade.min_atr_m5_pips": [3.0, 9.0]})
+
+    assert param_sweep.run_sweep(_cfg(), snaps, combos, workers=2) == param_sweep.run_sweep(
+        _cfg(), snaps, combos, workers=1
+    )
+
+
+def test_snapshot_recording_is_opt_in_and_keeps_only_recent_files(tmp_path) -> None:
+    assert _cfg().persistence.record_replay_snapshots is False
+
+    for day in range(4):
+        param_sweep.record_snapshot(tmp_path, _mt5_data(), now_utc=T0 + timedelta(days=day), retention_files=2)
+    files = sorted(p.name for p in (tmp_path / param_sweep.SNAPSHOT_DIRNAME).glob("snapshots_*.jsonl"))
+    assert files == ["snapshots_20240307.jsonl", "snapshots_20240308.jsonl"]
+
+
+def test_broker_offset_is_resolved_in_parent_for_pool_workers(monkeypatch) -> None:
+    parent = os.getpid()
+    # MT5 chỉ khả dụng ở tiến trình cha.
+    monkeypatch.setattr(mt5_service, "broker_utc_offset_sec", lambda symbol: 7200 if os.getpid() == parent else None)
+    t0 = int(T0.timestamp())
+    proposal = backtester.Proposal(
+        time=t0, side=1, entry=1.1, sl=1.099, tp1=1.101, tp2=1.1025, grade="A+", symbol="EURUSD"
+    )
+    bars = np.zeros(200, dtype=[("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8")])
+    bars[:60] = [(0, 1.1, 1.1002, 1.0985, 1.099)] * 60  # giờ broker = UTC: khớp rồi chạm SL
+    bars[60:120] = [(0, 1.105, 1.106, 1.104, 1.105)] * 60
+    bars[120:] = [(0, 1.1, 1.103, 1.0998, 1.1025)] * 80  # giờ broker = UTC+2: khớp rồi chạm TP2
+    bars["time"] = t0 + 60 * np.arange(200)
+    combos = param_sweep.grid({"auto_trade.min_rr_tp2": [2.0, 2.2]})
+
+    rows = param_sweep.run_sweep(_cfg(), [_snapshot(proposal=proposal)], combos, workers=2, bars={"EURUSD": bars})
+
+    assert [r["traded_filled"] for r in rows] == [1, 1]
+    assert all(r["traded_total_r"] > 0 for r in rows)
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from APP.analysis import backtester
+from APP.core import replay
+from APP.core.trading.param_sweep import ReplaySnapshot
+from APP.ui.state.config_state import UiConfigState
+
+T0 = datetime(2024, 3, 5, 14, 30, tzinfo=timezone.utc)
+
+
+def _cfg():
+    return UiConfigState.from_workspace_config({"mt5": {"symbol": "EURUSD"}}).to_run_config()
+
+
+def _mt5_data() -> dict:
+    return {
+        "symbol": "EURUSD",
+        "broker_time": "2024-03-05T16:30:00",
+        "info": {
+            "digits": 5,
+            "point": 0.00001,
+            "spread_current": 12,
+            "trade_tick_value": 1.0,
+            "trade_tick_size": 0.00001,
+            "volume_step": 0.01,
+            "volume_min": 0.01,
+            "volume_max": 100.0,
+        },
+        "account": {"balance": 10_000.0},
+        "tick": {"bid": 1.1, "ask": 1.10012},
+        "volatility": {"ATR": {"M5": 0.0008}},
+        "adr": {"d20": 0.008},
+        "killzone_active": "london",
+    }
+
+
+def _snapshot(**kw) -> ReplaySnapshot:
+    proposal = backtester.Proposal(
+        time=int(T0.timestamp()), side=1, entry=1.1, sl=1.099, tp1=1.101, tp2=1.1025, grade="A+"
+    )
+    values = {"time_utc": T0, "mt5_data": _mt5_data(), "proposal": proposal}
+    values.update(kw)
+    return ReplaySnapshot(**values)
+
+
+def test_full_session_runs_offline_and_sends_orders(tmp_path) -> None:
+    model = replay.StubGeminiModel(chunk_chars=16)
+    with replay.ReplayHarness(_cfg(), [_snapshot()], tmp_path, model=model, overrides={"auto_trade.cooldown_min": 0}) as harness:
+        results = harness.run(2)
+        requests = harness.order_backend.requests
+
+    first = results[0]
+    assert first.status == "completed" and not first.early_exit
+    assert set(first.timings) == set(replay.STAGES)
+    assert first.orders == 2 and len(requests) == 4
+    assert {r["comment"] for r in requests} == {"AI Trade TP1", "AI Trade TP2"}
+    assert requests[0]["sl"] == 1.099 and requests[0]["volume"] == pytest.approx(0.25)
+
+    # GĐ 3: lần đầu upload, lần sau lấy từ cache của FakeFileStore.
+    assert harness.file_store.uploads == len(replay.DEFAULT_IMAGE_NAMES)
+    assert model.calls[0]["media"] == len(replay.DEFAULT_IMAGE_NAMES)
+
+    reports_dir = tmp_path / "EURUSD" / "Reports"
+    assert len(list(reports_dir.glob("report_*.md"))) >= 1
+    assert list(reports_dir.glob("trade_log_*.jsonl"))
+
+
+def test_news_blackout_at_snapshot_time_exits_early(tmp_path) -> None:
+    event = {"title": "CPI", "country": "United States", "when_utc": T0 + timedelta(minutes=5)}
+    snap = _snapshot(news_events=(event,))
+    with replay.ReplayHarness(_cfg(), [snap], tmp_path) as harness:
+        (result,) = harness.run(1)
+
+    assert result.early_exit and result.orders == 0
+    assert "stage_4" not in result.timings and "stage_6" in result.timings
+    assert harness.model.calls == []
+
+
+def test_canned_reports_rotate_and_summary_covers_stages(tmp_path) -> None:
+    no_setup = replay.canned_report(_snapshot(proposal=None))
+    model = replay.StubGeminiModel([no_setup, replay.canned_report(_snapshot())], chunk_chars=1000)
+    with replay.ReplayHarness(_cfg(), [_snapshot()], tmp_path, model=model, overrides={"auto_trade.cooldown_min": 0}) as harness:
+        results = harness.run(4)
+
+    assert [r.orders for r in results] == [0, 2, 0, 2]
+    summary = replay.summarize(results)
+    assert summary["sessions"] == 4 and summary["orders"] == 4
+    assert set(summary["stages"]) == {*replay.STAGES, "total"}
+    assert summary["stages"]["total"]["p95_ms"] >= summary["stages"]["total"]["p50_ms"]
+    assert "stage_4" in replay.format_summary(summary)
+
+
+def test_replay_never_reaches_the_real_sdk(tmp_path, monkeypatch) -> None:
+    from APP.services import gemini_service, prompt_cache
+
+    def tripwire(*args, **kwargs):
+        raise AssertionError("Replay đã gọi SDK Gemini thật.")
+
+    monkeypatch.setattr(gemini_service, "GEMINI_AVAILABLE", True)
+    for target, attr in (
+        (gemini_service, "configure"),
+        (gemini_service, "list_models"),
+        (gemini_service, "GenerativeModel"),
+        (gemini_service, "get_cached_model"),
+        (prompt_cache, "CachedContent"),
+    ):
+        monkeypatch.setattr(target, attr, tripwire)
+
+    cfg = _cfg()
+    cfg = replace(
+        cfg,
+        api=replace(
+            cfg.api, prompt_cache_enabled=True, response_cache_enabled=True, hedge_enabled=True, async_stream=True
+        ),
+    )
+    with replay.ReplayHarness(cfg, [_snapshot()], tmp_path, overrides={"auto_trade.cooldown_min": 0}) as harness:
+        (result,) = harness.run(1)
+
+    api = harness.cfg.api
+    assert not (api.prompt_cache_enabled or api.response_cache_enabled or api.hedge_enabled or api.async_stream)
+    assert result.status == "completed" and result.errors == []
+    assert result.orders == 2 and len(harness.model.calls) == 1
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from APP.core.stream_accumulator import StreamAccumulator
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _accumulator(clock, events):
+    return StreamAccumulator(
+        on_replace=lambda text: events.append(("replace", text)),
+        on_append=lambda delta: events.append(("append", delta)),
+        max_hz=10,
+        clock=clock,
+    )
+
+
+def test_deltas_are_coalesced_to_frame_rate_and_flushed() -> None:
+    clock, events = _Clock(), []
+    acc = _accumulator(clock, events)
+
+    acc.add("A")  # lần đầu: thay nội dung chờ
+    for ch in "bcd":
+        clock.now += 0.02
+        acc.add(ch)
+    clock.now += 0.05  # 0.11s kể từ lần phát trước
+    acc.add("e")
+    acc.add("f")
+    acc.flush()
+
+    assert events == [("replace", "A"), ("append", "bcde"), ("append", "f")]
+    assert acc.text == "Abcdef" and acc.emits == 3
+
+
+def test_ui_text_equals_full_text_for_many_chunks() -> None:
+    clock, events = _Clock(), []
+    acc = _accumulator(clock, events)
+    chunks = [f"dòng {i}\n" for i in range(500)]
+    for i, chunk in enumerate(chunks):
+        clock.now = i * 0.01
+        acc.add(chunk)
+        acc.add("")  # chunk rỗng bị bỏ qua
+    acc.flush()
+    acc.flush()  # không còn gì để phát
+
+    ui = ""
+    for kind, text in events:
+        ui = text if kind == "replace" else ui + text
+    assert ui == acc.text == "".join(chunks)
+    assert len(events) <= 500 * 0.01 * 10 + 2
+
+
+def test_text_is_empty_without_chunks() -> None:
+    events: list = []
+    acc = _accumulator(_Clock(), events)
+    acc.flush()
+    assert acc.text == "" and events == []
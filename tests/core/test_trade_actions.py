@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import queue
+from dataclasses import replace
+from types import SimpleNamespace
+
+from APP.analysis import report_parser, structure_alignment
+from APP.core.trading import actions, trade_ledger
+from APP.core.trading.trade_ledger import TradeLedger
+from APP.services import mt5_service
+from APP.ui.state.config_state import UiConfigState
+
+
+def test_structure_veto_is_opt_in_and_independent_of_strict_bias(tmp_path, monkeypatch) -> None:
+    cfg = UiConfigState.from_workspace_config({"mt5": {"symbol": "EURUSD"}}).to_run_config()
+    cfg = replace(cfg, auto_trade=replace(cfg.auto_trade, enabled=True))
+    assert cfg.auto_trade.strict_bias and not cfg.auto_trade.require_structure_alignment
+
+    plan = {"direction": "BUY", "entry": 1.1, "sl": 1.099, "risk_multiplier": 1.0}
+    monkeypatch.setattr(actions, "mt5", SimpleNamespace())
+    monkeypatch.setattr(report_parser, "extract_json_block_prefer", lambda text: {"setup_grade": "A+", "proposed_plan": plan})
+    monkeypatch.setattr(
+        structure_alignment, "compute_alignment", lambda ctx: structure_alignment.AlignmentResult((), -1.0, 1.0)
+    )
+    monkeypatch.setattr(trade_ledger, "get_ledger", lambda **kw: TradeLedger(tmp_path / "ledger.jsonl"))
+    sized = []
+    monkeypatch.setattr(mt5_service, "calculate_lots", lambda *args: sized.append(args) or 0)
+    app = SimpleNamespace(ui_queue=queue.Queue(), ui_status=lambda message: None)
+
+    # Mặc định: cấu trúc ngược hướng không chặn lệnh (tới bước tính khối lượng).
+    assert actions.execute_trade_action(app, "", {"symbol": "EURUSD"}, cfg) is False
+    assert len(sized) == 1
+
+    vetoed = replace(cfg, auto_trade=replace(cfg.auto_trade, require_structure_alignment=True))
+    assert actions.execute_trade_action(app, "", {"symbol": "EURUSD"}, vetoed) is False
+    assert len(sized) == 1
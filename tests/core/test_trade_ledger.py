@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import json
+from dataclasses import replace
+from datetime import datetime, timezone
+
+from APP.core.trading import conditions, trade_ledger
+from APP.core.trading.trade_ledger import TradeLedger
+from APP.ui.state.config_state import UiConfigState
+
+# 2024-03-05 16:00 UTC = 23:00 giờ Việt Nam.
+T0 = datetime(2024, 3, 5, 16, 0, tzinfo=timezone.utc).timestamp()
+
+
+def _ledger(tmp_path, now: list[float]) -> TradeLedger:
+    return TradeLedger(tmp_path / "ledger.jsonl", timezone_name="Asia/Ho_Chi_Minh", clock=lambda: now[0])
+
+
+def test_cooldown_and_daily_limit_follow_local_day(tmp_path) -> None:
+    now = [T0]
+    ledger = _ledger(tmp_path, now)
+    ledger.record_entry("EURUSD", tickets=[1, 2], direction="buy")
+
+    status = ledger.status("EURUSD", cooldown_min=10, max_trades_per_day=1)
+    assert status.trades_today == 1 and status.limit_reached and status.blocked
+    assert status.cooldown_remaining_sec == 600
+    assert ledger.status("GBPUSD", 10, 1).blocked is False
+
+    # Sau 11 phút hết cooldown; 01:11 giờ VN đã là ngày mới nên bộ đếm về 0.
+    now[0] = T0 + 11 * 60
+    assert ledger.status("EURUSD", 10, 1).cooldown_remaining_sec == 0
+    now[0] = T0 + 2 * 3600 + 11 * 60
+    assert ledger.trades_today("EURUSD") == 0
+    assert ledger.status("EURUSD", 10, 1).blocked is False
+
+
+def test_reconcile_records_loss_and_restarts_cooldown(tmp_path) -> None:
+    now = [T0]
+    ledger = _ledger(tmp_path, now)
+    ledger.record_entry("EURUSD", tickets=[7])
+
+    now[0] = T0 + 30 * 60
+    assert ledger.reconcile("EURUSD", [{"ticket": 7, "profit": -12.5}]) == 0
+    assert ledger.open_tickets("EURUSD") == [7]
+
+    now[0] = T0 + 45 * 60
+    assert ledger.reconcile("EURUSD", []) == 1
+    status = ledger.status("EURUSD", cooldown_min=10)
+    assert ledger.open_tickets() == []
+    assert status.last_loss == now[0] and status.cooldown_remaining_sec == 600
+
+
+def test_reconcile_uses_realized_profit_from_deal_history(tmp_path) -> None:
+    now = [T0]
+    ledger = _ledger(tmp_path, now)
+    ledger.record_entry("EURUSD", tickets=[7, 8])
+    ledger.reconcile("EURUSD", [{"ticket": 7, "profit": 3.0}, {"ticket": 8, "profit": -2.0}])
+
+    # Lần thấy cuối đang lời nhưng đóng ở SL (7) và ngược lại (8); ticket 8 không tra được thì dùng profit thả nổi.
+    now[0] = T0 + 60
+    realized = {7: -10.0}
+    assert ledger.reconcile("EURUSD", [], realized_profit=realized.get) == 2
+    assert ledger.status("EURUSD", 0).last_loss == now[0]
+    exits = [json.loads(line) for line in ledger.path.read_text(encoding="utf-8").splitlines()][1:]
+    assert {e["ticket"]: e["profit"] for e in exits} == {7: -10.0, 8: -2.0}
+
+
+def test_state_is_rebuilt_from_journal_and_old_events_pruned(tmp_path) -> None:
+    now = [T0 - 20 * 86400]
+    ledger = _ledger(tmp_path, now)
+    ledger.record_entry("EURUSD", tickets=[1])
+    ledger.record_exit("EURUSD", ticket=1, profit=5.0)
+    ledger.record_entry("EURUSD", tickets=[2])  # vẫn mở -> phải giữ lại
+    now[0] = T0
+    ledger.record_entry("EURUSD", tickets=[3])
+    ledger.record_exit("EURUSD", ticket=3, profit=-1.0)
+    with open(ledger.path, "a", encoding="utf-8") as fh:
+        fh.write("{broken\n")
+
+    rebuilt = _ledger(tmp_path, now)
+    assert rebuilt.trades_today("EURUSD") == 1
+    assert rebuilt.open_tickets("EURUSD") == [2]
+    assert rebuilt.status("EURUSD", 10).last_loss == T0
+
+    lines = [json.loads(line) for line in ledger.path.read_text(encoding="utf-8").splitlines()]
+    assert [e.get("tickets") or e.get("ticket") for e in lines] == [[2], [3], 3]
+
+
+def test_no_trade_check_warns_during_cooldown_without_blocking_session(tmp_path) -> None:
+    cfg = UiConfigState.from_workspace_config({"mt5": {"symbol": "EURUSD"}}).to_run_config()
+    cfg = replace(cfg, auto_trade=replace(cfg.auto_trade, enabled=True, cooldown_min=15))
+    ledger = _ledger(tmp_path, [T0])
+    ledger.record_entry("EURUSD", tickets=[1])
+
+    def trade_limit_ids(at: float) -> list[str]:
+        result = conditions.check_no_trade_conditions(
+            None, cfg, None, now_utc=datetime.fromtimestamp(at, timezone.utc), ledger=ledger
+        )
+        # Cooldown chỉ chặn lệnh mới (trong `execute_trade_action`), phiên vẫn chạy để quản lý lệnh mở.
+        assert all(v.condition_id != "trade_limits" for v in result.blocking)
+        return [v.condition_id for v in result.warnings if v.condition_id == "trade_limits"]
+
+    assert trade_limit_ids(T0 + 5 * 60) == ["trade_limits"]
+    assert trade_limit_ids(T0 + 16 * 60) == []
+    assert trade_ledger.get_ledger(tmp_path / "x.jsonl") is trade_ledger.get_ledger(tmp_path / "x.jsonl")
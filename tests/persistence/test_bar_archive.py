@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from APP.analysis import backtester
+from APP.persistence import bar_archive
+from APP.persistence.bar_archive import BarArchive
+from APP.services import mt5_service
+
+# Thứ Ba 2024-01-30 23:00 (giờ broker coi như UTC).
+T0 = int(datetime(2024, 1, 30, 23, 0, tzinfo=timezone.utc).timestamp())
+
+
+def _rates(start: int, n: int, period: int = 60) -> np.ndarray:
+    dtype = [("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+             ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8")]
+    arr = np.zeros(n, dtype=dtype)
+    arr["time"] = start + np.arange(n) * period
+    arr["open"] = 1.1 + np.arange(n) * 1e-5
+    arr["high"] = arr["open"] + 2e-4
+    arr["low"] = arr["open"] - 2e-4
+    arr["close"] = arr["open"] + 1e-5
+    arr["tick_volume"] = 10
+    arr["spread"] = 12
+    return arr
+
+
+def test_append_is_idempotent_and_range_reads_span_partitions(tmp_path, monkeypatch) -> None:
+    archive = BarArchive("EURUSD", "M1", root=tmp_path)
+    rates = _rates(T0, 3 * 24 * 60)  # vắt qua ranh giới tháng 1 -> 2
+
+    # Nến cuối chưa đóng bị bỏ qua; ghi lại cùng dữ liệu không thêm gì.
+    assert archive.append(rates, closed_before=int(rates["time"][-1]) + 30) == len(rates) - 1
+    assert archive.append(rates[:-1]) == 0
+    assert archive.append(rates) == 1
+    assert archive.partitions() == [202401, 202402]
+    assert len(archive) == len(rates) and archive.last_time() == rates["time"][-1]
+
+    start, end = int(rates["time"][50]), int(rates["time"][4000])
+    window = archive.read(start, end)
+    assert window.dtype == bar_archive.ARCHIVE_DTYPE
+    assert np.array_equal(window["time"], rates["time"][50:4000])
+    assert np.array_equal(window["close"], rates["close"][50:4000])
+    assert window["spread"][0] == 12 and window["volume"][0] == 10
+    assert archive.read(columns=("time",)).dtype.names == ("time",)
+    # Đọc theo vị trí nến cũng vắt qua các partition.
+    assert np.array_equal(archive.read_rows(1400, 1600)["close"], rates["close"][1400:1600])
+    assert np.array_equal(archive.read_rows(4000, 10**6, ("time",))["time"], rates["time"][4000:])
+
+    monkeypatch.setattr(bar_archive, "default_root", lambda: tmp_path)
+    assert len(backtester.load_bars("EURUSD")) == len(rates)
+
+    # Backtest chỉ nạp đoạn nến quanh các đề xuất, và chỉ các cột cần cho mô phỏng.
+    params = backtester.BacktestParams(entry_expiry_bars=10, max_hold_bars=20)
+    props = [backtester.Proposal(time=int(rates["time"][100]), side=1, entry=1.1, sl=1.09, tp1=1.2, tp2=None)]
+    bars = backtester.load_bars_for("EURUSD", props, params)
+    assert bars["time"][0] == rates["time"][100] and len(bars) == 31
+    assert bars.dtype.names == ("time", "open", "high", "low", "close")
+
+
+def test_gaps_are_detected_and_backfilled(tmp_path) -> None:
+    archive = BarArchive("EURUSD", "M5", root=tmp_path)
+    full = _rates(T0, 100, period=300)
+    archive.append(np.concatenate([full[:20], full[30:]]))
+
+    gaps = archive.find_gaps()
+    assert gaps == [(int(full["time"][20]), int(full["time"][29]))]
+
+    requested = []
+
+    def fetch(date_from, date_to):
+        requested.append((date_from, date_to))
+        lo, hi = int(date_from.timestamp()), int(date_to.timestamp())
+        return full[(full["time"] >= lo) & (full["time"] <= hi)]
+
+    assert archive.backfill(fetch) == 10
+    assert requested[0][0] == datetime.fromtimestamp(int(full["time"][20]), timezone.utc)
+    assert archive.find_gaps() == []
+    assert np.array_equal(archive.read()["time"], full["time"])
+
+
+def test_weekend_gap_is_skipped(tmp_path) -> None:
+    archive = BarArchive("EURUSD", "H1", root=tmp_path)
+    friday = int(datetime(2024, 2, 2, 22, 0, tzinfo=timezone.utc).timestamp())
+    monday = int(datetime(2024, 2, 5, 0, 0, tzinfo=timezone.utc).timestamp())
+    archive.append(np.concatenate([_rates(friday, 2, 3600), _rates(monday, 2, 3600)]))
+
+    assert archive.find_gaps() == []
+    assert len(archive.find_gaps(skip_weekends=False)) == 1
+
+
+def test_torn_append_is_truncated_on_next_write(tmp_path) -> None:
+    archive = BarArchive("EURUSD", "M1", root=tmp_path)
+    rates = _rates(T0 - 6 * 3600, 100)
+    archive.append(rates[:50])
+
+    # Mô phỏng crash: chỉ cột `close` được ghi thêm 3 nến.
+    part = archive.path / "202401"
+    with open(part / "close.bin", "ab") as fh:
+        fh.write(np.zeros(3, dtype="<f8").tobytes())
+    assert len(archive) == 50
+
+    assert archive.append(rates[50:]) == 50
+    out = archive.read()
+    assert np.array_equal(out["time"], rates["time"])
+    assert np.array_equal(out["close"], rates["close"])
+
+
+def test_first_archive_write_in_session_backfills_from_mt5(tmp_path, monkeypatch) -> None:
+    full = _rates(T0, 200)
+    monkeypatch.setattr(bar_archive, "default_root", lambda: tmp_path)
+    monkeypatch.setattr(mt5_service, "_backfill_threads", {})
+    BarArchive("EURUSD", "M1").append(np.concatenate([full[:50], full[60:100]]))  # lần chạy trước
+
+    requested = []
+
+    def copy_rates_range(symbol, timeframe, date_from, date_to):
+        requested.append((int(date_from.timestamp()), int(date_to.timestamp())))
+        lo, hi = requested[-1]
+        return full[(full["time"] >= lo) & (full["time"] <= hi)]
+
+    monkeypatch.setattr(mt5_service, "copy_rates_range", copy_rates_range)
+    mt5_service._archive_closed_bars("EURUSD", "M1", full[150:])
+    mt5_service._backfill_threads["EURUSD", "M1"].join(5)
+
+    # Lấp đoạn ứng dụng tắt (100-149) và lỗ bên trong kho (50-59).
+    t = full["time"].astype(int)
+    assert sorted(requested) == [(t[50], t[59]), (t[100], t[149])]
+    assert np.array_equal(BarArchive("EURUSD", "M1").read()["time"], full["time"][:-1])
+
+    mt5_service._archive_closed_bars("EURUSD", "M1", full[150:])
+    mt5_service._backfill_threads["EURUSD", "M1"].join(5)
+    assert len(requested) == 2  # chỉ một lần mỗi phiên
+
+
+def test_gaps_without_source_bars_are_not_fetched_again(tmp_path) -> None:
+    archive = BarArchive("EURUSD", "M1", root=tmp_path)
+    full = _rates(T0, 300)
+    archive.append(np.concatenate([full[:20], full[30:200], full[210:]]))
+    requested = []
+
+    def fetch(date_from, date_to):
+        requested.append(int(date_from.timestamp()))
+        return full[:0]  # nguồn trả lời: không có nến (nghỉ giao dịch)
+
+    # Chỉ lấp trong cửa sổ: lỗ 20-29 nằm trước `start` nên không được hỏi.
+    assert archive.backfill(fetch, start=int(full["time"][100])) == 0
+    assert requested == [int(full["time"][200])]
+    assert archive.find_gaps(skip_unfillable=False)[-1] == (int(full["time"][200]), int(full["time"][209]))
+
+    # Lần sau (phiên khác) không hỏi lại khoảng đã biết là không có nến.
+    assert archive.find_gaps(int(full["time"][100])) == []
+    archive.backfill(fetch, start=int(full["time"][100]))
+    assert len(requested) == 1
+
+    # Lỗi của nguồn (None) không được ghi nhận: khoảng vẫn được thử lại.
+    assert archive.backfill(lambda a, b: None) == 0
+    assert archive.find_gaps() == [(int(full["time"][20]), int(full["time"][29]))]
+
+
+def test_interrupted_rewrite_never_mixes_partition_versions(tmp_path, monkeypatch) -> None:
+    archive = BarArchive("EURUSD", "M1", root=tmp_path)
+    rates = _rates(T0 - 6 * 3600, 100)
+    archive.append(rates[50:])
+
+    # Crash giữa hai lần đổi tên thư mục: partition cũ đã thành `.old`, `.new` chưa vào chỗ.
+    real_replace = bar_archive.os.replace
+    calls = []
+
+    def crash_on_second(src, dst):
+        calls.append(src)
+        if len(calls) == 2:
+            raise OSError("mô phỏng crash")
+        real_replace(src, dst)
+
+    monkeypatch.setattr(bar_archive.os, "replace", crash_on_second)
+    with pytest.raises(OSError):
+        archive.append(rates[:50])
+    monkeypatch.setattr(bar_archive.os, "replace", real_replace)
+    assert not (archive.path / "202401").exists()
+
+    recovered = BarArchive("EURUSD", "M1", root=tmp_path)
+    out = recovered.read()
+    assert np.array_equal(out["time"], rates["time"])
+    assert np.array_equal(out["close"], rates["close"])
+    assert sorted(p.name for p in recovered.path.iterdir()) == ["202401"]
+
+    # Ghi dở `.new` khi partition cũ còn nguyên: bỏ bản dở, giữ dữ liệu cũ.
+    staged = recovered.path / "202401.new"
+    staged.mkdir()
+    (staged / "open.bin").write_bytes(np.zeros(7, dtype="<f8").tobytes())
+    out = BarArchive("EURUSD", "M1", root=tmp_path).read()
+    assert np.array_equal(out["open"], rates["open"])
+    assert not staged.exists()
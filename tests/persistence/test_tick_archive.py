@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from APP.persistence import tick_archive
+from APP.persistence.tick_archive import TickArchive
+
+# 2024-03-05 23:50:00 UTC, tính bằng mili giây.
+T0_MS = int(datetime(2024, 3, 5, 23, 50, tzinfo=timezone.utc).timestamp()) * 1000
+POINT = 0.00001
+
+
+def _mt5_ticks(n: int, start_ms: int = T0_MS, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    dtype = [("time", "<i8"), ("bid", "<f8"), ("ask", "<f8"), ("last", "<f8"), ("volume", "<u8"),
+             ("time_msc", "<i8"), ("flags", "<u4"), ("volume_real", "<f8")]
+    arr = np.zeros(n, dtype=dtype)
+    arr["time_msc"] = start_ms + np.cumsum(rng.integers(1, 2000, n))
+    arr["time"] = arr["time_msc"] // 1000
+    bid_points = 110_000 + np.cumsum(rng.integers(-3, 4, n))
+    arr["bid"] = bid_points * POINT
+    arr["ask"] = (bid_points + rng.integers(8, 20, n)) * POINT
+    arr["flags"] = 6
+    return arr
+
+
+def test_round_trip_is_lossless_and_splits_days(tmp_path) -> None:
+    ticks = _mt5_ticks(2000)  # ~33 phút, vắt qua nửa đêm UTC
+    archive = TickArchive("EURUSD", POINT, root=tmp_path)
+
+    assert archive.append(ticks) == 2000
+    assert archive.days() == [20240305, 20240306]
+
+    out = archive.read()
+    assert np.array_equal(out["time_msc"], ticks["time_msc"])
+    assert np.array_equal(out["bid"], np.round(ticks["bid"], 5))
+    assert np.array_equal(out["ask"], np.round(ticks["ask"], 5))
+    assert np.all(out["flags"] == 6)
+
+    window = archive.read(int(ticks["time_msc"][100]), int(ticks["time_msc"][1500]))
+    assert np.array_equal(window["time_msc"], ticks["time_msc"][100:1500])
+
+
+def test_overlapping_windows_are_deduplicated_and_closed_days_compacted(tmp_path) -> None:
+    ticks = _mt5_ticks(3000, seed=1)
+    archive = TickArchive("EURUSD", POINT, root=tmp_path, flush_ticks=300)
+
+    # Mô phỏng các lần lấy cửa sổ 30 phút chồng lấn nhau.
+    for end in (500, 900, 900, 1400, 1900, 2400, 3000):
+        archive.append(ticks[max(0, end - 600) : end])
+
+    assert np.array_equal(archive.read()["time_msc"], ticks["time_msc"])
+    # Ngày đã qua chỉ còn một chunk; ngày hiện tại vẫn ghi nối tiếp theo chunk.
+    assert len(archive._chunks(20240305)) == 1
+    assert len(archive._chunks(20240306)) >= 2
+
+
+def test_ticks_are_buffered_until_threshold_interval_or_read(tmp_path) -> None:
+    ticks = _mt5_ticks(400, start_ms=T0_MS - 3_600_000, seed=3)  # cùng một ngày
+    now = [0.0]
+    archive = TickArchive("EURUSD", POINT, root=tmp_path, flush_ticks=10_000, flush_interval_sec=60, clock=lambda: now[0])
+
+    assert archive.append(ticks[:100]) == 100
+    assert archive.append(ticks[50:200]) == 100
+    assert archive.days() == []  # chưa chạm đĩa
+    assert archive.last_time_msc() == int(ticks["time_msc"][199])
+
+    now[0] = 61.0
+    archive.append(ticks[200:300])
+    assert len(archive._chunks(20240305)) == 1
+
+    archive.append(ticks[300:])
+    assert np.array_equal(archive.read()["time_msc"], ticks["time_msc"])  # đọc xả phần còn lại
+    # Kho mở lại từ đĩa vẫn biết mốc cuối.
+    assert TickArchive("EURUSD", POINT, root=tmp_path).append(ticks[-50:]) == 0
+
+
+def test_same_millisecond_ticks_at_boundary_are_kept(tmp_path) -> None:
+    ticks = _mt5_ticks(3, seed=4)
+    ticks["time_msc"] = T0_MS
+    ticks["bid"] = np.array([110_000, 110_001, 110_002]) * POINT
+    archive = TickArchive("EURUSD", POINT, root=tmp_path)
+
+    assert archive.append(ticks[:2]) == 2
+    assert archive.flush() == 2
+    # Tick thứ ba cùng mili giây đến ở lần lấy sau: không bị loại như khi so `time_msc > last`.
+    reopened = TickArchive("EURUSD", POINT, root=tmp_path)
+    assert reopened.append(ticks) == 1
+    assert reopened.append(ticks) == 0
+    assert np.array_equal(np.sort(reopened.read()["bid"]), np.round(np.sort(ticks["bid"]), 5))
+
+
+def test_spread_stats_streams_exact_percentiles(tmp_path) -> None:
+    ticks = _mt5_ticks(5000, seed=2)
+    archive = TickArchive("EURUSD", POINT, root=tmp_path)
+    for i in range(0, 5000, 700):
+        archive.append(ticks[i : i + 700])
+
+    spreads = np.rint((ticks["ask"] - ticks["bid"]) / POINT).astype(int)
+    stats = archive.spread_stats(percentiles=(50, 90))
+    assert stats["ticks"] == 5000
+    assert stats["p50_spread"] == int(np.percentile(spreads, 50, method="inverted_cdf"))
+    assert stats["p90_spread"] == int(np.percentile(spreads, 90, method="inverted_cdf"))
+    assert stats["mean_spread"] == pytest.approx(spreads.mean())
+
+    span_min = (ticks["time_msc"][-1] - ticks["time_msc"][0]) / 60_000
+    assert stats["ticks_per_min"] == pytest.approx(5000 / span_min)
+    assert archive.spread_stats(0, 1)["ticks"] == 0
+    with pytest.raises(ValueError):
+        tick_archive.TickArchive("EURUSD", 0.0, root=tmp_path)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import CancelledError
+from types import SimpleNamespace
+
+import pytest
+
+from APP.services import gemini_async, gemini_service
+from APP.utils.threading_utils import CancelToken
+
+
+class _AsyncModel:
+    """Model giả: `delays[i]` là thời gian chờ trước chunk thứ i."""
+
+    model_name = "models/fake-async"
+
+    def __init__(self, delays: list[float], connect_delay: float = 0.0) -> None:
+        self.delays = delays
+        self.connect_delay = connect_delay
+        self.closed = threading.Event()
+
+    async def generate_content_async(self, parts, stream=True, request_options=None):
+        await asyncio.sleep(self.connect_delay)
+        return self._chunks()
+
+    async def _chunks(self):
+        try:
+            for i, delay in enumerate(self.delays):
+                await asyncio.sleep(delay)
+                yield SimpleNamespace(text=f"c{i}")
+        finally:
+            self.closed.set()
+
+
+@pytest.fixture(scope="module")
+def bridge():
+    instance = gemini_async.AsyncStreamBridge()
+    yield instance
+    instance.close()
+
+
+def test_bridge_streams_chunks_in_order(bridge) -> None:
+    model = _AsyncModel([0.0, 0.01, 0.0])
+    chunks = list(bridge.stream(model, ["p"], gemini_async.StreamTimeouts(1.0, 1.0, 5.0)))
+    assert [c.text for c in chunks] == ["c0", "c1", "c2"]
+    assert model.closed.wait(1.0)
+
+
+@pytest.mark.parametrize(
+    ("model", "timeouts", "phase"),
+    [
+        (_AsyncModel([0.5]), gemini_async.StreamTimeouts(0.1, 1.0, 5.0), "first_token"),
+        (_AsyncModel([], connect_delay=0.5), gemini_async.StreamTimeouts(0.1, 1.0, 5.0), "first_token"),
+        (_AsyncModel([0.0, 0.5]), gemini_async.StreamTimeouts(1.0, 0.1, 5.0), "idle"),
+        (_AsyncModel([0.0, 0.08, 0.08, 0.08]), gemini_async.StreamTimeouts(1.0, 0.1, 0.2), "total"),
+    ],
+)
+def test_stalled_stream_times_out_by_phase(bridge, model, timeouts, phase) -> None:
+    received = []
+    with pytest.raises(gemini_async.StreamTimeoutError) as exc:
+        for chunk in bridge.stream(model, ["p"], timeouts):
+            received.append(chunk.text)
+    assert exc.value.phase == phase
+    if model.delays:
+        assert model.closed.wait(1.0)
+
+
+def test_cancel_token_aborts_stalled_stream_and_closes_connection(bridge) -> None:
+    model = _AsyncModel([0.0, 30.0])
+    token = CancelToken()
+    stream = bridge.stream(model, ["p"], gemini_async.StreamTimeouts(5.0, 60.0, 120.0), token)
+    assert next(stream).text == "c0"
+
+    threading.Timer(0.1, token.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(CancelledError):
+        next(stream)
+    assert time.monotonic() - started < 2.0
+    assert model.closed.wait(1.0)
+
+
+def test_stream_gemini_response_uses_async_path_and_does_not_retry_cancel(monkeypatch, bridge) -> None:
+    monkeypatch.setattr(gemini_async, "get_bridge", lambda: bridge)
+    monkeypatch.setattr(gemini_service.time, "sleep", lambda _s: None)
+    timeouts = gemini_async.StreamTimeouts(1.0, 1.0, 5.0)
+
+    out = list(gemini_service.stream_gemini_response(_AsyncModel([0.0, 0.0]), ["p"], tries=1, timeouts=timeouts))
+    assert [c.text for c in out] == ["c0", "c1"]
+
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(CancelledError):
+        list(gemini_service.stream_gemini_response(_AsyncModel([0.0]), ["p"], tries=3, cancel_token=token, timeouts=timeouts))
+
+
+def test_timeout_after_first_chunk_is_not_retried(monkeypatch, bridge) -> None:
+    monkeypatch.setattr(gemini_async, "get_bridge", lambda: bridge)
+    monkeypatch.setattr(gemini_service.time, "sleep", lambda _s: None)
+    timeouts = gemini_async.StreamTimeouts(1.0, 0.1, 5.0)
+
+    stalled = _AsyncModel([0.0, 0.5])  # "c0" rồi treo quá idle_sec
+    out = list(gemini_service.stream_gemini_response(stalled, ["p"], tries=3, timeouts=timeouts))
+    assert [c.text for c in out[:-1]] == ["c0"]
+    assert isinstance(out[-1], gemini_service.StreamError)
+
+    class _SlowThenFast(_AsyncModel):
+        calls = 0
+
+        async def generate_content_async(self, parts, stream=True, request_options=None):
+            type(self).calls += 1
+            self.delays = [0.5] if type(self).calls == 1 else [0.0, 0.0]
+            return await super().generate_content_async(parts, stream, request_options)
+
+    # Quá hạn trước chunk đầu vẫn được thử lại.
+    first_token_only = gemini_async.StreamTimeouts(0.1, 1.0, 5.0)
+    out = list(gemini_service.stream_gemini_response(_SlowThenFast([]), ["p"], tries=2, timeouts=first_token_only))
+    assert [c.text for c in out] == ["c0", "c1"]
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import pytest
+
+from APP.services import gemini_service
+
+
+class _FakeModel:
+    def __init__(self, model_name: str, generation_config=None) -> None:
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    configured: list[str] = []
+    monkeypatch.setattr(gemini_service, "GEMINI_AVAILABLE", True)
+    monkeypatch.setattr(gemini_service, "GenerativeModel", _FakeModel)
+    monkeypatch.setattr(gemini_service, "configure", lambda api_key: configured.append(api_key))
+    gemini_service.reset_model_pool()
+    yield configured
+    gemini_service.reset_model_pool()
+
+
+def test_models_are_reused_per_key_model_and_generation_config(pool) -> None:
+    first = gemini_service.initialize_model("key-a", "gemini-pro")
+    assert gemini_service.initialize_model("key-a", "gemini-pro") is first
+    assert gemini_service.ensure_configured("key-a")
+    assert pool == ["key-a"]
+
+    flash = gemini_service.initialize_model("key-a", "gemini-flash")
+    cold = gemini_service.initialize_model("key-a", "gemini-pro", {"temperature": 0.2})
+    assert flash is not first and cold is not first
+    assert cold.generation_config == {"temperature": 0.2}
+    assert gemini_service.initialize_model("key-a", "gemini-pro", {"temperature": 0.2}) is cold
+    assert pool == ["key-a"]
+
+
+def test_key_rotation_reconfigures_and_evicts_stale_models(pool) -> None:
+    old = gemini_service.initialize_model("key-a", "gemini-pro")
+    rotated = gemini_service.initialize_model("key-b", "gemini-pro")
+    assert rotated is not old and pool == ["key-a", "key-b"]
+    assert gemini_service.initialize_model("key-b", "gemini-pro") is rotated
+
+    back = gemini_service.initialize_model("key-a", "gemini-pro")
+    assert back is not old and pool == ["key-a", "key-b", "key-a"]
+
+
+def test_failures_return_none_without_poisoning_the_pool(pool, monkeypatch) -> None:
+    assert gemini_service.initialize_model("", "gemini-pro") is None
+    assert not gemini_service.ensure_configured("")
+
+    def boom(api_key: str) -> None:
+        raise RuntimeError("network down")
+
+    monkeypatch.setattr(gemini_service, "configure", boom)
+    assert gemini_service.initialize_model("key-a", "gemini-pro") is None
+    assert not gemini_service.ensure_configured("key-a")
+
+    monkeypatch.setattr(gemini_service, "configure", lambda api_key: pool.append(api_key))
+    assert gemini_service.initialize_model("key-a", "gemini-pro") is not None
+    assert pool == ["key-a"]
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from APP.services import hedging
+from APP.services.gemini_service import StreamError
+from APP.utils.threading_utils import CancelToken
+
+
+def _candidates(*stubs: hedging.StubStream) -> list[hedging.HedgeCandidate]:
+    return [
+        hedging.HedgeCandidate(f"c{i}", f"model-{i}", stub, input_tokens=100) for i, stub in enumerate(stubs)
+    ]
+
+
+def test_fast_primary_wins_without_launching_hedge() -> None:
+    primary = hedging.StubStream(["a", "b"], first_chunk_sec=0.0)
+    backup = hedging.StubStream(["x"])
+    hedged = hedging.HedgedStream(_candidates(primary, backup), delay_sec=1.0)
+
+    assert [c.text for c in hedged.stream()] == ["a", "b"]
+    assert backup.opened == 0
+    assert [(a.label, a.outcome, a.output_chars) for a in hedged.attempts] == [("c0", "won", 2)]
+
+
+def test_slow_primary_is_hedged_and_cancelled() -> None:
+    primary = hedging.StubStream(["slow"], first_chunk_sec=5.0)
+    backup = hedging.StubStream(["fast", " reply"], first_chunk_sec=0.0)
+    hedged = hedging.HedgedStream(_candidates(primary, backup), delay_sec=0.1)
+
+    started = time.monotonic()
+    assert "".join(c.text for c in hedged.stream()) == "fast reply"
+    assert time.monotonic() - started < 1.0
+
+    outcomes = {a.label: a.outcome for a in hedged.attempts}
+    assert outcomes == {"c0": "cancelled", "c1": "won"}
+    assert hedged.winner.launched_at >= 0.1
+    deadline = time.monotonic() + 1.0
+    while not primary.cancelled and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert primary.cancelled
+
+
+def test_failures_trigger_next_candidate_and_all_failed_yields_stream_error() -> None:
+    failing = hedging.StubStream(["never"], fail=True)
+    backup = hedging.StubStream(["ok"])
+    hedged = hedging.HedgedStream(_candidates(failing, backup), delay_sec=10.0)
+    assert [c.text for c in hedged.stream()] == ["ok"]
+    assert hedged.attempts[0].outcome == "failed" and "Stub" in hedged.attempts[0].error
+
+    hedged = hedging.HedgedStream(
+        _candidates(hedging.StubStream([], fail=True), hedging.StubStream([])), delay_sec=10.0
+    )
+    out = list(hedged.stream())
+    assert len(out) == 1 and isinstance(out[0], StreamError)
+    assert [a.outcome for a in hedged.attempts] == ["failed", "failed"]
+
+
+def test_parent_cancel_stops_all_and_ledger_records_every_attempt(tmp_path) -> None:
+    token = CancelToken()
+    stubs = (hedging.StubStream(["a"], first_chunk_sec=5.0), hedging.StubStream(["b"], first_chunk_sec=5.0))
+    hedged = hedging.HedgedStream(_candidates(*stubs), delay_sec=0.05, cancel_token=token)
+
+    threading.Timer(0.2, token.cancel).start()
+    with pytest.raises(CancelledError):
+        list(hedged.stream())
+    assert [a.outcome for a in hedged.attempts] == ["cancelled", "cancelled"]
+
+    ledger = tmp_path / hedging.LEDGER_FILENAME
+    hedging.append_ledger(ledger, hedged.attempts, symbol="EURUSD")
+    rows = [json.loads(line) for line in ledger.read_text(encoding="utf-8").splitlines()]
+    assert [(r["label"], r["symbol"], r["input_tokens"]) for r in rows] == [
+        ("c0", "EURUSD", 100),
+        ("c1", "EURUSD", 100),
+    ]
+
+
+
+@pytest.mark.parametrize("raise_error", [False, True])
+def test_candidate_ending_after_cancel_reports_cancelled_not_failed(raise_error) -> None:
+    def open_stream(token: CancelToken):
+        token.cancel()
+        if raise_error:
+            raise RuntimeError("kết nối bị đóng")
+        return iter(())
+
+    hedged = hedging.HedgedStream([hedging.HedgeCandidate("c0", "m", open_stream)], delay_sec=1.0)
+    hedged._launch()
+    assert hedged._events.get(timeout=1.0) == (0, "cancelled", None)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import json
+
+from APP.services import prompt_cache
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _cache(tmp_path, clock):
+    backend = prompt_cache.InMemoryCacheBackend(clock)
+    return backend, prompt_cache.PromptPrefixCache(backend, tmp_path / "prompt_cache.json", clock)
+
+
+def test_prefix_is_uploaded_once_and_refreshed_before_expiry(tmp_path) -> None:
+    clock = _Clock()
+    backend, cache = _cache(tmp_path, clock)
+
+    first = cache.acquire("key", "gemini-pro", "RULES v1", ttl_sec=600)
+    assert cache.acquire("key", "gemini-pro", "RULES v1", ttl_sec=600) == first
+    assert backend.calls == [("create", first.name)]
+    assert backend.model_for(first.name, "api-key")["prefix"] == "RULES v1"
+
+    clock.now += 600 - prompt_cache.REFRESH_MARGIN_SEC + 1
+    refreshed = cache.acquire("key", "gemini-pro", "RULES v1", ttl_sec=600)
+    assert refreshed.name == first.name and refreshed.expire_at == clock.now + 600
+    assert backend.calls[-1] == ("refresh", first.name)
+
+    clock.now += 601
+    recreated = cache.acquire("key", "gemini-pro", "RULES v1", ttl_sec=600)
+    assert recreated.name != first.name and backend.calls[-1] == ("create", recreated.name)
+
+
+def test_changed_prompt_replaces_cache_and_scopes_are_separate(tmp_path) -> None:
+    clock = _Clock()
+    backend, cache = _cache(tmp_path, clock)
+    old = cache.acquire("key", "gemini-pro", "RULES v1", ttl_sec=600)
+    new = cache.acquire("key", "gemini-pro", "RULES v2", ttl_sec=600)
+    assert new.name != old.name and ("delete", old.name) in backend.calls
+    assert old.name not in backend.entries
+
+    other = cache.acquire("other-key", "gemini-pro", "RULES v2", ttl_sec=600)
+    assert other.name != new.name
+
+    state = json.loads((tmp_path / "prompt_cache.json").read_text(encoding="utf-8"))
+    assert {e["name"] for e in state.values()} == {new.name, other.name}
+    _, reloaded = _cache(tmp_path, clock)
+    reloaded.backend = backend
+    assert reloaded.acquire("key", "gemini-pro", "RULES v2", ttl_sec=600) == new
+
+
+def test_backend_rejection_falls_back_without_retrying(tmp_path) -> None:
+    clock = _Clock()
+    backend, cache = _cache(tmp_path, clock)
+    attempts = []
+
+    def reject(model_name, text, ttl_sec, display_name):
+        attempts.append(text)
+        raise ValueError("Cached content is too small")
+
+    backend.create = reject
+    assert cache.acquire("key", "gemini-pro", "short", ttl_sec=600) is None
+    assert cache.acquire("key", "gemini-pro", "short", ttl_sec=600) is None
+    assert attempts == ["short"]
+
+    cache.invalidate("key", "gemini-pro")
+    assert cache.acquire("key", "gemini-pro", "short but edited", ttl_sec=600) is None
+    assert attempts == ["short", "short but edited"]
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import os
+from types import SimpleNamespace
+
+from APP.services import gemini_service, response_cache
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _FakeModel:
+    model_name = "models/gemini-pro"
+
+    def __init__(self, chunks: list[str], fail_after: int | None = None) -> None:
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def generate_content(self, parts, stream=True, request_options=None):
+        self.calls += 1
+        for i, text in enumerate(self.chunks):
+            if self.fail_after is not None and i == self.fail_after:
+                raise RuntimeError("stream bị ngắt")
+            yield SimpleNamespace(text=text)
+
+
+def test_request_key_uses_file_hash_and_model_settings() -> None:
+    model = _FakeModel([])
+    img_a = SimpleNamespace(name="files/abc", uri="https://x/abc", sha256_hash="deadbeef")
+    img_b = SimpleNamespace(name="files/xyz", uri="https://x/xyz", sha256_hash="deadbeef")
+
+    key = response_cache.request_key(model, ["prompt", img_a])
+    assert key == response_cache.request_key(model, ["prompt", img_b])
+    assert key != response_cache.request_key(model, ["prompt 2", img_a])
+
+    other = _FakeModel([])
+    other.model_name = "models/gemini-flash"
+    assert key != response_cache.request_key(other, ["prompt", img_a])
+
+
+def test_entries_expire_and_size_cap_evicts_least_recent(tmp_path) -> None:
+    clock = _Clock()
+    cache = response_cache.ResponseCache(tmp_path, ttl_sec=60, max_bytes=10_000, clock=clock)
+    cache.put("aa01", "first")
+    assert cache.get("aa01") == "first"
+    clock.now += 61
+    assert cache.get("aa01") is None
+
+    cache.max_bytes = 2_500
+    for i, key in enumerate(("bb01", "bb02", "bb03")):
+        cache.put(key, "x" * 1_000)
+        os.utime(cache._path(key), (clock.now + i, clock.now + i))
+    assert cache.get("bb01") is None
+    assert cache.get("bb02") == "x" * 1_000 and cache.get("bb03") == "x" * 1_000
+
+
+def test_stream_replays_cached_response_without_calling_model(tmp_path) -> None:
+    cache = response_cache.ResponseCache(tmp_path)
+    model = _FakeModel(["Phân tích ", "xong."])
+
+    first = list(gemini_service.stream_gemini_response(model, ["p"], tries=1, base_delay=0, response_cache=cache))
+    assert "".join(c.text for c in first) == "Phân tích xong." and model.calls == 1
+
+    replay = list(gemini_service.stream_gemini_response(model, ["p"], tries=1, base_delay=0, response_cache=cache))
+    assert all(isinstance(c, gemini_service.CachedChunk) for c in replay)
+    assert "".join(c.text for c in replay) == "Phân tích xong." and model.calls == 1
+
+
+def test_interrupted_stream_is_not_cached(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(gemini_service.time, "sleep", lambda _s: None)
+    cache = response_cache.ResponseCache(tmp_path)
+    model = _FakeModel(["a", "b", "c"], fail_after=2)
+
+    out = list(gemini_service.stream_gemini_response(model, ["p"], tries=1, base_delay=0, response_cache=cache))
+    assert isinstance(out[-1], gemini_service.StreamError)
+    assert cache.get(response_cache.request_key(model, ["p"])) is None
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Bộ sinh dữ liệu OHLC tổng hợp, xác định (cùng seed -> cùng dữ liệu) cho test và benchmark.
+
+Các kịch bản:
+- ``random_walk``: bước ngẫu nhiên Gauss, biến động đều.
+- ``trending``: xu hướng tăng rõ ràng kèm nhịp hồi — nhiều FVG/BOS.
+- ``gappy``: thỉnh thoảng nhảy giá mạnh giữa các nến — nhiều FVG/void.
+- ``flat``: đi ngang biên độ hẹp — ít swing, gần như không có cấu trúc.
+
+Trả về danh sách dict cùng định dạng với `mt5_service._series_from_mt5`.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Callable
+
+import numpy as np
+
+START_TIME = datetime(2020, 1, 1)
+
+
+def _to_rates(close: np.ndarray, rng: np.random.Generator, wick: float, step_minutes: int) -> list[dict]:
+    open_ = np.empty_like(close)
+    open_[0] = close[0]
+    open_[1:] = close[:-1]
+    high = np.maximum(open_, close) + np.abs(rng.normal(0.0, wick, close.size))
+    low = np.minimum(open_, close) - np.abs(rng.normal(0.0, wick, close.size))
+    vol = rng.integers(50, 500, close.size)
+
+    # Chuỗi thời gian được tạo một lần, tránh strftime cho từng nến.
+    base = np.datetime64(START_TIME, "m")
+    times = np.datetime_as_string(base + np.arange(close.size) * step_minutes, unit="s")
+    return [
+        {"time": t.replace("T", " "), "open": o, "high": h, "low": lo, "close": c, "vol": v}
+        for t, o, h, lo, c, v in zip(
+            times.tolist(), open_.tolist(), high.tolist(), low.tolist(), close.tolist(), vol.tolist()
+        )
+    ]
+
+
+def random_walk(n: int, seed: int = 0, start: float = 2000.0, step_minutes: int = 1) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    close = start + np.cumsum(rng.normal(0.0, 1.0, n))
+    return _to_rates(close, rng, wick=0.6, step_minutes=step_minutes)
+
+
+def trending(n: int, seed: int = 0, start: float = 2000.0, step_minutes: int = 1) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    drift = 0.35 + 0.25 * np.sin(np.arange(n) / 50.0)
+    close = start + np.cumsum(drift + rng.normal(0.0, 1.0, n))
+    return _to_rates(close, rng, wick=0.5, step_minutes=step_minutes)
+
+
+def gappy(n: int, seed: int = 0, start: float = 2000.0, step_minutes: int = 1) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0.0, 0.8, n)
+    jumps = rng.random(n) < 0.03
+    steps[jumps] += rng.choice([-1.0, 1.0], int(jumps.sum())) * rng.uniform(4.0, 10.0, int(jumps.sum()))
+    close = start + np.cumsum(steps)
+    return _to_rates(close, rng, wick=0.3, step_minutes=step_minutes)
+
+
+def flat(n: int, seed: int = 0, start: float = 2000.0, step_minutes: int = 1) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    close = start + rng.normal(0.0, 0.05, n)
+    return _to_rates(close, rng, wick=0.02, step_minutes=step_minutes)
+
+
+GENERATORS: dict[str, Callable[..., list[dict]]] = {
+    "random_walk": random_walk,
+    "trending": trending,
+    "gappy": gappy,
+    "flat": flat,
+}
+
+
+def generate(kind: str, n: int, seed: int = 0) -> list[dict]:
+    """Sinh `n` nến theo kịch bản `kind` (xem `GENERATORS`)."""
+    try:
+        return GENERATORS[kind](n, seed=seed)
+    except KeyError:
+        raise ValueError(f"Kịch bản không hợp lệ: {kind}. Chọn một trong {sorted(GENERATORS)}") from None
+
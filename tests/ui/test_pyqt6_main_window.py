@@ -635,6 +635,8 @@ def test_main_window_ui_detail_and_error(qapp, config_state: UiConfigState, tmp_
 
     window.ui_detail_replace("Chi tiết báo cáo mới")
     assert "Chi tiết báo cáo" in window.reports_tab.detail_output.toPlainText()
+    window.ui_detail_append(" - phần nối thêm")
+    assert window.reports_tab.detail_output.toPlainText() == "Chi tiết báo cáo mới - phần nối thêm"
 
     window.show_error_message("Lỗi", "Không thể xử lý")
     assert dialogs.error_messages[-1] == ("Lỗi", "Không thể xử lý")
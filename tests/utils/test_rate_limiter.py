@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from concurrent.futures import CancelledError
+
+import pytest
+
+from APP.utils.rate_limiter import RateLimiter
+from APP.utils.threading_utils import CancelToken
+
+
+class _Clock:
+    """Đồng hồ giả: `sleep` chỉ tịnh tiến thời gian."""
+
+    def __init__(self) -> None:
+        self.now = 100.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_requests_wait_exactly_until_refill() -> None:
+    clock = _Clock()
+    limiter = RateLimiter(rpm=2, clock=clock, sleeper=clock.sleep)
+
+    assert limiter.acquire(requests=1) == 0.0
+    assert limiter.acquire(requests=1) == 0.0
+    waited = limiter.acquire(requests=1)
+
+    assert waited == pytest.approx(30.0)
+    assert clock.sleeps == [pytest.approx(30.0)]
+    stats = limiter.metrics()["requests"]
+    assert stats["waits"] == 1 and stats["granted"] == 3 and stats["utilisation"] == pytest.approx(1.0)
+
+
+def test_buckets_are_debited_together_and_large_requests_leave_debt() -> None:
+    clock = _Clock()
+    limiter = RateLimiter(rpm=60, tpm=1_000, clock=clock, sleeper=clock.sleep)
+
+    # Vượt sức chứa: được cấp khi bucket đầy, phần dư thành nợ cho lời gọi sau.
+    assert limiter.acquire(requests=1, tokens=1_500) == 0.0
+    assert limiter.metrics()["tokens"]["available"] == pytest.approx(-500.0)
+    assert limiter.metrics()["requests"]["available"] == pytest.approx(59.0)
+
+    waited = limiter.acquire(requests=1, tokens=100)
+    assert waited == pytest.approx(36.0)  # (500 + 100) token ở tốc độ 1000/phút
+    assert "uploads" not in limiter.metrics()
+
+
+def test_wait_is_cancellable_and_times_out() -> None:
+    clock = _Clock()
+    token = CancelToken()
+    limiter = RateLimiter(uploads_per_min=1, clock=clock, sleeper=lambda s: (clock.sleep(s), token.cancel()))
+    limiter.acquire(uploads=1)
+
+    with pytest.raises(CancelledError):
+        limiter.acquire(uploads=1, cancel_token=token)
+    assert clock.sleeps == [0.25]  # chờ từng đoạn ngắn khi có cancel token
+
+    with pytest.raises(TimeoutError):
+        limiter.acquire(uploads=1, timeout=5.0)
+
+
+def test_reconfigure_keeps_usage_and_zero_disables() -> None:
+    clock = _Clock()
+    limiter = RateLimiter(rpm=10, clock=clock, sleeper=clock.sleep)
+    limiter.acquire(requests=8)
+
+    limiter.configure(rpm=5, tpm=0, uploads_per_min=0)
+    assert limiter.metrics()["requests"]["available"] == pytest.approx(2.0)
+
+    limiter.configure(rpm=0, tpm=0, uploads_per_min=0)
+    assert limiter.acquire(requests=100) == 0.0 and limiter.metrics() == {}